@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+asyncrunner.py
+--------------------
+Common execution layer for the external tools (import.pl, dali.pl, hmmscan,
+superfamily.pl, protenix).
+
+• Output is streamed straight into per-job log files (<log_dir>/<job>.out/.err),
+  never buffered in memory.
+• Every tool has a timeout; a hung job has its whole process group killed
+  (SIGTERM, then SIGKILL) and is retried a bounded number of times.
+• Concurrency is limited per tool and globally with asyncio semaphores.
+
+Synchronous scripts use `run_job(job)` / `run_jobs(jobs)`; async code can use
+`AsyncRunner.run_many` directly.
+
+Usage (ad hoc):
+    python asyncrunner.py --tool dali --timeout 60 -- dali.pl --cd1 1ABCA ...
+"""
+
+import argparse
+import asyncio
+import os
+import re
+import resource
+import shlex
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from tracing import get_tracer
+
+# ── configuration ─────────────────────────────────────────────────────────────
+LOG_DIR = "logs"
+
+# Per-tool timeouts in seconds (None = no limit)
+TOOL_TIMEOUTS = {
+    "import": 600,
+    "dali": 1800,
+    "hmmscan": 3600,
+    "superfamily": 7200,
+    "protenix": 12 * 3600,
+    "mmseqs": 3600,
+}
+# Per-tool concurrency limits
+TOOL_LIMITS = {
+    "import": 4,
+    "dali": os.cpu_count() or 1,
+    "hmmscan": 2,
+    "superfamily": 1,
+    "protenix": 1,
+    "mmseqs": 1,
+}
+# Retries after the first attempt; timeouts are always retried, non-zero exits
+# only when the job sets retry_on_error
+TOOL_RETRIES = {"import": 1, "dali": 1, "hmmscan": 1, "superfamily": 0, "protenix": 0, "mmseqs": 0}
+
+KILL_GRACE = 5.0        # seconds between SIGTERM and SIGKILL
+RETRY_BACKOFF = 2.0     # seconds, doubled on every retry
+
+
+class Job:
+    """An external command plus how to run it."""
+
+    def __init__(self, name, cmd, tool="generic", cwd=None, timeout=None, retries=None,
+                 retry_on_error=False, env=None, target=None):
+        self.name = name
+        self.target = target            # used to group trace events per target
+        self.cmd = shlex.split(cmd) if isinstance(cmd, str) else [str(c) for c in cmd]
+        self.tool = tool
+        self.cwd = cwd
+        self.timeout = timeout if timeout is not None else TOOL_TIMEOUTS.get(tool)
+        self.retries = retries if retries is not None else TOOL_RETRIES.get(tool, 0)
+        self.retry_on_error = retry_on_error
+        self.env = env
+
+
+class JobResult:
+    """Outcome of a job; output lives in the log files, not in memory."""
+
+    def __init__(self, job, returncode, attempts, elapsed, timed_out, stdout_log, stderr_log, error=None,
+                 cpu=None, peak_rss_kb=None):
+        self.job = job
+        self.name = job.name
+        self.returncode = returncode
+        self.attempts = attempts
+        self.elapsed = elapsed
+        self.timed_out = timed_out
+        self.stdout_log = stdout_log
+        self.stderr_log = stderr_log
+        self.error = error
+        self.cpu = cpu                  # seconds, whole process tree (wait4 rusage / /proc samples)
+        self.peak_rss_kb = peak_rss_kb
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out
+
+    def __repr__(self):
+        return (f"JobResult({self.name!r}, rc={self.returncode}, attempts={self.attempts}, "
+                f"timed_out={self.timed_out}, {self.elapsed:.1f}s)")
+
+
+def tail(path, lines=20):
+    """Last *lines* lines of a log file, read from the end without loading it all."""
+    path = Path(path)
+    if not path.exists():
+        return ""
+    with path.open("rb") as fh:
+        fh.seek(0, os.SEEK_END)
+        size = fh.tell()
+        fh.seek(max(0, size - 256 * lines))
+        data = fh.read().decode(errors="replace")
+    return "\n".join(data.splitlines()[-lines:])
+
+
+def _safe_name(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+def _reap(proc):
+    """Block until *proc* exits; returns its rusage, which includes every descendant it waited for."""
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return usage
+
+
+class AsyncRunner:
+    def __init__(self, log_dir=LOG_DIR, limits=None, max_parallel=None):
+        self.log_dir = Path(log_dir)
+        self.limits = {**TOOL_LIMITS, **(limits or {})}
+        self.max_parallel = max_parallel or max(self.limits.values())
+        self._semaphores = None
+        self._loop = None
+        # Jobs are reaped with wait4 in these threads rather than by asyncio's child watcher,
+        # which discards the child's rusage; the global semaphore bounds the live jobs
+        self._reaper = ThreadPoolExecutor(self.max_parallel, thread_name_prefix="reaper")
+
+    def _semaphore(self, tool):
+        if tool not in self._semaphores:
+            self._semaphores[tool] = asyncio.Semaphore(self.limits.get(tool, self.max_parallel))
+        return self._semaphores[tool]
+
+    @staticmethod
+    async def _kill_group(proc, reaped):
+        """Terminate the job's whole process group (the tool and its children)."""
+        for sig, grace in ((signal.SIGTERM, KILL_GRACE), (signal.SIGKILL, None)):
+            try:
+                os.killpg(proc.pid, sig)
+            except ProcessLookupError:
+                break
+            if grace is None:
+                break
+            try:
+                await asyncio.wait_for(asyncio.shield(reaped), grace)
+                return
+            except asyncio.TimeoutError:
+                pass
+        await reaped
+
+    async def _attempt(self, job, stdout_log, stderr_log, attempt):
+        """Run one attempt; returns (returncode, timed_out, error, metrics)."""
+        with stdout_log.open("wb") as out, stderr_log.open("wb") as err:
+            err.write(f"# attempt {attempt}: {shlex.join(job.cmd)}\n".encode())
+            err.flush()
+            spawned_from_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            try:
+                proc = subprocess.Popen(job.cmd, cwd=job.cwd, env=job.env, stdin=subprocess.DEVNULL,
+                                        stdout=out, stderr=err, start_new_session=True)
+            except (FileNotFoundError, PermissionError) as e:
+                return 127, False, str(e), None
+            reaped = asyncio.get_running_loop().run_in_executor(self._reaper, _reap, proc)
+            sampler = get_tracer().sampler() if get_tracer().enabled else None
+            if sampler:
+                sampler.track(proc.pid)   # session leader: pgid == pid
+            try:
+                await asyncio.wait_for(asyncio.shield(reaped), job.timeout)
+                timed_out, error = False, None
+            except asyncio.TimeoutError:
+                await self._kill_group(proc, reaped)
+                timed_out, error = True, f"timed out after {job.timeout}s"
+            except asyncio.CancelledError:
+                await self._kill_group(proc, reaped)
+                raise
+            finally:
+                sampled = sampler.release(proc.pid) if sampler else None
+            # rusage covers children the tool reaped, even short-lived ones the sampler never saw;
+            # the /proc samples cover the group as a whole (RSS summed over concurrent processes).
+            # Linux charges the image a child was forked from to its ru_maxrss, so a value not
+            # above our own peak may be this process rather than the tool and is left to the sampler
+            usage = reaped.result()
+            metrics = {"cpu": usage.ru_utime + usage.ru_stime,
+                       "peak_rss_kb": usage.ru_maxrss if usage.ru_maxrss > spawned_from_kb else 0}
+            if sampled:
+                metrics = {k: max(metrics[k], sampled[k]) for k in metrics}
+            return proc.returncode, timed_out, error, metrics
+
+    async def run_one(self, job: Job) -> JobResult:
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        stdout_log = self.log_dir / f"{_safe_name(job.name)}.out"
+        stderr_log = self.log_dir / f"{_safe_name(job.name)}.err"
+        # Semaphores belong to an event loop; recreate them for a new one
+        if self._loop is not asyncio.get_running_loop():
+            self._loop = asyncio.get_running_loop()
+            self._semaphores = {}
+            self._global = asyncio.Semaphore(self.max_parallel)
+
+        start = time.time()
+        attempt = 0
+        cpu, peak_rss_kb = None, None
+        # Tool slot first: a job waiting for its own tool must not hold one of the global slots,
+        # or a backlog of one tool starves every other tool
+        async with self._semaphore(job.tool), self._global:
+            while True:
+                attempt += 1
+                rc, timed_out, error, metrics = await self._attempt(job, stdout_log, stderr_log, attempt)
+                if metrics:
+                    cpu = (cpu or 0.0) + metrics["cpu"]
+                    peak_rss_kb = max(peak_rss_kb or 0, metrics["peak_rss_kb"])
+                retryable = timed_out or (rc not in (0, 127) and job.retry_on_error)
+                if not retryable or attempt > job.retries:
+                    break
+                print(f"🔁 {job.name}: {error or f'exit status {rc}'}, retry {attempt}/{job.retries}", flush=True)
+                await asyncio.sleep(RETRY_BACKOFF * 2 ** (attempt - 1))
+        result = JobResult(job, rc, attempt, time.time() - start, timed_out, stdout_log, stderr_log, error,
+                           cpu=cpu, peak_rss_kb=peak_rss_kb)
+        get_tracer().record(job.name, "external", start, result.elapsed, cpu=cpu, peak_rss_kb=peak_rss_kb,
+                            status="timeout" if timed_out else ("ok" if result.ok else "failed"),
+                            exit_status=rc, target=job.target, tool=job.tool, attempts=attempt)
+        return result
+
+    async def run_many(self, jobs):
+        """Run *jobs* concurrently within the limits; results keep the input order."""
+        return await asyncio.gather(*(self.run_one(job) for job in jobs))
+
+
+def run_jobs(jobs, log_dir=LOG_DIR, limits=None, max_parallel=None):
+    """Blocking entry point for the synchronous scripts."""
+    runner = AsyncRunner(log_dir, limits, max_parallel)
+    return asyncio.run(runner.run_many(list(jobs)))
+
+
+def run_job(job, log_dir=LOG_DIR):
+    return run_jobs([job], log_dir)[0]
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Run one external command through the async runner.")
+    parser.add_argument("--tool", default="generic", help="Tool class for timeouts/limits")
+    parser.add_argument("--name", help="Job name (default: command basename)")
+    parser.add_argument("--timeout", type=float, help="Timeout in seconds")
+    parser.add_argument("--retries", type=int, help="Retries after a timeout")
+    parser.add_argument("--log-dir", default=LOG_DIR)
+    parser.add_argument("cmd", nargs=argparse.REMAINDER, help="Command to run (after --)")
+    args = parser.parse_args()
+
+    cmd = args.cmd[1:] if args.cmd[:1] == ["--"] else args.cmd
+    if not cmd:
+        parser.error("no command given")
+    job = Job(args.name or Path(cmd[0]).name, cmd, tool=args.tool,
+              timeout=args.timeout, retries=args.retries)
+    result = run_job(job, args.log_dir)
+    print(f"{'✅' if result.ok else '❌'} {result}")
+    print(f"   logs: {result.stdout_log}, {result.stderr_log}")
+    sys.exit(0 if result.ok else (result.returncode or 1))
+
+
+if __name__ == "__main__":
+    main()
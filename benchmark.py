@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+"""
+benchmark.py
+--------------------
+Reproducible throughput benchmarks for the Python side of the pipeline.
+
+Everything runs in a temporary directory against synthetic inputs:
+• synthetic PDB/mmCIF libraries of configurable size and chain length
+  (deterministic, seeded), with pLDDT-like B-factors;
+• stub executables that mimic the output formats of `import.pl`, `dali.pl`,
+  `hmmscan` and `protenix` with a controllable latency (--latency).
+
+Benchmarks:
+    dali        DaliPipeline import → compare → extract, targets/sec vs. workers
+    zscores     extract_zscores over many DALI summary files
+    convert     mmCIF → PDB (gemmi, as convert.py) and structstore build
+    memory      peak RSS of a structstore build vs. library size
+    fasta       fasta2json parse_fasta/build_json on a large FASTA
+    seeds       seedsched.py adaptive seeds with the stub predictor
+    startup     `ppipe` --help / subcommand --help latency; fails outright if
+                `import ppipe` or parsing the command line loads gemmi,
+                Biopython, NumPy, SciPy or PyMOL
+    interface   interface.py KD-tree contacts over multi-chain samples
+    service     ppserve.py /annotate requests/sec from concurrent clients:
+                micro-batched, one request per batch, and process-per-request
+
+Results are compared with the baseline committed next to this script
+(bench_baseline.json, one section per size: "full" and "quick"); any metric
+that is worse than the baseline by more than --tolerance fails the run.
+With --ci a missing baseline, or a metric the baseline does not cover, fails
+the run as well, so the gate cannot pass by silently comparing nothing.
+The numbers are host-specific: re-record them on the CI host with
+--save-baseline when it changes.
+
+Usage:
+    python benchmark.py                       # run all, compare with baseline
+    python benchmark.py --quick dali zscores  # small sizes, selected benchmarks
+    python benchmark.py --quick --ci          # regression gate
+    python benchmark.py --save-baseline       # record the current numbers
+    python benchmark.py --quick --save-baseline --keep-worst   # widen it by another run
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPT_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(SCRIPT_DIR))
+sys.path.insert(0, str(SCRIPT_DIR / "src_gadget"))
+
+BASELINE = SCRIPT_DIR / "bench_baseline.json"
+TOLERANCE = 0.25
+MIN_DELTA_SECONDS = 0.02    # latencies of a few ms are noise at any relative tolerance
+SEED = 1234
+
+AMINO = "ACDEFGHIKLMNPQRSTVWY"
+ONE_TO_THREE = {
+    "A": "ALA", "C": "CYS", "D": "ASP", "E": "GLU", "F": "PHE", "G": "GLY",
+    "H": "HIS", "I": "ILE", "K": "LYS", "L": "LEU", "M": "MET", "N": "ASN",
+    "P": "PRO", "Q": "GLN", "R": "ARG", "S": "SER", "T": "THR", "V": "VAL",
+    "W": "TRP", "Y": "TYR",
+}
+
+
+# ── synthetic structures ──────────────────────────────────────────────────────
+def synthetic_chain(length, rng):
+    """Backbone (N, CA, C, O) of a kinked helix-like trace with pLDDT-ish B-factors."""
+    atoms = []
+    x0, y0, z0 = rng.uniform(-20, 20), rng.uniform(-20, 20), rng.uniform(-20, 20)
+    phase = rng.uniform(0, 2 * math.pi)
+    plddt = 70.0
+    for i in range(length):
+        t = phase + math.radians(100) * i
+        # bend the helix axis every 40 residues so chains are not all identical
+        bend = (i // 40) * 0.6
+        ca = (x0 + 2.3 * math.cos(t) + 1.5 * i * math.sin(bend),
+              y0 + 2.3 * math.sin(t),
+              z0 + 1.5 * i * math.cos(bend))
+        plddt = min(98.0, max(25.0, plddt + rng.gauss(0, 4)))
+        # low confidence termini, as in typical predicted models
+        b = plddt if 10 <= i < length - 10 else min(plddt, 40.0)
+        for name, (dx, dy, dz) in (("N", (-0.5, 1.2, -0.6)), ("CA", (0, 0, 0)),
+                                   ("C", (0.6, -1.2, 0.7)), ("O", (1.6, -1.4, 0.9))):
+            atoms.append((name, ca[0] + dx, ca[1] + dy, ca[2] + dz, b))
+    return atoms
+
+
+def synthetic_pdb_text(sequence_by_chain, rng):
+    lines, serial = [], 0
+    for chain_id, seq in sequence_by_chain.items():
+        backbone = synthetic_chain(len(seq), rng)
+        for i, aa in enumerate(seq):
+            for name, x, y, z, b in backbone[4 * i:4 * i + 4]:
+                serial += 1
+                lines.append(f"ATOM  {serial:5d}  {name:<3s} {ONE_TO_THREE[aa]} {chain_id}{i + 1:4d}    "
+                             f"{x:8.3f}{y:8.3f}{z:8.3f}  1.00{b:6.2f}           {name[0]}\n")
+        lines.append("TER\n")
+    lines.append("END\n")
+    return "".join(lines)
+
+
+def random_sequence(length, rng):
+    return "".join(rng.choice(AMINO) for _ in range(length))
+
+
+def make_library(out_dir, n_structures, chain_length, n_chains=1, fmt="pdb", seed=SEED):
+    """Write *n_structures* synthetic entries (syn0000.pdb …) into *out_dir*."""
+    rng = random.Random(seed)
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for n in range(n_structures):
+        chains = {chr(ord("A") + c): random_sequence(chain_length, rng) for c in range(n_chains)}
+        text = synthetic_pdb_text(chains, rng)
+        path = out_dir / f"syn{n:04d}.pdb"
+        path.write_text(text)
+        if fmt == "cif":
+            import gemmi  # pip install gemmi
+            st = gemmi.read_structure(str(path))
+            st.setup_entities()
+            cif_path = path.with_suffix(".cif")
+            st.make_mmcif_document().write_file(str(cif_path))
+            path.unlink()
+            path = cif_path
+        paths.append(path)
+    return paths
+
+
+def make_fasta(path, n_records, length, seed=SEED):
+    rng = random.Random(seed)
+    with Path(path).open("w") as fh:
+        for n in range(n_records):
+            seq = random_sequence(length, rng)
+            fh.write(f">syn{n:05d} synthetic\n")
+            for i in range(0, len(seq), 60):
+                fh.write(seq[i:i + 60] + "\n")
+
+
+# ── stub tools ────────────────────────────────────────────────────────────────
+STUB_HEADER = f"""#!{sys.executable}
+import os, sys, time, random, json
+from pathlib import Path
+time.sleep(float(os.environ.get("STUB_LATENCY", "0")))
+args = sys.argv[1:]
+def opt(name, default=None):
+    return args[args.index(name) + 1] if name in args else default
+"""
+
+STUBS = {
+    "import.pl": """
+pdbid, dat = opt("--pdbid"), Path(opt("--dat"))
+chains = sorted({line[21] for line in open(opt("--pdbfile")) if line.startswith("ATOM")})
+for ch in chains:
+    n = sum(1 for line in open(opt("--pdbfile")) if line.startswith("ATOM") and line[21] == ch and line[12:16] == " CA ")
+    (dat / f"{pdbid}{ch}.dat").write_text(f">>>> {pdbid}{ch} {n}\\n-ca\\n" + "   0   0   0\\n" * n)
+print(f"imported {pdbid}: {len(chains)} chains")
+""",
+    "dali.pl": """
+cd1, cd2 = opt("--cd1"), opt("--cd2")
+rng = random.Random(cd1 + cd2)
+z = rng.uniform(2, 40)
+Path(f"{cd1}.txt").write_text(
+    f"# Job: {cd1}\\n# Query: {cd1}\\n# No:  Chain   Z    rmsd lali nres  %id PDB  Description\\n"
+    f"   1:  {cd2[:-1].lower()}-{cd2[-1]}  {z:4.1f}  {rng.uniform(0.5, 4):4.1f}  {rng.randint(50, 300):3d}"
+    f"  {rng.randint(100, 400):4d}  {rng.randint(5, 100):3d}   MOLECULE: SYNTHETIC;\\n")
+""",
+    "hmmscan": """
+out, fasta = opt("--domtblout"), args[-1]
+names = [l[1:].split()[0] for l in open(fasta) if l.startswith(">")]
+with open(out, "w") as fh:
+    fh.write("# target name accession tlen query name accession qlen E-value score bias # of c-Evalue i-Evalue score bias from to from to from to acc description\\n")
+    for q in names:
+        for k, sf in enumerate(("52540", "46458")):
+            fh.write(f"{sf:<10s} - 200 {q} - 300 {1e-20 * (k + 1):.1e} 120.0 0.1 1 1 1e-20 1e-20 119.0 0.1 1 190 {10 + 150 * k} {140 + 150 * k} 5 150 0.95 -\\n")
+print(f"scanned {len(names)} sequences")
+""",
+    "protenix": """
+src, out_dir = opt("--input"), Path(opt("--out_dir"))
+seeds = [int(s) for s in opt("--seeds", "101").split(",")]
+data = json.load(open(src))
+bench_dir = os.environ["STUB_BENCH_DIR"]
+sys.path.insert(0, bench_dir)
+import gemmi
+from benchmark import synthetic_pdb_text
+for entry in data:
+    name = entry.get("name", Path(src).stem)
+    chains = {}
+    for k, seq in enumerate(entry["sequences"]):
+        pc = seq.get("proteinChain")
+        if pc:
+            for _ in range(pc.get("count", 1)):
+                chains[chr(ord("A") + len(chains))] = pc["sequence"]
+    for seed in seeds:
+        pred = out_dir / name / f"seed_{seed}" / "predictions"
+        pred.mkdir(parents=True, exist_ok=True)
+        for sample in range(5):
+            rng = random.Random(f"{name}-{seed}-{sample}")
+            st = gemmi.read_pdb_string(synthetic_pdb_text(chains, rng))
+            st.name = name
+            st.setup_entities()
+            st.make_mmcif_document().write_file(str(pred / f"{name}_seed_{seed}_sample_{sample}.cif"))
+            conf = {"plddt": rng.uniform(40, 95), "ptm": rng.uniform(0.3, 0.95),
+                    "iptm": rng.uniform(0.2, 0.9), "gpde": rng.uniform(0.3, 2.0),
+                    "ranking_score": rng.uniform(0.2, 0.95),
+                    "chain_ptm": [rng.uniform(0.3, 0.95) for _ in chains],
+                    "chain_plddt": [rng.uniform(40, 95) for _ in chains]}
+            (pred / f"{name}_seed_{seed}_summary_confidence_sample_{sample}.json").write_text(json.dumps(conf, indent=4))
+print(f"predicted {len(data)} entries x {len(seeds)} seeds")
+""",
+}
+
+
+def write_stubs(stub_dir):
+    """Create the stub executables in *stub_dir*; returns {tool: path}."""
+    stub_dir = Path(stub_dir)
+    stub_dir.mkdir(parents=True, exist_ok=True)
+    paths = {}
+    for name, body in STUBS.items():
+        path = stub_dir / name
+        path.write_text(STUB_HEADER + body)
+        path.chmod(0o755)
+        paths[name] = path
+    return paths
+
+
+def stub_env(latency):
+    os.environ["STUB_LATENCY"] = str(latency)
+    os.environ["STUB_BENCH_DIR"] = str(SCRIPT_DIR)
+
+
+# ── helpers ───────────────────────────────────────────────────────────────────
+@contextlib.contextmanager
+def working_dir(path):
+    old = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(old)
+
+
+@contextlib.contextmanager
+def quiet():
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def timed(func, repeat=3):
+    """Best wall time of *repeat* runs."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def child_peak_rss_kb(code):
+    """Run *code* in a fresh interpreter and return its peak RSS (KiB)."""
+    proc = subprocess.Popen([sys.executable, "-c", code], cwd=SCRIPT_DIR)
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    if proc.returncode != 0:
+        raise RuntimeError(f"benchmark child failed with exit status {proc.returncode}")
+    return usage.ru_maxrss
+
+
+# ── benchmarks ────────────────────────────────────────────────────────────────
+def bench_dali(tmp, sizes, latency):
+    """DaliPipeline end to end with stub tools: targets/sec for each worker count."""
+    from dali import DaliPipeline
+
+    stubs = write_stubs(tmp / "stubs")
+    stub_env(latency)
+    results = {}
+    for workers in sizes["workers"]:
+        work = tmp / f"dali_w{workers}"
+        make_library(work / "input_pdbs", sizes["library"], sizes["chain_length"])
+        (work / "input_pdbs" / "syn0000.pdb").rename(work / "input_pdbs" / "refx.pdb")
+        with working_dir(work), quiet():
+            pipeline = DaliPipeline()
+            pipeline.dali_pl, pipeline.import_pl = stubs["dali.pl"], stubs["import.pl"]
+            pipeline.workers = workers
+            start = time.perf_counter()
+            ok = pipeline.run_pipeline()
+            elapsed = time.perf_counter() - start
+        if not ok:
+            raise RuntimeError(f"DaliPipeline failed with {workers} workers")
+        results[f"dali.targets_per_sec.w{workers}"] = (sizes["library"] - 1) / elapsed
+    return results
+
+
+def bench_zscores(tmp, sizes, latency):
+    from dali import DaliPipeline
+
+    work = tmp / "zscores"
+    out = work / "dali_outputs"
+    out.mkdir(parents=True)
+    rng = random.Random(SEED)
+    for n in range(sizes["zscore_files"]):
+        (out / f"SYN{n:05d}A_vs_refxA.txt").write_text(
+            f"# Job: x\n   1:  refx-A  {rng.uniform(2, 40):4.1f}  1.2  150   200   30   MOLECULE: X;\n")
+    with working_dir(work), quiet():
+        pipeline = DaliPipeline()
+        seconds = timed(pipeline.extract_zscores)
+    return {"zscores.files_per_sec": sizes["zscore_files"] / seconds}
+
+
+def bench_convert(tmp, sizes, latency):
+    import gemmi  # pip install gemmi
+    from structstore import build_store
+
+    cifs = make_library(tmp / "cifs", sizes["convert"], sizes["chain_length"], n_chains=2, fmt="cif")
+    out = tmp / "converted"
+    out.mkdir()
+
+    def convert_all():
+        for cif in cifs:
+            gemmi.read_structure(str(cif)).write_pdb(str(out / f"{cif.stem}.pdb"))
+
+    seconds = timed(convert_all)
+    store_seconds = timed(lambda: build_store([tmp / "cifs"], tmp / "lib.ppstore"))
+    return {
+        "convert.cif_to_pdb_per_sec": len(cifs) / seconds,
+        "convert.store_build_per_sec": len(cifs) / store_seconds,
+    }
+
+
+def bench_memory(tmp, sizes, latency):
+    results = {}
+    for n in sizes["memory"]:
+        lib = tmp / f"mem{n}"
+        make_library(lib, n, sizes["chain_length"])
+        code = ("from structstore import build_store; "
+                f"build_store([{str(lib)!r}], {str(lib / 'lib.ppstore')!r})")
+        results[f"memory.store_build_peak_mb.n{n}"] = child_peak_rss_kb(code) / 1024
+    return results
+
+
+def bench_fasta(tmp, sizes, latency):
+    from fasta2json import parse_fasta, build_json
+
+    fasta = tmp / "big.fa"
+    make_fasta(fasta, sizes["fasta_records"], 400)
+    seconds = timed(lambda: build_json(parse_fasta(fasta)))
+    return {"fasta.records_per_sec": sizes["fasta_records"] / seconds}
+
+
+def bench_seeds(tmp, sizes, latency):
+    """Adaptive seed scheduling with the stub predictor: targets/sec and share of seeds saved."""
+    from seedsched import SeedScheduler
+
+    stubs = write_stubs(tmp / "stubs")
+    stub_env(latency)
+    rng = random.Random(SEED)
+    inputs = []
+    for n in range(sizes["seed_targets"]):
+        src = tmp / f"syn{n:04d}.json"
+        src.write_text(json.dumps([{"name": src.stem, "sequences": [
+            {"proteinChain": {"sequence": random_sequence(sizes["chain_length"], rng), "count": 1}}]}]))
+        inputs.append(src)
+    max_seeds = 5
+    with quiet():
+        scheduler = SeedScheduler(stubs["protenix"], tmp / "pred", tmp / "logs", max_seeds=max_seeds,
+                                  extra_args=())
+        start = time.perf_counter()
+        targets = scheduler.run(inputs)
+        elapsed = time.perf_counter() - start
+    used = sum(len(t.seeds) for t in targets)
+    return {
+        "seeds.targets_per_sec": len(inputs) / elapsed,
+        "seeds.saved_fraction": 1 - used / (max_seeds * len(inputs)),
+    }
+
+
+def bench_startup(tmp, sizes, latency):
+    """Interpreter start-up plus argument parsing of ppipe.py, as paid by every short workflow call."""
+    from ppipe import HEAVY_MODULES
+
+    report = f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    probes = {"import ppipe": "import sys, ppipe; " + report}
+    for argv in (["dali", "check"], ["convert"], ["render", "x.pdb", "y.pdb"]):
+        probes[f"parsing `ppipe {' '.join(argv)}`"] = (
+            f"import sys, ppipe; ppipe.build_parser().parse_args({argv!r}); " + report)
+    for label, code in probes.items():
+        loaded = subprocess.run([sys.executable, "-c", code], cwd=SCRIPT_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+        if loaded:
+            raise RuntimeError(f"{label} imported {loaded}")
+
+    def run(*argv):
+        subprocess.run([sys.executable, str(SCRIPT_DIR / "ppipe.py"), *argv],
+                       cwd=tmp, stdout=subprocess.DEVNULL, check=True)
+
+    bare = timed(lambda: subprocess.run([sys.executable, "-c", "pass"], check=True), repeat=sizes["startup_repeat"])
+    return {
+        "startup.help_seconds": timed(lambda: run("--help"), repeat=sizes["startup_repeat"]),
+        "startup.dali_help_seconds": timed(lambda: run("dali", "--help"), repeat=sizes["startup_repeat"]),
+        "startup.python_seconds": bare,
+    }
+
+
+def bench_interface(tmp, sizes, latency):
+    """Interface residues of multi-chain samples (CIF parsing + KD-tree contacts): samples/sec."""
+    import gemmi  # pip install gemmi
+    from ensemble import find_samples
+    from interface import analyze_target
+
+    rng = random.Random(SEED)
+    for t in range(sizes["interface_targets"]):
+        name = f"syn{t:04d}"
+        pred = tmp / "pred" / name / "seed_101" / "predictions"
+        pred.mkdir(parents=True)
+        chains = {chr(ord("A") + c): random_sequence(sizes["chain_length"], rng) for c in range(3)}
+        for sample in range(sizes["interface_samples"]):
+            st = gemmi.read_pdb_string(synthetic_pdb_text(chains, rng))
+            st.setup_entities()
+            st.make_mmcif_document().write_file(str(pred / f"{name}_seed_101_sample_{sample}.cif"))
+    targets = find_samples(tmp / "pred")
+    start = time.perf_counter()
+    for (_, target), samples in targets.items():
+        analyze_target(target, samples, tmp / "out")
+    return {"interface.samples_per_sec": sum(map(len, targets.values())) / (time.perf_counter() - start)}
+
+
+def bench_service(tmp, sizes, latency):
+    """ppserve.py on localhost with the stub hmmscan, against one Python process per request."""
+    import threading
+    import urllib.request
+    from concurrent.futures import ThreadPoolExecutor
+    from ppserve import Service, make_server
+
+    stubs = write_stubs(tmp / "stubs")
+    stub_env(latency)
+    n, clients = sizes["service_requests"], sizes["service_clients"]
+    body = json.dumps({"sequence": random_sequence(sizes["chain_length"], random.Random(SEED))}).encode()
+    results = {}
+    for label, max_batch in (("batched", 32), ("unbatched", 1)):
+        service = Service(None, tmp / label, stubs["hmmscan"], tmp / "hmmlib", protenix=stubs["protenix"],
+                          max_batch=max_batch)
+        service.start()
+        server = make_server(service, port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/annotate?wait=600"
+
+        def post(_):
+            with urllib.request.urlopen(urllib.request.Request(url, data=body)) as response:
+                if json.load(response)["status"] != "done":
+                    raise RuntimeError("ppserve annotate request failed")
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(clients) as pool:
+            list(pool.map(post, range(n)))
+        results[f"service.annotate_per_sec.{label}"] = n / (time.perf_counter() - start)
+        server.shutdown()
+        server.server_close()
+        service.stop()
+
+    # What callers did before: one interpreter per request, importing the scan/parse code
+    fasta = tmp / "one.fa"
+    fasta.write_text(f">q\n{json.loads(body)['sequence']}\n")
+    code = ("import sys; from asyncrunner import Job, run_job; from supfampred import parse_domtbl; "
+            "tbl = sys.argv[1] + '.tbl'; "
+            f"run_job(Job('hmmscan', [{str(stubs['hmmscan'])!r}, '--domtblout', tbl, sys.argv[2]], "
+            "tool='hmmscan'), sys.argv[1]); parse_domtbl(tbl)")
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([str(SCRIPT_DIR), str(SCRIPT_DIR / "src_gadget")])}
+
+    def spawn(k):
+        subprocess.run([sys.executable, "-c", code, str(tmp / f"proc{k}"), str(fasta)], env=env,
+                       stdout=subprocess.DEVNULL, check=True)
+
+    n_proc = max(1, n // 4)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(clients) as pool:
+        list(pool.map(spawn, range(n_proc)))
+    results["service.annotate_per_sec.process"] = n_proc / (time.perf_counter() - start)
+    return results
+
+
+BENCHMARKS = {
+    "dali": bench_dali,
+    "zscores": bench_zscores,
+    "convert": bench_convert,
+    "memory": bench_memory,
+    "fasta": bench_fasta,
+    "seeds": bench_seeds,
+    "startup": bench_startup,
+    "interface": bench_interface,
+    "service": bench_service,
+}
+
+SIZES = {
+    "full": {"workers": [1, 2, 4, 8], "library": 40, "chain_length": 250, "zscore_files": 5000,
+             "convert": 40, "memory": [10, 50, 200], "fasta_records": 20000,
+             "seed_targets": 20, "startup_repeat": 10,
+             "service_requests": 400, "service_clients": 32, "interface_targets": 20, "interface_samples": 25},
+    "quick": {"workers": [1, 4], "library": 8, "chain_length": 120, "zscore_files": 500,
+              "convert": 8, "memory": [5, 20], "fasta_records": 2000,
+              "seed_targets": 4, "startup_repeat": 3,
+              "service_requests": 64, "service_clients": 16, "interface_targets": 4, "interface_samples": 5},
+}
+
+
+def lower_is_better(metric):
+    """Throughput metrics (*_per_sec) should go up; memory and latency should go down."""
+    return "_mb" in metric or "seconds" in metric
+
+
+def compare_with_baseline(results, baseline, tolerance):
+    """Return the list of regressions (metric, baseline, current)."""
+    regressions = []
+    for metric, value in results.items():
+        if metric not in baseline:
+            continue
+        ref = baseline[metric]
+        if lower_is_better(metric):
+            slack = max(ref * tolerance, MIN_DELTA_SECONDS if "seconds" in metric else 0.0)
+            worse = value > ref + slack
+        else:
+            worse = value < ref * (1 - tolerance)
+        if worse:
+            regressions.append((metric, ref, value))
+    return regressions
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Reproducible throughput benchmarks with synthetic inputs.")
+    parser.add_argument("benchmarks", nargs="*",
+                        help=f"Benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--quick", action="store_true", help="Small sizes for a fast smoke run")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub tool latency in seconds")
+    parser.add_argument("--baseline", default=BASELINE, help=f"Baseline file (default: {BASELINE})")
+    parser.add_argument("--save-baseline", action="store_true", help="Store these results as the baseline")
+    parser.add_argument("--keep-worst", action="store_true",
+                        help="With --save-baseline: keep the worse of the stored and the new value per metric "
+                             "(record over several runs to absorb the host's noise)")
+    parser.add_argument("--ci", action="store_true",
+                        help="Fail when there is no baseline or a metric is missing from it")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE, help="Allowed relative regression")
+    parser.add_argument("--json", help="Also write the results to this JSON file")
+    args = parser.parse_args()
+
+    names = args.benchmarks or list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    sizes = SIZES["quick" if args.quick else "full"]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="ppbench_") as tmp:
+        for name in names:
+            print(f"⏱️  {name} ...", flush=True)
+            bench_tmp = Path(tmp) / name
+            bench_tmp.mkdir()
+            results.update(BENCHMARKS[name](bench_tmp, sizes, args.latency))
+
+    mode = "quick" if args.quick else "full"
+    baseline_path = Path(args.baseline)
+    stored = json.loads(baseline_path.read_text()) if baseline_path.exists() else {}
+    baseline = stored.get(mode, {})
+    print(f"\n{'metric':<40s} {'value':>12s} {'baseline':>12s}")
+    for metric, value in results.items():
+        ref = baseline.get(metric)
+        print(f"{metric:<40s} {value:12.2f} {'' if ref is None else f'{ref:12.2f}'}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    if args.save_baseline:
+        if args.keep_worst:
+            results = {k: v if k not in baseline else (max if lower_is_better(k) else min)(v, baseline[k])
+                       for k, v in results.items()}
+        stored[mode] = {**baseline, **{k: round(v, 4) for k, v in results.items()}}
+        baseline_path.write_text(json.dumps(stored, indent=2, sort_keys=True) + "\n")
+        print(f"\n✅ {mode} baseline saved to {baseline_path}")
+        return
+
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    uncovered = [metric for metric in results if metric not in baseline]
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) beyond {args.tolerance:.0%}:")
+        for metric, ref, value in regressions:
+            print(f"   {metric}: {ref:.2f} → {value:.2f}")
+    if uncovered:
+        print(f"\n{'❌' if args.ci else '⚠️'} No {mode} baseline in {baseline_path} for: {', '.join(uncovered)} "
+              f"(run with --save-baseline{' --quick' if args.quick else ''})")
+    if regressions or (args.ci and uncovered):
+        sys.exit(1)
+    if not uncovered:
+        print("\n✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
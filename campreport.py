@@ -0,0 +1,448 @@
+#!/usr/bin/env python3
+"""
+campreport.py
+--------------------
+Incremental static HTML report over a whole prediction campaign.
+
+One index page lists every target (best Protenix confidences, ensemble
+spread, top SUPERFAMILY assignment, top DALI hit); every target gets its own
+page with the full tables.  Inputs per target, as laid out by stagedag.py:
+
+    predicted_structures/tmp_X/**/X_seed_S_summary_confidence_sample_N.json
+        or, once packed, archive/tmp_X/X.ppred.npz   predarchive.py
+    work/X/X_ensemble.json                  ensemble.py
+    work/X/zscore_summary.csv, zscore_wide.csv   dali.py
+    <supfam results>/X.html                 supfamhtml.py
+
+With --store (a structstore.py store of the predictions) a target page also
+lists the chains of the best sample with their mean pLDDT, read from the store
+instead of parsing the mmCIF; samples missing from the store or changed since
+it was built are left out.
+
+Rebuilds are incremental: every input file is content-hashed (a file whose
+size and mtime did not change keeps its cached hash), and a target page is
+only re-rendered when the hash over its inputs changed.  The index table is
+split into chunks of --chunk rows that the browser loads on demand, so a
+10k-target report opens instantly; only chunks whose rows changed are
+rewritten.  Chunks are small .js files (JSON wrapped in a function call)
+because browsers refuse fetch() of JSON from file:// URLs.
+
+Usage:
+    python campreport.py [--out report/] [--work-dir work] [--pred-dir predicted_structures] [--archive-dir archive]
+                         [--supfam-dir /mnt/data2/supfam/fangshun/supfamresults] [--chunk 500]
+                         [--store predictions.ppstore]
+"""
+
+import argparse
+import csv
+import hashlib
+import html
+import json
+import os
+import re
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+from shardlayout import ShardedDir
+from stagedag import FASTA_DIR, PRED_DIR, SUPFAM_RESULTS, WORK_DIR
+
+REPORT_VERSION = 1      # bump when the page layout changes to force a full rebuild
+OUT_DIR = "report"
+ARCHIVE_DIR = "archive"  # predarchive.py pack --archive
+CHUNK = 500             # index rows per lazily loaded chunk
+TOP_HITS = 25           # DALI hits shown inline on a target page; the rest load on demand
+LOW_PLDDT = 50.0        # residues below this pLDDT count as low confidence on the best-model table
+MANIFEST = "manifest.json"
+CONF_RE = re.compile(r"_seed_(?P<seed>\d+)_summary_confidence_sample_(?P<sample>\d+)\.json$")
+INDEX_COLUMNS = ["target", "ranking_score", "ptm", "iptm", "plddt", "n_samples", "mean_pairwise_rmsd",
+                 "n_clusters", "superfamily", "sf_evalue", "top_hit", "top_z", "hits_z2"]
+
+
+# ── inputs ────────────────────────────────────────────────────────────────────
+def target_inputs(name, work_dir, pred_dir, supfam_dir, archive_dir=ARCHIVE_DIR):
+    """{kind: [paths]} of the existing input files of one target."""
+    tdir = Path(work_dir) / name
+    pred = ShardedDir(pred_dir, "pred")
+    tmp = pred.path(f"tmp_{name}")
+    confidence = sorted(tmp.rglob("*_summary_confidence_sample_*.json"))
+    archives = []
+    if not confidence:
+        # After `predarchive.py pack --remove` the confidences are in the archive, under the same relative path
+        from predarchive import find_archives
+        archives = find_archives(tmp) or find_archives(Path(archive_dir) / tmp.relative_to(pred.root))
+    inputs = {
+        "confidence": confidence,
+        "archive": archives,
+        "ensemble": [tdir / f"{name}_ensemble.json"],
+        "zscores": [tdir / "zscore_summary.csv"],
+        "zscores_wide": [tdir / "zscore_wide.csv"],
+        "superfamily": [Path(supfam_dir) / f"{name}.html"],
+    }
+    return {kind: [p for p in paths if p.is_file()] for kind, paths in inputs.items()}
+
+
+def discover_targets(work_dir, pred_dir, fasta_dir, supfam_dir):
+    names = {p.stem for p in Path(fasta_dir).glob("*.fa")}
+    names |= {p.name for p in Path(work_dir).glob("*") if p.is_dir()}
+    names |= {n[len("tmp_"):] for n in ShardedDir(pred_dir, "pred").names() if n.startswith("tmp_")}
+    names |= {p.stem for p in Path(supfam_dir).glob("*.html")}
+    return sorted(names)
+
+
+def file_hash(path, cache):
+    """sha256 of *path*; reused from *cache* while size and mtime are unchanged."""
+    st = path.stat()
+    key = str(path)
+    cached = cache.get(key)
+    if cached and cached[0] == st.st_size and cached[1] == st.st_mtime_ns:
+        return cached[2]
+    h = hashlib.sha256()
+    with path.open("rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    cache[key] = [st.st_size, st.st_mtime_ns, h.hexdigest()]
+    return cache[key][2]
+
+
+def cif_path(conf_json):
+    """Protenix mmCIF next to a *_summary_confidence_sample_N.json"""
+    conf_json = Path(conf_json)
+    return conf_json.with_name(conf_json.name.replace("_summary_confidence_sample_", "_sample_")[:-5] + ".cif")
+
+
+_stores = {}
+
+
+def open_store(path):
+    """StructStore at *path*, opened once per process"""
+    if path not in _stores:
+        from structstore import StructStore
+        _stores[path] = StructStore(path)
+    return _stores[path]
+
+
+# ── parsers ───────────────────────────────────────────────────────────────────
+def read_confidences(paths, archives=()):
+    """Confidence rows of the summary JSONs *paths* and of packed *archives*, best first."""
+    rows = []
+    for path in paths:
+        m = CONF_RE.search(path.name)
+        try:
+            conf = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        rows.append({"seed": int(m["seed"]), "sample": int(m["sample"]), "cif": cif_path(path),
+                     **{k: conf.get(k) for k in ("ranking_score", "ptm", "iptm", "plddt")}})
+    for path in archives:
+        from predarchive import read_meta
+        try:
+            meta = read_meta(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            continue
+        for key, entry in meta["confidences"].items():
+            seed, sample = map(int, key.split(":"))
+            # No mmCIF left on disk for the store to be looked up by
+            rows.append({"seed": seed, "sample": sample, "cif": None,
+                         **{k: entry["data"].get(k) for k in ("ranking_score", "ptm", "iptm", "plddt")}})
+    rows.sort(key=lambda r: -(r["ranking_score"] if r["ranking_score"] is not None else r["ptm"] or 0))
+    return rows
+
+
+def _text(cell):
+    return " ".join(html.unescape(re.sub(r"<[^>]+>", " ", cell.replace("<br>", ""))).split())
+
+
+def read_superfamily(path):
+    """Assignment rows of a SUPERFAMILY results page (rows without a match are skipped)."""
+    text = path.read_text(errors="replace")
+    rows = []
+    for row in re.findall(r"<tr>(.*?)</tr>", text, re.S):
+        cells = re.findall(r"<th>(.*?)</th>", row, re.S)
+        if len(cells) < 7 or cells[0] == "Seq_ID" or _text(cells[1]) in ("-", ""):
+            continue
+        sunid = re.search(r"sunid=(\d+)", cells[3])
+        rows.append({"seq_id": _text(cells[0]), "region": _text(cells[1]), "evalue": _text(cells[2]),
+                     "superfamily": _text(cells[3]), "sunid": sunid[1] if sunid else "",
+                     "family_evalue": _text(cells[4]), "family": _text(cells[5]), "closest": _text(cells[6])})
+    return rows
+
+
+def read_model_chains(store, cif):
+    """Per-chain rows of a predicted model from the store; [] if the store does not hold the current file."""
+    rows = []
+    for view in open_store(store).source_chains(cif) or []:
+        plddt = view.plddt[view.polymer_mask]
+        rows.append({"chain": view.chain, "residues": int(len(plddt)),
+                     "mean_plddt": float(plddt.mean()) if len(plddt) else None,
+                     f"plddt<{LOW_PLDDT:g}": int((plddt < LOW_PLDDT).sum())})
+    return rows
+
+
+def read_csv(path):
+    with path.open(newline="") as fh:
+        return list(csv.DictReader(fh))
+
+
+def _float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# ── rendering ─────────────────────────────────────────────────────────────────
+STYLE = """<style>
+body{font-family:sans-serif;margin:1.5em;color:#222}table{border-collapse:collapse;font-size:13px}
+th,td{border:1px solid #ccc;padding:3px 7px;text-align:left}th{background:#f0f0f0;cursor:pointer}
+tr.best td{background:#eaf6ea}.muted{color:#888}nav{margin:.6em 0}button{margin-right:.4em}
+</style>"""
+
+
+def _table(columns, rows, cls=""):
+    head = "".join(f"<th>{html.escape(c)}</th>" for c in columns)
+    body = "".join(
+        f"<tr{' class=best' if i == 0 and cls == 'best' else ''}>"
+        + "".join(f"<td>{html.escape(_fmt(r.get(c)))}</td>" for c in columns) + "</tr>"
+        for i, r in enumerate(rows))
+    return f"<table><tr>{head}</tr>{body}</table>"
+
+
+def _fmt(value):
+    if value is None:
+        return "-"
+    if isinstance(value, float):
+        return f"{value:.3f}"
+    return str(value)
+
+
+def build_target(name, inputs, out_dir, store=None):
+    """Render work/X inputs into <out>/targets/X.html (+ X.hits.js); returns the index row."""
+    conf = read_confidences(inputs["confidence"], inputs.get("archive", []))
+    ensemble = json.loads(inputs["ensemble"][0].read_text()) if inputs["ensemble"] else {}
+    zscores = read_csv(inputs["zscores"][0]) if inputs["zscores"] else []
+    for row in zscores:
+        row["zscore"] = _float(row.get("zscore"))
+    zscores.sort(key=lambda r: -(r["zscore"] if r["zscore"] is not None else -1e9))
+    wide = read_csv(inputs["zscores_wide"][0]) if inputs["zscores_wide"] else []
+    supfam = read_superfamily(inputs["superfamily"][0]) if inputs["superfamily"] else []
+    supfam.sort(key=lambda r: _float(r["evalue"]) if _float(r["evalue"]) is not None else 1e9)
+
+    best = conf[0] if conf else {}
+    chains = read_model_chains(store, best["cif"]) if store and best.get("cif") else []
+    row = {
+        "target": name,
+        **{k: best.get(k) for k in ("ranking_score", "ptm", "iptm", "plddt")},
+        "n_samples": len(conf) or ensemble.get("n_samples"),
+        "mean_pairwise_rmsd": ensemble.get("mean_pairwise_rmsd"),
+        "n_clusters": len(ensemble["clusters"]) if "clusters" in ensemble else None,
+        "superfamily": supfam[0]["superfamily"] if supfam else None,
+        "sf_evalue": supfam[0]["evalue"] if supfam else None,
+        "top_hit": zscores[0]["chain_id"] if zscores else None,
+        "top_z": zscores[0]["zscore"] if zscores else None,
+        "hits_z2": sum(1 for r in zscores if r["zscore"] is not None and r["zscore"] >= 2) if zscores else None,
+    }
+
+    parts = [f"<!DOCTYPE html><html><head><meta charset='utf-8'><title>{html.escape(name)}</title>{STYLE}</head><body>",
+             f"<p><a href='../index.html'>← campaign</a></p><h1>{html.escape(name)}</h1>"]
+    parts.append("<h2>Protenix confidence</h2>")
+    parts.append(_table(["seed", "sample", "ranking_score", "ptm", "iptm", "plddt"], conf, "best")
+                 if conf else "<p class=muted>no predictions</p>")
+    if chains:
+        parts.append(f"<h2>Best model (seed {best['seed']}, sample {best['sample']})</h2>")
+        parts.append(_table(list(chains[0]), chains))
+    if ensemble:
+        parts.append("<h2>Ensemble</h2>")
+        parts.append(_table(["n_samples", "n_residues", "mean_pairwise_rmsd", "clusters", "medoid"],
+                            [{**ensemble, "clusters": len(ensemble.get("clusters", []))}]))
+    parts.append("<h2>SUPERFAMILY</h2>")
+    parts.append(_table(["seq_id", "region", "evalue", "superfamily", "sunid", "family", "closest"], supfam)
+                 if supfam else "<p class=muted>no assignments</p>")
+    parts.append("<h2>DALI</h2>")
+    if zscores:
+        columns = [c for c in zscores[0] if c != ""]
+        parts.append(f"<div id=hits>{_table(columns, zscores[:TOP_HITS])}</div>")
+        if len(zscores) > TOP_HITS:
+            hits_js = Path(out_dir) / "targets" / f"{name}.hits.js"
+            hits_js.write_text(f"showHits({json.dumps({'columns': columns, 'rows': zscores})});\n")
+            parts.append(f"<button onclick=\"var s=document.createElement('script');"
+                         f"s.src={json.dumps(hits_js.name)};document.body.appendChild(s);this.remove()\">"
+                         f"show all {len(zscores)} hits</button>")
+            parts.append(HITS_JS)
+    else:
+        parts.append("<p class=muted>no Z-scores</p>")
+    if wide:
+        parts.append("<h2>DALI, all references</h2>")
+        parts.append(_table(list(wide[0]), wide[:TOP_HITS]))
+    parts.append("</body></html>")
+    page = Path(out_dir) / "targets" / f"{name}.html"
+    tmp = page.with_name(page.name + ".tmp")
+    tmp.write_text("".join(parts))
+    os.replace(tmp, page)
+    return row
+
+
+HITS_JS = """<script>
+function showHits(d){var h='<table><tr>'+d.columns.map(function(c){return '<th>'+c+'</th>'}).join('')+'</tr>';
+d.rows.forEach(function(r){h+='<tr>'+d.columns.map(function(c){return '<td>'+(r[c]==null?'-':r[c])+'</td>'}).join('')+'</tr>'});
+document.getElementById('hits').innerHTML=h+'</table>'}
+</script>"""
+
+
+INDEX_HTML = """<!DOCTYPE html><html><head><meta charset='utf-8'><title>Campaign report</title>{style}</head><body>
+<h1>Campaign report</h1><p class=muted id=info></p>
+<nav><button onclick="go(-1)">◀</button><span id=page></span> <button onclick="go(1)">▶</button>
+<input id=filter placeholder="filter this page" oninput="render()"></nav>
+<table id=rows></table>
+<script src="data/meta.js"></script>
+<script>
+var chunks={{}}, current=0, sortKey=null, sortDir=1;
+function reportChunk(i,rows){{chunks[i]=rows;if(i===current)render()}}
+function load(i){{if(chunks[i])return render();var s=document.createElement('script');
+s.src='data/'+META.chunks[i];document.body.appendChild(s)}}
+function go(d){{var n=current+d;if(n<0||n>=META.chunks.length)return;current=n;load(n)}}
+function cell(r,c){{var v=r[c];if(v==null)return '-';if(c==='target')return '<a href="targets/'+encodeURIComponent(v)+'.html">'+v+'</a>';
+return typeof v==='number'&&!Number.isInteger(v)?v.toFixed(3):v}}
+function sortBy(c){{sortDir=sortKey===c?-sortDir:1;sortKey=c;render()}}
+function render(){{var rows=(chunks[current]||[]).slice(),f=document.getElementById('filter').value.toLowerCase();
+if(f)rows=rows.filter(function(r){{return JSON.stringify(r).toLowerCase().indexOf(f)>=0}});
+if(sortKey)rows.sort(function(a,b){{var x=a[sortKey],y=b[sortKey];return (x==null)-(y==null)||(x<y?-1:x>y?1:0)*sortDir}});
+var h='<tr>'+META.columns.map(function(c){{return '<th onclick="sortBy(\\''+c+'\\')">'+c+'</th>'}}).join('')+'</tr>';
+rows.forEach(function(r){{h+='<tr>'+META.columns.map(function(c){{return '<td>'+cell(r,c)+'</td>'}}).join('')+'</tr>'}});
+document.getElementById('rows').innerHTML=h;
+document.getElementById('page').textContent='page '+(current+1)+' / '+META.chunks.length}}
+document.getElementById('info').textContent=META.n_targets+' targets, built '+META.built;
+load(0);
+</script></body></html>
+"""
+
+
+# ── incremental build ─────────────────────────────────────────────────────────
+def _build(args):
+    name, inputs, out_dir, store = args
+    return name, build_target(name, {k: [Path(p) for p in v] for k, v in inputs.items()}, out_dir, store)
+
+
+def _write_if_changed(path, text):
+    if path.exists() and path.read_text() == text:
+        return False
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+    return True
+
+
+def build_report(out_dir=OUT_DIR, work_dir=WORK_DIR, pred_dir=PRED_DIR, fasta_dir=FASTA_DIR,
+                 supfam_dir=SUPFAM_RESULTS, chunk=CHUNK, workers=None, force=False, store=None,
+                 archive_dir=ARCHIVE_DIR):
+    """Bring the report in *out_dir* up to date; returns (rebuilt, unchanged, removed, chunks written).
+
+    *store* is a structstore.py file holding the predicted models (optional); *archive_dir* is where
+    predarchive.py packed the predictions whose directories are gone.
+    """
+    out_dir = Path(out_dir)
+    (out_dir / "targets").mkdir(parents=True, exist_ok=True)
+    (out_dir / "data").mkdir(exist_ok=True)
+    manifest_path = out_dir / MANIFEST
+    manifest = json.loads(manifest_path.read_text()) if manifest_path.exists() else {}
+    if force or manifest.get("version") != REPORT_VERSION:
+        manifest = {"version": REPORT_VERSION, "files": {}, "targets": {}}
+    files, old_targets = manifest["files"], manifest["targets"]
+
+    names = discover_targets(work_dir, pred_dir, fasta_dir, supfam_dir)
+    with ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4)) as pool:
+        all_inputs = dict(zip(names, pool.map(lambda n: target_inputs(n, work_dir, pred_dir, supfam_dir, archive_dir), names)))
+        paths = [p for inputs in all_inputs.values() for ps in inputs.values() for p in ps]
+        digests = dict(zip(paths, pool.map(lambda p: file_hash(p, files), paths)))
+
+    todo, targets = [], {}
+    for name, inputs in all_inputs.items():
+        h = hashlib.sha256(name.encode())
+        for kind, ps in sorted(inputs.items()):
+            for p in ps:
+                h.update(f"{kind}\0{p.name}\0{digests[p]}\0".encode())
+        if store:
+            # A page shows the models the store holds, so (re)storing one re-renders it
+            models = open_store(store)
+            for p in inputs["confidence"]:
+                cif = cif_path(p)
+                state = models.sources.get(str(cif.resolve())) if models.is_current(cif) else None
+                h.update(f"store\0{cif.name}\0{state}\0".encode())
+        digest = h.hexdigest()
+        old = old_targets.get(name)
+        if old and old["hash"] == digest and (out_dir / "targets" / f"{name}.html").exists():
+            targets[name] = old
+        else:
+            targets[name] = {"hash": digest}
+            todo.append((name, {k: [str(p) for p in v] for k, v in inputs.items()}, str(out_dir), store))
+
+    if len(todo) > 32 and workers != 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            built = list(pool.map(_build, todo, chunksize=16))
+    else:
+        built = [_build(t) for t in todo]
+    for name, row in built:
+        targets[name]["row"] = row
+
+    removed = [n for n in old_targets if n not in targets]
+    for name in removed:
+        for suffix in (".html", ".hits.js"):
+            (out_dir / "targets" / f"{name}{suffix}").unlink(missing_ok=True)
+    live = {str(p) for p in paths}
+    manifest["files"] = {k: v for k, v in files.items() if k in live}
+    manifest["targets"] = targets
+
+    rows = [targets[n]["row"] for n in sorted(targets)]
+    chunk_names, written = [], 0
+    for i in range(0, max(len(rows), 1), chunk):
+        chunk_name = f"rows_{i // chunk:05d}.js"
+        chunk_names.append(chunk_name)
+        written += _write_if_changed(out_dir / "data" / chunk_name,
+                                     f"reportChunk({i // chunk},{json.dumps(rows[i:i + chunk])});\n")
+    for stale in (out_dir / "data").glob("rows_*.js"):
+        if stale.name not in chunk_names:
+            stale.unlink()
+    meta = {"n_targets": len(rows), "columns": INDEX_COLUMNS, "chunks": chunk_names,
+            "built": time.strftime("%Y-%m-%d %H:%M")}
+    (out_dir / "data" / "meta.js").write_text(f"var META={json.dumps(meta)};\n")
+    _write_if_changed(out_dir / "index.html", INDEX_HTML.format(style=STYLE))
+
+    tmp = manifest_path.with_name(MANIFEST + ".tmp")
+    tmp.write_text(json.dumps(manifest))
+    os.replace(tmp, manifest_path)
+    return len(todo), len(targets) - len(todo), len(removed), written
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Build/refresh the static campaign HTML report.")
+    parser.add_argument("--out", default=OUT_DIR, help=f"Report directory (default: {OUT_DIR})")
+    parser.add_argument("--work-dir", default=WORK_DIR)
+    parser.add_argument("--pred-dir", default=PRED_DIR)
+    parser.add_argument("--archive-dir", default=ARCHIVE_DIR,
+                        help=f"predarchive.py archive root, read for targets packed with --remove (default: {ARCHIVE_DIR})")
+    parser.add_argument("--fasta-dir", default=FASTA_DIR)
+    parser.add_argument("--supfam-dir", default=SUPFAM_RESULTS)
+    parser.add_argument("--chunk", type=int, default=CHUNK, help=f"Index rows per chunk (default: {CHUNK})")
+    parser.add_argument("--workers", type=int, help="Processes for rendering pages (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="Rebuild every page")
+    parser.add_argument("--store", metavar="PPSTORE",
+                        help="structstore.py store of the predictions: list the best model's chains from it")
+    args = parser.parse_args()
+
+    start = time.time()
+    rebuilt, unchanged, removed, chunks = build_report(args.out, args.work_dir, args.pred_dir, args.fasta_dir,
+                                                       args.supfam_dir, args.chunk, args.workers, args.force,
+                                                       args.store, args.archive_dir)
+    total = rebuilt + unchanged
+    if not total:
+        print("❌ No targets found")
+        sys.exit(1)
+    print(f"✅ {args.out}/index.html: {total} targets ({rebuilt} rebuilt, {unchanged} unchanged, "
+          f"{removed} removed), {chunks} index chunk(s) written in {time.time() - start:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+"""
+confagg.py
+--------------------
+Columnar aggregation of all Protenix summary-confidence JSONs.
+
+Confidence values (plddt, ptm, iptm, gpde, ranking_score, chain_ptm,
+chain_pair_iptm, ...) are spread over thousands of small
+    <target>_seed_<S>_summary_confidence_sample_<N>.json
+files.  This script walks the prediction tree in parallel and flattens them
+into one table with a row per run/target/seed/sample:
+
+    run, target, seed, sample, path, mtime key and bookkeeping columns
+                                           (run: the Protenix output directory
+                                           holding seed_<S>/, so two runs of
+                                           one target stay apart)
+    plddt, ptm, iptm, gpde, ...            every scalar field
+    chain_ptm_0, chain_ptm_1, ...          per-chain lists, one column per chain
+    chain_pair_iptm_0_0, _0_1, ...         per-chain-pair matrices (upper triangle)
+
+The table is written as Parquet when pyarrow is installed, otherwise as a
+NumPy .npz with the same columns.  Updates are incremental: only JSONs whose
+mtime changed are re-read, and rows of deleted files are dropped.
+
+Usage:
+    python confagg.py update predicted_structures/ [--table confidence.parquet]
+    python confagg.py query "iptm < 0.6"
+    python confagg.py query "ptm >= 0.8 and chain_pair_iptm_0_1 < 0.5" --targets
+"""
+
+import argparse
+import json
+import operator
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from ensemble import run_dir
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pip install pyarrow
+    pa = pq = None
+
+PRED_DIR = "predicted_structures"
+TABLE = "confidence.parquet" if pq else "confidence.npz"
+KEY_COLUMNS = ["run", "target", "seed", "sample", "path", "mtime"]
+CONF_RE = re.compile(r"^(?P<target>.+)_seed_(?P<seed>\d+)_summary_confidence_sample_(?P<sample>\d+)\.json$")
+PARSE_CHUNK = 64
+
+
+# ── scanning ──────────────────────────────────────────────────────────────────
+def _walk(root):
+    """(path, mtime) of every summary-confidence JSON below *root*."""
+    found = []
+    stack = [root]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif CONF_RE.match(entry.name):
+                    found.append((entry.path, entry.stat().st_mtime))
+    return found
+
+
+def scan(pred_dirs, workers=None):
+    """{path: mtime} for all confidence JSONs; top-level subdirectories are walked in parallel."""
+    roots = []
+    files = {}
+    for pred_dir in pred_dirs:
+        for entry in os.scandir(pred_dir):
+            if entry.is_dir():
+                roots.append(entry.path)
+            elif CONF_RE.match(entry.name):
+                files[entry.path] = entry.stat().st_mtime
+    with ThreadPoolExecutor(max_workers=workers or min(32, (os.cpu_count() or 1) * 4)) as pool:
+        for found in pool.map(_walk, roots):
+            files.update(found)
+    return files
+
+
+def flatten(conf):
+    """One flat {column: value} dict from a summary-confidence JSON."""
+    row = {}
+    for key, value in conf.items():
+        if isinstance(value, bool):
+            row[key] = float(value)
+        elif isinstance(value, (int, float)):
+            row[key] = float(value)
+        elif isinstance(value, list) and value and all(isinstance(v, (int, float)) for v in value):
+            for i, v in enumerate(value):
+                row[f"{key}_{i}"] = float(v)
+        elif isinstance(value, list) and value and all(isinstance(v, list) for v in value):
+            n = len(value)
+            for i in range(n):
+                for j in range(i, n):
+                    row[f"{key}_{i}_{j}"] = float(value[i][j])
+    return row
+
+
+def _parse(items):
+    rows = []
+    for path, mtime in items:
+        m = CONF_RE.match(os.path.basename(path))
+        try:
+            with open(path) as fh:
+                conf = json.load(fh)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping {path}: {e}", file=sys.stderr)
+            continue
+        rows.append({"run": str(run_dir(path)), "target": m["target"], "seed": int(m["seed"]),
+                     "sample": int(m["sample"]), "path": path, "mtime": mtime, **flatten(conf)})
+    return rows
+
+
+def parse_all(items, workers=None):
+    chunks = [items[i:i + PARSE_CHUNK] for i in range(0, len(items), PARSE_CHUNK)]
+    if len(chunks) <= 1:
+        return _parse(items)
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for part in pool.map(_parse, chunks):
+            rows.extend(part)
+    return rows
+
+
+# ── table I/O ─────────────────────────────────────────────────────────────────
+def rows_to_columns(rows):
+    """Column dict of NumPy arrays; missing values become NaN."""
+    names = list(KEY_COLUMNS)
+    for row in rows:
+        names.extend(k for k in row if k not in names)
+    columns = {}
+    for name in names:
+        values = [row.get(name) for row in rows]
+        if name in ("run", "target", "path"):
+            columns[name] = np.array(values, dtype=str)
+        elif name in ("seed", "sample"):
+            columns[name] = np.array(values, dtype=np.int64)
+        else:
+            columns[name] = np.array([np.nan if v is None else v for v in values], dtype=np.float64)
+    return columns
+
+
+def merge_columns(a, b):
+    """Concatenate two column dicts, filling columns missing on one side with NaN."""
+    na, nb = len(a["path"]), len(b["path"])
+    names = list(a) + [k for k in b if k not in a]
+    return {name: np.concatenate([a.get(name, np.full(na, np.nan)), b.get(name, np.full(nb, np.nan))])
+            for name in names}
+
+
+def write_table(columns, table):
+    table = Path(table)
+    tmp = table.with_name(table.name + ".tmp")
+    if table.suffix == ".parquet":
+        if pq is None:
+            raise SystemExit("❌ Writing Parquet needs pyarrow (pip install pyarrow); use a .npz table instead")
+        pq.write_table(pa.table(columns), tmp)
+    else:
+        with tmp.open("wb") as fh:
+            np.savez(fh, **columns)
+    os.replace(tmp, table)
+
+
+def read_table(table, columns=None):
+    """Column dict of NumPy arrays (optionally only *columns*)."""
+    table = Path(table)
+    if not table.exists():
+        return {}
+    if table.suffix == ".parquet":
+        if pq is None:
+            raise SystemExit("❌ Reading Parquet needs pyarrow (pip install pyarrow)")
+        t = pq.read_table(table, columns=columns)
+        return {name: t.column(name).to_numpy(zero_copy_only=False) for name in t.column_names}
+    with np.load(table, allow_pickle=False) as data:
+        return {name: data[name] for name in (columns or data.files) if name in data.files}
+
+
+def update(pred_dirs, table=TABLE, workers=None):
+    """Bring *table* up to date with the JSONs below *pred_dirs*; returns (added/changed, removed, total)."""
+    current = scan(pred_dirs, workers)
+    old = read_table(table)
+    if old and "run" not in old:
+        print(f"⚠️ {table} predates the run column; rebuilding it", file=sys.stderr)
+        old = {}
+    n_old = len(old.get("path", ()))
+    if n_old:
+        keep = np.array([current.get(p) == m for p, m in zip(old["path"].tolist(), old["mtime"].tolist())])
+        removed = sum(p not in current for p in old["path"].tolist())
+        kept = {name: col[keep] for name, col in old.items()}
+        known = set(kept["path"].tolist())
+    else:
+        removed, kept, known = 0, {}, set()
+
+    todo = sorted((p, m) for p, m in current.items() if p not in known)
+    new = rows_to_columns(parse_all(todo, workers)) if todo else {}
+    columns = merge_columns(kept, new) if kept and new else (kept or new)
+    if columns:
+        order = np.lexsort((columns["sample"], columns["seed"], columns["target"], columns["run"]))
+        columns = {name: col[order] for name, col in columns.items()}
+        write_table(columns, table)
+    return len(todo), removed, len(columns.get("path", ()))
+
+
+# ── queries ───────────────────────────────────────────────────────────────────
+OPS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge,
+       "==": operator.eq, "=": operator.eq, "!=": operator.ne}
+CLAUSE_RE = re.compile(r"^\s*([A-Za-z_][\w]*)\s*(<=|>=|==|!=|<|>|=)\s*(\S+)\s*$")
+
+
+def _clause(columns, text):
+    m = CLAUSE_RE.match(text)
+    if not m:
+        raise ValueError(f"cannot parse condition {text!r} (expected e.g. 'iptm < 0.6')")
+    name, op, value = m.groups()
+    if name not in columns:
+        raise ValueError(f"unknown column {name!r}")
+    col = columns[name]
+    value = value.strip("'\"") if col.dtype.kind in "US" else float(value)
+    return OPS[op](col, value)
+
+
+def query(columns, expr):
+    """Boolean mask for *expr*: conditions like 'iptm < 0.6' joined by 'and' / 'or' (and binds tighter)."""
+    n = len(columns["target"])
+    mask = np.zeros(n, dtype=bool)
+    for alternative in re.split(r"\s+or\s+", expr.strip()):
+        part = np.ones(n, dtype=bool)
+        for cond in re.split(r"\s+and\s+", alternative):
+            part &= _clause(columns, cond)
+        mask |= part
+    return mask
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Aggregate Protenix summary-confidence JSONs into one table.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_up = sub.add_parser("update", help="Scan prediction directories and update the table")
+    p_up.add_argument("pred_dirs", nargs="*", default=[PRED_DIR])
+    p_up.add_argument("--table", default=TABLE)
+    p_up.add_argument("--workers", type=int, help="Parallel walkers/parsers (default: CPU count)")
+    p_q = sub.add_parser("query", help='Select rows, e.g. "iptm < 0.6 and ptm > 0.5"')
+    p_q.add_argument("expr")
+    p_q.add_argument("--table", default=TABLE)
+    p_q.add_argument("--columns", nargs="+", default=["plddt", "ptm", "iptm", "ranking_score"],
+                     help="Columns to print besides target/seed/sample")
+    p_q.add_argument("--targets", action="store_true", help="Only list the distinct matching targets (with their run)")
+    args = parser.parse_args()
+
+    if args.command == "update":
+        changed, removed, total = update(args.pred_dirs, args.table, args.workers)
+        print(f"✅ {args.table}: {total} samples ({changed} new/changed, {removed} removed)")
+        return
+
+    columns = read_table(args.table)
+    if not columns:
+        print(f"❌ No table at {args.table} (run 'confagg.py update' first)")
+        sys.exit(1)
+    try:
+        mask = query(columns, args.expr)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    if args.targets:
+        for target, run in sorted(set(zip(columns["target"][mask].tolist(), columns["run"][mask].tolist()))):
+            print(f"{target}\t{run}")
+        return
+    shown = [c for c in args.columns if c in columns]
+    print("\t".join(["target", "seed", "sample", *shown, "run"]))
+    for i in np.flatnonzero(mask):
+        values = [f"{columns[c][i]:.3f}" for c in shown]
+        print("\t".join([str(columns["target"][i]), str(columns["seed"][i]), str(columns["sample"][i]), *values,
+                         str(columns["run"][i])]))
+    print(f"# {int(mask.sum())}/{len(mask)} samples", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,40 +6,150 @@ Supports multiple chains in PDB files with naming like 3wdl_B.pdb
 """
 
 from pathlib import Path
-import subprocess
 import csv
+import hashlib
+import json
 import os
 import argparse
-import glob
-import time
+import shutil
 import sys
 
+from asyncrunner import Job, run_job, run_jobs, tail
+from shardlayout import ShardedDir
+import tracing
+
 class DaliPipeline:
-    def __init__(self):
-        self.base_dir = Path(os.getcwd())
+    def __init__(self, base_dir=None):
+        self.base_dir = Path(base_dir or os.getcwd())
         self.pdb_dir = self.base_dir / "input_pdbs"
+        self.templates_dir = self.pdb_dir / "templates"  # template candidates of templdali.py, also queries
         self.dat1_dir = self.base_dir / "imported_DAT/input"
         self.dat2_dir = self.base_dir / "imported_DAT/refx"
         self.outputs_dir = self.base_dir / "dali_outputs"
         self.zscore_csv = self.base_dir / "zscore_summary.csv"
+        self.log_dir = self.base_dir / "logs"
+        self.work_dir = self.base_dir / "dali_work"
+        self.workers = os.cpu_count() or 1
+        self.target_name = self.base_dir.name  # trace label, e.g. work/<target>/
         
         self.ref_pdb = "refx.pdb"
         self.ref_base = "refx"
         self.ref_chain = "refxA"  # Only use A chain for reference
         
+        # Multi-reference mode: filled by add_reference(), all imported into dat2_dir
+        self.references = []
+        self.zscore_wide_csv = self.base_dir / "zscore_wide.csv"
+        self.trim_plddt = None  # pLDDT cutoff for trimming predicted references (plddttrim.py)
+        self.cluster_identity = None  # sequence-identity threshold for redundancy reduction (seqcluster.py)
+        self.clusters = {}  # DALI chain id → representative chain id
+        self.clusters_tsv = self.base_dir / "seq_clusters.tsv"
+        self.backend = "dalilite"  # or "native": in-process NumPy elastic scoring (dalinative.py), no import step
+        self.split_domains = False  # compare per-domain PDBs instead of whole query chains (domsplit.py)
+        self.domain_assignments = []  # SUPERFAMILY .ass/.html results for the query chains
+        self.ref_superfamilies = set()  # only domains of these superfamilies are compared (empty: all)
+        self.domains = {}  # domain label (d001_A) → source chain, region, superfamily
+        self.domains_dir = self.work_dir / "domains"
+        self._artifact_dirs = {}  # (directory, kind) → ShardedDir: sharded layout + manifest (shardlayout.py)
+        
         self.dali_pl = Path("/home/wenhao/6tx0/software/dali/DaliLite.v5/bin/dali.pl")
         self.import_pl = Path("/home/wenhao/6tx0/software/dali/DaliLite.v5/bin/import.pl")
     
+    def add_reference(self, pdb_name: str, chain: str = "A"):
+        """Register an extra reference (PDB file in input_pdbs/ or a path) for multi-reference mode"""
+        # DaliLite identifiers are 4 characters + chain, so references get codes r001, r002, ...
+        code = f"r{len(self.references) + 1:03d}"
+        self.references.append({
+            "name": f"{Path(pdb_name).stem.removesuffix('.ppred')}_{chain}",
+            "pdb": Path(pdb_name) if Path(pdb_name).is_absolute() else self.pdb_dir / pdb_name,
+            "code": code,
+            "chain": f"{code}{chain}",
+        })
+    
+    def use_sharded_layout(self):
+        """Shard new DAT/output directories (shardlayout.py); existing flat ones must be migrated first"""
+        for directory, kind in ((self.dat1_dir, "dat"), (self.outputs_dir, "dali")):
+            ShardedDir.create(directory, kind)
+        self._artifact_dirs.clear()
+    
+    def _artifacts(self, directory: Path, kind: str) -> ShardedDir:
+        key = (str(directory), kind)
+        if key not in self._artifact_dirs:
+            self._artifact_dirs[key] = ShardedDir(directory, kind)
+        return self._artifact_dirs[key]
+    
+    def dat_dir_for(self, pdb_base: str, dat_dir: Path) -> Path:
+        """Directory import.pl writes the DATs of pdb_base to (its shard, or dat_dir itself when flat)"""
+        return self._artifacts(dat_dir, "dat").shard_dir(pdb_base, create=True)
+    
+    def chain_dats(self, pdb_base: str, dat_dir: Path):
+        """DAT files of pdb_base's chains"""
+        return list(self.dat_dir_for(pdb_base, dat_dir).glob(f"{pdb_base}*.dat"))
+    
+    def query_chain_ids(self):
+        """Chain ids of the imported queries, from the manifest (a glob when dat1_dir is flat)"""
+        return [name[:-len(".dat")] for name in self._artifacts(self.dat1_dir, "dat").names()]
+    
+    def output_path(self, chain_id: str, ref_chain: str = None) -> Path:
+        return self._artifacts(self.outputs_dir, "dali").path(f"{chain_id}_vs_{ref_chain or self.ref_chain}.txt")
+    
+    def output_files(self, ref_chain: str = None):
+        """DALI result files against ref_chain, from the manifest (a glob when dali_outputs is flat)"""
+        return self._artifacts(self.outputs_dir, "dali").paths(group=ref_chain or self.ref_chain)
+    
+    def enable_domains(self, assignments=(), ref_superfamilies=()):
+        """Cut queries into domains before import; ref_superfamilies are sunids or the reference's .ass/.html"""
+        from domsplit import load_domains, read_assignments, reference_superfamilies
+        
+        self.split_domains = True
+        self.domain_assignments = list(assignments)
+        read_assignments(self.domain_assignments)  # fail now, not after the import, if .ass models cannot be mapped
+        sunids = {s for s in ref_superfamilies if str(s).isdigit()}
+        self.ref_superfamilies = sunids | reference_superfamilies([s for s in ref_superfamilies if not str(s).isdigit()])
+        self.dat1_dir = self.base_dir / "imported_DAT/domains"  # keeps whole-chain DATs out of the comparisons
+        self.domains = load_domains(self.domains_dir)
+    
+    def _reference_files(self):
+        if self.references:
+            return [ref["pdb"] for ref in self.references]
+        return [self.pdb_dir / self.ref_pdb]
+    
+    def _prepare_reference(self, pdb_file: Path) -> Path:
+        """Predicted reference as imported: exported from an archive and/or pLDDT-trimmed"""
+        if pdb_file.name.endswith(".ppred.npz"):
+            # Packed Protenix outputs (predarchive.py): import.pl needs a PDB, so export the best sample
+            from predarchive import PredictionArchive
+            exported = self.work_dir / "from_archive" / f"{pdb_file.name[:-len('.ppred.npz')]}.pdb"
+            if not exported.exists() or exported.stat().st_mtime < pdb_file.stat().st_mtime:
+                exported.parent.mkdir(parents=True, exist_ok=True)
+                arc = PredictionArchive(pdb_file)
+                arc.write_pdb(exported, *arc.best())
+            pdb_file = exported
+        if self.trim_plddt is None:
+            return pdb_file
+        from plddttrim import mapping_path, trim_structure
+        
+        trimmed = self.work_dir / "trimmed" / f"{pdb_file.stem}_trimmed.pdb"
+        map_file = mapping_path(trimmed)
+        if (trimmed.exists() and map_file.exists()
+                and trimmed.stat().st_mtime >= pdb_file.stat().st_mtime
+                and json.loads(map_file.read_text())["params"]["threshold"] == self.trim_plddt):
+            return trimmed
+        trimmed.parent.mkdir(parents=True, exist_ok=True)
+        mapping = trim_structure(pdb_file, trimmed, threshold=self.trim_plddt)
+        for name, info in mapping["chains"].items():
+            print(f"✂️ {pdb_file.name} chain {name}: kept {info['n_kept']}/{info['n_input']} residues (pLDDT >= {self.trim_plddt})")
+        return trimmed
+    
     def check_prerequisites(self):
         """Check required files and directories"""
         print("🔍 Checking environment...")
         
-        # Check DALI binaries
-        if not self.dali_pl.exists():
+        # Check DALI binaries (not needed by the native backend)
+        if self.backend == "dalilite" and not self.dali_pl.exists():
             print(f"❌ DALI binary not found: {self.dali_pl}")
             return False
         
-        if not self.import_pl.exists():
+        if self.backend == "dalilite" and not self.import_pl.exists():
             print(f"❌ Import binary not found: {self.import_pl}")
             return False
         
@@ -51,11 +161,11 @@ class DaliPipeline:
                 print(f"❌ Cannot create directory: {d}")
                 return False
         
-        # Check reference PDB
-        ref_path = self.pdb_dir / self.ref_pdb
-        if not ref_path.exists():
-            print(f"❌ Reference PDB not found: {ref_path}")
-            return False
+        # Check reference PDB(s)
+        for ref_path in self._reference_files():
+            if not ref_path.exists():
+                print(f"❌ Reference PDB not found: {ref_path}")
+                return False
         
         # Check input PDBs
         pdb_files = list(self.pdb_dir.glob("*.pdb"))
@@ -66,140 +176,439 @@ class DaliPipeline:
         print(f"✅ Environment check passed. Found {len(pdb_files)} PDB files")
         return True
     
-    def run_import(self, pdb_file: Path, pdb_base: str, dat_dir: Path):
-        """Import single PDB to DAT - imports all chains"""
+    def _import_job(self, pdb_file: Path, pdb_base: str, dat_dir: Path) -> Job:
         cmd = [
             str(self.import_pl),
             "--pdbfile", str(pdb_file),
             "--pdbid", pdb_base,
-            "--dat", str(dat_dir),
+            "--dat", str(self.dat_dir_for(pdb_base, dat_dir)),
             "--clean"
         ]
-        
-        print(f"> Importing {pdb_base}: {' '.join(cmd)}")
-        proc = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        
-        print(">>> STDOUT:\n", proc.stdout or "(empty)")
-        print(">>> STDERR:\n", proc.stderr or "(empty)")
-        
-        if proc.returncode != 0:
-            print(f"❌ Import failed for {pdb_base}")
+        # Own working directory per job so concurrent imports don't share temp files
+        workdir = self.work_dir / f"import_{dat_dir.name}_{pdb_base}"
+        workdir.mkdir(parents=True, exist_ok=True)
+        return Job(f"import_{dat_dir.name}_{pdb_base}", cmd, tool="import", cwd=str(workdir),
+                   target=self.target_name)
+
+    def _check_import(self, result, pdb_base: str, dat_dir: Path):
+        """Check the outcome of an import job"""
+        if not result.ok:
+            print(f"❌ Import failed for {pdb_base}: {result.error or f'exit status {result.returncode}'}")
+            print(f">>> STDERR (tail of {result.stderr_log}):\n", tail(result.stderr_log) or "(empty)")
             return False
         
         # Check generated DAT files (multiple chains)
-        generated_dats = list(dat_dir.glob(f"{pdb_base}*.dat"))
+        generated_dats = self.chain_dats(pdb_base, dat_dir)
         if not generated_dats:
             print(f"❌ No DAT files generated for {pdb_base}")
             return False
+        self._artifacts(dat_dir, "dat").record([d.name for d in generated_dats])
         
         print(f"✅ Imported {pdb_base}, generated {len(generated_dats)} chain DAT files: {[d.name for d in generated_dats]}")
         return True
     
+    def _is_imported(self, pdb_file: Path, pdb_base: str, dat_dir: Path) -> bool:
+        """True if DAT files for pdb_base exist and are newer than the PDB file"""
+        dats = self.chain_dats(pdb_base, dat_dir)
+        return bool(dats) and min(d.stat().st_mtime for d in dats) >= pdb_file.stat().st_mtime
+    
+    def _query_pdbs(self, domains=True):
+        """(pdb_file, pdb_base) for every query PDB, i.e. all PDBs except the reference(s)"""
+        if domains and self.domains:
+            return [(Path(d["file"]), d["base"]) for d in self.domains.values()]
+        # refx.pdb is the reference by convention, also when --refs names others
+        ref_files = {p.resolve() for p in self._reference_files() + [self.pdb_dir / self.ref_pdb]}
+        queries = []
+        for pdb_file in [*self.pdb_dir.glob("*.pdb"), *self.templates_dir.glob("*.pdb")]:
+            if pdb_file.resolve() in ref_files:
+                continue  # Skip reference
+            
+            # For naming like 3wdl_B.pdb, use pdb_base = "3WDL" (templates: t001_4mb0_B.pdb → "T001")
+            stem = pdb_file.stem.upper()
+            pdb_base = stem.split('_')[0] if '_' in stem else stem
+            queries.append((pdb_file, pdb_base))
+        return queries
+    
+    def cluster_queries(self):
+        """Cluster query chains by sequence identity; only representatives are imported and compared"""
+        from seqcluster import chain_sequences, cluster_sequences, write_clusters
+        
+        sequences = chain_sequences([pdb_file for pdb_file, _ in self._query_pdbs(domains=False)])
+        self.clusters = cluster_sequences(sequences, self.cluster_identity, log_dir=self.log_dir)
+        write_clusters(self.clusters, self.clusters_tsv)
+        n_reps = len(set(self.clusters.values()))
+        print(f"🧬 {len(self.clusters)} query chains → {n_reps} representatives at "
+              f"{self.cluster_identity:.0%} identity ({self.clusters_tsv.name})")
+        return True
+    
+    def split_query_domains(self):
+        """Write per-domain PDBs of the (representative) query chains; only these are imported and compared"""
+        from domsplit import read_assignments, split_library
+        
+        self.domains = split_library(self._query_pdbs(domains=False), read_assignments(self.domain_assignments),
+                                     self.ref_superfamilies, self.domains_dir, keep=self._is_representative)
+        self.dat1_dir.mkdir(parents=True, exist_ok=True)
+        chain_ids = {label.replace("_", "").upper() for label in self.domains}
+        dats = self._artifacts(self.dat1_dir, "dat")
+        stale = [cid for cid in self.query_chain_ids() if cid not in chain_ids]
+        for cid in stale:
+            dats.path(f"{cid}.dat").unlink(missing_ok=True)  # a domain that no longer exists would still be compared
+        dats.forget([f"{cid}.dat" for cid in stale])
+        outputs = self._artifacts(self.outputs_dir, "dali")
+        stale_outputs = [name for name in outputs.names(status=None) if name.partition("_vs_")[0] in stale]
+        for name in stale_outputs:
+            outputs.path(name).unlink(missing_ok=True)
+        outputs.forget(stale_outputs)
+        chains = {d["chain"] for d in self.domains.values()}
+        residues = sum(d["length"] for d in self.domains.values())
+        total = sum({d["chain"]: d["chain_length"] for d in self.domains.values()}.values())
+        print(f"✂️ {len(chains)} query chains → {len(self.domains)} domains "
+              f"({residues}/{total} residues{', superfamilies ' + ' '.join(sorted(self.ref_superfamilies)) if self.ref_superfamilies else ''})")
+        return bool(self.domains)
+    
+    def _best_domains(self, zscores: dict) -> dict:
+        """Domain Z-scores → the best domain per source chain: chain label → (Z-score, region)"""
+        best = {}
+        for label, z in zscores.items():
+            info = self.domains.get(label)
+            if info is None:
+                continue  # e.g. an old whole-chain result in dali_outputs/
+            if info["chain"] not in best or z > best[info["chain"]][0]:
+                best[info["chain"]] = (z, info["region"])
+        return best
+    
+    def _is_representative(self, chain_id: str) -> bool:
+        return self.clusters.get(chain_id, chain_id) == chain_id
+    
+    def _propagate(self, zscores: dict) -> dict:
+        """Copy representative Z-scores to the cluster members: label → (value, representative label)"""
+        labels = {cid: self._chain_label(cid) for cid in self.clusters}
+        rows = {label: (z, "") for label, z in zscores.items()}
+        for member, rep in self.clusters.items():
+            if member != rep and labels[rep] in zscores:
+                rows[labels[member]] = (zscores[labels[rep]], labels[rep])
+        return rows
+    
+    def import_queries(self, reuse=False):
+        """Import query PDBs concurrently; with reuse=True skip PDBs whose DATs are up to date"""
+        queries = self._query_pdbs()
+        if self.clusters:
+            # Skip PDB files whose clustered chains are all non-representatives
+            redundant = {cid[:-1] for cid in self.clusters} - {cid[:-1] for cid in self.clusters.values()}
+            skipped = [b for _, b in queries if b in redundant]
+            queries = [(f, b) for f, b in queries if b not in redundant]
+            if skipped:
+                print(f"🧬 Skipping {len(skipped)} redundant query structures")
+        todo = queries
+        if reuse:
+            todo = [(f, b) for f, b in queries if not self._is_imported(f, b, self.dat1_dir)]
+            if len(todo) < len(queries):
+                print(f"♻️ Reusing imported DATs for {len(queries) - len(todo)} query structures")
+        
+        jobs = [self._import_job(pdb_file, pdb_base, self.dat1_dir) for pdb_file, pdb_base in todo]
+        print(f"> Importing {len(jobs)} query structures ({self.workers} workers)")
+        results = run_jobs(jobs, self.log_dir, limits={"import": self.workers}, max_parallel=self.workers)
+        successful_imports = sum(
+            self._check_import(result, pdb_base, self.dat1_dir)
+            for result, (_, pdb_base) in zip(results, todo)
+        ) + len(queries) - len(todo)
+        
+        print(f"✅ Imported {successful_imports}/{len(queries)} query structures")
+        return successful_imports > 0
+    
+    def run_import(self, pdb_file: Path, pdb_base: str, dat_dir: Path):
+        """Import single PDB to DAT - imports all chains"""
+        job = self._import_job(pdb_file, pdb_base, dat_dir)
+        print(f"> Importing {pdb_base}: {' '.join(job.cmd)}")
+        result = run_job(job, self.log_dir)
+        return self._check_import(result, pdb_base, dat_dir)
+    
     def import_all_pdbs(self):
         """Import all PDBs to DAT"""
         print("🔄 Starting PDB to DAT import...")
         
         # Import reference (only A chain expected, but import all)
-        ref_path = self.pdb_dir / self.ref_pdb
+        ref_path = self._prepare_reference(self.pdb_dir / self.ref_pdb)
         if not self.run_import(ref_path, self.ref_base.upper(), self.dat2_dir):
             return False
         
-        # Import query PDBs
-        pdb_files = list(self.pdb_dir.glob("*.pdb"))
-        successful_imports = 0
-        
-        for pdb_file in pdb_files:
-            if pdb_file.name == self.ref_pdb:
-                continue  # Skip reference
-            
-            # For naming like 3wdl_B.pdb, use pdb_base = "3WDL"
-            stem = pdb_file.stem.upper()
-            pdb_base = stem.split('_')[0] if '_' in stem else stem
-            
-            if self.run_import(pdb_file, pdb_base, self.dat1_dir):
-                successful_imports += 1
-        
-        print(f"✅ Imported {successful_imports}/{len(pdb_files)-1} query structures")
-        return successful_imports > 0
+        # Import query PDBs concurrently
+        return self.import_queries()
     
-    def run_dali_comparison(self, chain_id: str) -> bool:
-        """Run DALI pairwise comparison for single chain"""
-        out_txt = self.outputs_dir / f"{chain_id}_vs_{self.ref_chain}.txt"
-        
+    def _reference_record(self, ref, source: Path) -> dict:
+        """references.json entry of a reference: what was imported under its code"""
+        return {"name": ref["name"], "pdb": str(Path(ref["pdb"]).resolve()), "imported": str(source),
+                "sha256": hashlib.sha256(source.read_bytes()).hexdigest()}
+    
+    def _read_references_json(self) -> dict:
+        path = self.dat2_dir / "references.json"
+        try:
+            return json.loads(path.read_text())
+        except (OSError, ValueError):
+            return {}
+    
+    def _drop_reference(self, ref):
+        """Delete the DATs and DALI outputs left under a reference code by whatever structure held it before"""
+        code = ref["code"].upper()
+        for dat in self.chain_dats(code, self.dat2_dir):
+            dat.unlink()
+        outputs = self._artifacts(self.outputs_dir, "dali")
+        stale = outputs.names(group=ref["chain"], status=None)
+        for name in stale:
+            outputs.path(name).unlink(missing_ok=True)
+        outputs.forget(stale)
+    
+    def import_references(self):
+        """Multi-reference mode: import every reference into dat2_dir once"""
+        print(f"🔄 Importing {len(self.references)} references...")
+        sources = {ref["code"]: self._prepare_reference(ref["pdb"]) for ref in self.references}
+        records = {ref["chain"]: self._reference_record(ref, sources[ref["code"]]) for ref in self.references}
+        # Codes are positional: reuse DATs only if the same file with the same content was imported under the code
+        imported = self._read_references_json()
+        todo = [ref for ref in self.references
+                if imported.get(ref["chain"]) != records[ref["chain"]]
+                or not self.chain_dats(ref["code"].upper(), self.dat2_dir)]
+        if len(todo) < len(self.references):
+            print(f"♻️ Reusing imported DATs for {len(self.references) - len(todo)} references")
+        for ref in todo:
+            self._drop_reference(ref)
+        jobs = [self._import_job(sources[ref["code"]], ref["code"].upper(), self.dat2_dir) for ref in todo]
+        results = run_jobs(jobs, self.log_dir, limits={"import": self.workers}, max_parallel=self.workers)
+        failed = {ref["chain"] for result, ref in zip(results, todo)
+                  if not self._check_import(result, ref["code"].upper(), self.dat2_dir)}
+        
+        # Keep the code → reference mapping next to the DATs; a failed import is retried next time
+        mapping = {chain: record for chain, record in records.items() if chain not in failed}
+        (self.dat2_dir / "references.json").write_text(json.dumps(mapping, indent=2))
+        return not failed
+    
+    def _comparison_job(self, chain_id: str, ref_chain: str = None) -> Job:
+        ref_chain = ref_chain or self.ref_chain
         args = [
             str(self.dali_pl),
             "--cd1", chain_id,
-            "--cd2", self.ref_chain,
-            "--dat1", str(self.dat1_dir),
-            "--dat2", str(self.dat2_dir),
+            "--cd2", ref_chain,
+            "--dat1", str(self.dat_dir_for(chain_id[:-1], self.dat1_dir)),
+            "--dat2", str(self.dat_dir_for(ref_chain[:-1], self.dat2_dir)),
             "--outfmt", "summary",
             "--clean"
         ]
+        # DALI writes <chain>.txt and fort.* into its cwd; isolate every comparison
+        workdir = self.work_dir / f"{chain_id}_vs_{ref_chain}"
+        workdir.mkdir(parents=True, exist_ok=True)
+        return Job(f"dali_{chain_id}_vs_{ref_chain}", args, tool="dali", cwd=str(workdir),
+                   target=self.target_name)
+    
+    def _collect_comparison(self, chain_id: str, result, ref_chain: str = None) -> bool:
+        """Move the DALI result of a finished comparison job into outputs_dir"""
+        ref_chain = ref_chain or self.ref_chain
+        outputs = self._artifacts(self.outputs_dir, "dali")
+        out_txt = outputs.path(f"{chain_id}_vs_{ref_chain}.txt", create=True)
+        saved = self._save_comparison(chain_id, ref_chain, result, out_txt)
+        outputs.record(out_txt.name, status=None if saved else "failed")
+        return saved
+    
+    def _save_comparison(self, chain_id: str, ref_chain: str, result, out_txt: Path) -> bool:
+        workdir = Path(result.job.cwd)
         
-        print(f"> Comparing {chain_id} vs {self.ref_chain}: {' '.join(args)}")
-        proc = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        
-        print("=== STDOUT ===")
-        print(proc.stdout or "(empty)")
-        print("=== STDERR ===")
-        print(proc.stderr or "(empty)")
+        if result.timed_out:
+            print(f"⚠️ Comparison {chain_id} vs {ref_chain} {result.error}")
+            return False
+        if not result.ok:
+            print(f"⚠️ DALI exited with {result.returncode} for {chain_id}; stderr tail:\n{tail(result.stderr_log) or '(empty)'}")
         
         # Check fort.*
-        fort_files = list(Path('.').glob('fort.*'))
-        print(f"→ fort.* files: {fort_files}")
+        fort_files = list(workdir.glob('fort.*'))
+        if fort_files:
+            print(f"→ fort.* files: {fort_files}")
         
         # Check if output file was generated by DALI (since output is redirected to file)
-        dali_generated_txt = Path(f"{chain_id}.txt")
+        dali_generated_txt = workdir / f"{chain_id}.txt"
         if dali_generated_txt.exists():
             try:
-                os.rename(dali_generated_txt, out_txt)
+                os.replace(dali_generated_txt, out_txt)
                 print(f"✅ Saved result to {out_txt}")
                 return True
             except Exception as e:
                 print(f"⚠️ Failed to move output file: {e}")
                 return False
-        elif proc.stdout:
-            out_txt.write_text(proc.stdout)
+        elif result.stdout_log.exists() and result.stdout_log.stat().st_size > 0:
+            shutil.copyfile(result.stdout_log, out_txt)
             print(f"✅ Saved result to {out_txt}")
             return True
         else:
             print(f"⚠️ No output for {chain_id}")
             return False
     
+    def _native_queries(self):
+        """{chain_id: (pdb_file, chain)} of the representative protein query chains"""
+        from seqcluster import chain_sequences
+        
+        queries = {}
+        for pdb_file, pdb_base in self._query_pdbs():
+            for chain_id in chain_sequences([pdb_file]):
+                if self._is_representative(chain_id):
+                    queries[chain_id] = (pdb_file, chain_id[len(pdb_base):])
+        return queries
+    
+    def run_native_comparisons(self, refs, queries=None):
+        """Native backend: compare query chains against (ref_pdb, chain, ref_chain) references in-process"""
+        from dalinative import compare_all
+        
+        queries = self._native_queries() if queries is None else queries
+        outputs = self._artifacts(self.outputs_dir, "dali")
+        saved = 0
+        for ref_pdb, chain, ref_chain in refs:
+            print(f"> Scoring {len(queries)} chains vs {ref_chain} in-process ({self.workers} workers)")
+            for chain_id, error in compare_all(queries, ref_pdb, chain, ref_chain, self.outputs_dir, self.workers):
+                if error:
+                    print(f"⚠️ No output for {chain_id} vs {ref_chain}: {error}")
+                else:
+                    saved += 1
+                outputs.record(f"{chain_id}_vs_{ref_chain}.txt", status="failed" if error else None)
+        print(f"✅ Saved {saved} native comparison results to {self.outputs_dir}")
+        return saved > 0
+    
+    def _native_references(self):
+        if self.references:
+            return [(self._prepare_reference(ref["pdb"]), ref["chain"][-1], ref["chain"]) for ref in self.references]
+        return [(self._prepare_reference(self.pdb_dir / self.ref_pdb), self.ref_chain[-1], self.ref_chain)]
+    
+    def run_dali_comparison(self, chain_id: str) -> bool:
+        """Run DALI pairwise comparison for single chain"""
+        if self.backend == "native":
+            queries = self._native_queries()
+            return chain_id in queries and self.run_native_comparisons(
+                self._native_references()[:1], {chain_id: queries[chain_id]})
+        job = self._comparison_job(chain_id)
+        print(f"> Comparing {chain_id} vs {self.ref_chain}: {' '.join(job.cmd)}")
+        return self._collect_comparison(chain_id, run_job(job, self.log_dir))
+    
     def run_all_comparisons(self):
         """Run all DALI comparisons for all chains"""
         print("🔍 Starting DALI comparisons...")
+        if self.backend == "native":
+            return self.run_native_comparisons(self._native_references())
         
-        dat_files = list(self.dat1_dir.glob("*.dat"))
-        if not dat_files:
+        chain_ids = self.query_chain_ids()  # e.g., "3WDLB" for B chain
+        if not chain_ids:
             print("❌ No DAT files in input directory")
             return False
         
-        for dat_file in dat_files:
-            chain_id = dat_file.stem  # e.g., "3WDLB" for B chain
-            self.run_dali_comparison(chain_id)
+        chain_ids = [chain_id for chain_id in chain_ids if self._is_representative(chain_id)]
+        jobs = [self._comparison_job(chain_id) for chain_id in chain_ids]
+        print(f"> Running {len(jobs)} comparisons vs {self.ref_chain} ({self.workers} workers)")
+        results = run_jobs(jobs, self.log_dir, limits={"dali": self.workers}, max_parallel=self.workers)
+        for chain_id, result in zip(chain_ids, results):
+            self._collect_comparison(chain_id, result)
         
         return True
     
+    def run_multi_reference(self):
+        """Compare every query chain against every reference; Z-scores go to a wide table"""
+        print(f"🚀 Starting multi-reference DALI sweep ({len(self.references)} references)...")
+        print("="*50)
+        
+        if not self.check_prerequisites():
+            return False
+        if self.cluster_identity and not self.run_step("cluster", self.cluster_queries):
+            return False
+        if self.split_domains and not self.run_step("split", self.split_query_domains):
+            return False
+        # The native backend reads the PDBs directly
+        if self.backend == "dalilite" and not self.run_step(
+                "import", lambda: self.import_references() and self.import_queries(reuse=True)):
+            return False
+        
+        self.run_step("compare", self.run_multi_comparisons)
+        if not self.run_step("extract", self.extract_zscore_table):
+            return False
+        
+        print("="*50)
+        print("🎉 Multi-reference sweep completed!")
+        return True
+    
+    def run_multi_comparisons(self):
+        """Compare every imported query chain against every reference"""
+        if self.backend == "native":
+            return self.run_native_comparisons(self._native_references())
+        chain_ids = [chain_id for chain_id in self.query_chain_ids() if self._is_representative(chain_id)]
+        pairs = [(chain_id, ref["chain"]) for chain_id in chain_ids for ref in self.references]
+        jobs = [self._comparison_job(chain_id, ref_chain) for chain_id, ref_chain in pairs]
+        print(f"> Running {len(jobs)} comparisons ({len(chain_ids)} chains x {len(self.references)} references, "
+              f"{self.workers} workers)")
+        results = run_jobs(jobs, self.log_dir, limits={"dali": self.workers}, max_parallel=self.workers)
+        for (chain_id, ref_chain), result in zip(pairs, results):
+            self._collect_comparison(chain_id, result, ref_chain)
+        return True
+    
+    def extract_zscore_table(self):
+        """Write the wide Z-score table: one row per query chain, one column per reference"""
+        print("📊 Extracting Z-score table...")
+        
+        table = {}
+        for ref in self.references:
+            for txt_file in self.output_files(ref["chain"]):
+                z = self._extract_zscore(txt_file)
+                if z != "NA":
+                    label = self._chain_label(txt_file.stem.split(f"_vs_{ref['chain']}")[0])
+                    table.setdefault(label, {})[ref["name"]] = z
+        
+        if self.domains:
+            by_ref = {}
+            for label, row in table.items():
+                for name, z in row.items():
+                    by_ref.setdefault(name, {})[label] = z
+            table = {}
+            for name, zscores in by_ref.items():
+                for chain, (z, _) in self._best_domains(zscores).items():
+                    table.setdefault(chain, {})[name] = z
+        
+        if not table:
+            print("❌ No valid Z-scores found")
+            return False
+        
+        names = [ref["name"] for ref in self.references]
+        representative = {}
+        if self.clusters:
+            for label, (row, rep) in self._propagate(table).items():
+                table[label] = row
+                representative[label] = rep
+        with self.zscore_wide_csv.open("w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["chain_id"] + names + (["representative"] if self.clusters else []))
+            for label in sorted(table):
+                extra = [representative.get(label, "")] if self.clusters else []
+                writer.writerow([label] + [table[label].get(name, "NA") for name in names] + extra)
+        
+        print(f"✅ Extracted Z-scores for {len(table)} chains x {len(names)} references, saved to {self.zscore_wide_csv}")
+        return True
+    
+    @staticmethod
+    def _chain_label(chain_id: str) -> str:
+        """DALI chain id (3WDLB) → summary label (3wdl_B)"""
+        chain_id = chain_id.lower()
+        pdb_id = chain_id[:-1] if len(chain_id) > 4 else chain_id
+        chain = chain_id[-1].upper() if len(chain_id) > 4 else "A"
+        return f"{pdb_id}_{chain}"
+    
     def extract_zscores(self):
         """Extract Z-scores from output files, skip empty or invalid TXT"""
         print("📊 Extracting Z-scores...")
         
         results = []
-        txt_files = list(self.outputs_dir.glob("*_vs_refxA.txt"))
+        txt_files = self.output_files(self.ref_chain)
         
         if not txt_files:
-            print("❌ No TXT files found in dali_outputs matching *_vs_refxA.txt")
+            print(f"❌ No TXT files found in dali_outputs matching *_vs_{self.ref_chain}.txt")
             return False
         
         for txt_file in txt_files:
-            chain_id = txt_file.stem.split('_vs_refxA')[0].lower()
-            pdb_id = chain_id[:-1] if len(chain_id) > 4 else chain_id
-            chain = chain_id[-1].upper() if len(chain_id) > 4 else "A"
+            chain_id = txt_file.stem.split(f'_vs_{self.ref_chain}')[0].lower()
             
             z = self._extract_zscore(txt_file)
             if z != "NA":
-                results.append((f"{pdb_id}_{chain}", z))
+                results.append((self._chain_label(chain_id), z))
                 print(f"✅ Extracted Z-score {z} for {chain_id}")
             else:
                 print(f"⚠️ Skipped {txt_file.name}: No Z-score found or empty file")
@@ -208,10 +617,25 @@ class DaliPipeline:
             print("❌ No valid Z-scores found")
             return False
         
+        regions = {}
+        if self.domains:
+            # One row per query chain: its best-scoring domain
+            best = self._best_domains(dict(results))
+            results = [(label, z) for label, (z, _) in best.items()]
+            regions = {label: region for label, (_, region) in best.items()}
+        
         with self.zscore_csv.open("w", newline="") as f:
             writer = csv.writer(f)
-            writer.writerow(["chain_id", "zscore"])
-            writer.writerows(results)
+            extra = ["domain"] if self.domains else []
+            if self.clusters:
+                # Members of a cluster inherit the representative's Z-score
+                rows = self._propagate(dict(results))
+                writer.writerow(["chain_id", "zscore", "representative"] + extra)
+                writer.writerows([label, z, rep] + ([regions.get(label, "")] if extra else [])
+                                 for label, (z, rep) in rows.items())
+            else:
+                writer.writerow(["chain_id", "zscore"] + extra)
+                writer.writerows([label, z] + ([regions[label]] if extra else []) for label, z in results)
         
         print(f"✅ Extracted {len(results)} Z-scores, saved to {self.zscore_csv}")
         return True
@@ -239,22 +663,22 @@ class DaliPipeline:
         return "NA"
     
     def debug_view_dat_files(self):
-        """Debug: View DAT files content summary"""
+        """Debug: View DAT files content summary (parsed in parallel, see datfile.py)"""
+        from datfile import print_summary, scan
         print("🔍 Viewing DAT files...")
-        
-        for dat_dir in [self.dat1_dir, self.dat2_dir]:
-            print(f"📂 {dat_dir}")
-            for dat_file in dat_dir.glob("*.dat"):
-                print(f"  - {dat_file.name}")
-                with dat_file.open() as f:
-                    lines = f.readlines()
-                    print(f"    Lines: {len(lines)}")
-                    print(f"    First line: {lines[0].strip() if lines else 'Empty'}")
-                    if "-ca" in ''.join(lines):
-                        print("    Contains -ca: Yes")
-                    else:
-                        print("    Contains -ca: No")
-        
+        infos = scan([d for d in (self.dat1_dir, self.dat2_dir) if d.is_dir()], self.workers)
+        if not infos:
+            print("❌ No DAT files found")
+            return
+        print_summary(infos)
+        
+    def run_step(self, name, func):
+        """Run one pipeline step, recorded as a stage in the trace"""
+        with tracing.get_tracer().span(name, target=self.target_name) as info:
+            ok = func()
+            info["status"] = "ok" if ok else "failed"
+        return ok
+    
     def run_pipeline(self):
         """Run complete DALI pipeline"""
         print("🚀 Starting DALI pipeline...")
@@ -264,15 +688,23 @@ class DaliPipeline:
             if not self.check_prerequisites():
                 return False
             
-            # Step 1: Import PDBs
-            if not self.import_all_pdbs():
+            # Step 0: Sequence-identity redundancy reduction (optional)
+            if self.cluster_identity and not self.run_step("cluster", self.cluster_queries):
+                return False
+            
+            # Step 0b: Cut the queries into domains (optional)
+            if self.split_domains and not self.run_step("split", self.split_query_domains):
+                return False
+            
+            # Step 1: Import PDBs (the native backend reads the PDBs directly)
+            if self.backend == "dalilite" and not self.run_step("import", self.import_all_pdbs):
                 return False
             
             # Step 2: Run comparisons
-            self.run_all_comparisons()
+            self.run_step("compare", self.run_all_comparisons)
             
             # Step 3: Extract Z-scores
-            if not self.extract_zscores():
+            if not self.run_step("extract", self.extract_zscores):
                 return False
             
             print("="*50)
@@ -288,10 +720,54 @@ def main():
     parser.add_argument('--check', action='store_true', help='Only check environment')
     parser.add_argument('--debug-dat', action='store_true', help='Debug DAT files')
     parser.add_argument('--skip-import', action='store_true', help='Skip PDB import step')
+    parser.add_argument('--workers', type=int, help='Concurrent import/DALI jobs (default: CPU count)')
+    parser.add_argument('--trace', metavar='DIR', help='Record timing/resource trace files in DIR')
+    parser.add_argument('--refs', nargs='+', metavar='PDB[:CHAIN]',
+                        help='Multi-reference mode: compare all queries against each reference '
+                             '(e.g. 7.6.2.14.pdb 7.6.2.15.pdb:B), writes zscore_wide.csv')
+    parser.add_argument('--cluster-identity', type=float, metavar='FRAC',
+                        help='Only import/compare one representative per sequence cluster (e.g. 0.9); '
+                             'members inherit its Z-score')
+    parser.add_argument('--trim-plddt', type=float, metavar='THRESH',
+                        help='Trim low-pLDDT termini/loops from predicted references before import')
+    parser.add_argument('--backend', choices=['dalilite', 'native'], default='dalilite',
+                        help='Comparison engine: DaliLite (default) or in-process NumPy elastic scoring '
+                             '(dalinative.py, no DaliLite install or import step needed)')
+    parser.add_argument('--domains', nargs='*', metavar='ASS',
+                        help='Compare per-domain PDBs instead of whole query chains (domsplit.py): regions from '
+                             'these SUPERFAMILY .ass/.html results, geometric split for unassigned chains')
+    parser.add_argument('--ref-superfamily', nargs='+', default=[], metavar='SUNID|FILE',
+                        help="With --domains: only compare domains of these superfamilies "
+                             "(sunids or the reference's SUPERFAMILY .ass/.html)")
+    parser.add_argument('--sharded', action='store_true',
+                        help='Hash-shard imported_DAT/input and dali_outputs and track them in a SQLite manifest '
+                             '(shardlayout.py); migrate existing flat directories with shardlayout.py first')
     
     args = parser.parse_args()
     
+    if args.trace:
+        tracing.enable(args.trace)
     pipeline = DaliPipeline()
+    if args.workers:
+        pipeline.workers = args.workers
+    pipeline.trim_plddt = args.trim_plddt
+    pipeline.backend = args.backend
+    pipeline.cluster_identity = args.cluster_identity
+    if args.domains is not None:
+        try:
+            pipeline.enable_domains(args.domains, args.ref_superfamily)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+    if args.sharded:
+        try:
+            pipeline.use_sharded_layout()
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+    for ref in args.refs or []:
+        pdb_name, _, chain = ref.partition(':')
+        pipeline.add_reference(pdb_name, chain or "A")
     
     if args.check:
         pipeline.check_prerequisites()
@@ -301,9 +777,12 @@ def main():
         pipeline.debug_view_dat_files()
         return
     
-    if args.skip_import:
+    if pipeline.references:
+        success = pipeline.run_multi_reference()
+    elif args.skip_import:
         print("⏭️ Skipping import step")
-        success = pipeline.run_all_comparisons() and pipeline.extract_zscores()
+        success = (pipeline.run_step("compare", pipeline.run_all_comparisons)
+                   and pipeline.run_step("extract", pipeline.extract_zscores))
     else:
         success = pipeline.run_pipeline()
     
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+datfile.py
+--------------------
+Streaming parser for DaliLite DAT files (imported_DAT/input, imported_DAT/refx).
+
+A DAT file holds one or more records:
+
+    >>>> 3F2BA  259 ...        header: code, residue count, further counts
+    -dssp "LLEEEEELLHHHH..."   per-residue secondary structure
+    -sequence "MSDH..."        one-letter sequence
+    -sse                       secondary-structure elements (integer rows)
+    -domain                    domain definitions (integer rows)
+    -ca                        CA coordinates, x y z per residue
+
+Lines are read one at a time and numeric sections are collected straight
+into NumPy arrays; nothing is held as a joined string.  CA values written
+as integers are DaliLite fixed point (0.1 Å) and are rescaled to Å.
+Unknown sections are kept as raw lines.
+
+Records can be validated (missing -ca, residue count mismatch, chain breaks)
+and whole DAT directories are summarised in parallel.
+
+Usage:
+    python datfile.py summary imported_DAT/input imported_DAT/refx [--workers 8]
+    python datfile.py validate imported_DAT/input        # exit status 1 on problems
+    python datfile.py show imported_DAT/refx/REFXA.dat
+"""
+
+import argparse
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from shardlayout import ShardedDir
+
+CA_FIXED_POINT = 10.0   # DaliLite integer coordinates are 0.1 Å
+CA_BREAK = 4.2          # Å, consecutive CA distance counted as a chain break
+NUMERIC_SECTIONS = ("ca", "sse", "domain", "domains")
+
+
+class DatRecord:
+    """One protein chain from a DAT file."""
+
+    def __init__(self, code, header):
+        self.code = code
+        self.header = header            # integer fields after the code
+        self.ca = np.zeros((0, 3), dtype=np.float32)
+        self.dssp = ""
+        self.sequence = ""
+        self.sse = np.zeros((0, 0), dtype=np.int32)
+        self.domains = np.zeros((0, 0), dtype=np.int32)
+        self.extra = {}                 # other sections, raw lines
+
+    @property
+    def nres(self):
+        return self.header[0] if self.header else len(self.ca)
+
+    def validate(self):
+        """List of problems found in this record (empty when it looks sane)."""
+        problems = []
+        if len(self.ca) == 0:
+            problems.append("no -ca coordinates")
+        elif self.header and self.header[0] != len(self.ca):
+            problems.append(f"header says {self.header[0]} residues, found {len(self.ca)} CA")
+        if self.sequence and len(self.sequence) != len(self.ca):
+            problems.append(f"sequence length {len(self.sequence)} != {len(self.ca)} CA")
+        if len(self.ca) and not np.isfinite(self.ca).all():
+            problems.append("non-finite coordinates")
+        breaks = self.chain_breaks()
+        if breaks:
+            problems.append(f"{breaks} chain break(s) > {CA_BREAK} Å")
+        return problems
+
+    def chain_breaks(self, cutoff=CA_BREAK):
+        if len(self.ca) < 2 or not self.ca.any():
+            return 0
+        d = np.linalg.norm(np.diff(self.ca, axis=0), axis=1)
+        return int((d > cutoff).sum())
+
+    def contact_map(self, cutoff=8.0):
+        """Boolean (n, n) CA contact map."""
+        d2 = ((self.ca[:, None, :] - self.ca[None, :, :]) ** 2).sum(axis=2)
+        return d2 <= cutoff ** 2
+
+    def ss_fraction(self):
+        """{state: fraction} of the -dssp string."""
+        if not self.dssp:
+            return {}
+        states, counts = np.unique(np.frombuffer(self.dssp.encode(), dtype="S1"), return_counts=True)
+        return {s.decode(): round(int(c) / len(self.dssp), 3) for s, c in zip(states, counts)}
+
+
+def _finish(record, section, rows):
+    if record is None or section is None:
+        return
+    if section == "ca":
+        values = np.array([v for row in rows for v in row], dtype=np.float64)
+        if values.size % 3:
+            values = values[:values.size - values.size % 3]
+        if rows and all(float(v).is_integer() for v in values[:30]) and values.size and np.abs(values).max() > 0:
+            values = values / CA_FIXED_POINT
+        record.ca = values.reshape(-1, 3).astype(np.float32)
+    elif section in ("sse", "domain", "domains"):
+        width = max((len(r) for r in rows), default=0)
+        arr = np.full((len(rows), width), -1, dtype=np.int32)
+        for i, row in enumerate(rows):
+            arr[i, :len(row)] = row
+        if section == "sse":
+            record.sse = arr
+        else:
+            record.domains = arr
+    else:
+        record.extra[section] = rows
+
+
+def _numbers(tokens, cast):
+    """Numeric tokens of a line; labels mixed into DaliLite rows (e.g. 'H', 'E') are skipped."""
+    values = []
+    for t in tokens:
+        try:
+            values.append(cast(t))
+        except ValueError:
+            pass
+    return values
+
+
+def _quoted(line):
+    start, end = line.find('"'), line.rfind('"')
+    return line[start + 1:end] if 0 <= start < end else line.split(None, 1)[1] if " " in line else ""
+
+
+def iter_records(path):
+    """Yield DatRecord objects from *path*, reading line by line."""
+    record, section, rows = None, None, []
+    with open(path, errors="replace") as fh:
+        for line in fh:
+            if line.startswith(">>>>"):
+                _finish(record, section, rows)
+                if record is not None:
+                    yield record
+                fields = line.split()
+                code = fields[1] if len(fields) > 1 else Path(path).stem
+                header = [int(f) for f in fields[2:] if f.lstrip("-").isdigit()]
+                record, section, rows = DatRecord(code, header), None, []
+            elif line.startswith("-") and line[1:2].isalpha():
+                _finish(record, section, rows)
+                if record is None:
+                    record = DatRecord(Path(path).stem, [])
+                key = line[1:].split(None, 1)[0].lower()
+                section, rows = None, []
+                if key == "dssp":
+                    record.dssp = _quoted(line.rstrip("\n"))
+                elif key in ("sequence", "seq"):
+                    record.sequence = _quoted(line.rstrip("\n"))
+                else:
+                    section = key
+            elif section is not None:
+                tokens = line.split()
+                if not tokens:
+                    continue
+                if section in NUMERIC_SECTIONS:
+                    rows.append(_numbers(tokens, float if section == "ca" else int))
+                else:
+                    rows.append(line.rstrip("\n"))
+    _finish(record, section, rows)
+    if record is not None:
+        yield record
+
+
+def read_dat(path):
+    """First (usually only) record of a DAT file."""
+    return next(iter_records(path), None)
+
+
+# ── directory summaries ───────────────────────────────────────────────────────
+def summarize_file(path):
+    path = Path(path)
+    info = {"file": str(path), "bytes": path.stat().st_size, "records": 0, "residues": 0,
+            "has_ca": False, "problems": []}
+    try:
+        for record in iter_records(path):
+            info["records"] += 1
+            info["residues"] += len(record.ca)
+            info["has_ca"] |= len(record.ca) > 0
+            info["problems"].extend(f"{record.code}: {p}" for p in record.validate())
+            info.setdefault("code", record.code)
+    except (OSError, UnicodeError) as e:
+        info["problems"].append(f"unreadable: {e}")
+    if info["records"] == 0:
+        info["problems"].append("no records")
+    return info
+
+
+def scan(dat_dirs, workers=None):
+    """Summaries of every *.dat file in *dat_dirs* (flat or sharded), computed in parallel."""
+    files = sorted(f for d in dat_dirs for f in ShardedDir(d, "dat").paths())
+    if len(files) < 2 or workers == 1:
+        return [summarize_file(f) for f in files]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(summarize_file, files, chunksize=16))
+
+
+def print_summary(infos, verbose=True):
+    by_dir = {}
+    for info in infos:
+        by_dir.setdefault(str(Path(info["file"]).parent), []).append(info)
+    for dat_dir, group in by_dir.items():
+        print(f"📂 {dat_dir}")
+        if verbose:
+            for info in group:
+                flag = "✅" if not info["problems"] else "⚠️"
+                print(f"  {flag} {Path(info['file']).name:<16s} records={info['records']:<3d} "
+                      f"residues={info['residues']:<5d} -ca={'yes' if info['has_ca'] else 'no'}")
+                for problem in info["problems"]:
+                    print(f"      {problem}")
+        residues = np.array([i["residues"] for i in group])
+        bad = sum(bool(i["problems"]) for i in group)
+        print(f"  {len(group)} files, {residues.sum()} residues "
+              f"(min {residues.min()}, median {int(np.median(residues))}, max {residues.max()}), "
+              f"{sum(i['bytes'] for i in group) / 1e6:.1f} MB, {bad} with problems")
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Parse, validate and summarise DaliLite DAT files.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    for name, text in (("summary", "Per-file and per-directory summary"),
+                       ("validate", "Only report files with problems; exit status 1 if any")):
+        p = sub.add_parser(name, help=text)
+        p.add_argument("dat_dirs", nargs="+")
+        p.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    p_show = sub.add_parser("show", help="Print the parsed content of one DAT file")
+    p_show.add_argument("dat_file")
+    args = parser.parse_args()
+
+    if args.command == "show":
+        for record in iter_records(args.dat_file):
+            print(f">>>> {record.code} header={record.header}")
+            print(f"  CA: {len(record.ca)}  sequence: {record.sequence[:60] or '-'}")
+            print(f"  SS: {record.ss_fraction() or '-'}  SSEs: {len(record.sse)}  domains: {len(record.domains)}")
+            print(f"  problems: {record.validate() or 'none'}")
+        return
+
+    infos = scan(args.dat_dirs, args.workers)
+    if not infos:
+        print(f"❌ No .dat files in {', '.join(args.dat_dirs)}")
+        sys.exit(1)
+    if args.command == "summary":
+        print_summary(infos)
+        return
+    bad = [i for i in infos if i["problems"]]
+    for info in bad:
+        print(f"⚠️ {info['file']}: {'; '.join(info['problems'])}")
+    print(f"{'❌' if bad else '✅'} {len(infos) - len(bad)}/{len(infos)} DAT files valid")
+    sys.exit(1 if bad else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,343 @@
+#!/usr/bin/env python3
+"""
+domsplit.py
+--------------------
+Cut query chains into per-domain PDBs before DALI import.
+
+Large multi-domain chains compared whole against the reference are slow and
+their Z-score is diluted by the domains that do not match.  This stage cuts
+every query chain into its domains and keeps only the domains that are
+relevant to the reference:
+
+    superfamily  regions from SUPERFAMILY results for the query chains
+                 (.ass or the results .html); a domain is kept when its
+                 superfamily is one of the reference's (--ref-superfamily)
+    geometric    chains without an assignment are bisected recursively at the
+                 cut with the fewest CA contacts across it (relative to the
+                 contacts within both parts); all such domains are kept
+
+Positions in the regions refer to the chain sequences written by
+`domsplit.py fasta` (all polymer residues, headers are DALI chain ids such
+as 3WDLB), which is the FASTA to run SUPERFAMILY on.
+
+Each domain becomes its own PDB with a 4-character DALI code (d001, d002,
+...) and the original chain letter; domains.json maps the codes back to
+chain, region and superfamily.  A code belongs to a chain and residue range:
+a domain cut again keeps the code it had in domains.json and new domains get
+codes no earlier domain used, so DATs and DALI outputs filed under a code
+always describe the same domain.  dali.py --domains uses this stage and
+reports the best domain Z-score per chain.
+
+.ass rows name SUPERFAMILY models, which model.tab maps to superfamilies;
+without it the superfamily filter cannot work, so reading .ass files fails
+instead of keeping every domain.
+
+Usage:
+    python domsplit.py fasta input_pdbs/ --out queries.fa
+    python domsplit.py split input_pdbs/ --assignments queries.ass --ref-superfamily target.ass [--out dali_work/domains]
+"""
+
+import argparse
+import itertools
+import json
+import sys
+from pathlib import Path
+
+from seqcluster import dali_chain_id
+
+MODEL_TAB = "/mnt/data2/supfam/supfam/model.tab"   # SUPERFAMILY model id → superfamily sunid
+MIN_REGION = 20         # shorter SUPERFAMILY regions are not worth a DALI run
+MIN_DOMAIN = 40         # smallest domain produced by the geometric parser
+CONTACT = 8.0           # Å, CA–CA contact distance
+SPLIT_RATIO = 0.07      # accept a geometric cut if inter / sqrt(intra1 * intra2) contacts is below this
+CODE_DIGITS = "0123456789abcdefghijklmnopqrstuvwxyz"
+
+
+# ── SUPERFAMILY assignments ───────────────────────────────────────────────────
+def parse_region(region):
+    """'12-50,80-140' → [(12, 50), (80, 140)] (1-based, inclusive)"""
+    segments = []
+    for part in region.replace(" ", "").split(","):
+        start, _, end = part.partition("-")
+        if start.isdigit() and end.isdigit():
+            segments.append((int(start), int(end)))
+    return segments
+
+
+def read_model_tab(path=None):
+    """{model id: superfamily sunid}; empty if model.tab is not available."""
+    try:
+        lines = Path(path or MODEL_TAB).read_text().splitlines()
+    except OSError:
+        return {}
+    table = {}
+    for line in lines:
+        parts = line.split("\t")
+        if len(parts) >= 2:
+            table[parts[0]] = parts[1]
+    return table
+
+
+def read_superfamily_names(paths):
+    """{superfamily sunid: name} from SUPERFAMILY results .html pages and SCOP dir.des files."""
+    from campreport import read_superfamily
+
+    names = {}
+    for path in paths:
+        path = Path(path)
+        if path.suffix == ".html":
+            for row in read_superfamily(path):
+                if row["sunid"]:
+                    names.setdefault(row["sunid"], row["superfamily"])
+            continue
+        # dir.des.scop.txt: sunid, level, sccs, px, description; superfamilies are level 'sf'
+        for line in path.read_text(errors="replace").splitlines():
+            parts = line.split("\t")
+            if len(parts) >= 5 and parts[1] == "sf":
+                names[parts[0]] = parts[4]
+    return names
+
+
+def read_ass(path, model_tab=None):
+    """Rows of a SUPERFAMILY .ass file: sequence id, model id, region, E-value, ..."""
+    models = read_model_tab() if model_tab is None else model_tab
+    if not models:
+        raise ValueError(f"{path}: no SUPERFAMILY model table ({MODEL_TAB}) to map its models to superfamilies")
+    rows = []
+    for line in Path(path).read_text(errors="replace").splitlines():
+        parts = line.split("\t")
+        if len(parts) < 4 or line.startswith("#") or not parse_region(parts[2]):
+            continue
+        rows.append({"seq_id": parts[0].split()[0], "region": parts[2], "evalue": parts[3],
+                     "superfamily": models.get(parts[1], "")})
+    return rows
+
+
+def read_assignments(paths):
+    """{sequence id: [(segments, superfamily sunid), ...]} from .ass and results .html files."""
+    from campreport import read_superfamily
+
+    model_tab = None
+    assignments = {}
+    for path in paths:
+        path = Path(path)
+        if path.suffix == ".html":
+            rows = [{**row, "superfamily": row["sunid"]} for row in read_superfamily(path)]
+        else:
+            model_tab = read_model_tab() if model_tab is None else model_tab
+            rows = read_ass(path, model_tab)
+        for row in rows:
+            assignments.setdefault(row["seq_id"], []).append((parse_region(row["region"]), row["superfamily"]))
+    return assignments
+
+
+def reference_superfamilies(paths):
+    """Every superfamily assigned in the reference's SUPERFAMILY results."""
+    superfamilies = {sf for hits in read_assignments(paths).values() for _, sf in hits if sf}
+    if paths and not superfamilies:
+        # An empty set would switch the filter off and keep every domain
+        raise ValueError(f"no superfamily assigned in {', '.join(map(str, paths))}")
+    return superfamilies
+
+
+# ── geometric fallback ────────────────────────────────────────────────────────
+def _block_sums(contacts):
+    """Padded 2-D prefix sums, so any block sum is four lookups."""
+    import numpy as np
+
+    s = np.zeros((len(contacts) + 1,) * 2, dtype=np.int64)
+    s[1:, 1:] = contacts.cumsum(0).cumsum(1)
+    return s
+
+
+def geometric_domains(ca, min_size=MIN_DOMAIN, max_ratio=SPLIT_RATIO):
+    """[(start, end)] 0-based half-open segments from recursive contact bisection of (n, 3) CA coordinates."""
+    import numpy as np
+
+    ca = np.asarray(ca, dtype=np.float32)
+    diff = ca[:, None, :] - ca[None, :, :]
+    contacts = (np.einsum("ijk,ijk->ij", diff, diff) < CONTACT ** 2).astype(np.int32)
+    idx = np.arange(len(ca))
+    contacts[np.abs(idx[:, None] - idx[None, :]) < 3] = 0      # ignore chain neighbours
+    s = _block_sums(contacts)
+
+    def block(r0, r1, c0, c1):
+        return s[r1, c1] - s[r0, c1] - s[r1, c0] + s[r0, c0]
+
+    domains, todo = [], [(0, len(ca))]
+    while todo:
+        a, b = todo.pop()
+        cuts = np.arange(a + min_size, b - min_size + 1)
+        if not len(cuts):
+            domains.append((a, b))
+            continue
+        intra1, intra2 = block(a, cuts, a, cuts), block(cuts, b, cuts, b)
+        inter = block(a, cuts, cuts, b)
+        ratio = inter / np.sqrt(np.maximum(intra1 * intra2, 1))
+        best = int(np.argmin(ratio))
+        if ratio[best] >= max_ratio:
+            domains.append((a, b))
+            continue
+        todo += [(a, int(cuts[best])), (int(cuts[best]), b)]
+    return sorted(domains)
+
+
+# ── cutting ───────────────────────────────────────────────────────────────────
+def _code(n):
+    """n-th DALI code: d001 ... d00z, d010, ... (4 characters, never a PDB id)"""
+    if n >= len(CODE_DIGITS) ** 3:
+        raise ValueError(f"more than {len(CODE_DIGITS) ** 3 - 1} domains; DALI codes are 4 characters")
+    digits = ""
+    for _ in range(3):
+        n, r = divmod(n, len(CODE_DIGITS))
+        digits = CODE_DIGITS[r] + digits
+    return f"d{digits}"
+
+
+def _domain_pdb(st, chain_name, residues):
+    import gemmi  # pip install gemmi
+
+    out = gemmi.Structure()
+    out.cell, out.spacegroup_hm = st.cell, st.spacegroup_hm
+    chain = gemmi.Chain(chain_name)
+    for res in residues:
+        chain.add_residue(res)
+    model = gemmi.Model("1")
+    model.add_chain(chain)
+    out.add_model(model)
+    out.setup_entities()
+    return out.make_pdb_string()
+
+
+def _region_label(segments):
+    return ",".join(f"{a}-{b}" for a, b in segments)
+
+
+def chain_domains(polymer, hits, superfamilies=None):
+    """[(1-based segments, superfamily, source)] to cut from one chain; hits are its SUPERFAMILY rows."""
+    n = len(polymer)
+    if hits:
+        domains = []
+        for segments, sf in hits:
+            segments = [(max(1, a), min(n, b)) for a, b in segments if a <= n]
+            if sum(b - a + 1 for a, b in segments) < MIN_REGION:
+                continue
+            if superfamilies and sf and sf not in superfamilies:
+                continue            # a superfamily the reference does not have
+            domains.append((segments, sf, "superfamily"))
+        return domains
+    positions, ca = [], []
+    for i, res in enumerate(polymer):
+        atom = res.find_atom("CA", "*")
+        if atom:
+            positions.append(i + 1)
+            ca.append(atom.pos.tolist())
+    if len(ca) < 2 * MIN_DOMAIN:
+        return [([(1, n)], "", "whole")]
+    return [([(positions[a], positions[b - 1])], "", "geometric") for a, b in geometric_domains(ca)]
+
+
+def split_library(queries, assignments, superfamilies, out_dir, keep=None):
+    """
+    Cut the protein chains of *queries* ([(pdb_file, pdb_base)]) into domain
+    PDBs in *out_dir*; *keep(chain_id)* limits the chains (e.g. to cluster
+    representatives).  Unchanged files are not rewritten, so their DATs stay
+    valid.  Returns and saves (domains.json) {domain label: info}.
+    """
+    import gemmi  # pip install gemmi
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    # Codes are keyed by chain and region, never by position in the library
+    previous = {(d["chain"], d["region"]): label.partition("_")[0] for label, d in load_domains(out_dir).items()}
+    taken = set(previous.values())
+    fresh = (code for code in map(_code, itertools.count(1)) if code not in taken)
+    domains, written = {}, set()
+    for pdb_file, pdb_base in sorted(queries):
+        st = gemmi.read_structure(str(pdb_file))
+        st.setup_entities()
+        for chain in st[0]:
+            polymer = chain.get_polymer()
+            if polymer.check_polymer_type() not in (gemmi.PolymerType.PeptideL, gemmi.PolymerType.PeptideD):
+                continue
+            chain_id = dali_chain_id(pdb_file, chain.name)
+            if keep is not None and not keep(chain_id):
+                continue
+            label = f"{pdb_base.lower()}_{chain.name}"
+            hits = assignments.get(chain_id) or assignments.get(label)
+            for segments, sf, source in chain_domains(polymer, hits, superfamilies):
+                code = previous.get((label, _region_label(segments))) or next(fresh)
+                residues = [polymer[i - 1] for a, b in segments for i in range(a, b + 1)]
+                text = _domain_pdb(st, chain.name, residues)
+                path = out_dir / f"{code}.pdb"
+                if not path.exists() or path.read_text() != text:
+                    path.write_text(text)
+                written.add(path.name)
+                domains[f"{code}_{chain.name}"] = {
+                    "file": str(path), "base": code.upper(), "chain": label,
+                    "region": _region_label(segments), "superfamily": sf, "source": source,
+                    "length": len(residues), "chain_length": len(polymer)}
+    for stale in out_dir.glob("d*.pdb"):
+        if stale.name not in written:
+            stale.unlink()
+    (out_dir / "domains.json").write_text(json.dumps(domains, indent=2))
+    return domains
+
+
+def load_domains(out_dir):
+    path = Path(out_dir) / "domains.json"
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def write_fasta(pdb_files, out_fasta):
+    """Chain sequences with DALI chain ids as headers, the input for SUPERFAMILY."""
+    from seqcluster import chain_sequences
+
+    sequences = chain_sequences(pdb_files)
+    Path(out_fasta).write_text("".join(f">{cid}\n{seq}\n" for cid, seq in sequences.items()))
+    return len(sequences)
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Cut query chains into per-domain PDBs for DALI.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_fasta = sub.add_parser("fasta", help="Write the chain sequences to run SUPERFAMILY on")
+    p_fasta.add_argument("pdb_dir", nargs="?", default="input_pdbs")
+    p_fasta.add_argument("--out", default="queries.fa")
+
+    p_split = sub.add_parser("split", help="Write per-domain PDBs and domains.json")
+    p_split.add_argument("pdb_dir", nargs="?", default="input_pdbs")
+    p_split.add_argument("--assignments", nargs="*", default=[], metavar="ASS",
+                         help="SUPERFAMILY .ass/.html results for the query chains")
+    p_split.add_argument("--ref-superfamily", nargs="*", default=[], metavar="SUNID|FILE",
+                         help="Superfamily sunids or the reference's .ass/.html; other domains are dropped")
+    p_split.add_argument("--exclude", nargs="*", default=["refx.pdb"], help="Files that are not queries")
+    p_split.add_argument("--out", default="dali_work/domains")
+    args = parser.parse_args()
+
+    pdb_files = sorted(p for p in Path(args.pdb_dir).glob("*.pdb") if p.name not in getattr(args, "exclude", []))
+    if not pdb_files:
+        print(f"❌ No PDB files in {args.pdb_dir}")
+        sys.exit(1)
+    if args.command == "fasta":
+        n = write_fasta(pdb_files, args.out)
+        print(f"✅ Wrote {n} chain sequences to {args.out}")
+        return
+
+    try:
+        superfamilies = {s for s in args.ref_superfamily if s.isdigit()}
+        superfamilies |= reference_superfamilies([s for s in args.ref_superfamily if not s.isdigit()])
+        queries = [(p, p.stem.upper().split("_")[0]) for p in pdb_files]
+        domains = split_library(queries, read_assignments(args.assignments), superfamilies, args.out)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    chains = {d["chain"] for d in domains.values()}
+    kept = sum(d["length"] for d in domains.values())
+    print(f"✅ {len(chains)} chains → {len(domains)} domains ({kept} residues) in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
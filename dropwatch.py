@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+dropwatch.py
+--------------------
+Watch-folder daemon: push new or changed FASTA/PDB drops through the
+relevant stages as soon as they land, instead of rerunning a full batch.
+
+    input_pdbs/X.pdb (query)      import X → compare its chains against the
+                                  reference(s) → upsert rows of
+                                  zscore_summary.csv / zscore_wide.csv
+    input_pdbs/refx.pdb (or a     re-import it and re-compare every query
+    --refs reference)             (the only full rerun)
+    fasta/X.fa                    SUPERFAMILY scan (supfamhtml.py), in its own
+                                  lane so long scans don't hold up DALI drops
+
+Changes are detected with inotify (Linux, through ctypes; close-write and
+move-in events only, so half-written files are never seen) and otherwise by
+polling size/mtime.  Events are debounced: a file is processed once it has
+been quiet for --debounce seconds and its size/mtime is stable; drops that
+arrive together are imported and compared as one concurrent batch.
+
+Processed files are remembered with their size/mtime in the state file, so
+a restart only catches up on what changed while the daemon was down
+(--skip-existing marks the current files as done without processing them).
+Sequence clustering and domain splitting stay batch steps of dali.py.
+
+Usage:
+    python dropwatch.py [--refs a.pdb b.pdb:B] [--backend native] [--debounce 1] [--workers 8]
+    python dropwatch.py --once          # catch up on changed files, then exit
+"""
+
+import argparse
+import csv
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from asyncrunner import run_jobs
+from dali import DaliPipeline
+import tracing
+
+FASTA_DIR = "fasta"
+STATE_FILE = ".dropwatch_state.json"
+DEBOUNCE = 1.0          # seconds a file must be quiet before it is processed
+POLL_INTERVAL = 1.0     # seconds between scans of the polling watcher
+PDB_SUFFIXES = (".pdb",)
+FASTA_SUFFIXES = (".fa", ".fasta")
+
+# inotify(7)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+_EVENT = struct.Struct("iIII")
+
+
+def signature(path):
+    """(size, mtime_ns) of *path*, None if it is gone."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _relevant(name):
+    return not name.startswith(".") and name.endswith(PDB_SUFFIXES + FASTA_SUFFIXES)
+
+
+def scan(dirs):
+    """{path: signature} of the relevant files in *dirs*."""
+    files = {}
+    for d in dirs:
+        try:
+            entries = list(os.scandir(d))
+        except OSError:
+            continue
+        for entry in entries:
+            if entry.is_file() and _relevant(entry.name):
+                st = entry.stat()
+                files[str(Path(d) / entry.name)] = (st.st_size, st.st_mtime_ns)
+    return files
+
+
+# ── watchers ──────────────────────────────────────────────────────────────────
+class PollingWatcher:
+    """Portable fallback: compare directory snapshots."""
+
+    method = "polling"
+
+    def __init__(self, dirs, interval=POLL_INTERVAL):
+        self.dirs, self.interval = dirs, interval
+        self.snapshot = scan(dirs)
+
+    def poll(self, timeout):
+        time.sleep(min(timeout, self.interval))
+        current = scan(self.dirs)
+        changed = {p for p, sig in current.items() if self.snapshot.get(p) != sig}
+        self.snapshot = current
+        return changed
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """Linux inotify through libc; raises OSError where it is unavailable."""
+
+    method = "inotify"
+
+    def __init__(self, dirs):
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify needs Linux")
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}
+        for d in dirs:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(d), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {d}")
+            self.dirs[wd] = Path(d)
+
+    def poll(self, timeout):
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        changed = set()
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset + _EVENT.size <= len(data):
+            wd, mask, _, length = _EVENT.unpack_from(data, offset)
+            name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0").decode(errors="replace")
+            offset += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                # Events were dropped by the kernel: fall back to a full scan
+                changed |= set(scan(list(self.dirs.values())))
+            elif wd in self.dirs and _relevant(name):
+                changed.add(str(self.dirs[wd] / name))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+def make_watcher(dirs, method="auto"):
+    if method in ("auto", "inotify"):
+        try:
+            return InotifyWatcher(dirs)
+        except (OSError, AttributeError) as e:
+            if method == "inotify":
+                raise
+            print(f"⚠️ inotify unavailable ({e}); polling every {POLL_INTERVAL:.0f}s")
+    return PollingWatcher(dirs)
+
+
+class Debouncer:
+    """Holds changed paths until they have been quiet for *delay* seconds with a stable size/mtime."""
+
+    def __init__(self, delay=DEBOUNCE):
+        self.delay = delay
+        self.pending = {}       # path → (time of last event, signature then)
+
+    def add(self, paths):
+        now = time.monotonic()
+        for path in paths:
+            self.pending[path] = (now, signature(path))
+
+    def ready(self):
+        now, ready = time.monotonic(), []
+        for path, (seen, sig) in list(self.pending.items()):
+            if now - seen < self.delay:
+                continue
+            current = signature(path)
+            if current != sig:
+                self.pending[path] = (now, current)     # still being written
+            elif current is not None:
+                ready.append(path)
+                del self.pending[path]
+            else:
+                del self.pending[path]                  # removed again
+        return sorted(ready)
+
+    def wait_time(self):
+        if not self.pending:
+            return POLL_INTERVAL
+        oldest = min(seen for seen, _ in self.pending.values())
+        return max(0.05, self.delay - (time.monotonic() - oldest))
+
+
+# ── summary tables ────────────────────────────────────────────────────────────
+def upsert_csv(path, header, rows):
+    """
+    Add *rows* (first column is the key) to a CSV.  New keys are appended;
+    the file is only rewritten when a key is already present (its columns
+    are replaced) or *header* has columns the file lacks.  Columns the file
+    has beyond *header* (e.g. representative, domain) are kept.
+    """
+    path = Path(path)
+    old_header, old_rows = list(header), []
+    if path.exists() and path.stat().st_size:
+        with path.open(newline="") as fh:
+            old_header, *old_rows = list(csv.reader(fh))
+    columns = old_header + [c for c in header if c not in old_header]
+    new = {row[0]: dict(zip(header, row)) for row in rows}
+    if old_rows and columns == old_header and not {row[0] for row in old_rows} & new.keys():
+        with path.open("a", newline="") as fh:
+            csv.writer(fh).writerows([d.get(c, "") for c in columns] for d in new.values())
+        return
+    merged = []
+    for row in old_rows:
+        d = dict(zip(old_header, row))
+        d.update(new.pop(row[0], {}))       # a chain was dropped again
+        merged.append(d)
+    tmp = path.with_suffix(".tmp")
+    with tmp.open("w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(columns)
+        writer.writerows([d.get(c, "") for c in columns] for d in merged + list(new.values()))
+    os.replace(tmp, path)
+
+
+# ── incremental stages ────────────────────────────────────────────────────────
+class DropProcessor:
+    def __init__(self, pipeline: DaliPipeline, fasta_dir=FASTA_DIR, state_file=STATE_FILE):
+        self.pipeline = pipeline
+        self.fasta_dir = Path(fasta_dir)
+        self.state_file = Path(state_file)
+        self.state = json.loads(self.state_file.read_text()) if self.state_file.exists() else {}
+        self.lock = threading.Lock()
+
+    @property
+    def dirs(self):
+        return [d for d in (self.pipeline.pdb_dir, self.fasta_dir) if d.is_dir()]
+
+    def _done(self, paths):
+        with self.lock:
+            for path in paths:
+                sig = signature(path)
+                if sig is not None:
+                    self.state[str(path)] = list(sig)
+            tmp = self.state_file.with_suffix(".tmp")
+            tmp.write_text(json.dumps(self.state, indent=1, sort_keys=True))
+            os.replace(tmp, self.state_file)
+
+    def changed_since_last_run(self):
+        return [p for p, sig in scan(self.dirs).items() if self.state.get(p) != list(sig)]
+
+    def mark_all_done(self):
+        self._done(scan(self.dirs))
+
+    def _is_reference(self, path):
+        return Path(path).resolve() in {p.resolve() for p in self.pipeline._reference_files()}
+
+    def _references(self):
+        """(ref_chain, column name) of every reference"""
+        if self.pipeline.references:
+            return [(ref["chain"], ref["name"]) for ref in self.pipeline.references]
+        return [(self.pipeline.ref_chain, "zscore")]
+
+    def process_pdbs(self, paths):
+        p = self.pipeline
+        refs = [path for path in paths if self._is_reference(path)]
+        if refs:
+            print(f"📌 Reference changed ({', '.join(Path(r).name for r in refs)}): full DALI rerun")
+            ok = p.run_multi_reference() if p.references else p.run_pipeline()
+            if ok:
+                self._done(paths)
+            return ok
+
+        queries = [(Path(path), Path(path).stem.upper().split("_")[0]) for path in paths]
+        start = time.perf_counter()
+        chain_ids = self._import(queries)
+        if not chain_ids:
+            return False
+        zscores = self._compare(chain_ids, queries)
+        self._write_tables(zscores)
+        self._done([str(f) for f, base in queries if any(c.startswith(base) for c in chain_ids)])
+        print(f"✅ {len(queries)} dropped structure(s), {len(chain_ids)} chain(s) scored "
+              f"in {time.perf_counter() - start:.1f}s")
+        return True
+
+    def import_references(self):
+        """Import the reference(s) unless their DAT files exist (first drop before any batch run)"""
+        p = self.pipeline
+        if p.backend == "native":
+            return True
+        p.work_dir.mkdir(parents=True, exist_ok=True)
+        if p.references:
+            return p.import_references()    # reuses DATs that match references.json
+        if (p.dat2_dir / f"{p.ref_chain.upper()}.dat").exists():
+            return True
+        return p.run_import(p._prepare_reference(p.pdb_dir / p.ref_pdb), p.ref_base.upper(), p.dat2_dir)
+
+    def _import(self, queries):
+        """DALI chain ids of the imported *queries*"""
+        p = self.pipeline
+        if p.backend == "native":
+            from seqcluster import chain_sequences
+            return [cid for f, _ in queries for cid in chain_sequences([f])]
+
+        def do_import():
+            if not self.import_references():
+                return False
+            jobs = [p._import_job(f, base, p.dat1_dir) for f, base in queries]
+            results = run_jobs(jobs, p.log_dir, limits={"import": p.workers}, max_parallel=p.workers)
+            return any([p._check_import(r, base, p.dat1_dir) for r, (_, base) in zip(results, queries)])
+
+        if not p.run_step("import", do_import):
+            return []
+        return sorted(dat.stem for _, base in queries for dat in p.chain_dats(base, p.dat1_dir)
+                      if len(dat.stem) == len(base) + 1)
+
+    def _compare(self, chain_ids, queries):
+        """{chain id: {column: Z-score}} for the freshly imported chains"""
+        p = self.pipeline
+        refs = self._references()
+
+        def compare():
+            if p.backend == "native":
+                files = {base: f for f, base in queries}
+                wanted = {cid: (files[base], cid[len(base):])
+                          for cid in chain_ids for base in files if cid.startswith(base)}
+                return p.run_native_comparisons(p._native_references(), wanted)
+            pairs = [(cid, ref_chain) for cid in chain_ids for ref_chain, _ in refs]
+            jobs = [p._comparison_job(cid, ref_chain) for cid, ref_chain in pairs]
+            results = run_jobs(jobs, p.log_dir, limits={"dali": p.workers}, max_parallel=p.workers)
+            return any([p._collect_comparison(cid, r, ref_chain) for (cid, ref_chain), r in zip(pairs, results)])
+
+        p.run_step("compare", compare)
+        zscores = {}
+        for cid in chain_ids:
+            for ref_chain, column in refs:
+                z = p._extract_zscore(p.output_path(cid, ref_chain))
+                zscores.setdefault(cid, {})[column] = z
+        return zscores
+
+    def _write_tables(self, zscores):
+        p = self.pipeline
+        label = p._chain_label
+        if p.references:
+            names = [name for _, name in self._references()]
+            rows = [[label(cid)] + [row.get(name, "NA") for name in names] for cid, row in sorted(zscores.items())]
+            upsert_csv(p.zscore_wide_csv, ["chain_id"] + names, rows)
+            print(f"📊 {len(rows)} row(s) → {p.zscore_wide_csv}")
+        else:
+            rows = [[label(cid), row["zscore"]] for cid, row in sorted(zscores.items()) if row["zscore"] != "NA"]
+            upsert_csv(p.zscore_csv, ["chain_id", "zscore"], rows)
+            print(f"📊 {len(rows)} Z-score(s) → {p.zscore_csv}")
+
+    def process_fastas(self, paths):
+        import supfamhtml
+
+        for path in paths:
+            with tracing.get_tracer().span("superfamily", target=Path(path).stem) as info:
+                try:
+                    ok = supfamhtml.run_superfamily_pipeline(path)
+                except OSError as e:
+                    print(f"❌ SUPERFAMILY failed for {Path(path).name}: {e}")
+                    ok = False
+                info["status"] = "ok" if ok else "failed"
+            if ok:
+                self._done([path])
+
+
+# ── main loop ─────────────────────────────────────────────────────────────────
+def watch(processor: DropProcessor, debounce=DEBOUNCE, method="auto", once=False):
+    pdb_dir, fasta_dir = processor.pipeline.pdb_dir.resolve(), processor.fasta_dir.resolve()
+    supfam_lane = ThreadPoolExecutor(max_workers=1, thread_name_prefix="supfam")
+    pending_supfam = []
+
+    def dispatch(paths):
+        pdbs = [p for p in paths if p.endswith(PDB_SUFFIXES) and Path(p).resolve().parent == pdb_dir]
+        fastas = [p for p in paths if p.endswith(FASTA_SUFFIXES) and Path(p).resolve().parent == fasta_dir]
+        if fastas:
+            print(f"🧬 {len(fastas)} FASTA drop(s): {', '.join(Path(f).name for f in fastas)}")
+            pending_supfam.append(supfam_lane.submit(processor.process_fastas, fastas))
+        if pdbs:
+            print(f"📥 {len(pdbs)} PDB drop(s): {', '.join(Path(p).name for p in pdbs)}")
+            try:
+                processor.process_pdbs(pdbs)
+            except Exception as e:      # keep the daemon alive; the files are retried on their next change
+                print(f"❌ Processing failed: {e}")
+
+    catch_up = processor.changed_since_last_run()
+    if catch_up:
+        print(f"♻️ {len(catch_up)} file(s) changed since the last run")
+    if once:
+        dispatch(catch_up)
+        supfam_lane.shutdown(wait=True)
+        return
+
+    watcher = make_watcher([str(d) for d in processor.dirs], method)
+    debouncer = Debouncer(debounce)
+    debouncer.add(catch_up)
+    print(f"👀 Watching {', '.join(str(d) for d in processor.dirs)} ({watcher.method}, debounce {debounce:g}s)")
+    try:
+        while True:
+            debouncer.add(watcher.poll(debouncer.wait_time()))
+            ready = debouncer.ready()
+            if ready:
+                dispatch(ready)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping (waiting for running SUPERFAMILY scans)")
+    finally:
+        watcher.close()
+        supfam_lane.shutdown(wait=True)
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Process new or changed FASTA/PDB drops incrementally.")
+    parser.add_argument("--fasta-dir", default=FASTA_DIR, help=f"Watched FASTA directory (default: {FASTA_DIR})")
+    parser.add_argument("--refs", nargs="+", metavar="PDB[:CHAIN]",
+                        help="Multi-reference mode (as dali.py --refs); rows go to zscore_wide.csv")
+    parser.add_argument("--backend", choices=["dalilite", "native"], default="dalilite")
+    parser.add_argument("--workers", type=int, help="Concurrent import/DALI jobs (default: CPU count)")
+    parser.add_argument("--dali-bin", metavar="DIR", help="Directory with dali.pl and import.pl")
+    parser.add_argument("--debounce", type=float, default=DEBOUNCE, help=f"Quiet seconds before processing (default: {DEBOUNCE})")
+    parser.add_argument("--method", choices=["auto", "inotify", "polling"], default="auto")
+    parser.add_argument("--state", default=STATE_FILE, help=f"Processed-file state (default: {STATE_FILE})")
+    parser.add_argument("--skip-existing", action="store_true", help="Mark the current files as processed and exit")
+    parser.add_argument("--once", action="store_true", help="Process files changed since the last run, then exit")
+    parser.add_argument("--trace", metavar="DIR", help="Record timing/resource trace files in DIR")
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace)
+
+    pipeline = DaliPipeline()
+    pipeline.backend = args.backend
+    if args.workers:
+        pipeline.workers = args.workers
+    if args.dali_bin:
+        pipeline.dali_pl = Path(args.dali_bin).resolve() / "dali.pl"
+        pipeline.import_pl = Path(args.dali_bin).resolve() / "import.pl"
+    for ref in args.refs or []:
+        pdb_name, _, chain = ref.partition(":")
+        pipeline.add_reference(pdb_name, chain or "A")
+    if not pipeline.check_prerequisites():
+        sys.exit(1)
+
+    processor = DropProcessor(pipeline, args.fasta_dir, args.state)
+    if args.skip_existing:
+        processor.mark_all_done()
+        print(f"✅ Marked {len(processor.state)} existing files as processed ({args.state})")
+        return
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    watch(processor, args.debounce, args.method, args.once)
+
+
+if __name__ == "__main__":
+    main()
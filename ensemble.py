@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+ensemble.py
+--------------------
+Seed/sample ensemble analysis of Protenix outputs.
+
+Protenix writes several samples per seed, e.g.
+    predicted_structures/tmp_target/target/seed_101/predictions/target_seed_101_sample_0.cif
+but the pipeline keeps only one of them.  This script loads the CA atoms of
+ALL samples of a target into one (M, N, 3) array (no intermediate PDBs) and
+computes, in batched NumPy:
+
+• the full pairwise superposed RMSD and TM-score matrices
+  (Kabsch superposition, refined by a few TM-weighted Kabsch iterations);
+• greedy RMSD clustering (largest neighbourhood first, as in SPICKER);
+• a per-residue variability profile (RMSF after iterative superposition on
+  the ensemble mean) together with the mean pLDDT per residue.
+
+Outputs per target (in --out):
+    <target>_ensemble.json      samples, matrices, clusters, medoid
+    <target>_variability.csv    chain, residue, RMSF, mean pLDDT
+
+Samples are grouped per Protenix run (the directory holding seed_<n>/), so
+two runs of one target stay two ensembles, labelled <target>@<run dir>.
+The target is the job name Protenix put in the file names (from the input
+JSON); --name overrides it when the inputs hold a single ensemble, e.g. the
+stagedag.py target whose work/X/X_ensemble.json is expected.
+
+Usage:
+    python ensemble.py predicted_structures/tmp_target --out ensemble/
+    python ensemble.py predicted_structures/ --out ensemble/ --workers 8   # every target below
+    python ensemble.py archive/ --out ensemble/                           # packed targets (predarchive.py)
+    python ensemble.py predicted_structures/tmp_X --out work/X --name X
+"""
+
+import argparse
+import csv
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+SAMPLE_RE = re.compile(r"^(?P<target>.+)_seed_(?P<seed>\d+)_sample_(?P<sample>\d+)\.cif$")
+SEED_DIR_RE = re.compile(r"^seed_\d+$")
+CLUSTER_CUTOFF = 2.0    # Å, RMSD neighbourhood for clustering
+TM_ITERATIONS = 3       # TM-weighted Kabsch refinements per pair
+PAIR_BLOCK = 2_000_000  # max pair × residue elements processed at once
+
+
+# ── discovery / loading ───────────────────────────────────────────────────────
+def run_dir(path):
+    """Output directory of the Protenix run a sample belongs to: the parent of its seed_<n>/ directory."""
+    for parent in Path(path).parents:
+        if SEED_DIR_RE.match(parent.name):
+            return parent.parent
+    return Path(path).parent
+
+
+def find_samples(pred_dir):
+    """{(run dir, target): [(seed, sample, path), ...]} for every sample CIF below *pred_dir*.
+
+    Samples are grouped per run: two Protenix runs of the same target are two ensembles.
+    """
+    targets = {}
+    for path in sorted(Path(pred_dir).rglob("*_sample_*.cif")):
+        m = SAMPLE_RE.match(path.name)
+        if m:
+            targets.setdefault((run_dir(path), m["target"]), []).append((int(m["seed"]), int(m["sample"]), path))
+    for samples in targets.values():
+        samples.sort()
+    return targets
+
+
+def ensemble_labels(keys):
+    """{(run dir or archive, target): output label}: the target name, plus its run path when several runs share it."""
+    keys = sorted(keys)
+    runs = {}
+    for run, target in keys:
+        runs.setdefault(target, []).append(run)
+    labels = {}
+    for run, target in keys:
+        if len(runs[target]) == 1:
+            labels[run, target] = target
+            continue
+        # Shortest trailing part of the run paths that tells the runs apart, e.g. 7.6.2.14@runB
+        for depth in range(1, len(run.parts) + 1):
+            suffixes = ["-".join(r.resolve().parts[-depth - 1:-1]) for r in runs[target]]
+            if len(set(suffixes)) == len(suffixes):
+                break
+        labels[run, target] = f"{target}@{suffixes[runs[target].index(run)]}"
+    return labels
+
+
+def _read_ca(path):
+    """{(chain, num, icode): (resname, xyz, b_iso)} for the polymer CA atoms of the first model."""
+    import gemmi  # pip install gemmi
+
+    st = gemmi.read_structure(str(path))
+    residues = {}
+    for chain in st[0]:
+        for res in chain.get_polymer():
+            ca = res.find_atom("CA", "*")
+            if ca is not None:
+                residues[(chain.name, res.seqid.num, res.seqid.icode.strip())] = (
+                    res.name, (ca.pos.x, ca.pos.y, ca.pos.z), ca.b_iso)
+    return residues
+
+
+def load_archive(path):
+    """Same as load_ensemble, for a packed target (predarchive.py)."""
+    from predarchive import PredictionArchive
+
+    arc = PredictionArchive(path)
+    if not arc.samples():
+        return arc.name, [], None
+    topo = arc.topology
+    mask = arc.ca_mask()
+    keys = list(zip(topo["chain"][mask].tolist(), topo["res_seq"][mask].tolist(), topo["icode"][mask].tolist()))
+    coords = np.array([arc.coords(*key)[mask] for key in arc.samples()])
+    plddt = np.array([arc.plddt(*key) for key in arc.samples()])
+    samples = [(seed, sample, f"{path}#{seed}:{sample}") for seed, sample in arc.samples()]
+    return arc.name, samples, (coords, plddt, keys, topo["res_name"][mask].tolist())
+
+
+def load_ensemble(paths):
+    """CA coordinates (M, N, 3), pLDDT (M, N) and residue keys shared by all *paths*."""
+    parsed = [_read_ca(p) for p in paths]
+    common = set(parsed[0])
+    for residues in parsed[1:]:
+        common &= set(residues)
+    if len(common) < len(parsed[0]):
+        print(f"⚠️ Samples differ in residues; using the {len(common)} common CA atoms", file=sys.stderr)
+    keys = [k for k in parsed[0] if k in common]   # keep the file order
+    coords = np.array([[residues[k][1] for k in keys] for residues in parsed], dtype=np.float64)
+    plddt = np.array([[residues[k][2] for k in keys] for residues in parsed], dtype=np.float64)
+    names = [parsed[0][k][0] for k in keys]
+    return coords, plddt, keys, names
+
+
+# ── batched superposition ─────────────────────────────────────────────────────
+def superpose(mobile, target, weights=None):
+    """Superpose each mobile[b] onto target[b] (both (B, N, 3)); returns the moved coordinates."""
+    if weights is None:
+        weights = np.ones(mobile.shape[:2])
+    w = weights / weights.sum(axis=1, keepdims=True)
+    cm = np.einsum("bn,bnk->bk", w, mobile)
+    ct = np.einsum("bn,bnk->bk", w, target)
+    p = mobile - cm[:, None]
+    q = target - ct[:, None]
+    h = np.einsum("bn,bnk,bnl->bkl", w, p, q)
+    u, _, vt = np.linalg.svd(h)
+    d = np.sign(np.linalg.det(np.matmul(u, vt)))
+    u[:, :, 2] *= d[:, None]          # avoid reflections
+    rot = np.matmul(u, vt)            # row vectors: p @ rot
+    return np.matmul(p, rot) + ct[:, None]
+
+
+def tm_d0(n):
+    return max(0.5, 1.24 * np.cbrt(max(n, 19) - 15) - 1.8)
+
+
+def pairwise_scores(coords, tm_iterations=TM_ITERATIONS):
+    """Superposed RMSD and TM-score matrices (M, M) for an ensemble (M, N, 3)."""
+    m, n, _ = coords.shape
+    rmsd = np.zeros((m, m))
+    tm = np.ones((m, m))
+    d0 = tm_d0(n)
+    ii, jj = np.triu_indices(m, k=1)
+    block = max(1, PAIR_BLOCK // max(n, 1))
+    for s in range(0, len(ii), block):
+        i, j = ii[s:s + block], jj[s:s + block]
+        a, b = coords[i], coords[j]
+        d2 = ((superpose(b, a) - a) ** 2).sum(axis=2)
+        rmsd[i, j] = rmsd[j, i] = np.sqrt(d2.mean(axis=1))
+
+        # TM-score under the RMSD superposition, refined by TM-weighted superpositions
+        best = (1.0 / (1.0 + d2 / d0 ** 2)).mean(axis=1)
+        for _ in range(tm_iterations):
+            w = 1.0 / (1.0 + d2 / d0 ** 2)
+            d2 = ((superpose(b, a, w) - a) ** 2).sum(axis=2)
+            best = np.maximum(best, (1.0 / (1.0 + d2 / d0 ** 2)).mean(axis=1))
+        tm[i, j] = tm[j, i] = best
+    return rmsd, tm
+
+
+# ── clustering / variability ──────────────────────────────────────────────────
+def cluster(rmsd, cutoff=CLUSTER_CUTOFF):
+    """Greedy clustering: repeatedly take the sample with most unassigned neighbours within *cutoff*."""
+    neighbours = rmsd <= cutoff
+    unassigned = np.ones(len(rmsd), dtype=bool)
+    clusters = []
+    while unassigned.any():
+        counts = (neighbours & unassigned).sum(axis=1) * unassigned
+        center = int(np.argmax(counts))
+        members = np.flatnonzero(neighbours[center] & unassigned)
+        unassigned[members] = False
+        clusters.append({"center": center, "members": members.tolist()})
+    return clusters
+
+
+def variability(coords, start=0, iterations=3):
+    """Per-residue RMSF (Å) after iterative superposition of all samples on their mean."""
+    ref = coords[start]
+    for _ in range(iterations):
+        fitted = superpose(coords, np.broadcast_to(ref, coords.shape))
+        ref = fitted.mean(axis=0)
+    return np.sqrt(((fitted - ref) ** 2).sum(axis=2).mean(axis=0))
+
+
+# ── per-target analysis ───────────────────────────────────────────────────────
+def analyze_target(target, samples, out_dir, cutoff=CLUSTER_CUTOFF):
+    """Analyse one target's samples (or a packed archive); writes the JSON/CSV and returns the JSON payload."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if isinstance(samples, (str, Path)):
+        name, samples, loaded = load_archive(samples)
+        target = target or name
+        if not samples:
+            return None     # MSA-only archive
+    else:
+        loaded = load_ensemble([p for _, _, p in samples])
+    coords, plddt, keys, names = loaded
+    rmsd, tm = pairwise_scores(coords)
+    clusters = cluster(rmsd, cutoff)
+    medoid = int(np.argmin(rmsd.mean(axis=1)))
+    rmsf = variability(coords, start=medoid)
+    mean_plddt = plddt.mean(axis=0)
+
+    result = {
+        "target": target,
+        "n_samples": len(samples),
+        "n_residues": len(keys),
+        "samples": [{"seed": seed, "sample": sample, "path": str(path),
+                     "mean_plddt": round(float(plddt[k].mean()), 2)}
+                    for k, (seed, sample, path) in enumerate(samples)],
+        "medoid": medoid,
+        "cluster_cutoff": cutoff,
+        "clusters": clusters,
+        "mean_pairwise_rmsd": round(float(rmsd[np.triu_indices(len(rmsd), 1)].mean()), 3) if len(rmsd) > 1 else 0.0,
+        "rmsd": np.round(rmsd, 3).tolist(),
+        "tm": np.round(tm, 4).tolist(),
+    }
+    (out_dir / f"{target}_ensemble.json").write_text(json.dumps(result, indent=1))
+
+    with (out_dir / f"{target}_variability.csv").open("w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(["chain", "residue", "icode", "resname", "rmsf", "mean_plddt"])
+        for (chain, num, icode), name, f, p in zip(keys, names, rmsf, mean_plddt):
+            writer.writerow([chain, num, icode, name, f"{f:.3f}", f"{p:.2f}"])
+    return result
+
+
+def _analyze(args):
+    target, samples, out_dir, cutoff = args
+    result = analyze_target(target, samples, out_dir, cutoff)
+    if result is None:
+        return None
+    return result["target"], result["n_samples"], result["n_residues"], result["mean_pairwise_rmsd"], len(result["clusters"])
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Pairwise RMSD/TM, clustering and variability over Protenix samples.")
+    parser.add_argument("pred_dirs", nargs="+", help="Protenix output directories (searched recursively)")
+    parser.add_argument("--out", default="ensemble", help="Output directory (default: ensemble)")
+    parser.add_argument("--cutoff", type=float, default=CLUSTER_CUTOFF, help="Clustering RMSD cutoff in Å")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Targets analysed in parallel")
+    parser.add_argument("--name", help="Output label of the only ensemble in the inputs (default: its target name)")
+    args = parser.parse_args()
+
+    from predarchive import archive_name, find_archives
+
+    targets = {}
+    archives = []
+    for pred_dir in args.pred_dirs:
+        targets.update(find_samples(pred_dir))
+        archives.extend(find_archives(pred_dir))
+    if not targets and not archives:
+        print("❌ No *_seed_*_sample_*.cif files or .ppred.npz archives found")
+        sys.exit(1)
+
+    # An archive takes part in the labelling like a run directory, so same-named targets never share outputs
+    targets.update({(a, archive_name(a)): a for a in archives})
+    labels = ensemble_labels(targets)
+    tasks = [(labels[key], s, args.out, args.cutoff) for key, s in sorted(targets.items())]
+    if args.name:
+        if len(tasks) != 1:
+            print(f"❌ --name needs exactly one ensemble, found {len(tasks)}")
+            sys.exit(1)
+        tasks = [(args.name, *tasks[0][1:])]
+    with ProcessPoolExecutor(max_workers=min(args.workers, len(tasks))) as pool:
+        for summary in filter(None, pool.map(_analyze, tasks)):
+            target, m, n, mean_rmsd, n_clusters = summary
+            print(f"✅ {target}: {m} samples × {n} CA, mean RMSD {mean_rmsd:.2f} Å, {n_clusters} cluster(s)")
+    print(f"✓ Results written to {args.out}/")
+
+
+if __name__ == "__main__":
+    main()
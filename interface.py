@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+interface.py
+--------------------
+Inter-chain interface residues of multi-chain Protenix predictions, joined
+with the per-sample confidences.
+
+Protenix reports chain_pair_iptm per sample, but not which residues make the
+contacts.  For every seed/sample of a target this script takes the heavy
+atoms of the model (mmCIF or .ppred.npz archive), builds one KD-tree per
+chain (scipy's cKDTree) and queries every chain pair whose bounding boxes
+come within --cutoff of each other in one batch call.
+The atom contacts are reduced to residues with NumPy.
+
+Outputs per target (in --out):
+    <target>_interface.csv        seed, sample, chain, residue, partner chain:
+                                  contacts, min distance, pLDDT of the residue
+                                  and of its partners, chain_pair_iptm, iptm
+    <target>_interface_pairs.csv  seed, sample, chain pair: interface size,
+                                  mean interface pLDDT, chain_pair_iptm, iptm
+
+Residue pLDDT is the CA B-factor (the atom mean for ligands); chain indices
+of chain_pair_iptm follow the chain order of the model.  Without scipy a
+blocked NumPy distance search is used (same result, slower).
+
+Usage:
+    python interface.py predicted_structures/tmp_target --out interface/
+    python interface.py predicted_structures/ archive/ --out interface/ --cutoff 4.5 --workers 8
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # pip install scipy
+    cKDTree = None
+
+CUTOFF = 5.0            # Å, heavy-atom contact distance
+ATOM_BLOCK = 4_000_000  # max atom pairs per NumPy block (fallback without scipy)
+SKIP_RESIDUES = {"HOH", "DOD", "WAT"}
+RESIDUE_COLUMNS = ["seed", "sample", "chain", "residue", "icode", "resname", "partner_chain",
+                   "n_partner_residues", "n_contacts", "min_distance", "plddt", "partner_plddt",
+                   "chain_pair_iptm", "iptm", "ranking_score"]
+PAIR_COLUMNS = ["seed", "sample", "chain_a", "chain_b", "n_residues_a", "n_residues_b", "n_contacts",
+                "min_distance", "interface_plddt", "chain_pair_iptm", "iptm", "ranking_score"]
+
+
+# ── loading ───────────────────────────────────────────────────────────────────
+def heavy_atoms(topo, coords, bfactor):
+    """Drop hydrogens and waters; keeps the topology columns used here."""
+    keep = ~np.isin(np.char.upper(topo["element"]), ["H", "D"]) & ~np.isin(topo["res_name"], list(SKIP_RESIDUES))
+    return ({k: topo[k][keep] for k in ("chain", "res_seq", "icode", "res_name", "atom_name")},
+            coords[keep], bfactor[keep])
+
+
+def read_confidence(cif_path):
+    """Summary-confidence JSON written next to a sample CIF, {} if missing."""
+    cif_path = Path(cif_path)
+    conf = cif_path.with_name(cif_path.name.replace("_sample_", "_summary_confidence_sample_")[:-4] + ".json")
+    try:
+        return json.loads(conf.read_text())
+    except (OSError, ValueError):
+        return {}
+
+
+def _sample_coords(path):
+    """Coordinates and B-factors from the atom_site table only (no structure model built)."""
+    import gemmi  # pip install gemmi
+
+    block = gemmi.cif.read(str(path)).sole_block()
+    tags = ("Cartn_x", "Cartn_y", "Cartn_z", "B_iso_or_equiv")
+    values = np.array([block.find_values(f"_atom_site.{tag}") for tag in tags], dtype=np.float64)
+    return values[:3].T, values[3]
+
+
+def load_samples(target, samples):
+    """Yield (seed, sample, topology, coords, bfactor, confidence) for CIF samples or a packed archive."""
+    from predarchive import PredictionArchive, _topology_and_coords
+
+    if isinstance(samples, (str, Path)):
+        arc = PredictionArchive(samples)
+        for seed, sample in arc.samples():
+            yield (seed, sample, *heavy_atoms(arc.topology, arc.coords(seed, sample), arc.bfactor(seed, sample)),
+                   arc.confidence(seed, sample) or {})
+        return
+    topo = None
+    for seed, sample, path in samples:
+        # All samples of a target share the topology (as in predarchive.py): parse it once
+        if topo is not None:
+            coords, bfactor = _sample_coords(path)
+        if topo is None or len(coords) != len(topo["chain"]):
+            topo, coords, bfactor = _topology_and_coords(path)
+        yield (seed, sample, *heavy_atoms(topo, coords, bfactor), read_confidence(path))
+
+
+def residues(topo, bfactor):
+    """Residue index of every atom, and per residue: chain, number, icode, name and pLDDT."""
+    keys = (topo["chain"], topo["res_seq"], topo["icode"])
+    new = np.ones(len(topo["chain"]), dtype=bool)
+    new[1:] = np.any([k[1:] != k[:-1] for k in keys], axis=0)
+    atom_res = np.cumsum(new) - 1
+    first = np.flatnonzero(new)
+    n = len(first)
+    plddt = np.bincount(atom_res, weights=bfactor, minlength=n) / np.bincount(atom_res, minlength=n)
+    ca = topo["atom_name"] == "CA"
+    plddt[atom_res[ca]] = bfactor[ca]
+    table = {"chain": topo["chain"][first], "res_seq": topo["res_seq"][first], "icode": topo["icode"][first],
+             "res_name": topo["res_name"][first], "plddt": plddt}
+    return atom_res, table
+
+
+# ── contacts ──────────────────────────────────────────────────────────────────
+def _pairs_numpy(a, b, cutoff):
+    """(i, j, d) of points of *a* and *b* within *cutoff*, in blocks of ATOM_BLOCK pairs."""
+    out_i, out_j, out_d = [], [], []
+    step = max(1, ATOM_BLOCK // max(len(b), 1))
+    for s in range(0, len(a), step):
+        d2 = ((a[s:s + step, None, :] - b[None, :, :]) ** 2).sum(axis=2)
+        i, j = np.nonzero(d2 <= cutoff ** 2)
+        out_i.append(i + s)
+        out_j.append(j)
+        out_d.append(np.sqrt(d2[i, j]))
+    return np.concatenate(out_i), np.concatenate(out_j), np.concatenate(out_d)
+
+
+def chain_contacts(coords, atom_chain, cutoff=CUTOFF):
+    """Inter-chain heavy-atom pairs within *cutoff*: atom indices (i, j) and distances."""
+    chains = list(dict.fromkeys(atom_chain.tolist()))
+    index = {c: np.flatnonzero(atom_chain == c) for c in chains}
+    lo = {c: coords[index[c]].min(axis=0) - cutoff for c in chains}
+    hi = {c: coords[index[c]].max(axis=0) + cutoff for c in chains}
+    trees = {}
+    out_i, out_j, out_d = [], [], []
+    for k, a in enumerate(chains):
+        for b in chains[k + 1:]:
+            if np.any(lo[a] > hi[b] - cutoff) or np.any(lo[b] > hi[a] - cutoff):
+                continue    # bounding boxes further apart than the cutoff
+            # Only atoms inside the other chain's (expanded) box can be in contact
+            ia = index[a][np.all((coords[index[a]] >= lo[b]) & (coords[index[a]] <= hi[b]), axis=1)]
+            ib = index[b][np.all((coords[index[b]] >= lo[a]) & (coords[index[b]] <= hi[a]), axis=1)]
+            if not len(ia) or not len(ib):
+                continue
+            if cKDTree is not None:
+                if a not in trees:
+                    trees[a] = cKDTree(coords[index[a]])
+                tree_b = cKDTree(coords[ib])
+                found = trees[a].sparse_distance_matrix(tree_b, cutoff, output_type="ndarray")
+                i, j, d = index[a][found["i"]], ib[found["j"]], found["v"]
+            else:
+                i, j, d = _pairs_numpy(coords[ia], coords[ib], cutoff)
+                i, j = ia[i], ib[j]
+            out_i.append(i)
+            out_j.append(j)
+            out_d.append(d)
+    if not out_i:
+        return np.zeros(0, int), np.zeros(0, int), np.zeros(0)
+    return np.concatenate(out_i), np.concatenate(out_j), np.concatenate(out_d)
+
+
+def residue_contacts(atom_i, atom_j, dist, atom_res, n_res):
+    """
+    Contacts per (residue, partner residue), both directions:
+    (res, partner, n atom contacts, min distance) arrays.
+    """
+    res = np.concatenate([atom_res[atom_i], atom_res[atom_j]])
+    partner = np.concatenate([atom_res[atom_j], atom_res[atom_i]])
+    dist = np.concatenate([dist, dist])
+    pair, inverse = np.unique(res.astype(np.int64) * n_res + partner, return_inverse=True)
+    count = np.bincount(inverse, minlength=len(pair))
+    min_d = np.full(len(pair), np.inf)
+    np.minimum.at(min_d, inverse, dist)
+    return pair // n_res, pair % n_res, count, min_d
+
+
+# ── per-target analysis ───────────────────────────────────────────────────────
+def _matrix(conf, key, i, j):
+    try:
+        return conf[key][i][j]
+    except (KeyError, IndexError, TypeError):
+        return None
+
+
+def _fmt(value, digits=3):
+    return "" if value is None else f"{value:.{digits}f}"
+
+
+def analyze_sample(topo, coords, bfactor, conf, cutoff=CUTOFF):
+    """Per-residue and per-chain-pair rows (without seed/sample) of one model."""
+    atom_res, table = residues(topo, bfactor)
+    n_res = len(table["chain"])
+    chains = list(dict.fromkeys(table["chain"].tolist()))
+    chain_no = {c: k for k, c in enumerate(chains)}
+    atom_i, atom_j, dist = chain_contacts(coords, topo["chain"], cutoff)
+    res, partner, count, min_d = residue_contacts(atom_i, atom_j, dist, atom_res, n_res)
+    iptm, ranking = conf.get("iptm"), conf.get("ranking_score")
+
+    res_chain = np.array([chain_no[c] for c in table["chain"]], dtype=np.int64)
+    # group the residue pairs by (residue, partner chain)
+    order = np.lexsort((partner, res_chain[partner], res))
+    res, partner, count, min_d = res[order], partner[order], count[order], min_d[order]
+    group, start = np.unique(res * len(chains) + res_chain[partner], return_index=True)
+    rows = []
+    bounds = list(start) + [len(res)]
+    for g, s, e in zip(group, bounds[:-1], bounds[1:]):
+        r, pc = int(g // len(chains)), int(g % len(chains))
+        c = chain_no[table["chain"][r]]
+        rows.append([table["chain"][r], int(table["res_seq"][r]), table["icode"][r], table["res_name"][r],
+                     chains[pc], e - s, int(count[s:e].sum()), _fmt(min_d[s:e].min()),
+                     _fmt(table["plddt"][r], 2), _fmt(table["plddt"][partner[s:e]].mean(), 2),
+                     _fmt(_matrix(conf, "chain_pair_iptm", c, pc), 4), _fmt(iptm, 4), _fmt(ranking, 4)])
+
+    pairs = []
+    for a in range(len(chains)):
+        for b in range(a + 1, len(chains)):
+            ab = (res_chain[res] == a) & (res_chain[partner] == b)
+            if not ab.any():
+                continue
+            side_a, side_b = np.unique(res[ab]), np.unique(partner[ab])
+            pairs.append([chains[a], chains[b], len(side_a), len(side_b), int(count[ab].sum()),
+                          _fmt(min_d[ab].min()), _fmt(table["plddt"][np.concatenate([side_a, side_b])].mean(), 2),
+                          _fmt(_matrix(conf, "chain_pair_iptm", a, b), 4), _fmt(iptm, 4), _fmt(ranking, 4)])
+    return rows, pairs, len(chains)
+
+
+def analyze_target(target, samples, out_dir, cutoff=CUTOFF):
+    """Interface tables of one target's samples (or a packed archive); returns a summary dict."""
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if isinstance(samples, (str, Path)) and not target:
+        from predarchive import archive_name
+        target = archive_name(samples)
+    all_rows, all_pairs, n_samples, n_chains = [], [], 0, 0
+    for seed, sample, topo, coords, bfactor, conf in load_samples(target, samples):
+        rows, pairs, n_chains = analyze_sample(topo, coords, bfactor, conf, cutoff)
+        all_rows.extend([seed, sample, *row] for row in rows)
+        all_pairs.extend([seed, sample, *pair] for pair in pairs)
+        n_samples += 1
+    if n_chains < 2:
+        return {"target": target, "n_samples": n_samples, "n_chains": n_chains}
+
+    for name, columns, rows in (("interface", RESIDUE_COLUMNS, all_rows),
+                                ("interface_pairs", PAIR_COLUMNS, all_pairs)):
+        with (out_dir / f"{target}_{name}.csv").open("w", newline="") as fh:
+            writer = csv.writer(fh)
+            writer.writerow(columns)
+            writer.writerows(rows)
+    interfaces = sorted({f"{row[2]}-{row[3]}" for row in all_pairs})
+    return {"target": target, "n_samples": n_samples, "n_chains": n_chains, "interfaces": interfaces,
+            "mean_residues": len(all_rows) / max(n_samples, 1)}
+
+
+def _analyze(args):
+    target, samples, out_dir, cutoff = args
+    try:
+        return analyze_target(target, samples, out_dir, cutoff)
+    except (OSError, ValueError, RuntimeError) as e:
+        return {"target": target or str(samples), "error": str(e)}
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Per-residue inter-chain interfaces of Protenix samples.")
+    parser.add_argument("pred_dirs", nargs="+", help="Protenix output directories or archives (searched recursively)")
+    parser.add_argument("--out", default="interface", help="Output directory (default: interface)")
+    parser.add_argument("--cutoff", type=float, default=CUTOFF, help=f"Heavy-atom contact distance in Å (default: {CUTOFF})")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Targets analysed in parallel")
+    args = parser.parse_args()
+
+    from ensemble import ensemble_labels, find_samples
+    from predarchive import archive_name, find_archives
+
+    if cKDTree is None:
+        print("⚠️ scipy not installed; using the slower NumPy contact search (pip install scipy)")
+    targets = {}
+    archives = []
+    for pred_dir in args.pred_dirs:
+        targets.update(find_samples(pred_dir))
+        archives.extend(find_archives(pred_dir))
+    if not targets and not archives:
+        print("❌ No *_seed_*_sample_*.cif files or .ppred.npz archives found")
+        sys.exit(1)
+
+    # Archives are labelled together with the run directories, as in ensemble.py
+    targets.update({(a, archive_name(a)): a for a in archives})
+    labels = ensemble_labels(targets)
+    tasks = [(labels[key], s, args.out, args.cutoff) for key, s in sorted(targets.items())]
+    failed = 0
+    with ProcessPoolExecutor(max_workers=min(args.workers, len(tasks))) as pool:
+        for summary in pool.map(_analyze, tasks, chunksize=max(1, len(tasks) // (4 * args.workers))):
+            if "error" in summary:
+                failed += 1
+                print(f"❌ {summary['target']}: {summary['error']}")
+            elif summary["n_chains"] < 2:
+                print(f"⏭️ {summary['target']}: single chain, no interface")
+            else:
+                print(f"✅ {summary['target']}: {summary['n_samples']} samples, "
+                      f"interfaces {', '.join(summary['interfaces']) or 'none'}, "
+                      f"{summary['mean_residues']:.0f} interface residue rows per sample")
+    print(f"✓ Results written to {args.out}/")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
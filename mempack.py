@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+mempack.py
+--------------------
+Memory-budgeted bin-packing of Protenix jobs.
+
+predictcif.py / prep.py start whatever JSON they are given: one 2000-residue
+target can exhaust the node's memory while short targets leave it idle.
+This scheduler estimates every job from its Protenix input JSON
+
+    tokens   one per residue / nucleotide, one per ligand heavy atom, one per
+             ion (× count); a JSON with several entries is sized by its
+             largest entry (Protenix runs them one after another)
+    chains   number of chain copies
+
+and runs the jobs concurrently in --slots slots under a --budget-gb memory
+budget: largest first, with EASY backfill (a smaller job may jump the queue
+only if it ends before the largest waiting job could start, or fits next to
+it).  A job that alone exceeds the budget runs on its own.
+
+The estimate is learned: every finished run appends tokens, chains, peak
+RSS and wall time to the history file, and the model
+    peak MB = a + b·tokens + c·tokens² + d·chains      (least squares)
+    seconds = e + f·tokens²
+is refitted from it at every start, with a safety margin taken from the
+worst under-estimate seen so far.  `learn` adds past runs recorded in
+trace files (tracing.py) of predictcif.py / seedsched.py runs.  A job killed
+for lack of memory is recorded and retried once on its own.
+
+Peak RSS comes from the async runner: the job's wait4 rusage, plus /proc
+samples of its whole process group while tracing is on, so tracing is
+switched on (to <out-dir>/trace) when it is not already enabled.  It is host
+memory; GPU memory is not measured.
+
+Usage:
+    python mempack.py run work/*/*.json --budget-gb 120 --slots 4 [--pdb-dir models/]
+    python mempack.py run work/*/*.json --dry-run           # estimates and packing order
+    python mempack.py learn traces/ --inputs work/*/*.json  # learn from earlier runs
+    python mempack.py model                                 # fitted coefficients
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+from asyncrunner import AsyncRunner, Job, JobResult, tail
+from shardlayout import ShardedDir
+import tracing
+
+# ── configuration ─────────────────────────────────────────────────────────────
+PROTENIX = "protenix"
+PRED_DIR = "predicted_structures"
+LOG_DIR = "predicted_structures/logs"
+HISTORY = "predicted_structures/mempack_history.jsonl"
+SLOTS = 4
+BUDGET_FRACTION = 0.8   # default budget: this share of MemTotal
+MIN_MARGIN = 1.15       # estimates are multiplied by at least this
+MAX_MARGIN = 2.0
+MIN_FIT = 8             # successful runs needed before the regression replaces the defaults
+# Defaults until there is history (MB, seconds); the pair representation makes both ~tokens²
+DEFAULT_MEM = {"const": 6000.0, "tokens": 2.0, "tokens2": 0.006, "chains": 50.0}
+DEFAULT_TIME = {"const": 120.0, "tokens2": 0.0004}
+LIGAND_TOKENS = 30      # heavy atoms of an unknown CCD ligand
+CCD_HEAVY_ATOMS = {"ATP": 31, "ADP": 27, "AMP": 23, "GTP": 32, "GDP": 28, "NAD": 44, "NAP": 48,
+                   "FAD": 53, "FMN": 31, "SAM": 27, "SAH": 26, "HEM": 43, "COA": 48, "ACO": 51}
+SMILES_ATOM = re.compile(r"Cl|Br|\[[^\]]*\]|[BCNOPSFI]|[cnops]")
+OOM_EXIT = (-9, 137)    # SIGKILL from the kernel's OOM killer
+
+
+# ── sizing ────────────────────────────────────────────────────────────────────
+def _ligand_tokens(ligand):
+    ligand = str(ligand)
+    if ligand.startswith("CCD_"):
+        return sum(CCD_HEAVY_ATOMS.get(code, LIGAND_TOKENS) for code in ligand[4:].split("_"))
+    if ligand.startswith("FILE_"):
+        return LIGAND_TOKENS
+    atoms = SMILES_ATOM.findall(ligand)     # SMILES: one token per heavy atom
+    return sum(1 for a in atoms if not a.startswith("[H")) or LIGAND_TOKENS
+
+
+def entry_size(entry):
+    """(tokens, chains) of one Protenix input entry."""
+    tokens = chains = 0
+    for item in entry.get("sequences", []):
+        for kind, spec in item.items():
+            count = int(spec.get("count", 1))
+            if kind in ("proteinChain", "dnaSequence", "rnaSequence"):
+                n = len(spec.get("sequence", ""))
+            elif kind == "ligand":
+                n = _ligand_tokens(spec.get("ligand", ""))
+            elif kind == "ion":
+                n = 1
+            else:
+                continue
+            tokens += n * count
+            chains += count
+    return tokens, chains
+
+
+def input_size(path):
+    """(tokens, chains, entries) of a Protenix JSON: the largest entry decides the memory."""
+    data = json.loads(Path(path).read_text())
+    entries = data if isinstance(data, list) else [data]
+    sizes = [entry_size(e) for e in entries] or [(0, 0)]
+    tokens, chains = max(sizes)
+    return tokens, chains, len(entries)
+
+
+# ── cost model ────────────────────────────────────────────────────────────────
+def read_history(path):
+    path = Path(path)
+    if not path.exists():
+        return []
+    with path.open() as fh:
+        return [json.loads(line) for line in fh if line.strip()]
+
+
+def append_history(path, record):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a") as fh:
+        fh.write(json.dumps(record) + "\n")
+
+
+class CostModel:
+    """Peak memory (MB) and wall time (s) from tokens and chains, fitted to the run history."""
+
+    def __init__(self, history=()):
+        self.mem = dict(DEFAULT_MEM)
+        self.time = dict(DEFAULT_TIME)
+        self.margin = MIN_MARGIN
+        self.n_runs = 0
+        self.fit(history)
+
+    @staticmethod
+    def _features(tokens, chains, names):
+        tokens, chains = np.asarray(tokens, dtype=float), np.asarray(chains, dtype=float)
+        columns = {"const": np.ones_like(tokens), "tokens": tokens, "tokens2": tokens ** 2, "chains": chains}
+        return np.stack([columns[n] for n in names], axis=-1)
+
+    def _predict(self, coef, tokens, chains):
+        names = list(coef)
+        return self._features(tokens, chains, names) @ np.array([coef[n] for n in names])
+
+    @staticmethod
+    def _lstsq(x, y, names):
+        """Least squares over *names*, dropping terms until no coefficient is negative."""
+        names = list(names)
+        while names:
+            cols = [["const", "tokens", "tokens2", "chains"].index(n) for n in names]
+            coef, *_ = np.linalg.lstsq(x[:, cols], y, rcond=None)
+            if (coef >= 0).all():
+                return dict(zip(names, coef.tolist()))
+            names.remove(names[int(np.argmin(coef))])
+        return None
+
+    def fit(self, history):
+        runs = [r for r in history if r.get("peak_rss_mb") and r.get("tokens")]
+        ok = [r for r in runs if r.get("status") == "ok"]
+        self.n_runs = len(ok)
+        if not runs:
+            return
+        tokens = np.array([r["tokens"] for r in runs], dtype=float)
+        chains = np.array([r.get("chains", 1) for r in runs], dtype=float)
+        peak = np.array([r["peak_rss_mb"] for r in runs], dtype=float)
+        seconds = np.array([r.get("seconds") or 0.0 for r in runs], dtype=float)
+        good = np.array([r.get("status") == "ok" for r in runs])
+
+        if good.sum() >= MIN_FIT:
+            x = self._features(tokens[good], chains[good], ["const", "tokens", "tokens2", "chains"])
+            self.mem = self._lstsq(x, peak[good], ["const", "tokens", "tokens2", "chains"]) or self.mem
+            self.time = self._lstsq(x, seconds[good], ["const", "tokens2"]) or self.time
+        elif good.any():
+            # Too few runs for a regression: rescale the defaults to the observed level
+            for coef, observed in ((self.mem, peak), (self.time, seconds)):
+                scale = float(np.median(observed[good] / self._predict(coef, tokens[good], chains[good])))
+                for k in coef:
+                    coef[k] *= scale
+
+        # Safety margin: the worst under-estimate so far (an OOM-killed run's peak is a lower bound)
+        ratio = peak / np.maximum(self._predict(self.mem, tokens, chains), 1.0)
+        self.margin = float(np.clip(ratio.max() * 1.05, MIN_MARGIN, MAX_MARGIN))
+
+    def memory_mb(self, tokens, chains):
+        return float(self._predict(self.mem, tokens, chains)) * self.margin
+
+    def seconds(self, tokens, chains):
+        return max(1.0, float(self._predict(self.time, tokens, chains)))
+
+    def describe(self):
+        mem = " + ".join(f"{v:.4g}·{k}" if k != "const" else f"{v:.4g}" for k, v in self.mem.items())
+        sec = " + ".join(f"{v:.4g}·{k}" if k != "const" else f"{v:.4g}" for k, v in self.time.items())
+        source = f"fitted to {self.n_runs} runs" if self.n_runs >= MIN_FIT else (
+            f"defaults scaled to {self.n_runs} runs" if self.n_runs else "defaults, no history yet")
+        return f"peak MB = ({mem}) × {self.margin:.2f}\nseconds = {sec}\n({source})"
+
+
+# ── scheduling ────────────────────────────────────────────────────────────────
+class PackedJob:
+    def __init__(self, src, model, budget_mb):
+        self.src = Path(src)
+        self.name = self.src.stem
+        self.tokens, self.chains, self.entries = input_size(src)
+        self.estimate_mb = model.memory_mb(self.tokens, self.chains)
+        self.seconds = model.seconds(self.tokens, self.chains) * self.entries
+        self.exclusive = self.estimate_mb > budget_mb
+        self.mem_mb = min(self.estimate_mb, budget_mb)     # what it reserves
+        self.attempts = 0
+
+
+def memory_total_mb():
+    try:
+        for line in Path("/proc/meminfo").read_text().splitlines():
+            if line.startswith("MemTotal:"):
+                return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+class MemoryPacker:
+    def __init__(self, budget_mb, slots=SLOTS, protenix=PROTENIX, out_dir=PRED_DIR, log_dir=LOG_DIR,
+                 history=HISTORY, extra_args=("--use_msa_server",)):
+        if slots < 1 or budget_mb <= 0:
+            raise ValueError(f"need at least one slot and a positive budget (slots={slots}, budget={budget_mb:.0f} MB)")
+        self.budget_mb = budget_mb
+        self.slots = slots
+        self.protenix = protenix
+        self.preds = ShardedDir(out_dir, "pred")
+        self.log_dir = log_dir
+        self.history = history
+        self.extra_args = list(extra_args)
+        self.model = CostModel(read_history(history))
+
+    def plan(self, sources):
+        jobs = [PackedJob(src, self.model, self.budget_mb) for src in sources]
+        return sorted(jobs, key=lambda j: (-j.mem_mb, -j.seconds, j.name))
+
+    def _job(self, job):
+        cmd = [self.protenix, "predict", "--input", str(job.src), "--out_dir",
+               str(self.preds.path(f"tmp_{job.name}", create=True)), *self.extra_args]
+        return Job(f"protenix_{job.name}", cmd, tool="protenix", target=job.name)
+
+    def _pick(self, pending, running, now):
+        """Jobs to start now: the head of the queue if it fits, otherwise EASY backfill."""
+        free = self.budget_mb - sum(j.mem_mb for j in running.values())
+        slots = self.slots - len(running)
+        if any(j.exclusive for j in running.values()):
+            return []
+        picked = []
+        head = pending[0]
+        if head.exclusive:
+            return [head] if not running else []
+        if head.mem_mb <= free and slots > 0:
+            picked.append(head)
+            free -= head.mem_mb
+            slots -= 1
+            rest = pending[1:]
+            shadow, extra = float("inf"), free
+        else:
+            # When could the head start?  Walk the running jobs by expected end time
+            freed, shadow = free, float("inf")
+            ends = sorted(((task.started + j.seconds, j) for task, j in running.items()), key=lambda e: e[0])
+            for end, j in ends:
+                freed += j.mem_mb
+                if freed >= head.mem_mb:
+                    shadow = end
+                    break
+            extra = freed - head.mem_mb     # memory left over next to the head at that time
+            rest = pending[1:]
+        for job in rest:
+            if slots <= 0:
+                break
+            if job.exclusive or job.mem_mb > free:
+                continue
+            if now + job.seconds <= shadow or job.mem_mb <= extra:
+                picked.append(job)
+                free -= job.mem_mb
+                slots -= 1
+                if now + job.seconds > shadow:
+                    extra -= job.mem_mb
+        return picked
+
+    async def _run(self, pending):
+        runner = AsyncRunner(self.log_dir, limits={"protenix": self.slots}, max_parallel=self.slots)
+        running, results = {}, {}
+        while pending or running:
+            now = time.time()
+            for job in self._pick(pending, running, now) if pending else []:
+                pending.remove(job)
+                job.attempts += 1
+                task = asyncio.ensure_future(runner.run_one(self._job(job)))
+                task.started = now
+                running[task] = job
+                used = sum(j.mem_mb for j in running.values())
+                print(f"▶ {job.name}: {job.tokens} tokens, {job.chains} chains, est. {job.estimate_mb / 1024:.1f} GB"
+                      f"{' (alone)' if job.exclusive else ''}; {used / 1024:.1f}/{self.budget_mb / 1024:.1f} GB reserved",
+                      flush=True)
+            if not running:
+                # Nothing could start with every slot free: these jobs would never run
+                for job in pending:
+                    error = f"not schedulable in {self.slots} slot(s) under {self.budget_mb / 1024:.1f} GB"
+                    results[job.name] = JobResult(Job(f"protenix_{job.name}", [self.protenix], tool="protenix",
+                                                      target=job.name), None, 0, 0.0, False, None, None, error)
+                    print(f"❌ {job.name}: {error}", flush=True)
+                break
+            done, _ = await asyncio.wait(list(running), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                job = running.pop(task)
+                result = task.result()
+                self._record(job, result)
+                if result.ok:
+                    results[job.name] = result
+                    print(f"✅ {job.name} in {result.elapsed:.0f}s, peak "
+                          f"{(result.peak_rss_kb or 0) / 1024 ** 2:.1f} GB (est. {job.estimate_mb / 1024:.1f} GB)",
+                          flush=True)
+                elif result.returncode in OOM_EXIT and job.attempts == 1 and not job.exclusive:
+                    print(f"💥 {job.name} killed (out of memory?); retrying on its own", flush=True)
+                    job.exclusive, job.mem_mb = True, self.budget_mb
+                    pending.insert(0, job)
+                else:
+                    results[job.name] = result
+                    print(f"❌ Protenix failed for {job.name}: {result.error or f'exit status {result.returncode}'}")
+                    print(tail(result.stderr_log), file=sys.stderr, flush=True)
+        return results
+
+    def _record(self, job, result):
+        status = "ok" if result.ok else ("oom" if result.returncode in OOM_EXIT else "failed")
+        self.preds.record(f"tmp_{job.name}", status="ok" if result.ok else "failed")
+        if result.peak_rss_kb is None and status == "ok":
+            return      # nothing to learn without a measurement
+        append_history(self.history, {
+            "name": job.name, "input": str(job.src), "tokens": job.tokens, "chains": job.chains,
+            "entries": job.entries, "peak_rss_mb": round((result.peak_rss_kb or 0) / 1024, 1),
+            "seconds": round(result.elapsed / job.entries, 2), "estimate_mb": round(job.estimate_mb, 1),
+            "status": status, "time": time.time(),
+        })
+
+    def run(self, sources):
+        """Run all *sources*; returns {name: JobResult}."""
+        jobs = self.plan(sources)
+        print(f"📦 {len(jobs)} Protenix job(s) into {self.slots} slot(s) under {self.budget_mb / 1024:.1f} GB")
+        with tracing.get_tracer().span("mempack", jobs=len(jobs), budget_mb=round(self.budget_mb)):
+            return asyncio.run(self._run(jobs))
+
+
+# ── learning from traces ──────────────────────────────────────────────────────
+def learn_from_traces(trace_paths, inputs, history=HISTORY):
+    """Add Protenix runs of earlier traces (matched to *inputs* by target name) to the history."""
+    sizes = {}
+    for src in inputs:
+        try:
+            sizes[Path(src).stem] = input_size(src)
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Skipping {src}: {e}")
+    known = {(r.get("name"), r.get("time")) for r in read_history(history)}
+    added = 0
+    for event in tracing.load_events(trace_paths):
+        if event.get("args", {}).get("tool") != "protenix" or not event.get("peak_rss_kb"):
+            continue
+        size = sizes.get(event.get("target"))
+        if size is None or (event["target"], event["start"]) in known:
+            continue
+        tokens, chains, entries = size
+        status = "ok" if event["status"] == "ok" else ("oom" if event.get("exit_status") in OOM_EXIT else "failed")
+        append_history(history, {
+            "name": event["target"], "input": "trace", "tokens": tokens, "chains": chains, "entries": entries,
+            "peak_rss_mb": round(event["peak_rss_kb"] / 1024, 1), "seconds": round(event["wall"] / entries, 2),
+            "status": status, "time": event["start"],
+        })
+        added += 1
+    return added
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Pack Protenix jobs under a memory budget, learning from past runs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_run = sub.add_parser("run", help="Run Protenix on the inputs, packed under the budget")
+    p_run.add_argument("inputs", nargs="+", help="Protenix input JSON files")
+    p_run.add_argument("--budget-gb", type=float,
+                       help=f"Memory budget (default: {BUDGET_FRACTION:.0%} of MemTotal)")
+    p_run.add_argument("--slots", type=int, default=SLOTS, help=f"Concurrent Protenix jobs at most (default: {SLOTS})")
+    p_run.add_argument("--out-dir", default=PRED_DIR, help=f"Protenix output root (default: {PRED_DIR})")
+    p_run.add_argument("--pdb-dir", help="Write <name>.pdb of each target's best sample here")
+    p_run.add_argument("--protenix", default=PROTENIX, help="Protenix executable")
+    p_run.add_argument("--offline", action="store_true", help="Do not pass --use_msa_server")
+    p_run.add_argument("--dry-run", action="store_true", help="Print the estimates and packing order only")
+    p_run.add_argument("--trace", metavar="DIR", help="Trace directory (default: <out-dir>/trace)")
+
+    p_learn = sub.add_parser("learn", help="Add Protenix runs from trace files to the history")
+    p_learn.add_argument("traces", nargs="+", help="Trace directories or .jsonl files")
+    p_learn.add_argument("--inputs", nargs="+", required=True, help="The Protenix JSONs of those runs")
+
+    p_model = sub.add_parser("model", help="Show the fitted memory/time model")
+    for p in (p_run, p_learn, p_model):
+        p.add_argument("--history", default=HISTORY, help=f"Run history (default: {HISTORY})")
+    args = parser.parse_args()
+
+    if args.command == "learn":
+        added = learn_from_traces(args.traces, args.inputs, args.history)
+        print(f"✅ Added {added} run(s) to {args.history}")
+        print(CostModel(read_history(args.history)).describe())
+        return
+    if args.command == "model":
+        print(CostModel(read_history(args.history)).describe())
+        return
+
+    if args.slots < 1:
+        parser.error("--slots must be at least 1")
+    if args.budget_gb is not None and args.budget_gb <= 0:
+        parser.error("--budget-gb must be positive")
+    total = memory_total_mb()
+    budget_mb = args.budget_gb * 1024 if args.budget_gb else (total or 64 * 1024) * BUDGET_FRACTION
+    packer = MemoryPacker(budget_mb, args.slots, args.protenix, args.out_dir, Path(args.out_dir) / "logs",
+                          args.history, extra_args=() if args.offline else ("--use_msa_server",))
+    if args.dry_run:
+        print(packer.model.describe())
+        print(f"\n{'input':<28s} {'tokens':>7s} {'chains':>6s} {'est GB':>7s} {'est min':>8s}")
+        for job in packer.plan(args.inputs):
+            print(f"{job.name:<28s} {job.tokens:7d} {job.chains:6d} {job.estimate_mb / 1024:7.1f} "
+                  f"{job.seconds / 60:8.1f}{'  alone (over budget)' if job.exclusive else ''}")
+        return
+
+    # The process group (not just its largest process) is only sampled while tracing is on
+    if args.trace or not tracing.get_tracer().enabled:
+        tracing.enable(args.trace or Path(args.out_dir) / "trace")
+    Path(args.out_dir).mkdir(parents=True, exist_ok=True)
+    results = packer.run(args.inputs)
+
+    failed = [name for name, r in results.items() if not r.ok]
+    if args.pdb_dir:
+        from seedsched import read_confidences
+        import gemmi  # pip install gemmi
+
+        Path(args.pdb_dir).mkdir(parents=True, exist_ok=True)
+        for name, result in results.items():
+            rows = read_confidences(packer.preds.path(f"tmp_{name}")) if result.ok else []
+            if rows:
+                best = max(rows, key=lambda r: r["score"])
+                gemmi.read_structure(best["cif"]).write_pdb(str(Path(args.pdb_dir) / f"{name}.pdb"))
+            elif result.ok:
+                failed.append(name)
+                print(f"❌ No confidence files produced for {name}")
+    print(f"✅ {len(results) - len(failed)}/{len(results)} targets predicted")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
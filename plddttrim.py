@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+plddttrim.py
+--------------------
+pLDDT-guided trimming of predicted models before DALI / superposition.
+
+Protenix writes per-residue confidence (pLDDT) into the B-factor column.
+Long disordered tails and loops inflate DALI runtime and blur Z-scores, so
+this step removes low-confidence termini and loops:
+
+1. per-residue pLDDT = B-factor of the CA atom (optionally smoothed);
+2. residues with pLDDT >= --threshold are kept;
+3. interior low-confidence dips of at most --max-gap residues are kept
+   (so a well-predicted domain is not fragmented by one bad turn);
+4. kept segments shorter than --min-segment residues are dropped.
+
+All steps are vectorised with NumPy.  The trimmed PDB keeps the original
+residue numbering; a JSON mapping (<out>.trim.json) records, per chain, the
+sequential index → original residue for mapping DALI hit positions back.
+
+Usage:
+    python plddttrim.py target.pdb --out target_trimmed.pdb [--threshold 70]
+"""
+
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+
+THRESHOLD = 70.0
+MIN_SEGMENT = 10
+MAX_GAP = 4
+SMOOTH = 1
+
+
+def _runs(mask):
+    """(start, stop) index pairs of the True runs in a boolean array."""
+    padded = np.concatenate(([False], mask, [False]))
+    edges = np.flatnonzero(np.diff(padded.astype(np.int8)))
+    return edges[0::2], edges[1::2]
+
+
+def keep_mask(plddt, threshold=THRESHOLD, min_segment=MIN_SEGMENT, max_gap=MAX_GAP, smooth=SMOOTH):
+    """Boolean mask of residues to keep, given a per-residue pLDDT array."""
+    plddt = np.asarray(plddt, dtype=float)
+    if plddt.size == 0:
+        return np.zeros(0, dtype=bool)
+    if smooth > 1:
+        kernel = np.ones(smooth) / smooth
+        padded = np.pad(plddt, (smooth // 2, smooth - 1 - smooth // 2), mode="edge")
+        plddt = np.convolve(padded, kernel, mode="valid")
+
+    keep = plddt >= threshold
+
+    # fill short interior gaps (runs of low confidence flanked by kept residues)
+    starts, stops = _runs(~keep)
+    interior = (starts > 0) & (stops < keep.size) & (stops - starts <= max_gap)
+    for a, b in zip(starts[interior], stops[interior]):
+        keep[a:b] = True
+
+    # drop kept segments that are too short to be meaningful
+    starts, stops = _runs(keep)
+    short = stops - starts < min_segment
+    for a, b in zip(starts[short], stops[short]):
+        keep[a:b] = False
+    return keep
+
+
+def trim_structure(in_pdb, out_pdb, threshold=THRESHOLD, min_segment=MIN_SEGMENT,
+                   max_gap=MAX_GAP, smooth=SMOOTH):
+    """Trim every polymer chain of *in_pdb*; write *out_pdb* and its mapping JSON."""
+    import gemmi  # pip install gemmi
+
+    st = gemmi.read_structure(str(in_pdb))
+    st.remove_empty_chains()
+    mapping = {
+        "source": str(in_pdb),
+        "params": {"threshold": threshold, "min_segment": min_segment, "max_gap": max_gap, "smooth": smooth},
+        "chains": {},
+    }
+    model = st[0]
+    for chain in model:
+        polymer = chain.get_polymer()
+        if len(polymer) == 0:
+            continue
+        plddt = np.array([res.find_atom("CA", "*").b_iso if res.find_atom("CA", "*") else
+                          np.mean([a.b_iso for a in res]) for res in polymer])
+        keep = keep_mask(plddt, threshold, min_segment, max_gap, smooth)
+
+        kept = [(res.seqid.num, res.seqid.icode.strip(), res.name)
+                for res, k in zip(polymer, keep) if k]
+        drop = {(res.seqid.num, res.seqid.icode) for res, k in zip(polymer, keep) if not k}
+        starts, stops = _runs(keep)
+        segments = [[polymer[int(a)].seqid.num, polymer[int(b) - 1].seqid.num] for a, b in zip(starts, stops)]
+        for i in range(len(chain) - 1, -1, -1):
+            if (chain[i].seqid.num, chain[i].seqid.icode) in drop:
+                del chain[i]
+
+        mapping["chains"][chain.name] = {
+            "n_input": int(keep.size),
+            "n_kept": int(keep.sum()),
+            "mean_plddt_kept": round(float(plddt[keep].mean()), 2) if keep.any() else None,
+            "segments": segments,
+            # index i (1-based, as in DALI alignments) → original residue number
+            "residues": [[i + 1, num, icode, name] for i, (num, icode, name) in enumerate(kept)],
+        }
+    st.remove_empty_chains()
+    st.write_pdb(str(out_pdb))
+
+    map_path = mapping_path(out_pdb)
+    map_path.write_text(json.dumps(mapping, indent=1))
+    return mapping
+
+
+def mapping_path(out_pdb):
+    out_pdb = Path(out_pdb)
+    return out_pdb.with_name(out_pdb.stem + ".trim.json")
+
+
+def map_back(mapping, chain, positions):
+    """Original residue numbers for 1-based positions in the trimmed chain."""
+    residues = mapping["chains"][chain]["residues"]
+    return [residues[p - 1][1] if 0 < p <= len(residues) else None for p in positions]
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Trim low-pLDDT termini and loops from a predicted model.")
+    parser.add_argument("pdb", help="Input PDB (pLDDT in the B-factor column)")
+    parser.add_argument("--out", help="Output PDB (default: <input>_trimmed.pdb)")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help=f"pLDDT cutoff (default: {THRESHOLD})")
+    parser.add_argument("--min-segment", type=int, default=MIN_SEGMENT,
+                        help=f"Drop kept segments shorter than this (default: {MIN_SEGMENT})")
+    parser.add_argument("--max-gap", type=int, default=MAX_GAP,
+                        help=f"Keep interior low-pLDDT dips up to this length (default: {MAX_GAP})")
+    parser.add_argument("--smooth", type=int, default=SMOOTH, help="Moving-average window for pLDDT (default: 1)")
+    args = parser.parse_args()
+
+    in_pdb = Path(args.pdb)
+    if not in_pdb.is_file():
+        sys.exit(f"Input PDB not found: {in_pdb}")
+    out_pdb = Path(args.out) if args.out else in_pdb.with_name(in_pdb.stem + "_trimmed.pdb")
+
+    mapping = trim_structure(in_pdb, out_pdb, args.threshold, args.min_segment, args.max_gap, args.smooth)
+    for name, info in mapping["chains"].items():
+        print(f"✂️ Chain {name}: kept {info['n_kept']}/{info['n_input']} residues, segments {info['segments']}")
+    print(f"✓ Wrote {out_pdb} and {mapping_path(out_pdb)}")
+
+
+if __name__ == "__main__":
+    main()
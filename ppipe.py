@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+ppipe.py
+--------------------
+One command for the whole pipeline, with fast start-up.
+
+The individual scripts import Biopython, gemmi, NumPy or PyMOL when they are
+loaded, so even `--help` or `--check` costs hundreds of milliseconds.  Here
+the argument parser is built from the standard library only; a subcommand
+imports the module that implements it when it runs, and every heavy
+dependency is imported inside the function that needs it.
+
+    predict   Protenix → first model as PDB            (predictcif.py)
+    convert   mmCIF / prediction archive → PDB         (gemmi, predarchive.py)
+    supfam    SUPERFAMILY annotation of FASTA files    (supfamhtml.py)
+    dali      import | compare | zscores | check       (dali.py)
+    render    PyMOL superposition figures              (pymol1.py)
+
+`pip install -e .` installs it as `ppipe` (see pyproject.toml);
+`python benchmark.py startup` guards the start-up time.
+
+Usage:
+    ppipe predict 7.6.2.14.json 7.6.2.14.pdb [--trim-plddt 70] [--adaptive]
+    ppipe convert predicted_structures/tmp_target target.pdb
+    ppipe supfam fasta/7.6.2.14.fa
+    ppipe dali import|compare|zscores [--refs a.pdb b.pdb:B] [--backend native] [--workers 8]
+    ppipe render 7.6.2.14.pdb 1v43A.pdb --out structures
+    ppipe --trace traces/ dali compare
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Modules that must not be loaded just to parse the command line
+HEAVY_MODULES = ("gemmi", "Bio", "pymol", "numpy", "scipy")
+
+
+# ── subcommands ───────────────────────────────────────────────────────────────
+def cmd_predict(args):
+    import subprocess
+    import predictcif
+
+    try:
+        Path(predictcif.PRED_DIR).mkdir(exist_ok=True)
+        if args.adaptive:
+            predictcif.predict_adaptive(args.src, args.dst, args.trim_plddt)
+        else:
+            predictcif.predict_to_single_pdb(args.src, args.dst, args.trim_plddt)
+    except subprocess.CalledProcessError as e:
+        return e.returncode
+    except Exception as exc:
+        print("ERROR:", exc, file=sys.stderr, flush=True)
+        return 1
+    return 0
+
+
+def cmd_convert(args):
+    import tracing
+    from predarchive import SUFFIX, find_archives, open_structure
+
+    src = Path(args.src)
+    if src.is_dir():
+        # Loose mmCIF files first, then packed outputs (read without unpacking)
+        candidates = sorted(src.rglob("*.cif")) or find_archives(src)
+        if not candidates:
+            print(f"❌ No .cif files or {SUFFIX} archives under {src}")
+            return 1
+        src = candidates[0]
+        print(f"✔ Selected {src}")
+    elif not Path(str(src).partition("#")[0]).exists():
+        print(f"❌ Not found: {src}")
+        return 1
+
+    with tracing.get_tracer().span("convert", target=Path(str(src).partition("#")[0]).stem):
+        open_structure(src).write_pdb(args.dst)
+    print(f"✓ Successfully wrote {args.dst}")
+
+    if args.trim_plddt is not None:
+        from plddttrim import mapping_path, trim_structure
+        mapping = trim_structure(args.dst, args.dst, threshold=args.trim_plddt)
+        for name, info in mapping["chains"].items():
+            print(f"✂️ Chain {name}: kept {info['n_kept']}/{info['n_input']} residues (pLDDT >= {args.trim_plddt})")
+        print(f"✓ Residue mapping written to {mapping_path(args.dst)}")
+    return 0
+
+
+def cmd_supfam(args):
+    import glob
+    import os
+    import supfamhtml
+
+    fasta_files = []
+    for path in args.fasta or [os.path.join(supfamhtml.fangshun_dir, "fasta/")]:
+        if os.path.isdir(path):
+            fasta_files += sorted(glob.glob(os.path.join(path, "*.fa")))
+        else:
+            fasta_files.append(path)
+    if not fasta_files:
+        print("No .fa files found")
+        return 1
+    ok = [supfamhtml.run_superfamily_pipeline(fasta) for fasta in fasta_files]
+    print(f"✅ SUPERFAMILY finished for {sum(ok)}/{len(ok)} FASTA files")
+    return 0 if all(ok) else 1
+
+
+def cmd_dali(args):
+    from dali import DaliPipeline
+
+    pipeline = DaliPipeline(args.base_dir)
+    if args.workers:
+        pipeline.workers = args.workers
+    pipeline.backend = args.backend
+    pipeline.trim_plddt = args.trim_plddt
+    pipeline.cluster_identity = args.cluster_identity
+    if args.domains is not None:
+        try:
+            pipeline.enable_domains(args.domains, args.ref_superfamily)
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+    if args.dali_bin:
+        pipeline.dali_pl = Path(args.dali_bin).resolve() / "dali.pl"
+        pipeline.import_pl = Path(args.dali_bin).resolve() / "import.pl"
+    for ref in args.refs or []:
+        pdb_name, _, chain = ref.partition(":")
+        pipeline.add_reference(pdb_name, chain or "A")
+    multi = bool(pipeline.references)
+
+    if args.step == "check":
+        return 0 if pipeline.check_prerequisites() else 1
+    if args.step == "zscores":
+        if pipeline.cluster_identity and pipeline.clusters_tsv.exists():
+            from seqcluster import read_clusters
+            pipeline.clusters = read_clusters(pipeline.clusters_tsv)
+        ok = pipeline.run_step("extract", pipeline.extract_zscore_table if multi else pipeline.extract_zscores)
+        return 0 if ok else 1
+
+    if not pipeline.check_prerequisites():
+        return 1
+    if pipeline.cluster_identity and not pipeline.run_step("cluster", pipeline.cluster_queries):
+        return 1
+    if pipeline.split_domains and not pipeline.run_step("split", pipeline.split_query_domains):
+        return 1
+    if args.step == "import":
+        if pipeline.backend == "native":
+            print("⏭️ The native backend reads the PDBs directly; nothing to import")
+            return 0
+        if multi:
+            ok = pipeline.run_step("import", lambda: pipeline.import_references() and pipeline.import_queries(reuse=True))
+        else:
+            ok = pipeline.run_step("import", pipeline.import_all_pdbs)
+    else:
+        ok = pipeline.run_step("compare", pipeline.run_multi_comparisons if multi else pipeline.run_all_comparisons)
+    return 0 if ok else 1
+
+
+def cmd_render(args):
+    from pymol1 import render
+
+    render(args.reference, args.pdb_files, args.out, args.store)
+    print(f"✅ Rendered {len(args.pdb_files)} structure(s) to {args.out}")
+    return 0
+
+
+# ── argument parsing ──────────────────────────────────────────────────────────
+def build_parser():
+    parser = argparse.ArgumentParser(prog="ppipe", description="Protein structure prediction and analysis pipeline.")
+    parser.add_argument("--trace", metavar="DIR", help="Record timing/resource trace files in DIR")
+    sub = parser.add_subparsers(dest="command", required=True, metavar="COMMAND")
+
+    p = sub.add_parser("predict", help="Run Protenix and keep the first model as PDB")
+    p.add_argument("src", nargs="?", default="7.6.2.14.json", help="Input JSON (default: 7.6.2.14.json)")
+    p.add_argument("dst", nargs="?", default="7.6.2.14.pdb", help="Output PDB (default: 7.6.2.14.pdb)")
+    p.add_argument("--trim-plddt", type=float, metavar="THRESH",
+                   help="Remove low-pLDDT termini/loops from the saved model (see plddttrim.py)")
+    p.add_argument("--adaptive", action="store_true",
+                   help="Run seeds incrementally until confidence plateaus (see seedsched.py)")
+    p.set_defaults(func=cmd_predict)
+
+    p = sub.add_parser("convert", help="Convert an mmCIF file, prediction directory or archive to PDB")
+    p.add_argument("src", nargs="?", default="predicted_structures/tmp_target",
+                   help="mmCIF file, x.ppred.npz[#seed:sample] or a directory (first .cif found)")
+    p.add_argument("dst", nargs="?", default="target.pdb", help="Output PDB (default: target.pdb)")
+    p.add_argument("--trim-plddt", type=float, metavar="THRESH",
+                   help="Remove low-pLDDT termini/loops after conversion (see plddttrim.py)")
+    p.set_defaults(func=cmd_convert)
+
+    p = sub.add_parser("supfam", help="Run SUPERFAMILY annotation and collect the .ass/.html results")
+    p.add_argument("fasta", nargs="*", help="FASTA files or directories (default: the server fasta/ directory)")
+    p.set_defaults(func=cmd_supfam)
+
+    p = sub.add_parser("dali", help="DALI structure comparison steps")
+    p.add_argument("step", choices=["import", "compare", "zscores", "check"])
+    p.add_argument("--base-dir", help="Working directory with input_pdbs/ (default: current directory)")
+    p.add_argument("--workers", type=int, help="Concurrent import/DALI jobs (default: CPU count)")
+    p.add_argument("--dali-bin", metavar="DIR", help="Directory with dali.pl and import.pl")
+    p.add_argument("--refs", nargs="+", metavar="PDB[:CHAIN]",
+                   help="Multi-reference mode (as dali.py --refs); zscores writes zscore_wide.csv")
+    p.add_argument("--cluster-identity", type=float, metavar="FRAC",
+                   help="Only import/compare one representative per sequence cluster (e.g. 0.9)")
+    p.add_argument("--trim-plddt", type=float, metavar="THRESH",
+                   help="Trim low-pLDDT termini/loops from predicted references before import")
+    p.add_argument("--domains", nargs="*", metavar="ASS",
+                   help="Compare per-domain PDBs (domsplit.py), regions from these SUPERFAMILY results")
+    p.add_argument("--ref-superfamily", nargs="+", default=[], metavar="SUNID|FILE",
+                   help="With --domains: only compare domains of these superfamilies")
+    p.add_argument("--backend", choices=["dalilite", "native"], default="dalilite",
+                   help="Comparison engine: DaliLite (default) or in-process NumPy scoring (dalinative.py)")
+    p.set_defaults(func=cmd_dali)
+
+    p = sub.add_parser("render", help="Superpose structures on a reference and save PyMOL figures")
+    p.add_argument("reference", help="Reference PDB")
+    p.add_argument("pdb_files", nargs="+", help="PDB files to align")
+    p.add_argument("--out", default="structures", help="Output directory (default: structures)")
+    p.add_argument("--store", metavar="PPSTORE",
+                   help="Load the structures through this store (structstore.py build) instead of parsing")
+    p.set_defaults(func=cmd_render)
+    return parser
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main(argv=None):
+    # The pipeline scripts are plain modules next to this file
+    here = Path(__file__).resolve().parent
+    if str(here) not in sys.path:
+        sys.path.insert(0, str(here))
+
+    args = build_parser().parse_args(argv)
+    if args.trace:
+        import tracing
+        tracing.enable(args.trace)
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,626 @@
+#!/usr/bin/env python3
+"""
+ppserve.py
+--------------------
+Local HTTP/JSON service around the pipeline, for tools that would otherwise
+spawn one Python process per request and parse its stdout.
+
+    POST /annotate   {"sequence": "MKV...", "id": "q1"}, {"sequences": {"q1": "MKV...", ...}}
+                     or {"fasta": ">q1\\nMKV..."}
+                     → SUPERFAMILY hits per sequence (hmmscan + superfamily names)
+    POST /compare    {"pdb": "path/on/this/host.pdb"} or {"pdb_text": "ATOM ...", "name": "x"}
+                     → DALI Z-score of every chain against the reference(s)
+    POST /predict    {"sequence": "MKV...", "name": "x"} or {"json": <Protenix input entry>}
+                     → best Protenix sample as PDB, with its confidence
+    GET  /jobs/<id>           job status (queued | running | done | failed)
+    GET  /jobs/<id>/result    result; 202 while the job is pending
+    GET  /health              queue lengths, batch statistics, warm state
+
+A POST answers 202 {"id": ...} at once; with ?wait=SECONDS it blocks until
+the job has finished (or the wait expired) and returns the job with its
+result, so simple clients need one round trip.
+
+Micro-batching: every endpoint has one batch thread.  It takes the first
+queued request, waits at most --max-wait seconds for more (up to
+--max-batch) and runs them as one batch: one hmmscan over a combined FASTA,
+one concurrent import + compare round, one Protenix run over a combined
+input JSON.  While a batch runs, new requests queue up and form the next
+batch, so the batch size grows with the load.
+
+Warm state, loaded once at start-up: the reference DATs (imported if
+missing), the superfamily tables (SUPERFAMILY model id → sunid from
+model.tab; sunid → name from the campaign's SUPERFAMILY results pages or a
+SCOP dir.des file, --sf-names), Biopython/gemmi.  Compare batches
+reuse DropProcessor of dropwatch.py on a pipeline of their own under
+<work-dir>/compare/ that shares only the campaign's reference DATs: uploads
+never reach the campaign's imported_DAT/input/, dali_outputs/ or Z-score
+tables.  Batches run one at a time and clear the query DATs and outputs of
+the previous batch first.
+
+Usage:
+    python ppserve.py [--port 8765] [--max-batch 32] [--max-wait 0.05] [--refs a.pdb b.pdb:B]
+    curl -s -XPOST 'localhost:8765/annotate?wait=60' -d '{"sequence": "MKV..."}'
+"""
+
+import argparse
+import copy
+import itertools
+import json
+import queue
+import re
+import shutil
+import signal
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+sys.path.insert(0, str(Path(__file__).resolve().parent / "src_gadget"))
+
+from asyncrunner import Job, run_job, tail
+import tracing
+
+HOST = "127.0.0.1"
+PORT = 8765
+WORK_DIR = "ppserve_work"
+MAX_BATCH = 32
+MAX_WAIT = 0.05         # seconds a batch waits for more requests after the first
+MAX_CLIENT_WAIT = 600.0  # upper bound of ?wait=
+KEEP_JOBS = 10000       # finished jobs kept for /jobs/<id>
+MAX_BODY = 64 << 20     # bytes
+KINDS = ("annotate", "compare", "predict")
+SEQ_RE = re.compile(r"^[A-Za-z*-]+$")
+
+
+# ── jobs ──────────────────────────────────────────────────────────────────────
+class ServiceJob:
+    def __init__(self, kind, request):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.request = request
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = self.finished = None
+        self.result = self.error = None
+        self.done = threading.Event()
+
+    def start(self):
+        self.status, self.started = "running", time.time()
+
+    def finish(self, outcome):
+        if isinstance(outcome, Exception):
+            self.status, self.error = "failed", str(outcome) or type(outcome).__name__
+        else:
+            self.status, self.result = "done", outcome
+        self.finished = time.time()
+        self.done.set()
+
+    def as_dict(self, result=True):
+        d = {"id": self.id, "kind": self.kind, "status": self.status, "submitted": self.submitted,
+             "started": self.started, "finished": self.finished}
+        if self.error:
+            d["error"] = self.error
+        if result and self.status == "done":
+            d["result"] = self.result
+        return d
+
+
+class JobStore:
+    """Jobs by id; the oldest finished jobs are dropped beyond *keep*."""
+
+    def __init__(self, keep=KEEP_JOBS):
+        self.keep = keep
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def add(self, job):
+        with self.lock:
+            self.jobs[job.id] = job
+            if len(self.jobs) > self.keep:
+                for old in [j for j in self.jobs.values() if j.done.is_set()][:len(self.jobs) - self.keep]:
+                    del self.jobs[old.id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def counts(self):
+        with self.lock:
+            statuses = [j.status for j in self.jobs.values()]
+        return {s: statuses.count(s) for s in ("queued", "running", "done", "failed")}
+
+
+class MicroBatcher:
+    """Coalesces queued jobs into batches for *handler* ([jobs] → {job id: result or Exception})."""
+
+    def __init__(self, kind, handler, max_batch=MAX_BATCH, max_wait=MAX_WAIT):
+        self.kind, self.handler = kind, handler
+        self.max_batch, self.max_wait = max_batch, max_wait
+        self.queue = queue.Queue()
+        self.batches = self.batched = 0
+        self.largest = 0
+        self.thread = threading.Thread(target=self._loop, name=f"batch-{kind}", daemon=True)
+        self.thread.start()
+
+    def submit(self, job):
+        self.queue.put(job)
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while batch[-1] is not None and len(batch) < self.max_batch:
+            try:
+                batch.append(self.queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            stop = batch[-1] is None
+            batch = [job for job in batch if job is not None]
+            if batch:
+                self._run(batch)
+            if stop:
+                return
+
+    def _run(self, batch):
+        for job in batch:
+            job.start()
+        self.batches += 1
+        self.batched += len(batch)
+        self.largest = max(self.largest, len(batch))
+        with tracing.get_tracer().span(f"serve_{self.kind}", target=f"batch{self.batches}", jobs=len(batch)) as info:
+            try:
+                results = self.handler(batch)
+            except Exception as e:      # the whole batch failed; the service keeps running
+                print(f"❌ {self.kind} batch of {len(batch)} failed: {e}", flush=True)
+                results = {job.id: e for job in batch}
+            failed = 0
+            for job in batch:
+                outcome = results.get(job.id, RuntimeError("no result produced"))
+                failed += isinstance(outcome, Exception)
+                job.finish(outcome)
+            info["status"] = "failed" if failed else "ok"
+
+    def stop(self):
+        self.queue.put(None)
+        self.thread.join()
+
+    def stats(self):
+        return {"queued": self.queue.qsize(), "batches": self.batches, "jobs": self.batched,
+                "mean_batch": round(self.batched / self.batches, 2) if self.batches else 0,
+                "largest_batch": self.largest}
+
+
+# ── request parsing (400 on ValueError) ───────────────────────────────────────
+def _sequence(seq, what):
+    seq = "".join(str(seq).split())
+    if not seq or not SEQ_RE.match(seq):
+        raise ValueError(f"{what}: not a protein sequence")
+    return seq.upper()
+
+
+def parse_annotate(body):
+    """→ {"sequences": [(id, sequence), ...]}"""
+    if "fasta" in body:
+        records, name = [], None
+        for line in str(body["fasta"]).splitlines():
+            if line.startswith(">"):
+                name = line[1:].split()[0] if line[1:].split() else f"seq{len(records) + 1}"
+                records.append([name, ""])
+            elif line.strip():
+                if name is None:
+                    raise ValueError("fasta: sequence before the first '>' header")
+                records[-1][1] += line.strip()
+    elif "sequences" in body and isinstance(body["sequences"], dict):
+        records = list(body["sequences"].items())
+    elif "sequence" in body:
+        records = [(body.get("id", "query"), body["sequence"])]
+    else:
+        raise ValueError("expected 'sequence', 'sequences' or 'fasta'")
+    if not records:
+        raise ValueError("no sequences")
+    return {"sequences": [(str(name), _sequence(seq, name)) for name, seq in records]}
+
+
+def parse_compare(body):
+    """→ {"name": ..., "pdb": path} or {"name": ..., "pdb_text": text}"""
+    if "pdb" in body:
+        path = Path(body["pdb"])
+        if not path.is_file():
+            raise ValueError(f"pdb: no such file on the service host: {path}")
+        return {"name": body.get("name", path.stem), "pdb": str(path.resolve())}
+    if "pdb_text" in body:
+        if "ATOM" not in body["pdb_text"]:
+            raise ValueError("pdb_text: no ATOM records")
+        return {"name": body.get("name", "query"), "pdb_text": body["pdb_text"]}
+    raise ValueError("expected 'pdb' or 'pdb_text'")
+
+
+def parse_predict(body):
+    """→ {"name": ..., "entry": Protenix input entry}"""
+    if "json" in body:
+        entry = body["json"]
+        if isinstance(entry, list) and len(entry) == 1:
+            entry = entry[0]
+        if not isinstance(entry, dict) or not entry.get("sequences"):
+            raise ValueError("json: expected one Protenix input entry with 'sequences'")
+        return {"name": entry.get("name", body.get("name", "query")), "entry": entry}
+    if "sequence" in body:
+        name = body.get("name", "query")
+        seq = _sequence(body["sequence"], name)
+        return {"name": name, "entry": {"name": name, "sequences": [
+            {"proteinChain": {"sequence": seq, "count": int(body.get("count", 1))}}]}}
+    raise ValueError("expected 'sequence' or 'json'")
+
+
+PARSERS = {"annotate": parse_annotate, "compare": parse_compare, "predict": parse_predict}
+
+
+# ── service ───────────────────────────────────────────────────────────────────
+class Service:
+    def __init__(self, pipeline=None, work_dir=WORK_DIR, hmmscan=None, hmm_library=None, e_value=0.001,
+                 protenix="protenix", offline=False, max_batch=MAX_BATCH, max_wait=MAX_WAIT, sf_names=None):
+        import supfampred
+
+        self.work_dir = Path(work_dir).resolve()
+        self.log_dir = self.work_dir / "logs"
+        self.pipeline = pipeline
+        self.hmmscan = hmmscan or supfampred.hmmscan
+        self.hmm_library = hmm_library or supfampred.default_hmm_library
+        self.e_value = e_value
+        self.protenix = protenix
+        self.offline = offline
+        self.sf_names = sf_names    # files for the sunid → name table; default: the SUPERFAMILY results pages
+        self.jobs = JobStore()
+        self.unavailable = {}   # kind → reason
+        self.warm = {}
+        self.started = time.time()
+        self._batch_no = itertools.count(1)
+        self.batchers = {}
+        self.max_batch, self.max_wait = max_batch, max_wait
+
+    # start-up
+    def start(self):
+        self.work_dir.mkdir(parents=True, exist_ok=True)
+        self._warm_annotate()
+        self._warm_compare()
+        self._warm_predict()
+        for kind in KINDS:
+            if kind not in self.unavailable:
+                handler = getattr(self, f"run_{kind}")
+                # Compare batches share one batch layout; DAT codes are only unique within a batch
+                limit = min(self.max_batch, 999) if kind == "compare" else self.max_batch
+                self.batchers[kind] = MicroBatcher(kind, handler, limit, self.max_wait)
+
+    def _warm_annotate(self):
+        import supfampred
+        from domsplit import read_model_tab, read_superfamily_names
+        from stagedag import SUPFAM_RESULTS
+        from Bio import SearchIO  # noqa: F401  (loaded now instead of on the first request)
+
+        # hmmscan reports SUPERFAMILY model ids: model.tab maps them to sunids, the name table sunids to names
+        self.superfamily_models = read_model_tab(supfampred.model_tab)
+        sources = self.sf_names if self.sf_names is not None else sorted(Path(SUPFAM_RESULTS).glob("*.html"))
+        self.superfamily_names = read_superfamily_names(sources)
+        self.warm["superfamily_models"] = len(self.superfamily_models)
+        self.warm["superfamily_names"] = len(self.superfamily_names)
+        if not Path(self.hmmscan).exists():
+            self.unavailable["annotate"] = f"hmmscan not found: {self.hmmscan}"
+
+    def _warm_compare(self):
+        from dropwatch import DropProcessor
+
+        p = self.pipeline
+        if p is None:
+            self.unavailable["compare"] = "no DALI pipeline configured"
+            return
+        if not p.check_prerequisites():
+            self.unavailable["compare"] = "DALI prerequisites missing (see service log)"
+            return
+        self.batch_pipeline = self._batch_pipeline(p)
+        self.processor = DropProcessor(self.batch_pipeline, state_file=self.work_dir / "unused_state.json")
+        if not self.processor.import_references():
+            self.unavailable["compare"] = "reference import failed"
+            return
+        if p.backend == "native":
+            self.batch_pipeline._native_references()      # exports/trims predicted references once
+        self.warm["references"] = [column for _, column in self.processor._references()]
+        self.uploads = self.work_dir / "uploads"
+        self.uploads.mkdir(exist_ok=True)
+
+    def _batch_pipeline(self, p):
+        """Copy of the campaign pipeline for compare batches: own query DATs, outputs and work files
+        under <work-dir>/compare/, the campaign's reference DATs (dat2_dir) and reference PDBs"""
+        root = self.work_dir / "compare"
+        bp = copy.copy(p)
+        bp.base_dir = root
+        bp.dat1_dir = root / "imported_DAT/input"
+        bp.outputs_dir = root / "dali_outputs"
+        bp.work_dir = root / "dali_work"
+        bp.log_dir = self.log_dir
+        bp.zscore_csv = root / "zscore_summary.csv"
+        bp.zscore_wide_csv = root / "zscore_wide.csv"
+        bp.clusters_tsv = root / "seq_clusters.tsv"
+        bp.cluster_identity, bp.clusters = None, {}
+        bp.split_domains, bp.domains = False, {}
+        bp._artifact_dirs = {}
+        for directory in (bp.dat1_dir, bp.outputs_dir, bp.work_dir):
+            directory.mkdir(parents=True, exist_ok=True)
+        return bp
+
+    def _clear_batch(self):
+        """Remove the query DATs, DALI outputs and comparison work dirs of the previous batch"""
+        bp = self.batch_pipeline
+        for directory in (bp.dat1_dir, bp.outputs_dir):
+            shutil.rmtree(directory, ignore_errors=True)
+            directory.mkdir(parents=True)
+        for workdir in bp.work_dir.glob("*_vs_*"):
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    def _warm_predict(self):
+        import gemmi  # noqa: F401
+
+        if not shutil.which(str(self.protenix)):
+            self.unavailable["predict"] = f"Protenix not found: {self.protenix}"
+
+    def stop(self):
+        for batcher in self.batchers.values():
+            batcher.stop()
+
+    # requests
+    def submit(self, kind, body):
+        """Validate and queue one request; raises ValueError (bad request) or LookupError (unavailable)."""
+        if kind in self.unavailable:
+            raise LookupError(self.unavailable[kind])
+        job = ServiceJob(kind, PARSERS[kind](body))
+        self.jobs.add(job)
+        self.batchers[kind].submit(job)
+        return job
+
+    def health(self):
+        return {"status": "ok", "uptime": round(time.time() - self.started, 1), "jobs": self.jobs.counts(),
+                "batchers": {kind: b.stats() for kind, b in self.batchers.items()},
+                "unavailable": self.unavailable, "warm": self.warm}
+
+    # batch handlers: [jobs] → {job id: result or Exception}
+    def run_annotate(self, batch):
+        from supfampred import parse_domtbl
+
+        n = next(self._batch_no)
+        out = self.work_dir / "annotate"
+        out.mkdir(exist_ok=True)
+        fasta, tbl = out / f"batch{n}.fa", out / f"batch{n}.tbl"
+        with fasta.open("w") as fh:
+            for job in batch:
+                for k, (_, seq) in enumerate(job.request["sequences"]):
+                    fh.write(f">{job.id}_{k}\n{seq}\n")
+        result = run_job(Job(f"hmmscan_batch{n}", [str(self.hmmscan), "--domtblout", str(tbl),
+                                                   "-E", str(self.e_value), str(self.hmm_library), str(fasta)],
+                             tool="hmmscan"), self.log_dir)
+        if not result.ok:
+            raise RuntimeError(f"hmmscan failed: {result.error or tail(result.stderr_log, 5)}")
+        hits = parse_domtbl(tbl, self.e_value)
+        fasta.unlink()
+        tbl.unlink()
+        results = {}
+        for job in batch:
+            results[job.id] = {"sequences": {
+                name: [self._named(hit) for hit in hits.get(f"{job.id}_{k}", [])]
+                for k, (name, _) in enumerate(job.request["sequences"])}}
+        return results
+
+    def _named(self, hit):
+        # Without model.tab the hit id is taken as the sunid itself
+        sunid = self.superfamily_models.get(hit["superfamily_id"], hit["superfamily_id"])
+        return {**hit, "sunid": sunid, "superfamily": self.superfamily_names.get(sunid, "Unknown")}
+
+    def run_compare(self, batch):
+        # Codes are reused by every batch: nothing of the previous batch may be read as this one's
+        self._clear_batch()
+        queries = []
+        for i, job in enumerate(batch):
+            code = f"Q{i:03d}"      # DaliLite ids are 4 characters + chain
+            pdb = self.uploads / f"{code}.pdb"
+            if "pdb" in job.request:
+                shutil.copyfile(job.request["pdb"], pdb)
+            else:
+                pdb.write_text(job.request["pdb_text"])
+            queries.append((pdb, code))
+        chain_ids = self.processor._import(queries)
+        zscores = self.processor._compare(chain_ids, queries) if chain_ids else {}
+        results = {}
+        for job, (_, code) in zip(batch, queries):
+            chains = {cid[len(code):]: zscores[cid] for cid in chain_ids if cid.startswith(code)}
+            results[job.id] = ({"name": job.request["name"], "chains": chains} if chains
+                               else RuntimeError("import produced no chains (see service log)"))
+        return results
+
+    def run_predict(self, batch):
+        from seedsched import read_confidences
+        import gemmi  # pip install gemmi
+
+        n = next(self._batch_no)
+        out = self.work_dir / "predict" / f"batch{n}"
+        out.mkdir(parents=True, exist_ok=True)
+        src = out / "input.json"
+        # Unique entry names: clients may reuse names across concurrent requests
+        src.write_text(json.dumps([{**job.request["entry"], "name": f"j{job.id}"} for job in batch], indent=1))
+        cmd = [str(self.protenix), "predict", "--input", str(src), "--out_dir", str(out)]
+        if not self.offline:
+            cmd.append("--use_msa_server")
+        result = run_job(Job(f"protenix_batch{n}", cmd, tool="protenix"), self.log_dir)
+        if not result.ok:
+            raise RuntimeError(f"Protenix failed: {result.error or tail(result.stderr_log, 5)}")
+        pdb_dir = self.work_dir / "structures"
+        pdb_dir.mkdir(exist_ok=True)
+        results = {}
+        for job in batch:
+            rows = read_confidences(out / f"j{job.id}")
+            if not rows:
+                results[job.id] = RuntimeError("Protenix produced no model")
+                continue
+            best = max(rows, key=lambda r: r["score"])
+            pdb = pdb_dir / f"{job.id}.pdb"
+            gemmi.read_structure(best["cif"]).write_pdb(str(pdb))
+            results[job.id] = {"name": job.request["name"], "pdb": str(pdb),
+                               **{k: best[k] for k in ("seed", "sample", "ranking_score", "ptm", "plddt")}}
+        return results
+
+
+# ── HTTP ──────────────────────────────────────────────────────────────────────
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"   # keep-alive: clients reuse connections
+    verbose = False
+
+    @property
+    def service(self) -> Service:
+        return self.server.service
+
+    def log_message(self, fmt, *args):
+        if self.verbose:
+            super().log_message(fmt, *args)
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _wait(self, job, query):
+        try:
+            wait = min(float(query.get("wait", ["0"])[0]), MAX_CLIENT_WAIT)
+        except ValueError:
+            wait = 0.0
+        if wait > 0:
+            job.done.wait(wait)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        if parts == ["health"]:
+            return self._send(200, self.service.health())
+        if len(parts) in (2, 3) and parts[0] == "jobs" and parts[2:] in ([], ["result"]):
+            job = self.service.jobs.get(parts[1])
+            if job is None:
+                return self._send(404, {"error": f"unknown job {parts[1]}"})
+            self._wait(job, parse_qs(url.query))
+            if len(parts) == 2:
+                return self._send(200, job.as_dict(result=False))
+            if job.status == "done":
+                return self._send(200, job.result)
+            if job.status == "failed":
+                return self._send(500, {"id": job.id, "status": job.status, "error": job.error})
+            return self._send(202, {"id": job.id, "status": job.status})
+        self._send(404, {"error": f"no such endpoint: {url.path}"})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        kind = url.path.strip("/")
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY:
+            self.close_connection = True
+            return self._send(413, {"error": f"request body larger than {MAX_BODY} bytes"})
+        raw = self.rfile.read(length)
+        if kind not in KINDS:
+            return self._send(404, {"error": f"no such endpoint: {url.path}"})
+        try:
+            body = json.loads(raw or b"{}")
+            if not isinstance(body, dict):
+                raise ValueError("expected a JSON object")
+            job = self.service.submit(kind, body)
+        except ValueError as e:     # includes JSONDecodeError
+            return self._send(400, {"error": str(e)})
+        except LookupError as e:
+            return self._send(503, {"error": f"{kind} unavailable: {e.args[0]}"})
+        self._wait(job, parse_qs(url.query))
+        self._send(200 if job.done.is_set() else 202, job.as_dict())
+
+
+class ServiceServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256    # listen backlog; the default of 5 resets bursts of clients
+
+
+def make_server(service, host=HOST, port=PORT):
+    """Server bound to *host*:*port* (0 picks a free port); call service.start() first."""
+    server = ServiceServer((host, port), Handler)
+    server.service = service
+    return server
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Local HTTP/JSON service with micro-batching.")
+    parser.add_argument("--host", default=HOST, help=f"Bind address (default: {HOST}, local only)")
+    parser.add_argument("--port", type=int, default=PORT, help=f"Port (default: {PORT})")
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH, help=f"Largest batch (default: {MAX_BATCH})")
+    parser.add_argument("--max-wait", type=float, default=MAX_WAIT,
+                        help=f"Seconds a batch waits for more requests (default: {MAX_WAIT})")
+    parser.add_argument("--work-dir", default=WORK_DIR, help=f"Uploads, batch files and logs (default: {WORK_DIR})")
+    parser.add_argument("--refs", nargs="+", metavar="PDB[:CHAIN]",
+                        help="Multi-reference mode (as dali.py --refs); /compare returns one Z-score per reference")
+    parser.add_argument("--backend", choices=["dalilite", "native"], default="dalilite")
+    parser.add_argument("--workers", type=int, help="Concurrent import/DALI jobs (default: CPU count)")
+    parser.add_argument("--dali-bin", metavar="DIR", help="Directory with dali.pl and import.pl")
+    parser.add_argument("--no-compare", action="store_true", help="Do not offer /compare (no DALI set-up here)")
+    parser.add_argument("--hmmscan", help="hmmscan executable (default: the SUPERFAMILY installation)")
+    parser.add_argument("--hmm-library", help="SUPERFAMILY HMM library")
+    parser.add_argument("--e-value", type=float, default=0.001, help="E-value threshold for /annotate")
+    parser.add_argument("--sf-names", nargs="+", metavar="FILE",
+                        help="Superfamily names: SCOP dir.des file(s) or SUPERFAMILY results .html pages "
+                             "(default: the pages in the SUPERFAMILY results directory)")
+    parser.add_argument("--protenix", default="protenix", help="Protenix executable")
+    parser.add_argument("--offline", action="store_true", help="Do not pass --use_msa_server to Protenix")
+    parser.add_argument("--trace", metavar="DIR", help="Record timing/resource trace files in DIR")
+    parser.add_argument("--verbose", action="store_true", help="Log every HTTP request")
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace)
+
+    pipeline = None
+    if not args.no_compare:
+        from dali import DaliPipeline
+
+        pipeline = DaliPipeline()
+        pipeline.backend = args.backend
+        if args.workers:
+            pipeline.workers = args.workers
+        if args.dali_bin:
+            pipeline.dali_pl = Path(args.dali_bin).resolve() / "dali.pl"
+            pipeline.import_pl = Path(args.dali_bin).resolve() / "import.pl"
+        for ref in args.refs or []:
+            pdb_name, _, chain = ref.partition(":")
+            pipeline.add_reference(pdb_name, chain or "A")
+
+    service = Service(pipeline, args.work_dir, args.hmmscan, args.hmm_library, args.e_value,
+                      args.protenix, args.offline, args.max_batch, args.max_wait, args.sf_names)
+    service.start()
+    for kind, reason in service.unavailable.items():
+        print(f"⚠️ /{kind} unavailable: {reason}")
+    if len(service.unavailable) == len(KINDS):
+        sys.exit(1)
+    Handler.verbose = args.verbose
+    server = make_server(service, args.host, args.port)
+    print(f"🌐 Serving {', '.join('/' + k for k in service.batchers)} on http://{args.host}:{server.server_port} "
+          f"(batches of up to {args.max_batch}, max wait {args.max_wait:g}s)", flush=True)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping (finishing queued batches)")
+    finally:
+        server.server_close()
+        service.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,396 @@
+#!/usr/bin/env python3
+"""
+predarchive.py
+--------------------
+Compact binary archival of Protenix outputs with transparent readers.
+
+A Protenix target directory (e.g. predicted_structures/tmp_target/target/)
+holds one ~2.5k-line text mmCIF per seed/sample, the summary-confidence
+JSONs and a copy of the MSA folder.  `pack` turns it into
+
+    <archive>/<rel path>.ppred.npz      one compressed container per target
+        topology   shared by all samples: chain, residue, atom names, ...
+        coords     (samples, atoms, 3) int32, 0.001 Å fixed point
+        bfactor    (samples, atoms)    int16, 0.01 fixed point (pLDDT); int32
+                                       when a value exceeds ±327.67
+        meta       JSON: seeds/samples, confidences, file manifest
+    <archive>/blobs/ab/<sha256>         content-addressed store for every other
+                                        file (MSAs, m8 hits, ...), gzip-compressed;
+                                        identical MSAs are stored once
+
+Reader API (no unpacking to disk):
+    arc = PredictionArchive("archive/tmp_target/target.ppred.npz")
+    arc.samples()                  → [(seed, sample), ...]
+    arc.structure(101, 0)          → gemmi.Structure
+    arc.coords(101, 0), arc.plddt(101, 0), arc.confidence(101, 0)
+    arc.best("ranking_score")      → (seed, sample)
+    arc.read_file("msa_resmsa_seq_0/0.a3m")
+    open_structure("x.cif" | "y.ppred.npz" | "y.ppred.npz#101:0")
+
+Usage:
+    python predarchive.py pack predicted_structures/ --archive archive/ [--remove]
+    python predarchive.py list archive/tmp_target/target.ppred.npz
+    python predarchive.py export archive/tmp_target/target.ppred.npz --out target.pdb [--seed 101 --sample 0]
+    python predarchive.py unpack archive/tmp_target/target.ppred.npz --out restored/
+"""
+
+import argparse
+import gzip
+import hashlib
+import json
+import re
+import shutil
+import sys
+from pathlib import Path
+
+import numpy as np
+
+SUFFIX = ".ppred.npz"
+SAMPLE_RE = re.compile(r"_seed_(?P<seed>\d+)_sample_(?P<sample>\d+)\.cif$")
+CONF_RE = re.compile(r"_seed_(?P<seed>\d+)_summary_confidence_sample_(?P<sample>\d+)\.json$")
+COORD_SCALE = 1000.0
+BFACTOR_SCALE = 100.0
+INT16_MAX = np.iinfo(np.int16).max
+TOPOLOGY = ["chain", "res_name", "res_seq", "icode", "hetero", "atom_name", "element"]
+
+
+# ── packing ───────────────────────────────────────────────────────────────────
+def _topology_and_coords(path):
+    import gemmi  # pip install gemmi
+
+    st = gemmi.read_structure(str(path))
+    st.remove_empty_chains()
+    topo = {k: [] for k in TOPOLOGY}
+    xyz, bfac = [], []
+    for chain in st[0]:
+        for res in chain:
+            for atom in res:
+                topo["chain"].append(chain.name)
+                topo["res_name"].append(res.name)
+                topo["res_seq"].append(res.seqid.num)
+                topo["icode"].append(res.seqid.icode.strip())
+                topo["hetero"].append(res.het_flag == "H")
+                topo["atom_name"].append(atom.name)
+                topo["element"].append(atom.element.name)
+                xyz.append((atom.pos.x, atom.pos.y, atom.pos.z))
+                bfac.append(atom.b_iso)
+    topo = {k: np.array(v, dtype=bool if k == "hetero" else (np.int32 if k == "res_seq" else str))
+            for k, v in topo.items()}
+    return topo, np.array(xyz), np.array(bfac)
+
+
+def _store_blob(data, blob_dir):
+    digest = hashlib.sha256(data).hexdigest()
+    path = Path(blob_dir) / digest[:2] / digest
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(digest + ".tmp")
+        with gzip.open(tmp, "wb", compresslevel=6) as fh:
+            fh.write(data)
+        tmp.replace(path)
+    return digest
+
+
+def find_targets(pred_dir):
+    """Protenix target directories (with seed_*/predictions or msa_res* folders) below *pred_dir*."""
+    targets = {p.parent.parent.parent for p in Path(pred_dir).rglob("*_sample_*.cif")
+               if p.parent.name == "predictions" and p.parent.parent.name.startswith("seed_")}
+    targets.update(p.parent for p in Path(pred_dir).rglob("msa_res*") if p.is_dir())
+    return sorted(targets)
+
+
+def pack_target(target_dir, out_path, blob_dir):
+    """Pack one target directory; returns (files packed, bytes before)."""
+    target_dir = Path(target_dir)
+    samples, confidences, files = [], {}, {}
+    topology, coords, bfactors = None, [], []
+    n_files, n_bytes = 0, 0
+    for path in sorted(p for p in target_dir.rglob("*") if p.is_file()):
+        rel = path.relative_to(target_dir).as_posix()
+        n_files += 1
+        n_bytes += path.stat().st_size
+        m_sample, m_conf = SAMPLE_RE.search(path.name), CONF_RE.search(path.name)
+        if m_sample and path.parent.name == "predictions":
+            topo, xyz, bfac = _topology_and_coords(path)
+            if topology is None:
+                topology = topo
+            elif any(not np.array_equal(topology[k], topo[k]) for k in TOPOLOGY):
+                raise ValueError(f"{path}: topology differs from the other samples")
+            samples.append([int(m_sample["seed"]), int(m_sample["sample"]), rel])
+            coords.append(np.rint(xyz * COORD_SCALE).astype(np.int32))
+            bfactors.append(np.rint(bfac * BFACTOR_SCALE).astype(np.int64))
+        elif m_conf and path.parent.name == "predictions":
+            confidences[f"{int(m_conf['seed'])}:{int(m_conf['sample'])}"] = {
+                "file": rel, "data": json.loads(path.read_text())}
+        else:
+            files[rel] = _store_blob(path.read_bytes(), blob_dir)
+
+    bfactor = np.array(bfactors)
+    # pLDDT fits int16; B-factors and other confidence fields can exceed ±327.67
+    bfactor = bfactor.astype(np.int16 if bfactor.size == 0 or np.abs(bfactor).max() <= INT16_MAX else np.int32)
+    meta = {"source": str(target_dir), "name": target_dir.name, "samples": samples,
+            "confidences": confidences, "files": files}
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out_path.with_name(out_path.name + ".tmp")
+    with tmp.open("wb") as fh:
+        np.savez_compressed(fh, meta=np.array(json.dumps(meta)),
+                            coords=np.array(coords), bfactor=bfactor,
+                            **{f"topo_{k}": v for k, v in (topology or {}).items()})
+    tmp.replace(out_path)
+    return n_files, n_bytes
+
+
+def verify_target(target_dir, arc):
+    """Differences between a target directory and its archive, decoded from disk (empty if it round-trips)."""
+    target_dir = Path(target_dir)
+    problems = []
+    stored = {rel for _, _, rel in arc.meta["samples"]}
+    stored |= {entry["file"] for entry in arc.meta["confidences"].values()}
+    stored |= set(arc.meta["files"])
+    on_disk = {p.relative_to(target_dir).as_posix() for p in target_dir.rglob("*") if p.is_file()}
+    problems += [f"{rel}: not archived" for rel in sorted(on_disk - stored)]
+    for seed, sample, rel in arc.meta["samples"]:
+        topo, xyz, bfac = _topology_and_coords(target_dir / rel)
+        if any(not np.array_equal(arc.topology[k], topo[k]) for k in TOPOLOGY):
+            problems.append(f"{rel}: topology differs")
+        elif not np.allclose(arc.coords(seed, sample), xyz, rtol=0, atol=0.5 / COORD_SCALE + 1e-6):
+            problems.append(f"{rel}: coordinates differ")
+        elif not np.allclose(arc.bfactor(seed, sample), bfac, rtol=0, atol=0.5 / BFACTOR_SCALE + 1e-6):
+            problems.append(f"{rel}: B-factors differ")
+    for entry in arc.meta["confidences"].values():
+        if json.loads((target_dir / entry["file"]).read_text()) != entry["data"]:
+            problems.append(f"{entry['file']}: confidences differ")
+    for rel in arc.meta["files"]:
+        try:
+            if arc.read_file(rel) != (target_dir / rel).read_bytes():
+                problems.append(f"{rel}: content differs")
+        except OSError as e:
+            problems.append(f"{rel}: {e}")
+    return problems
+
+
+# ── reading ───────────────────────────────────────────────────────────────────
+class PredictionArchive:
+    """Read-only view of a packed target."""
+
+    def __init__(self, path, blob_dir=None):
+        self.path = Path(path)
+        self.blob_dir = Path(blob_dir) if blob_dir else self._find_blob_dir()
+        with np.load(self.path, allow_pickle=False) as data:
+            self.meta = json.loads(str(data["meta"]))
+            self._coords = data["coords"]
+            self._bfactor = data["bfactor"]
+            self.topology = {k: data[f"topo_{k}"] for k in TOPOLOGY if f"topo_{k}" in data.files}
+        self._index = {(seed, sample): i for i, (seed, sample, _) in enumerate(self.meta["samples"])}
+
+    def _find_blob_dir(self):
+        for parent in self.path.parents:
+            if (parent / "blobs").is_dir():
+                return parent / "blobs"
+        return self.path.parent / "blobs"
+
+    @property
+    def name(self):
+        return self.meta["name"]
+
+    def samples(self):
+        return sorted(self._index)
+
+    def _i(self, seed, sample):
+        if seed is None:
+            return 0
+        return self._index[(seed, sample)]
+
+    def coords(self, seed=None, sample=0):
+        """(atoms, 3) float coordinates of one sample (first sample by default)."""
+        return self._coords[self._i(seed, sample)] / COORD_SCALE
+
+    def bfactor(self, seed=None, sample=0):
+        return self._bfactor[self._i(seed, sample)] / BFACTOR_SCALE
+
+    def ca_mask(self):
+        return (self.topology["atom_name"] == "CA") & ~self.topology["hetero"]
+
+    def plddt(self, seed=None, sample=0):
+        """Per-residue pLDDT (CA B-factors)."""
+        return self.bfactor(seed, sample)[self.ca_mask()]
+
+    def confidence(self, seed, sample):
+        entry = self.meta["confidences"].get(f"{seed}:{sample}")
+        return entry["data"] if entry else None
+
+    def best(self, metric="ranking_score"):
+        """(seed, sample) with the highest confidence *metric*."""
+        scored = [(self.confidence(*key) or {}).get(metric, float("-inf")) for key in self.samples()]
+        return self.samples()[int(np.argmax(scored))]
+
+    def structure(self, seed=None, sample=0):
+        """gemmi.Structure of one sample, built in memory."""
+        import gemmi  # pip install gemmi
+
+        topo = self.topology
+        xyz, bfac = self.coords(seed, sample), self.bfactor(seed, sample)
+        st = gemmi.Structure()
+        st.name = self.name
+        model = gemmi.Model("1")
+        chain = residue = None
+        prev = None
+        for i in range(len(xyz)):
+            key = (topo["chain"][i], topo["res_seq"][i], topo["icode"][i], topo["res_name"][i])
+            if chain is None or key[0] != chain.name:
+                if chain is not None:
+                    if residue is not None:
+                        chain.add_residue(residue)
+                    model.add_chain(chain)
+                chain, residue, prev = gemmi.Chain(str(key[0])), None, None
+            if key != prev:
+                if residue is not None:
+                    chain.add_residue(residue)
+                residue = gemmi.Residue()
+                residue.name = str(key[3])
+                residue.seqid = gemmi.SeqId(int(key[1]), str(key[2]) or " ")
+                residue.het_flag = "H" if topo["hetero"][i] else "A"
+                prev = key
+            atom = gemmi.Atom()
+            atom.name = str(topo["atom_name"][i])
+            atom.element = gemmi.Element(str(topo["element"][i]))
+            atom.pos = gemmi.Position(*xyz[i])
+            atom.b_iso = float(bfac[i])
+            atom.occ = 1.0
+            residue.add_atom(atom)
+        if residue is not None:
+            chain.add_residue(residue)
+        if chain is not None:
+            model.add_chain(chain)
+        st.add_model(model)
+        st.setup_entities()
+        return st
+
+    def write_pdb(self, out_pdb, seed=None, sample=0):
+        self.structure(seed, sample).write_pdb(str(out_pdb))
+
+    def files(self):
+        return dict(self.meta["files"])
+
+    def read_file(self, rel):
+        """Bytes of an archived non-structure file (MSA, m8, ...)."""
+        digest = self.meta["files"][rel]
+        with gzip.open(self.blob_dir / digest[:2] / digest, "rb") as fh:
+            return fh.read()
+
+    def unpack(self, out_dir):
+        """Recreate the target directory (mmCIF samples are regenerated by gemmi)."""
+        out_dir = Path(out_dir)
+        for seed, sample, rel in self.meta["samples"]:
+            dst = out_dir / rel
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            st = self.structure(seed, sample)
+            st.make_mmcif_document().write_file(str(dst))
+        for entry in self.meta["confidences"].values():
+            dst = out_dir / entry["file"]
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            dst.write_text(json.dumps(entry["data"], indent=4))
+        for rel in self.meta["files"]:
+            dst = out_dir / rel
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            dst.write_bytes(self.read_file(rel))
+
+
+def find_archives(path):
+    return sorted(Path(path).rglob(f"*{SUFFIX}"))
+
+
+def read_meta(path):
+    """Meta of an archive (name, samples, confidences, files), read without loading its coordinates."""
+    with np.load(path, allow_pickle=False) as data:
+        return json.loads(str(data["meta"]))
+
+
+def archive_name(path):
+    """Target name stored in an archive."""
+    return read_meta(path)["name"]
+
+
+def open_structure(spec):
+    """gemmi.Structure from a PDB/mmCIF path or an archive ('x.ppred.npz' or 'x.ppred.npz#seed:sample')."""
+    import gemmi  # pip install gemmi
+
+    path, _, key = str(spec).partition("#")
+    if not path.endswith(SUFFIX):
+        return gemmi.read_structure(path)
+    arc = PredictionArchive(path)
+    if key:
+        seed, _, sample = key.partition(":")
+        return arc.structure(int(seed), int(sample or 0))
+    return arc.structure(*arc.samples()[0])
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Pack Protenix outputs into compact binary archives.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_pack = sub.add_parser("pack", help="Archive every target directory below PRED_DIR")
+    p_pack.add_argument("pred_dir")
+    p_pack.add_argument("--archive", default="archive", help="Archive root (default: archive)")
+    p_pack.add_argument("--remove", action="store_true", help="Delete the originals after a verified pack")
+    p_list = sub.add_parser("list", help="Show the samples and files in an archive")
+    p_list.add_argument("archive")
+    p_exp = sub.add_parser("export", help="Write one sample as PDB")
+    p_exp.add_argument("archive")
+    p_exp.add_argument("--out", required=True)
+    p_exp.add_argument("--seed", type=int, help="Default: best ranking_score")
+    p_exp.add_argument("--sample", type=int, default=0)
+    p_un = sub.add_parser("unpack", help="Restore the original directory layout")
+    p_un.add_argument("archive")
+    p_un.add_argument("--out", required=True)
+    args = parser.parse_args()
+
+    if args.command == "pack":
+        pred_dir, root = Path(args.pred_dir), Path(args.archive)
+        targets = find_targets(pred_dir)
+        if not targets:
+            print(f"❌ No Protenix target directories found under {pred_dir}")
+            sys.exit(1)
+        total_files = total_bytes = failed = 0
+        for target_dir in targets:
+            out = root / (target_dir.relative_to(pred_dir).as_posix() + SUFFIX)
+            n_files, n_bytes = pack_target(target_dir, out, root / "blobs")
+            arc = PredictionArchive(out, root / "blobs")
+            total_files += n_files
+            total_bytes += n_bytes
+            print(f"📦 {target_dir} → {out} ({len(arc.samples())} samples, {n_files} files)")
+            if args.remove:
+                # Decode the archive as written and compare it with the originals before deleting them
+                problems = verify_target(target_dir, arc)
+                if problems:
+                    print(f"❌ Verification failed for {out}; originals kept:\n   " + "\n   ".join(problems[:10]))
+                    failed += 1
+                    continue
+                shutil.rmtree(target_dir)
+        archived = [p for p in root.rglob("*") if p.is_file()]
+        size = sum(p.stat().st_size for p in archived)
+        print(f"✅ {total_files} files / {total_bytes / 1e6:.1f} MB → "
+              f"{len(archived)} files / {size / 1e6:.1f} MB in {root}/")
+        sys.exit(1 if failed else 0)
+
+    arc = PredictionArchive(args.archive)
+    if args.command == "list":
+        print(f"{arc.name}: {len(arc.topology.get('chain', []))} atoms, {len(arc.samples())} samples")
+        for seed, sample in arc.samples():
+            conf = arc.confidence(seed, sample) or {}
+            print(f"  seed {seed} sample {sample}  ranking_score={conf.get('ranking_score', float('nan')):.3f}  "
+                  f"plddt={conf.get('plddt', float('nan')):.1f}")
+        for rel in sorted(arc.files()):
+            print(f"  {rel}")
+    elif args.command == "export":
+        seed, sample = (args.seed, args.sample) if args.seed is not None else arc.best()
+        arc.write_pdb(args.out, seed, sample)
+        print(f"✓ seed {seed} sample {sample} → {args.out}")
+    else:
+        arc.unpack(args.out)
+        print(f"✓ Restored {args.archive} → {args.out}")
+
+
+if __name__ == "__main__":
+    main()
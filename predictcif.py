@@ -12,36 +12,48 @@ Workflow
 3. If no PDB exists, take the first *.cif*, convert it to PDB with *gemmi*.
 4. Copy the chosen PDB to `reference.pdb`.
 """
-import subprocess, glob, shutil, sys
+import argparse, subprocess, glob, shutil, sys
 from pathlib import Path
-import gemmi                         # pip install gemmi
+
+from asyncrunner import Job, run_job, tail
+from shardlayout import ShardedDir
+import tracing
 
 # ── configuration ─────────────────────────────────────────────────────────────
 PROTENIX      = "protenix"           # absolute path if not in $PATH
 PRED_DIR      = "predicted_structures"
+LOG_DIR       = "predicted_structures/logs"   # Protenix stdout/stderr per run
 TARGET_JSON   = "7.6.2.14.json"
 REFERENCE_PDB = "7.6.2.14.pdb"
 
 # ── helper: run shell commands ────────────────────────────────────────────────
-def run(cmd: str) -> None:
-    """Run a shell command; raise CalledProcessError on failure."""
+def run(cmd: str, name: str = None, target: str = None) -> None:
+    """Run a command through the async runner; raise CalledProcessError on failure."""
     print(f"▶ {cmd}", flush=True)
-    subprocess.run(cmd, shell=True, check=True,
-                   stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    job = Job(name or Path(cmd.split()[0]).name, cmd, tool="protenix", target=target)
+    result = run_job(job, LOG_DIR)
+    if not result.ok:
+        print(tail(result.stderr_log), file=sys.stderr, flush=True)
+        raise subprocess.CalledProcessError(result.returncode or 1, cmd)
 
 # ── core routine ──────────────────────────────────────────────────────────────
-def predict_to_single_pdb(src: str, dst_pdb: str) -> None:
+def predict_to_single_pdb(src: str, dst_pdb: str, trim_plddt: float = None) -> None:
     """
     Call Protenix on *src* (FASTA / JSON / PDB) and save the first structure
-    in PDB format to *dst_pdb*.
+    in PDB format to *dst_pdb*.  With *trim_plddt* the low-confidence termini
+    and loops are removed (see plddttrim.py); the residue mapping is written
+    next to *dst_pdb* as <name>.trim.json.
     """
     base   = Path(src).stem
-    tmpdir = Path(PRED_DIR) / f"tmp_{base}"
+    preds  = ShardedDir(PRED_DIR, "pred")
+    tmpdir = preds.path(f"tmp_{base}", create=True)
     tmpdir.mkdir(parents=True, exist_ok=True)
 
     # 1. run inference (replace --use_msa_server with --cycle 0 for offline mode)
-    run(f"{PROTENIX} predict --input {src} "
-        f"--out_dir {tmpdir} --use_msa_server")
+    with tracing.get_tracer().span("predict", target=base):
+        run(f"{PROTENIX} predict --input {src} "
+            f"--out_dir {tmpdir} --use_msa_server", name=f"protenix_{base}", target=base)
+    preds.record(tmpdir.name)
 
     # 2. preferred output: PDB
     pdb_files = glob.glob(str(tmpdir / "**" / "*.pdb"), recursive=True)
@@ -52,19 +64,59 @@ def predict_to_single_pdb(src: str, dst_pdb: str) -> None:
         cif_files = glob.glob(str(tmpdir / "**" / "*.cif"), recursive=True)
         if not cif_files:
             raise RuntimeError(f"No structure produced in {tmpdir}")
+        import gemmi                     # pip install gemmi
         cif_path  = cif_files[0]
         first_pdb = tmpdir / "converted.pdb"
-        gemmi.read_structure(cif_path).write_pdb(str(first_pdb))
+        with tracing.get_tracer().span("convert", target=base):
+            gemmi.read_structure(cif_path).write_pdb(str(first_pdb))
 
     # 4. copy to destination
-    shutil.copy(first_pdb, dst_pdb)
+    if trim_plddt is None:
+        shutil.copy(first_pdb, dst_pdb)
+    else:
+        _trim(first_pdb, dst_pdb, trim_plddt)
     print(f"✓ saved PDB → {dst_pdb}", flush=True)
 
+
+def _trim(src_pdb, dst_pdb, trim_plddt: float) -> None:
+    from plddttrim import trim_structure
+    mapping = trim_structure(src_pdb, dst_pdb, threshold=trim_plddt)
+    kept = sum(c["n_kept"] for c in mapping["chains"].values())
+    total = sum(c["n_input"] for c in mapping["chains"].values())
+    print(f"✂️ trimmed to {kept}/{total} residues with pLDDT >= {trim_plddt}", flush=True)
+
+
+def predict_adaptive(src: str, dst_pdb: str, trim_plddt: float = None, **schedule) -> None:
+    """
+    Like predict_to_single_pdb, but run seeds incrementally until confidence
+    plateaus (see seedsched.py) and keep the best-ranked sample.
+    """
+    from seedsched import SeedScheduler, save_best
+    target = SeedScheduler(PROTENIX, PRED_DIR, LOG_DIR, **schedule).run([src])[0]
+    save_best(target, dst_pdb)
+    if trim_plddt is not None:
+        _trim(dst_pdb, dst_pdb, trim_plddt)
+
 # ── entry point ───────────────────────────────────────────────────────────────
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run Protenix and keep the first model as PDB.")
+    parser.add_argument("src", nargs="?", default=TARGET_JSON, help=f"Input JSON (default: {TARGET_JSON})")
+    parser.add_argument("dst", nargs="?", default=REFERENCE_PDB, help=f"Output PDB (default: {REFERENCE_PDB})")
+    parser.add_argument("--trace", metavar="DIR", help="Record timing/resource trace files in DIR")
+    parser.add_argument("--trim-plddt", type=float, metavar="THRESH",
+                        help="Remove low-pLDDT termini/loops from the saved model (see plddttrim.py)")
+    parser.add_argument("--adaptive", action="store_true",
+                        help="Run seeds incrementally until confidence plateaus (see seedsched.py)")
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace)
+
     try:
         Path(PRED_DIR).mkdir(exist_ok=True)
-        predict_to_single_pdb(TARGET_JSON, REFERENCE_PDB)
+        if args.adaptive:
+            predict_adaptive(args.src, args.dst, args.trim_plddt)
+        else:
+            predict_to_single_pdb(args.src, args.dst, args.trim_plddt)
     except subprocess.CalledProcessError as e:
         sys.exit(e.returncode)
     except Exception as exc:
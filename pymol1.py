@@ -1,29 +1,54 @@
-import pymol
 import os
 
 # Start PyMOL
 output_dir = "structures"
-os.makedirs(output_dir, exist_ok=True)
-
-pymol.finish_launching(['pymol', '-qc'])
-# Load the reference PDB file
-pymol.cmd.load('7.6.2.14.pdb', 'reference')
-# Iterate over the list of PDB files to align and cluster
+reference_pdb = '7.6.2.14.pdb'
+# List of PDB files to align and cluster
 pdb_files = ['1v43A.pdb']
-for pdb_file in pdb_files:
-# Load the current PDB file
-    pymol.cmd.load(pdb_file, 'current')
-    # Align all atoms to the reference
-    pymol.cmd.align('current', 'reference')
-    # Cluster the aligned structure based on CA atoms
-    # pymol.cmd.cluster('current', cutoff=3.0, selection='name CA')
-    # Save the aligned and clustered structure
-    pymol.cmd.zoom('current')
-    pdb_out_path = os.path.join(output_dir, 'aligned_clustered_' + pdb_file)
-    pymol.cmd.save(pdb_out_path, 'current')
-    png_out_path = os.path.join(output_dir, 'aligned_clustered_' + pdb_file.replace('.pdb', '.png'))
-    pymol.cmd.png(png_out_path, dpi=300, ray=1)
-
-    # Delete the current structure from the PyMOL session
-    
-# Quit PyMOL
+# Optional structstore.py store: files it holds unchanged are loaded from it instead of parsed
+store_path = None
+
+
+def load(cmd, pdb_file, name, store):
+    chains = store.source_chains(pdb_file) if store is not None else None
+    if chains:
+        from structstore import pdb_text
+        cmd.read_pdbstr(pdb_text(chains), name)
+    else:
+        cmd.load(pdb_file, name)
+
+
+def render(reference_pdb=reference_pdb, pdb_files=pdb_files, output_dir=output_dir, store_path=store_path):
+    import pymol  # imported here so importing this module does not start PyMOL
+
+    store = None
+    if store_path and os.path.exists(store_path):
+        from structstore import StructStore
+        store = StructStore(store_path)
+    os.makedirs(output_dir, exist_ok=True)
+    pymol.finish_launching(['pymol', '-qc'])
+    # Load the reference PDB file
+    load(pymol.cmd, reference_pdb, 'reference', store)
+    # Iterate over the list of PDB files to align and cluster
+    for pdb_file in pdb_files:
+        # Load the current PDB file
+        load(pymol.cmd, pdb_file, 'current', store)
+        # Align all atoms to the reference
+        pymol.cmd.align('current', 'reference')
+        # Cluster the aligned structure based on CA atoms
+        # pymol.cmd.cluster('current', cutoff=3.0, selection='name CA')
+        # Save the aligned and clustered structure
+        pymol.cmd.zoom('current')
+        name = os.path.basename(pdb_file)
+        pdb_out_path = os.path.join(output_dir, 'aligned_clustered_' + name)
+        pymol.cmd.save(pdb_out_path, 'current')
+        png_out_path = os.path.join(output_dir, 'aligned_clustered_' + name.replace('.pdb', '.png'))
+        pymol.cmd.png(png_out_path, dpi=300, ray=1)
+
+        # Delete the current structure from the PyMOL session
+        pymol.cmd.delete('current')
+
+
+if __name__ == "__main__":
+    render()
+    # Quit PyMOL
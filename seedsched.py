@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+seedsched.py
+--------------------
+Adaptive early-stopping seed scheduler for Protenix.
+
+Instead of one `protenix predict` run with a fixed seed list, seeds are run
+in rounds.  After every round the `*_summary_confidence_sample_N.json` files
+are read (ranking_score, ptm, plddt) and a target stops receiving seeds when
+
+• its best score reaches --threshold            (confident → done), or
+• the best score improved by less than --min-gain over the last
+  --patience rounds                             (plateau), or
+• --max-seeds seeds have been used.
+
+All targets share the rounds, so extra seeds (and GPU time) only go to the
+targets that are still low-confidence.  The best sample of each target is
+converted to PDB, and the decisions are logged to seed_schedule.json in the
+target's Protenix output directory.
+
+Usage:
+    python seedsched.py 7.6.2.14.json target.json --out-dir predicted_structures
+    python seedsched.py 7.6.2.14.json --threshold 0.85 --max-seeds 8 --seeds-per-round 2
+"""
+
+import argparse
+import json
+import re
+import sys
+from pathlib import Path
+
+from asyncrunner import Job, run_jobs, tail
+from shardlayout import ShardedDir
+import tracing
+
+# ── configuration ─────────────────────────────────────────────────────────────
+PROTENIX = "protenix"
+PRED_DIR = "predicted_structures"
+LOG_DIR = "predicted_structures/logs"
+FIRST_SEED = 101
+SEEDS_PER_ROUND = 1
+MAX_SEEDS = 5
+THRESHOLD = 0.85        # stop once the best score reaches this
+MIN_GAIN = 0.01         # smaller improvements count as a plateau
+PATIENCE = 2            # rounds without MIN_GAIN improvement before stopping
+METRIC = "ranking_score"
+
+CONF_RE = re.compile(r"_seed_(?P<seed>\d+)_summary_confidence_sample_(?P<sample>\d+)\.json$")
+
+
+def score(conf, metric=METRIC):
+    """Scalar confidence in [0, 1]; pLDDT (0–100) is rescaled, missing ranking_score falls back to ptm."""
+    if metric == "plddt":
+        return conf["plddt"] / 100.0
+    if metric not in conf and metric == "ranking_score":
+        return conf.get("ptm", 0.0)
+    return conf[metric]
+
+
+def read_confidences(pred_dir, metric=METRIC):
+    """[{seed, sample, score, ranking_score, ptm, plddt, json, cif}] for every sample below *pred_dir*."""
+    rows = []
+    for path in Path(pred_dir).rglob("*_summary_confidence_sample_*.json"):
+        m = CONF_RE.search(path.name)
+        if not m:
+            continue
+        conf = json.loads(path.read_text())
+        seed, sample = int(m["seed"]), int(m["sample"])
+        cif = path.with_name(path.name.replace("_summary_confidence_sample_", "_sample_")[:-5] + ".cif")
+        rows.append({
+            "seed": seed, "sample": sample, "score": score(conf, metric),
+            "ranking_score": conf.get("ranking_score"), "ptm": conf.get("ptm"), "plddt": conf.get("plddt"),
+            "json": str(path), "cif": str(cif),
+        })
+    return rows
+
+
+class TargetState:
+    """Seeds used and best score per round for one input JSON."""
+
+    def __init__(self, src, out_dir):
+        self.src = Path(src)
+        self.name = self.src.stem
+        self.out_dir = ShardedDir(out_dir, "pred").path(f"tmp_{self.name}", create=True)
+        self.seeds = []
+        self.history = []       # best score after each round
+        self.stop_reason = None
+        self.best = None
+
+    @property
+    def active(self):
+        return self.stop_reason is None
+
+
+class SeedScheduler:
+    def __init__(self, protenix=PROTENIX, out_dir=PRED_DIR, log_dir=LOG_DIR, first_seed=FIRST_SEED,
+                 seeds_per_round=SEEDS_PER_ROUND, max_seeds=MAX_SEEDS, threshold=THRESHOLD,
+                 min_gain=MIN_GAIN, patience=PATIENCE, metric=METRIC, extra_args=("--use_msa_server",)):
+        # A round without new seeds changes nothing and would repeat forever
+        if seeds_per_round < 1 or max_seeds < 1:
+            raise ValueError(f"need at least one seed per round and in total "
+                             f"(seeds_per_round={seeds_per_round}, max_seeds={max_seeds})")
+        self.protenix = protenix
+        self.out_dir = Path(out_dir)
+        self.log_dir = log_dir
+        self.first_seed = first_seed
+        self.seeds_per_round = seeds_per_round
+        self.max_seeds = max_seeds
+        self.threshold = threshold
+        self.min_gain = min_gain
+        self.patience = patience
+        self.metric = metric
+        self.extra_args = list(extra_args)
+
+    def _job(self, target, seeds):
+        cmd = [self.protenix, "predict", "--input", str(target.src), "--out_dir", str(target.out_dir),
+               "--seeds", ",".join(map(str, seeds)), *self.extra_args]
+        return Job(f"protenix_{target.name}_s{seeds[0]}", cmd, tool="protenix", target=target.name)
+
+    def _update(self, target):
+        rows = read_confidences(target.out_dir, self.metric)
+        if rows:
+            target.best = max(rows, key=lambda r: r["score"])
+        best = target.best["score"] if target.best else 0.0
+        target.history.append(round(best, 4))
+
+        if best >= self.threshold:
+            target.stop_reason = "threshold"
+        elif (len(target.history) > self.patience
+              and best - target.history[-1 - self.patience] < self.min_gain):
+            target.stop_reason = "plateau"
+        elif len(target.seeds) >= self.max_seeds:
+            target.stop_reason = "max_seeds"
+
+    def run(self, sources):
+        """Schedule seeds over all *sources*; returns the TargetState list."""
+        targets = [TargetState(src, self.out_dir) for src in sources]
+        for target in targets:
+            # Resume: seeds already predicted by an earlier run count as round 0
+            done = sorted({r["seed"] for r in read_confidences(target.out_dir, self.metric)})
+            if done:
+                target.seeds = done
+                self._update(target)
+                print(f"♻️ {target.name}: {len(done)} seed(s) already predicted, best {target.history[-1]:.3f}")
+        rnd = 0
+        while any(t.active for t in targets):
+            rnd += 1
+            active = [t for t in targets if t.active]
+            jobs = []
+            for target in active:
+                n = min(self.seeds_per_round, self.max_seeds - len(target.seeds))
+                start = max(target.seeds) + 1 if target.seeds else self.first_seed
+                seeds = list(range(start, start + n))
+                target.seeds.extend(seeds)
+                jobs.append(self._job(target, seeds))
+            print(f"🎲 Round {rnd}: {len(active)} target(s) still below {self.threshold} "
+                  f"({sum(len(t.seeds) for t in targets)} seeds used)", flush=True)
+
+            with tracing.get_tracer().span("predict_round", round=rnd, targets=len(active)):
+                results = run_jobs(jobs, self.log_dir)
+            for target, result in zip(active, results):
+                if not result.ok:
+                    print(f"❌ Protenix failed for {target.name}: {result.error or f'exit status {result.returncode}'}")
+                    print(tail(result.stderr_log), file=sys.stderr, flush=True)
+                    target.stop_reason = "failed"
+                    continue
+                self._update(target)
+                if not target.active:
+                    print(f"⏹️ {target.name}: stop ({target.stop_reason}) after {len(target.seeds)} seed(s), "
+                          f"best {self.metric} {target.history[-1]:.3f}", flush=True)
+        for target in targets:
+            self._write_log(target)
+        ShardedDir(self.out_dir, "pred").record([t.out_dir.name for t in targets if t.best])
+        return targets
+
+    def _write_log(self, target):
+        target.out_dir.mkdir(parents=True, exist_ok=True)
+        log = {
+            "input": str(target.src), "metric": self.metric, "threshold": self.threshold,
+            "seeds": target.seeds, "history": target.history, "stop_reason": target.stop_reason,
+            "best": target.best,
+        }
+        (target.out_dir / "seed_schedule.json").write_text(json.dumps(log, indent=2))
+
+
+def save_best(target, dst_pdb):
+    """Convert the best-scoring sample of *target* to PDB."""
+    import gemmi  # pip install gemmi
+
+    if not target.best:
+        raise RuntimeError(f"No confidence files produced for {target.name}")
+    gemmi.read_structure(target.best["cif"]).write_pdb(str(dst_pdb))
+    print(f"✓ {target.name}: seed {target.best['seed']} sample {target.best['sample']} → {dst_pdb}", flush=True)
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Run Protenix seeds adaptively until confidence plateaus.")
+    parser.add_argument("inputs", nargs="+", help="Protenix input JSON files")
+    parser.add_argument("--out-dir", default=PRED_DIR, help=f"Protenix output root (default: {PRED_DIR})")
+    parser.add_argument("--pdb-dir", default=".", help="Where <name>.pdb of the best sample is written")
+    parser.add_argument("--protenix", default=PROTENIX, help="Protenix executable")
+    parser.add_argument("--metric", default=METRIC, choices=["ranking_score", "ptm", "plddt"])
+    parser.add_argument("--threshold", type=float, default=THRESHOLD)
+    parser.add_argument("--min-gain", type=float, default=MIN_GAIN)
+    parser.add_argument("--patience", type=int, default=PATIENCE)
+    parser.add_argument("--seeds-per-round", type=int, default=SEEDS_PER_ROUND)
+    parser.add_argument("--max-seeds", type=int, default=MAX_SEEDS)
+    parser.add_argument("--first-seed", type=int, default=FIRST_SEED)
+    parser.add_argument("--offline", action="store_true", help="Do not pass --use_msa_server")
+    parser.add_argument("--trace", metavar="DIR", help="Record timing/resource trace files in DIR")
+    args = parser.parse_args()
+    if args.seeds_per_round < 1:
+        parser.error("--seeds-per-round must be at least 1")
+    if args.max_seeds < 1:
+        parser.error("--max-seeds must be at least 1")
+    if args.trace:
+        tracing.enable(args.trace)
+
+    scheduler = SeedScheduler(args.protenix, args.out_dir, first_seed=args.first_seed,
+                              seeds_per_round=args.seeds_per_round, max_seeds=args.max_seeds,
+                              threshold=args.threshold, min_gain=args.min_gain, patience=args.patience,
+                              metric=args.metric, extra_args=() if args.offline else ("--use_msa_server",))
+    targets = scheduler.run(args.inputs)
+
+    failed = 0
+    for target in targets:
+        try:
+            save_best(target, Path(args.pdb_dir) / f"{target.name}.pdb")
+        except RuntimeError as exc:
+            print(f"❌ {exc}", file=sys.stderr)
+            failed += 1
+    print(f"✅ {len(targets) - failed}/{len(targets)} targets, "
+          f"{sum(len(t.seeds) for t in targets)} seeds in total")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
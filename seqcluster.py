@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+seqcluster.py
+--------------------
+Sequence-identity redundancy reduction of the chains in input_pdbs/.
+
+PDB-derived libraries contain many near-identical chains (same protein,
+different ligand state).  This script reads every chain sequence once and
+clusters them at an identity threshold; only the cluster representatives are
+imported and compared by dali.py, and their Z-scores are propagated to the
+members in zscore_summary.csv.
+
+Methods:
+    mmseqs   local MMseqs2 (`mmseqs easy-cluster`), used automatically when
+             it is on $PATH
+    python   greedy incremental clustering (longest sequence first, as in
+             CD-HIT): a shared 3-mer prefilter, then a banded alignment (free
+             end gaps) around the dominant k-mer diagonal
+
+Identity is the number of identical aligned residues divided by the length
+of the shorter sequence; the shorter sequence must also be covered by at
+least --coverage of the alignment.
+
+Usage:
+    python seqcluster.py input_pdbs/ --identity 0.9 [--method python] [--out seq_clusters.tsv] [--store library.ppstore]
+"""
+
+import argparse
+import shutil
+import sys
+import tempfile
+from collections import Counter
+from pathlib import Path
+
+from asyncrunner import Job, run_job, tail
+
+IDENTITY = 0.9
+COVERAGE = 0.8
+KMER = 3
+BAND = 16           # residues either side of the k-mer diagonal
+MMSEQS = "mmseqs"
+
+
+# ── sequences ─────────────────────────────────────────────────────────────────
+def dali_chain_id(pdb_file, chain):
+    """DALI chain id as used by dali.py: 3wdl_B.pdb chain B → 3WDLB"""
+    stem = Path(pdb_file).stem.upper()
+    return f"{stem.split('_')[0]}{chain}"
+
+
+def _store_sequence(view):
+    """Sequence of a stored chain as gemmi gives it: modified residues (MSE, TPO) are X, ligands left out."""
+    import numpy as np
+    from structstore import THREE_TO_ONE
+
+    res = view.res_index - view._res_start
+    has = {atom: np.bincount(res[view.atom_names == atom], minlength=len(view)) > 0 for atom in (b"N", b"C")}
+    polymer = (view.ca_index >= 0) & (~view.hetero | (has[b"N"] & has[b"C"]))
+    return "".join("X" if het else THREE_TO_ONE.get(name.decode(), "X")
+                   for name, het in zip(view.res_names[polymer], view.hetero[polymer]))
+
+
+def chain_sequences(pdb_files, store=None):
+    """{dali chain id: one-letter sequence} for the protein chains of *pdb_files*.
+
+    With a StructStore (structstore.py), files it holds unchanged are read from it instead of parsed.
+    """
+    sequences = {}
+    for pdb_file in pdb_files:
+        chains = store.source_chains(pdb_file) if store is not None else None
+        if chains:
+            for view in chains:
+                seq = _store_sequence(view)
+                if seq:
+                    sequences[dali_chain_id(pdb_file, view.chain)] = seq
+            continue
+        import gemmi  # pip install gemmi; not needed when the store has every file
+
+        st = gemmi.read_structure(str(pdb_file))
+        st.setup_entities()
+        for chain in st[0]:
+            polymer = chain.get_polymer()
+            if polymer.check_polymer_type() not in (gemmi.PolymerType.PeptideL, gemmi.PolymerType.PeptideD):
+                continue
+            seq = gemmi.one_letter_code([res.name for res in polymer]).upper()
+            if seq:
+                sequences[dali_chain_id(pdb_file, chain.name)] = seq
+    return sequences
+
+
+# ── in-Python clustering ──────────────────────────────────────────────────────
+def _kmers(seq, k=KMER):
+    return Counter(seq[i:i + k] for i in range(len(seq) - k + 1))
+
+
+def _diagonal(a, b, k=KMER):
+    """Most common offset (j - i) between shared k-mers of a and b."""
+    positions = {}
+    for j in range(len(b) - k + 1):
+        positions.setdefault(b[j:j + k], []).append(j)
+    offsets = Counter(j - i for i in range(len(a) - k + 1) for j in positions.get(a[i:i + k], ()))
+    return offsets.most_common(1)[0][0] if offsets else 0
+
+
+def banded_identity(a, b, band=BAND, offset=None):
+    """(identical residues, aligned pairs) of a banded alignment with free end gaps."""
+    if offset is None:
+        offset = _diagonal(a, b)
+    n, m = len(a), len(b)
+    gap = -0.5
+    best_end = (0.0, 0, 0)
+    # (score, matches, aligned pairs) of the best path into each cell of the band
+    prev = {j: (0.0, 0, 0) for j in range(0, max(0, min(m, offset + band)) + 1)}
+    for i in range(1, n + 1):
+        cur = {}
+        for j in range(max(0, i + offset - band), min(m, i + offset + band) + 1):
+            if j == 0:
+                cur[j] = (0.0, 0, 0)            # leading overhang of a is free
+                continue
+            cell = None
+            d = prev.get(j - 1)
+            if d is not None:
+                hit = a[i - 1] == b[j - 1]
+                cell = (d[0] + hit, d[1] + hit, d[2] + 1)
+            for nb in (cur.get(j - 1), prev.get(j)):
+                if nb is not None and (cell is None or nb[0] + gap > cell[0]):
+                    cell = (nb[0] + gap, nb[1], nb[2])
+            cur[j] = cell
+        prev = cur
+        if m in cur and cur[m][0] > best_end[0]:
+            best_end = cur[m]                   # trailing overhang of a is free
+    for cell in prev.values():                  # trailing overhang of b is free
+        if cell[0] > best_end[0]:
+            best_end = cell
+    return best_end[1], best_end[2]
+
+
+def cluster_python(sequences, identity=IDENTITY, coverage=COVERAGE):
+    """{member: representative} by greedy incremental clustering."""
+    order = sorted(sequences, key=lambda c: (-len(sequences[c]), c))
+    reps = []                       # (chain id, sequence, k-mer counts)
+    assignment = {}
+    for cid in order:
+        seq = sequences[cid]
+        kmers = _kmers(seq)
+        assigned = None
+        for rep, rep_seq, rep_kmers in reps:
+            shorter = min(len(seq), len(rep_seq))
+            if shorter < coverage * max(len(seq), len(rep_seq)):
+                continue
+            # k-mer prefilter: sequences at identity p share roughly p**k of their k-mers
+            shared = sum((kmers & rep_kmers).values())
+            if shared < (identity ** KMER) * (shorter - KMER + 1) * 0.8:
+                continue
+            matches, aligned = banded_identity(rep_seq, seq)
+            if aligned >= coverage * shorter and matches >= identity * shorter:
+                assigned = rep
+                break
+        if assigned is None:
+            reps.append((cid, seq, kmers))
+            assigned = cid
+        assignment[cid] = assigned
+    return assignment
+
+
+# ── MMseqs2 ───────────────────────────────────────────────────────────────────
+def cluster_mmseqs(sequences, identity=IDENTITY, coverage=COVERAGE, mmseqs=MMSEQS, log_dir="logs"):
+    """{member: representative} from `mmseqs easy-cluster`."""
+    with tempfile.TemporaryDirectory(prefix="seqcluster_") as tmp:
+        tmp = Path(tmp)
+        fasta = tmp / "chains.fasta"
+        fasta.write_text("".join(f">{cid}\n{seq}\n" for cid, seq in sequences.items()))
+        cmd = [mmseqs, "easy-cluster", fasta, tmp / "out", tmp / "work",
+               "--min-seq-id", identity, "-c", coverage, "--cov-mode", 0]
+        result = run_job(Job("mmseqs_cluster", cmd, tool="mmseqs"), log_dir)
+        if not result.ok:
+            raise RuntimeError(f"mmseqs failed ({result.error or result.returncode}):\n{tail(result.stderr_log)}")
+        assignment = {}
+        for line in (tmp / "out_cluster.tsv").read_text().splitlines():
+            rep, member = line.split("\t")[:2]
+            assignment[member] = rep
+    return assignment
+
+
+def cluster_sequences(sequences, identity=IDENTITY, coverage=COVERAGE, method="auto", log_dir="logs"):
+    if method == "mmseqs" or (method == "auto" and shutil.which(MMSEQS)):
+        return cluster_mmseqs(sequences, identity, coverage, log_dir=log_dir)
+    return cluster_python(sequences, identity, coverage)
+
+
+def write_clusters(assignment, out_tsv):
+    with Path(out_tsv).open("w") as fh:
+        fh.write("representative\tmember\n")
+        for member, rep in sorted(assignment.items(), key=lambda kv: (kv[1], kv[0] != kv[1], kv[0])):
+            fh.write(f"{rep}\t{member}\n")
+
+
+def read_clusters(tsv):
+    assignment = {}
+    for line in Path(tsv).read_text().splitlines()[1:]:
+        rep, member = line.split("\t")
+        assignment[member] = rep
+    return assignment
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Cluster input_pdbs chains by sequence identity.")
+    parser.add_argument("pdb_dir", nargs="?", default="input_pdbs")
+    parser.add_argument("--identity", type=float, default=IDENTITY, help=f"Identity threshold (default: {IDENTITY})")
+    parser.add_argument("--coverage", type=float, default=COVERAGE, help=f"Minimum coverage (default: {COVERAGE})")
+    parser.add_argument("--method", default="auto", choices=["auto", "mmseqs", "python"])
+    parser.add_argument("--out", default="seq_clusters.tsv")
+    parser.add_argument("--store", metavar="PPSTORE",
+                        help="Read the chains through this structure store (structstore.py build) instead of parsing")
+    args = parser.parse_args()
+
+    pdb_files = sorted(Path(args.pdb_dir).glob("*.pdb"))
+    if not pdb_files:
+        print(f"❌ No PDB files in {args.pdb_dir}")
+        sys.exit(1)
+    store = None
+    if args.store and Path(args.store).exists():
+        from structstore import StructStore
+        store = StructStore(args.store)
+    sequences = chain_sequences(pdb_files, store)
+    assignment = cluster_sequences(sequences, args.identity, args.coverage, args.method)
+    write_clusters(assignment, args.out)
+    n_reps = len(set(assignment.values()))
+    print(f"✅ {len(assignment)} chains → {n_reps} clusters at {args.identity:.0%} identity, saved to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
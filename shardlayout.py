@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+"""
+shardlayout.py
+--------------------
+Hash-sharded artifact directories with a SQLite manifest.
+
+dali_outputs/, imported_DAT/input/ and predicted_structures/ used to be flat
+directories that every run listed with glob(); with 100k+ entries on a
+network filesystem the listing alone takes minutes.  A sharded directory
+keeps each artifact two hash levels down
+
+    dali_outputs/3f/a0/3WDLB_vs_refxA.txt
+    imported_DAT/input/3f/a0/3WDLB.dat          (all chains of 3WDL together)
+    predicted_structures/41/7d/tmp_7.6.2.14/
+
+and records it in <dir>/.manifest.sqlite (name, shard key, group, status,
+size, mtime), so stages ask the manifest instead of listing directories.
+The layout is described by <dir>/.layout.json; a directory without one is
+flat and behaves exactly as before, so every tool works on both.
+
+Artifact kinds (the shard key keeps the files of one structure together):
+    dat    <BASE><CHAIN>.dat          key BASE, no group
+    dali   <QUERY>_vs_<REF>.txt       key QUERY minus its chain letter, group REF
+    pred   tmp_<name>/, <name>.ppred.npz   key name, no group
+
+The manifest uses SQLite's default rollback journal, like workqueue.py, so it
+can live on NFS (POSIX locks required).
+
+Usage:
+    python shardlayout.py migrate work/T1/dali_outputs --kind dali [--dry-run]
+    python shardlayout.py init work/T1/imported_DAT/input --kind dat
+    python shardlayout.py ls work/T1/dali_outputs [--group refxA] [--status failed]
+    python shardlayout.py resolve work/T1/dali_outputs 3WDLB_vs_refxA.txt
+    python shardlayout.py status work/T1/dali_outputs
+    python shardlayout.py reindex work/T1/dali_outputs    # rebuild the manifest, re-placing misplaced entries
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+LAYOUT_FILE = ".layout.json"
+MANIFEST_FILE = ".manifest.sqlite"
+LEVELS = 2              # 2 levels × 2 hex digits: 65536 leaf directories
+WIDTH = 2
+BUSY_TIMEOUT = 60.0     # SQLite lock wait; shared filesystems can be slow
+BATCH = 1000            # manifest rows per transaction during migration
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS artifacts (
+    name     TEXT PRIMARY KEY,
+    shard    TEXT NOT NULL,
+    grp      TEXT NOT NULL DEFAULT '',
+    status   TEXT NOT NULL,                 -- ok | failed | empty | moving (during migrate)
+    size     INTEGER,
+    mtime    REAL,
+    meta     TEXT,
+    updated  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_group ON artifacts (grp, status);
+CREATE INDEX IF NOT EXISTS artifacts_status ON artifacts (status);
+"""
+
+
+# ── artifact kinds ────────────────────────────────────────────────────────────
+def _dat_key(name):
+    stem = name[:-len(".dat")] if name.endswith(".dat") else name
+    return stem[:-1] or stem, ""
+
+
+def _dali_key(name):
+    stem = name[:-len(".txt")] if name.endswith(".txt") else name
+    query, _, ref = stem.partition("_vs_")
+    return query[:-1] or query, ref
+
+
+PRED_SUFFIXES = (".ppred.npz",)     # packed targets (predarchive.py) share the shard of tmp_<name>/
+
+
+def _pred_key(name):
+    # Target names are often EC numbers (tmp_7.6.2.14): only a known suffix is stripped, never at the first dot
+    key = name.removeprefix("tmp_")
+    for suffix in PRED_SUFFIXES:
+        key = key.removesuffix(suffix)
+    return key, ""
+
+
+KINDS = {
+    # kind: (name → (shard key, group), does a top-level entry belong to the kind?)
+    "dat": (_dat_key, lambda e: e.is_file() and e.name.endswith(".dat")),
+    "dali": (_dali_key, lambda e: e.is_file() and e.name.endswith(".txt") and "_vs_" in e.name),
+    "pred": (_pred_key, lambda e: (e.is_dir() and e.name.startswith("tmp_")) or e.name.endswith(".ppred.npz")),
+}
+FLAT_PATTERNS = {"dat": "*.dat", "dali": "*_vs_*.txt", "pred": "tmp_*"}
+
+
+def shard_of(key, levels=LEVELS, width=WIDTH):
+    """Relative shard directory of *key*, e.g. '3f/a0' (stable across processes and hosts)."""
+    digest = hashlib.md5(key.encode()).hexdigest()
+    return "/".join(digest[i * width:(i + 1) * width] for i in range(levels))
+
+
+# ── sharded directory ─────────────────────────────────────────────────────────
+class ShardedDir:
+    """Path resolution and artifact manifest of one directory; a flat directory passes through to glob()."""
+
+    def __init__(self, root, kind=None):
+        self.root = Path(root)
+        layout_file = self.root / LAYOUT_FILE
+        self.layout = json.loads(layout_file.read_text()) if layout_file.exists() else None
+        self.kind = self.layout["kind"] if self.layout else kind
+        if self.kind is not None and self.kind not in KINDS:
+            raise ValueError(f"unknown artifact kind {self.kind!r} for {self.root} (one of {', '.join(KINDS)})")
+        self.manifest = self.root / MANIFEST_FILE
+        self._schema_ready = False
+
+    @property
+    def sharded(self):
+        return self.layout is not None
+
+    @classmethod
+    def create(cls, root, kind, levels=LEVELS, width=WIDTH):
+        """Turn a new or empty directory into a sharded one (a flat one with artifacts needs `migrate`)."""
+        root = Path(root)
+        if (root / LAYOUT_FILE).exists():
+            return cls(root)
+        root.mkdir(parents=True, exist_ok=True)
+        match = KINDS[kind][1]
+        with os.scandir(root) as entries:
+            if any(match(e) for e in entries):
+                raise ValueError(f"{root} already holds flat {kind} artifacts; run `shardlayout.py migrate` first")
+        layout = {"kind": kind, "levels": levels, "width": width, "created": time.time()}
+        (root / LAYOUT_FILE).write_text(json.dumps(layout, indent=2))
+        return cls(root)
+
+    # ── paths ─────────────────────────────────────────────────────────────────
+    def key(self, name):
+        return KINDS[self.kind][0](name)[0]
+
+    def shard_dir(self, key, create=False):
+        """Directory that holds the artifacts with shard *key*; *create* it before writing there."""
+        if not self.sharded:
+            return self.root
+        directory = self.root / shard_of(key, self.layout["levels"], self.layout["width"])
+        if create:
+            directory.mkdir(parents=True, exist_ok=True)
+        return directory
+
+    def path(self, name, create=False):
+        """Where artifact *name* lives (or is to be written, with *create*)."""
+        if not self.sharded:
+            return self.root / name
+        return self.shard_dir(self.key(name), create) / name
+
+    # ── manifest ──────────────────────────────────────────────────────────────
+    @contextmanager
+    def _tx(self, write=True):
+        # A fresh connection per transaction, as in workqueue.py: workers on other nodes share the file
+        db = sqlite3.connect(self.manifest, timeout=BUSY_TIMEOUT, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            if not self._schema_ready:
+                db.executescript(SCHEMA)
+                self._schema_ready = True
+            db.execute("BEGIN IMMEDIATE" if write else "BEGIN")
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def _row(self, name, status, meta):
+        path = self.path(name)
+        try:
+            st = path.stat()
+            size, mtime = (st.st_size if path.is_file() else None), st.st_mtime
+        except OSError:
+            size = mtime = None
+        if status is None:
+            status = "ok" if size != 0 and mtime is not None else ("empty" if size == 0 else "failed")
+        key, grp = KINDS[self.kind][0](name)
+        return (name, key, grp, status, size, mtime, json.dumps(meta) if meta else None, time.time())
+
+    def record(self, names, status=None, meta=None):
+        """Record artifacts (a name or a list); status defaults to ok / empty / failed from the file."""
+        if not self.sharded:
+            return
+        names = [names] if isinstance(names, str) else list(names)
+        rows = [self._row(name, status, meta) for name in names]
+        with self._tx() as db:
+            db.executemany("INSERT OR REPLACE INTO artifacts (name, shard, grp, status, size, mtime, meta, updated) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def forget(self, names):
+        if not self.sharded:
+            return
+        names = [names] if isinstance(names, str) else list(names)
+        with self._tx() as db:
+            db.executemany("DELETE FROM artifacts WHERE name = ?", [(n,) for n in names])
+
+    def names(self, group=None, status="ok", prefix=None):
+        """Artifact names, from the manifest; a flat directory is listed with glob() instead (no status)."""
+        if not self.sharded:
+            if self.kind is None:
+                raise ValueError(f"{self.root} is flat; its artifact kind is needed to list it")
+            if not self.root.is_dir():
+                return []
+            pattern = f"{prefix or ''}{FLAT_PATTERNS[self.kind]}"
+            return sorted(p.name for p in self.root.glob(pattern)
+                          if group is None or KINDS[self.kind][0](p.name)[1] == group)
+        sql, params = "SELECT name FROM artifacts WHERE 1", []
+        if group is not None:
+            sql, params = sql + " AND grp = ?", params + [group]
+        if status is not None:
+            sql, params = sql + " AND status = ?", params + [status]
+        if prefix is not None:
+            # Range scan on the primary key instead of LIKE (names hold '_', a LIKE wildcard)
+            sql, params = sql + " AND name >= ? AND name < ?", params + [prefix, prefix + "\U0010ffff"]
+        with self._tx(write=False) as db:
+            return [row["name"] for row in db.execute(sql + " ORDER BY name", params)]
+
+    def paths(self, group=None, status="ok", prefix=None):
+        return [self.path(name) for name in self.names(group, status, prefix)]
+
+    def counts(self):
+        """{(group, status): n}"""
+        if not self.sharded:
+            return {("", "ok"): len(self.names())}
+        with self._tx(write=False) as db:
+            return {(r["grp"], r["status"]): r["n"] for r in
+                    db.execute("SELECT grp, status, COUNT(*) AS n FROM artifacts GROUP BY grp, status")}
+
+    # ── maintenance ───────────────────────────────────────────────────────────
+    def reindex(self):
+        """Rebuild the manifest from the shard directories, moving misplaced entries; returns (recorded, dropped)."""
+        if not self.sharded:
+            raise ValueError(f"{self.root} is not sharded")
+        match = KINDS[self.kind][1]
+        levels = self.layout["levels"]
+        found = []
+
+        def walk(directory, depth):
+            with os.scandir(directory) as entries:
+                for e in entries:
+                    if depth < levels:
+                        if e.is_dir() and len(e.name) == self.layout["width"]:
+                            walk(e.path, depth + 1)
+                    elif match(e):
+                        found.append(e)
+
+        walk(self.root, 0)
+        # An entry outside the shard of its key (sharded before a key change) is moved where path() looks
+        for e in found:
+            dest = self.path(e.name)
+            if Path(e.path) != dest and not dest.exists():
+                self.path(e.name, create=True)
+                os.replace(e.path, dest)
+        found = [e.name for e in found]
+        present = set(found)
+        stale = [n for n in self.names(status=None) if n not in present]
+        self.forget(stale)
+        for i in range(0, len(found), BATCH):
+            self.record(found[i:i + BATCH])
+        return len(found), len(stale)
+
+
+def migrate(root, kind, levels=LEVELS, width=WIDTH, dry_run=False):
+    """Move the artifacts of a flat directory into shards and record them; resumable after an interruption."""
+    root = Path(root)
+    match = KINDS[kind][1]
+    with os.scandir(root) as entries:
+        todo = [e.name for e in entries if match(e)]
+    if dry_run:
+        return len(todo)
+    if not (root / LAYOUT_FILE).exists():
+        layout = {"kind": kind, "levels": levels, "width": width, "created": time.time()}
+        (root / LAYOUT_FILE).write_text(json.dumps(layout, indent=2))
+    store = ShardedDir(root)
+    # Rows are entered as 'moving' before the renames, so an interrupted run leaves no shard file
+    # the manifest does not know; finish the rows of such a run first
+    pending = store.names(status="moving")
+    if pending:
+        flat = set(todo)
+        store.record([n for n in pending if n not in flat and store.path(n).exists()])
+        store.forget([n for n in pending if n not in flat and not store.path(n).exists()])
+        print(f"♻️ Resuming an interrupted migration ({len(pending)} name(s) in flight)", flush=True)
+    for i in range(0, len(todo), BATCH):
+        batch = todo[i:i + BATCH]
+        for name in batch:
+            dest = store.path(name)
+            if dest.exists():
+                raise FileExistsError(f"{dest} exists; both it and {root / name} hold {name}")
+        store.record(batch, status="moving")
+        for name in batch:
+            os.replace(root / name, store.path(name, create=True))     # same filesystem: a rename, no copy
+        store.record(batch)
+        print(f"📦 {min(i + BATCH, len(todo))}/{len(todo)} moved", flush=True)
+    return len(todo)
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Hash-sharded artifact directories with a SQLite manifest.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_mig = sub.add_parser("migrate", help="Move a flat directory's artifacts into shards")
+    p_init = sub.add_parser("init", help="Make a new or empty directory sharded")
+    for p in (p_mig, p_init):
+        p.add_argument("dir")
+        p.add_argument("--kind", choices=sorted(KINDS), required=True)
+        p.add_argument("--levels", type=int, default=LEVELS, help=f"Hash levels (default: {LEVELS})")
+        p.add_argument("--width", type=int, default=WIDTH, help=f"Hex digits per level (default: {WIDTH})")
+    p_mig.add_argument("--dry-run", action="store_true", help="Only count what would move")
+
+    p_ls = sub.add_parser("ls", help="List artifacts from the manifest")
+    p_ls.add_argument("dir")
+    p_ls.add_argument("--group", help="e.g. the reference chain of DALI outputs")
+    p_ls.add_argument("--status", default="ok", help="ok | failed | empty | all (default: ok)")
+    p_ls.add_argument("--paths", action="store_true", help="Print paths instead of names")
+
+    p_res = sub.add_parser("resolve", help="Print the path of an artifact")
+    p_res.add_argument("dir")
+    p_res.add_argument("names", nargs="+")
+
+    p_stat = sub.add_parser("status", help="Artifact counts per group and status")
+    p_stat.add_argument("dir")
+    p_re = sub.add_parser("reindex", help="Rebuild the manifest from the shards")
+    p_re.add_argument("dir")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "migrate":
+            n = migrate(args.dir, args.kind, args.levels, args.width, args.dry_run)
+            print(f"{'🔍 Would move' if args.dry_run else '✅ Moved'} {n} {args.kind} artifact(s) in {args.dir}")
+        elif args.command == "init":
+            store = ShardedDir.create(args.dir, args.kind, args.levels, args.width)
+            print(f"✅ {store.root} is sharded ({store.kind}, {store.layout['levels']}×{store.layout['width']})")
+        elif args.command == "ls":
+            store = ShardedDir(args.dir)
+            status = None if args.status == "all" else args.status
+            for name in store.names(args.group, status):
+                print(store.path(name) if args.paths else name)
+        elif args.command == "resolve":
+            store = ShardedDir(args.dir)
+            for name in args.names:
+                print(store.path(name))
+        elif args.command == "status":
+            store = ShardedDir(args.dir)
+            print(f"{store.root}: {'sharded' if store.sharded else 'flat'} ({store.kind})")
+            for (grp, status), n in sorted(store.counts().items()):
+                print(f"  {grp or '-':<20s} {status:<8s} {n:8d}")
+        elif args.command == "reindex":
+            recorded, dropped = ShardedDir(args.dir).reindex()
+            print(f"✅ Recorded {recorded} artifact(s), dropped {dropped} missing one(s)")
+    except (ValueError, FileExistsError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
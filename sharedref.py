@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+"""
+sharedref.py
+--------------------
+Publish a reference structure's derived arrays once for all comparison workers.
+
+Every parallel comparison against the same reference needs its CA
+coordinates and the full intra-chain distance matrix.  Instead of each worker
+process loading and deriving them again (N workers × n² floats), the
+arrays are built once and published through
+
+    shm      one multiprocessing.shared_memory block (reference_pool()
+             workers started by the publishing process)
+    memmap   .npy files read with np.load(mmap_mode="r") (independent
+             processes, e.g. workqueue.py workers, also on other nodes of a
+             shared filesystem; the page cache is shared per node)
+
+Workers receive only a small picklable handle and attach zero-copy, read-only.
+For a 1500-residue reference the distance matrix is 9 MB; with 64 workers
+that is 9 MB in total instead of 576 MB.
+
+    with SharedReference.from_pdb("input_pdbs/refx.pdb", "A") as ref:
+        with reference_pool(ref.handle, workers=64) as pool:
+            pool.map(score_chain, chains)     # score_chain() calls get_reference()
+
+Usage:
+    python sharedref.py input_pdbs/refx.pdb --chain A [--backend memmap --dir dali_work/shared]
+"""
+
+import argparse
+import os
+import sys
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+
+ALIGN = 64              # byte alignment of the arrays inside one shared block
+
+_attached = {}          # handle id → (arrays, keep-alive objects) of this process
+_reference = None       # arrays attached by the pool initializer
+
+
+# ── deriving the arrays ───────────────────────────────────────────────────────
+def distance_matrix(ca):
+    """(n, n) float32 CA–CA distances."""
+    ca = np.asarray(ca, dtype=np.float32)
+    diff = ca[:, None, :] - ca[None, :, :]
+    return np.sqrt(np.einsum("ijk,ijk->ij", diff, diff))
+
+
+def read_chain_ca(pdb_file, chain=None):
+    """(sequence, (n, 3) CA coordinates) of one protein chain (default: the first) of a PDB/mmCIF file."""
+    import gemmi  # pip install gemmi
+
+    st = gemmi.read_structure(str(pdb_file))
+    st.setup_entities()
+    for ch in st[0]:
+        if chain is not None and ch.name != chain:
+            continue
+        residues = [res for res in ch.get_polymer() if res.find_atom("CA", "*")]
+        if not residues:
+            continue
+        ca = np.array([res.find_atom("CA", "*").pos.tolist() for res in residues], dtype=np.float32)
+        return gemmi.one_letter_code([res.name for res in residues]).upper(), ca
+    raise ValueError(f"no protein chain {chain or ''} with CA atoms in {pdb_file}")
+
+
+def reference_arrays(ca):
+    return {"ca": np.asarray(ca, dtype=np.float32), "dist": distance_matrix(ca)}
+
+
+# ── publishing / attaching ────────────────────────────────────────────────────
+def _layout(arrays):
+    fields, offset = [], 0
+    for key, arr in arrays.items():
+        offset = -(-offset // ALIGN) * ALIGN
+        fields.append((key, arr.dtype.str, arr.shape, offset))
+        offset += arr.nbytes
+    return fields, max(offset, 1)
+
+
+def attach(handle):
+    """{name: read-only array} for a published *handle*; cached per process."""
+    if handle["id"] in _attached:
+        return _attached[handle["id"]][0]
+    arrays = {}
+    if handle["backend"] == "shm":
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=handle["name"], track=False)
+        else:
+            # Pool workers share the publisher's resource tracker, so registering the
+            # block again is harmless; independent processes should use memmap
+            shm = shared_memory.SharedMemory(name=handle["name"])
+        for key, dtype, shape, offset in handle["fields"]:
+            arr = np.ndarray(shape, dtype=dtype, buffer=shm.buf, offset=offset)
+            arr.flags.writeable = False
+            arrays[key] = arr
+        keep = shm
+    else:
+        for key, *_ in handle["fields"]:
+            arrays[key] = np.load(Path(handle["dir"]) / f"{handle['id']}.{key}.npy", mmap_mode="r")
+        keep = None
+    _attached[handle["id"]] = (arrays, keep)
+    return arrays
+
+
+class SharedReference:
+    """Owner of published reference arrays; release() (or leaving the with-block) frees them."""
+
+    def __init__(self, arrays, backend="shm", directory=None, meta=None):
+        self.id = uuid.uuid4().hex[:12]
+        fields, size = _layout(arrays)
+        self.handle = {"id": self.id, "backend": backend, "fields": fields, **(meta or {})}
+        self._shm = None
+        if backend == "shm":
+            self._shm = shared_memory.SharedMemory(create=True, size=size, name=f"ref_{self.id}")
+            for key, dtype, shape, offset in fields:
+                np.ndarray(shape, dtype=dtype, buffer=self._shm.buf, offset=offset)[...] = arrays[key]
+            self.handle["name"] = self._shm.name
+        elif backend == "memmap":
+            directory = Path(directory or ".")
+            directory.mkdir(parents=True, exist_ok=True)
+            for key, arr in arrays.items():
+                tmp = directory / f"{self.id}.{key}.tmp.npy"
+                np.save(tmp, arr)
+                os.replace(tmp, directory / f"{self.id}.{key}.npy")
+            self.handle["dir"] = str(directory.resolve())
+        else:
+            raise ValueError(f"unknown backend {backend!r} (shm or memmap)")
+
+    @classmethod
+    def from_ca(cls, ca, backend="shm", directory=None, **meta):
+        return cls(reference_arrays(ca), backend, directory, meta)
+
+    @classmethod
+    def from_pdb(cls, pdb_file, chain=None, backend="shm", directory=None):
+        sequence, ca = read_chain_ca(pdb_file, chain)
+        return cls.from_ca(ca, backend, directory, source=str(pdb_file), chain=chain, sequence=sequence)
+
+    @property
+    def nbytes(self):
+        return sum(int(np.prod(shape)) * np.dtype(dtype).itemsize for _, dtype, shape, _ in self.handle["fields"])
+
+    def arrays(self):
+        return attach(self.handle)
+
+    def release(self):
+        _attached.pop(self.id, None)
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+        elif self.handle["backend"] == "memmap":
+            for key, *_ in self.handle["fields"]:
+                (Path(self.handle["dir"]) / f"{self.id}.{key}.npy").unlink(missing_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+# ── worker pools ──────────────────────────────────────────────────────────────
+def _init_worker(handle):
+    global _reference
+    _reference = attach(handle)
+
+
+def get_reference():
+    """Reference arrays inside a reference_pool() worker."""
+    if _reference is None:
+        raise RuntimeError("not running in a reference_pool() worker")
+    return _reference
+
+
+def reference_pool(handle, workers=None):
+    """ProcessPoolExecutor whose workers attach *handle* once at start-up."""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(handle,))
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def _worker_probe(_):
+    ref = get_reference()
+    return os.getpid(), ref["dist"].shape[0], float(ref["dist"].max())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish a reference distance matrix and attach it from workers.")
+    parser.add_argument("pdb_file")
+    parser.add_argument("--chain", help="Reference chain (default: first protein chain)")
+    parser.add_argument("--backend", default="shm", choices=["shm", "memmap"])
+    parser.add_argument("--dir", default="dali_work/shared", help="Directory for the memmap backend")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    try:
+        ref = SharedReference.from_pdb(args.pdb_file, args.chain, args.backend, args.dir)
+    except (OSError, ValueError) as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    with ref:
+        n = ref.arrays()["ca"].shape[0]
+        print(f"📌 {args.pdb_file}: {n} residues, {ref.nbytes / 1e6:.1f} MB published via {args.backend}")
+        with reference_pool(ref.handle, args.workers) as pool:
+            seen = set(pool.map(_worker_probe, range(args.workers * 4)))
+        print(f"✅ {len({pid for pid, *_ in seen})} worker(s) attached zero-copy "
+              f"(would be {ref.nbytes * args.workers / 1e6:.1f} MB as private copies)")
+
+
+if __name__ == "__main__":
+    main()
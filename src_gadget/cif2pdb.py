@@ -4,17 +4,27 @@ Convert mmCIF files from input_cifs to chain-specific PDB files in input_pdbs
 """
 
 from pathlib import Path
-from Bio.PDB import MMCIFParser, PDBIO, Select
 import os
 
-class ChainSelect(Select):
+class ChainSelect:
+    """Bio.PDB.Select-compatible filter; Biopython itself is only imported on conversion"""
     def __init__(self, chain_id):
         self.chain_id = chain_id
 
+    def accept_model(self, model):
+        return 1
+
     def accept_chain(self, chain):
         return chain.id == self.chain_id
 
+    def accept_residue(self, residue):
+        return 1
+
+    def accept_atom(self, atom):
+        return 1
+
 def convert_cif_to_pdb(cif_path, pdb_path, chain_id):
+    from Bio.PDB import MMCIFParser, PDBIO
     parser = MMCIFParser(QUIET=True)
     structure = parser.get_structure(cif_path.stem, cif_path)
     
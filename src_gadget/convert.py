@@ -4,12 +4,19 @@ convert.py
 ———————————————
 • Run after Protenix prediction is completed
 • Converts predicted_structures/**.cif → reference.pdb
+• --store library.ppstore reads the structure from a structstore.py store
+  when it holds the current file, instead of parsing the mmCIF
 """
 
+import argparse
 import glob
 import sys
 from pathlib import Path
-import gemmi  # pip install gemmi
+
+# tracing, plddttrim and predarchive live in the repository root; running in place from src_gadget/ needs it on the path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import tracing
 
 # === Parameters: modify as needed ===
 PRED_DIR = "predicted_structures/tmp_target"  # Output directory from Protenix
@@ -24,20 +31,55 @@ def pick_cif(cif_list):
     return cif_list[0] if cif_list else None
 
 def main():
+    parser = argparse.ArgumentParser(description="Convert the Protenix mmCIF output to PDB.")
+    parser.add_argument("--trim-plddt", type=float, metavar="THRESH",
+                        help="Remove low-pLDDT termini/loops after conversion (see plddttrim.py)")
+    parser.add_argument("--store", metavar="PPSTORE",
+                        help="Read through this structure store (structstore.py build) instead of parsing")
+    args = parser.parse_args()
+
     # Recursively find all .cif files under the prediction directory
     cif_files = glob.glob(str(Path(PRED_DIR) / "**" / "*.cif"), recursive=True)
     if not cif_files:
-        print(f"[ERROR] No .cif files found under {PRED_DIR}/ and its subdirectories", file=sys.stderr)
-        sys.exit(1)
+        # Packed outputs (predarchive.py) are read directly, without unpacking
+        from predarchive import find_archives, open_structure
+        archives = find_archives(PRED_DIR)
+        if not archives:
+            print(f"[ERROR] No .cif files or archives found under {PRED_DIR}/ and its subdirectories", file=sys.stderr)
+            sys.exit(1)
+        cif_files = [str(a) for a in archives]
+        read = open_structure
+    else:
+        def read(path):
+            import gemmi  # pip install gemmi; not needed when the store has the file
+            return gemmi.read_structure(path)
 
     # Select a cif file to convert
     cif_path = pick_cif(sorted(cif_files))
     print(f"✔ Selected mmCIF file: {cif_path}")
 
     # Convert mmCIF to PDB
-    st = gemmi.read_structure(cif_path)
-    st.write_pdb(OUTPUT_PDB)
-    print(f"✓ Successfully wrote {OUTPUT_PDB}")
+    with tracing.get_tracer().span("convert", target=Path(cif_path).stem) as info:
+        chains = None
+        if args.store and Path(args.store).exists():
+            from structstore import StructStore, write_pdb
+            chains = StructStore(args.store).source_chains(cif_path)
+        if chains:
+            write_pdb(chains, OUTPUT_PDB)
+            info["source"] = "store"
+        else:
+            if args.store:
+                print(f"⚠️ {cif_path} is not in {args.store} or has changed since; parsing it")
+            st = read(cif_path)
+            st.write_pdb(OUTPUT_PDB)
+    print(f"✓ Successfully wrote {OUTPUT_PDB}{' from ' + args.store if chains else ''}")
+
+    if args.trim_plddt is not None:
+        from plddttrim import mapping_path, trim_structure
+        mapping = trim_structure(OUTPUT_PDB, OUTPUT_PDB, threshold=args.trim_plddt)
+        for name, info in mapping["chains"].items():
+            print(f"✂️ Chain {name}: kept {info['n_kept']}/{info['n_input']} residues (pLDDT >= {args.trim_plddt})")
+        print(f"✓ Residue mapping written to {mapping_path(OUTPUT_PDB)}")
 
 if __name__ == "__main__":
     main()
@@ -2,12 +2,13 @@
 """
 fasta2json.py – Convert a FASTA file to the JSON schema required by Protenix.
 
-The script supports one or many FASTA records.  Only the first sequence is
-written to the "sequence" field (to match the example file you provided);
-the total number of records is stored in "count".
+The script supports one or many FASTA records.  Every record becomes its own
+protein chain entity with "count" 1 (a FASTA of two different chains is a
+heterodimer, not two copies of the first one).  The job "name" is the first
+word of the first header unless --name is given.
 
 Usage:
-    python fasta2json.py <input.fasta> [--out output.json]
+    python fasta2json.py <input.fasta> [--out output.json] [--name target]
 """
 
 import argparse
@@ -38,11 +39,9 @@ def parse_fasta(path: pathlib.Path):
     return records
 
 
-def build_json(records):
-    """Create a Protenix-style JSON object."""
-    header, seq = records[0]           # use the first record as the sequence
-    count = len(records)               # total number of FASTA records
-    name = (header.split() or ["target"])[0]
+def build_json(records, name=None):
+    """Create a Protenix-style JSON object: one protein entity (count 1) per FASTA record."""
+    name = name or (records[0][0].split() or ["target"])[0]
 
     return [
         {
@@ -50,9 +49,10 @@ def build_json(records):
                 {
                     "proteinChain": {
                         "sequence": seq,
-                        "count": count
+                        "count": 1
                     }
                 }
+                for _, seq in records
             ],
             "name": name
         }
@@ -63,6 +63,7 @@ def main():
     parser = argparse.ArgumentParser(description="Convert FASTA to Protenix JSON.")
     parser.add_argument("fasta", help="input FASTA file")
     parser.add_argument("--out", help="output JSON file (default: <input>.json)")
+    parser.add_argument("--name", help="Protenix job name (default: first word of the first header)")
     args = parser.parse_args()
 
     in_path = pathlib.Path(args.fasta)
@@ -71,11 +72,11 @@ def main():
 
     out_path = pathlib.Path(args.out) if args.out else in_path.with_suffix(".json")
 
-    data = build_json(parse_fasta(in_path))
+    data = build_json(parse_fasta(in_path), args.name)
     with out_path.open("w") as fp:
         json.dump(data, fp, indent=2)
 
-    print(f"✔ Wrote {out_path} (found {data[0]['sequences'][0]['proteinChain']['count']} FASTA record(s))")
+    print(f"✔ Wrote {out_path} (found {len(data[0]['sequences'])} FASTA record(s))")
 
 
 if __name__ == "__main__":
@@ -21,21 +21,30 @@ import glob
 import shutil
 import sys
 from pathlib import Path
-import gemmi  # pip install gemmi
+
+# asyncrunner/tracing live in the repository root; running in place from src_gadget/ needs it on the path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from asyncrunner import Job, run_job, tail
+import tracing
 
 # ── configuration ─────────────────────────────────────────────────────────────
 PROTENIX = "protenix"  # absolute path if not in $PATH
 PRED_DIR = "predicted_structures"
+LOG_DIR = "predicted_structures/logs"  # Protenix stdout/stderr per run
 DEFAULT_FASTA = "target.fasta"
 DEFAULT_JSON = "target_without_msa.json"
 DEFAULT_PDB = "reference1.pdb"
 
 # ── helper: run shell commands ────────────────────────────────────────────────
-def run(cmd: str) -> None:
-    """Run a shell command; raise CalledProcessError on failure."""
+def run(cmd: str, name: str = None, target: str = None) -> None:
+    """Run a command through the async runner; raise CalledProcessError on failure."""
     print(f"▶ {cmd}", flush=True)
-    subprocess.run(cmd, shell=True, check=True,
-                   stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    job = Job(name or Path(cmd.split()[0]).name, cmd, tool="protenix", target=target)
+    result = run_job(job, LOG_DIR)
+    if not result.ok:
+        print(tail(result.stderr_log), file=sys.stderr, flush=True)
+        raise subprocess.CalledProcessError(result.returncode or 1, cmd)
 
 # ── FASTA to JSON conversion ──────────────────────────────────────────────────
 def parse_fasta(path: Path):
@@ -59,11 +68,9 @@ def parse_fasta(path: Path):
         raise ValueError("No valid FASTA records found.")
     return records
 
-def build_json(records):
-    """Create a Protenix-style JSON object."""
-    header, seq = records[0]  # use the first record as the sequence
-    count = len(records)  # total number of FASTA records
-    name = (header.split() or ["target"])[0]
+def build_json(records, name=None):
+    """Create a Protenix-style JSON object: one protein entity (count 1) per FASTA record."""
+    name = name or (records[0][0].split() or ["target"])[0]
 
     return [
         {
@@ -71,9 +78,10 @@ def build_json(records):
                 {
                     "proteinChain": {
                         "sequence": seq,
-                        "count": count
+                        "count": 1
                     }
                 }
+                for _, seq in records
             ],
             "name": name
         }
@@ -84,7 +92,7 @@ def fasta_to_json(in_path: Path, out_path: Path):
     data = build_json(parse_fasta(in_path))
     with out_path.open("w") as fp:
         json.dump(data, fp, indent=2)
-    print(f"✔ Wrote {out_path} (found {data[0]['sequences'][0]['proteinChain']['count']} FASTA record(s))")
+    print(f"✔ Wrote {out_path} (found {len(data[0]['sequences'])} FASTA record(s))")
 
 # ── Prediction to PDB ─────────────────────────────────────────────────────────
 def predict_to_single_pdb(src: str, dst_pdb: str) -> None:
@@ -96,8 +104,9 @@ def predict_to_single_pdb(src: str, dst_pdb: str) -> None:
     tmpdir.mkdir(parents=True, exist_ok=True)
 
     # Run inference (replace --use_msa_server with --cycle 0 for offline mode)
-    run(f"{PROTENIX} predict --input {src} "
-        f"--out_dir {tmpdir} --use_msa_server")
+    with tracing.get_tracer().span("predict", target=base):
+        run(f"{PROTENIX} predict --input {src} "
+            f"--out_dir {tmpdir} --use_msa_server", name=f"protenix_{base}", target=base)
 
     # Preferred output: PDB
     pdb_files = glob.glob(str(tmpdir / "**" / "*.pdb"), recursive=True)
@@ -108,9 +117,11 @@ def predict_to_single_pdb(src: str, dst_pdb: str) -> None:
         cif_files = glob.glob(str(tmpdir / "**" / "*.cif"), recursive=True)
         if not cif_files:
             raise RuntimeError(f"No structure produced in {tmpdir}")
+        import gemmi  # pip install gemmi
         cif_path = cif_files[0]
         first_pdb = tmpdir / "converted.pdb"
-        gemmi.read_structure(cif_path).write_pdb(str(first_pdb))
+        with tracing.get_tracer().span("convert", target=base):
+            gemmi.read_structure(cif_path).write_pdb(str(first_pdb))
 
     # Copy to destination
     shutil.copy(first_pdb, dst_pdb)
@@ -122,7 +133,10 @@ def main():
     parser.add_argument("--fasta", default=DEFAULT_FASTA, help="Input FASTA file (default: target.fasta)")
     parser.add_argument("--json", default=DEFAULT_JSON, help="Target JSON file (default: target_without_msa.json)")
     parser.add_argument("--out", default=DEFAULT_PDB, help="Output PDB file (default: reference.pdb)")
+    parser.add_argument("--trace", metavar="DIR", help="Record timing/resource trace files in DIR")
     args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace)
 
     fasta_path = Path(args.fasta)
     json_path = Path(args.json)
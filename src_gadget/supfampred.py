@@ -1,10 +1,36 @@
-import subprocess
 import argparse
-from Bio import SearchIO
+import sys
+from pathlib import Path
+
+# asyncrunner lives in the repository root; running in place from src_gadget/ needs it on the path
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from asyncrunner import Job, run_job, tail
 
 # Default paths
 default_target = 'target.fasta'
 model_tab = '/mnt/data2/supfam/supfam/model.tab'
+hmmscan = '/mnt/data2/supfam/hmmer-3.1b2/src/hmmscan'
+default_hmm_library = '/mnt/data2/supfam/supfam/hmmlib'
+
+def parse_domtbl(output_tbl, e_value_threshold=0.001):
+    """
+    Significant hits of an hmmscan --domtblout file.
+
+    Returns: {query id: [{superfamily_id, evalue, bitscore, start, end}, ...]};
+    queries without significant hits map to an empty list.
+    """
+    from Bio import SearchIO  # imported here so --help stays fast
+
+    hits = {}
+    for query in SearchIO.parse(output_tbl, 'hmmscan3-domtab'):
+        rows = hits.setdefault(query.id, [])
+        for hit in query.hits:
+            for hsp in hit.hsps:
+                if hsp.evalue < e_value_threshold:
+                    rows.append({'superfamily_id': hit.id, 'evalue': hsp.evalue, 'bitscore': hsp.bitscore,
+                                 'start': hsp.query_start, 'end': hsp.query_end})
+    return hits
 
 def predict_superfamily(input_fasta, hmm_library='/mnt/data2/supfam/supfam/hmmlib', output_tbl='output.tbl', e_value_threshold=0.001):
     """
@@ -24,26 +50,25 @@ def predict_superfamily(input_fasta, hmm_library='/mnt/data2/supfam/supfam/hmmli
     print(f"Starting prediction for file: {input_fasta}")
     print(f"HMM library: {hmm_library}")
 
-    # Run hmmscan command
-    try:
-        result = subprocess.run([
-            '/mnt/data2/supfam/hmmer-3.1b2/src/hmmscan',  # Full path to hmmscan binary
-            '--domtblout', output_tbl,
-            '-E', str(e_value_threshold),
-            hmm_library,
-            input_fasta
-        ], check=True, capture_output=True, text=True)
-
-        print("hmmscan ran successfully. Stdout:", result.stdout)
-        print("Stderr (if any):", result.stderr)
-    except subprocess.CalledProcessError as e:
-        print(f"Error running hmmscan: {e.stderr}")
+    # Run hmmscan command; its (large) stdout goes to logs/hmmscan.out
+    result = run_job(Job('hmmscan', [
+        hmmscan,  # Full path to hmmscan binary
+        '--domtblout', output_tbl,
+        '-E', str(e_value_threshold),
+        hmm_library,
+        input_fasta
+    ], tool='hmmscan'))
+
+    if result.returncode == 127:
+        print(f"Command not found: {result.error}")
         return
-    except FileNotFoundError as fnf:
-        print(f"Command not found: {fnf}")
+    if not result.ok:
+        print(f"Error running hmmscan: {result.error or tail(result.stderr_log)}")
         return
+    print(f"hmmscan ran successfully in {result.elapsed:.1f}s. Output log: {result.stdout_log}")
 
     print("Parsing output file...")
+    from Bio import SearchIO  # imported here so --help stays fast
 
     try:
         # Parse HMMER domtblout results
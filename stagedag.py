@@ -0,0 +1,412 @@
+#!/usr/bin/env python3
+"""
+stagedag.py
+--------------------
+Resumable stage DAG runner for the FASTA → Protenix → SUPERFAMILY → DALI flow.
+
+Each stage declares its input and output files; dependencies are derived from
+them (a stage depends on whichever stage produces one of its inputs).  A stage
+is skipped when its outputs exist, are newer than its inputs and were produced
+by the same command.  Independent stages and targets run concurrently, limited
+by per-resource slots (cpu / gpu / disk, and one supfam slot for the shared
+SUPERFAMILY working directory).  State is checkpointed to a JSON file
+after every stage, so a crashed batch resumes where it stopped.
+
+Per-target workflow (one target per FASTA in fasta/):
+    json     fasta2json.py  fasta/X.fa        → work/X/X.json
+    predict  predictcif.py  work/X/X.json     → work/X/X.pdb        (gpu)
+    ensemble ensemble.py    all Protenix samples → work/X/X_ensemble.json
+    supfam   supfamhtml.py  fasta/X.fa        → supfamresults/X.html
+    dali_in  stage inputs   work/X/X.pdb      → work/X/input_pdbs/refx.pdb
+    templates templdali.py  pdb70 hits of X's MSA → work/X/candidates.tsv
+             (only with --template-mirror: top template chains from the
+             local mmCIF mirror are added to work/X/input_pdbs/templates)
+    dali     dali.py        work/X/input_pdbs → work/X/zscore_summary.csv
+             (with --library-domains: per-domain comparisons, restricted to
+             the superfamilies of supfamresults/X.html, see domsplit.py)
+
+Usage:
+    python stagedag.py run [--targets 7.6.2.14 ...] [--cpu 8 --gpu 1 --disk 2]
+    python stagedag.py run --dry-run
+    python stagedag.py status
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from shardlayout import ShardedDir
+import tracing
+
+# ── configuration ─────────────────────────────────────────────────────────────
+SCRIPT_DIR = Path(__file__).resolve().parent
+FASTA_DIR = "fasta"
+WORK_DIR = "work"
+LIBRARY_DIR = "input_pdbs"
+PRED_DIR = "predicted_structures"    # predictcif.py writes tmp_<target>/ here
+SUPFAM_RESULTS = "/mnt/data2/supfam/fangshun/supfamresults"
+STATE_FILE = ".stagedag_state.json"
+PYTHON = sys.executable
+
+# supfam: SUPERFAMILY works in one fixed directory, so only one run at a time whatever --disk says
+DEFAULT_LIMITS = {"cpu": os.cpu_count() or 1, "gpu": 1, "disk": 2, "supfam": 1}
+
+
+class Stage:
+    """One unit of work: a command or a Python callable with declared files."""
+
+    def __init__(self, name, inputs, outputs, action, resources=None, cwd=None):
+        self.name = name
+        self.inputs = [Path(p) for p in inputs]
+        self.outputs = [Path(p) for p in outputs]
+        self.action = action            # list[str] command, or callable()
+        self.resources = resources or {"cpu": 1}
+        self.cwd = cwd
+        self.deps = set()
+
+    @property
+    def signature(self):
+        """Identifies what the stage runs; a changed command forces a rerun."""
+        if callable(self.action):
+            desc = f"{self.action.__module__}.{getattr(self.action, '__qualname__', repr(self.action))}"
+        else:
+            desc = " ".join(map(str, self.action))
+        desc += "|" + "|".join(map(str, self.inputs + self.outputs))
+        return hashlib.sha1(desc.encode()).hexdigest()
+
+    def up_to_date(self):
+        if not self.outputs or not all(p.exists() for p in self.outputs):
+            return False
+        oldest_out = min(p.stat().st_mtime for p in self.outputs)
+        newest_in = max((p.stat().st_mtime for p in self.inputs if p.exists()), default=0)
+        return oldest_out >= newest_in
+
+
+class StageGraph:
+    """A set of stages plus a resource-limited, checkpointing scheduler."""
+
+    def __init__(self, state_file=STATE_FILE, log_dir=".stagedag_logs"):
+        self.stages = {}
+        self.state_file = Path(state_file)
+        self.log_dir = Path(log_dir)
+        self.state = self._load_state()
+        self._lock = threading.Lock()
+
+    # ── graph construction ───────────────────────────────────────────────────
+    def add(self, stage: Stage):
+        if stage.name in self.stages:
+            raise ValueError(f"Duplicate stage name: {stage.name}")
+        self.stages[stage.name] = stage
+        return stage
+
+    def resolve(self):
+        """Derive dependencies from outputs → inputs and reject cycles."""
+        producers = {}
+        for stage in self.stages.values():
+            for out in stage.outputs:
+                if out in producers:
+                    raise ValueError(f"{out} is produced by both {producers[out]} and {stage.name}")
+                producers[out] = stage.name
+        for stage in self.stages.values():
+            stage.deps = {producers[p] for p in stage.inputs if p in producers} - {stage.name}
+
+        visiting, done = set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle detected at stage {name}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    # ── checkpointing ────────────────────────────────────────────────────────
+    def _load_state(self):
+        if self.state_file.exists():
+            try:
+                return json.loads(self.state_file.read_text())
+            except json.JSONDecodeError:
+                print(f"⚠️ Ignoring unreadable state file {self.state_file}")
+        return {}
+
+    def _checkpoint(self, name, status, **extra):
+        with self._lock:
+            self.state[name] = {"status": status, "time": time.time(), **extra}
+            tmp = self.state_file.with_name(self.state_file.name + ".tmp")
+            tmp.write_text(json.dumps(self.state, indent=1, sort_keys=True))
+            tmp.replace(self.state_file)
+
+    def is_current(self, stage: Stage):
+        record = self.state.get(stage.name, {})
+        return (record.get("status") == "done"
+                and record.get("signature") == stage.signature
+                and stage.up_to_date())
+
+    # ── execution ────────────────────────────────────────────────────────────
+    def _execute(self, stage: Stage):
+        for out in stage.outputs:
+            out.parent.mkdir(parents=True, exist_ok=True)
+        if callable(stage.action):
+            stage.action()
+            return 0
+        self.log_dir.mkdir(parents=True, exist_ok=True)
+        log_path = self.log_dir / f"{stage.name.replace('/', '_')}.log"
+        with log_path.open("w") as log:
+            proc = subprocess.run([str(a) for a in stage.action], cwd=stage.cwd,
+                                  stdout=log, stderr=subprocess.STDOUT)
+        return proc.returncode
+
+    def run(self, limits=None, dry_run=False):
+        """Run every stage that is not up to date; return True if all succeeded."""
+        self.resolve()
+        limits = {**DEFAULT_LIMITS, **(limits or {})}
+        for stage in self.stages.values():
+            for res, need in stage.resources.items():
+                if need > limits.get(res, 0):
+                    raise ValueError(f"Stage {stage.name} needs {need} {res} but the limit is {limits.get(res, 0)}")
+
+        # A stage that reruns invalidates everything downstream, whatever the output mtimes say now
+        status = {}
+        stale = set()
+        for name in self._topological(list(self.stages)):
+            if stale & self.stages[name].deps or not self.is_current(self.stages[name]):
+                stale.add(name)
+            else:
+                status[name] = "skipped"
+        # Dependencies first, so one pass over it propagates "blocked" down a whole chain
+        pending = self._topological([n for n in self.stages if n not in status])
+        print(f"🧭 {len(self.stages)} stages: {len(status)} up to date, {len(pending)} to run")
+
+        if dry_run:
+            for name in self._topological(pending):
+                print(f"  → {name}")
+            return True
+
+        free = dict(limits)
+        cond = threading.Condition()
+        running = set()
+
+        def finish(name, ok, elapsed, error=None):
+            with cond:
+                status[name] = "done" if ok else "failed"
+                running.discard(name)
+                for res, need in self.stages[name].resources.items():
+                    free[res] += need
+                cond.notify_all()
+            if ok:
+                self._checkpoint(name, "done", signature=self.stages[name].signature, seconds=round(elapsed, 2))
+                print(f"✅ {name} ({elapsed:.1f}s)")
+            else:
+                self._checkpoint(name, "failed", error=error)
+                print(f"❌ {name}: {error}")
+
+        def work(name):
+            stage = self.stages[name]
+            self._checkpoint(name, "running")
+            start = time.time()
+            target, _, step = name.rpartition("/")
+            try:
+                with tracing.get_tracer().span(step, category="dag", target=target or None) as info:
+                    rc = self._execute(stage)
+                    info["exit_status"] = rc
+                missing = [str(p) for p in stage.outputs if not p.exists()]
+                if rc != 0:
+                    finish(name, False, time.time() - start, f"exit status {rc}")
+                elif missing:
+                    finish(name, False, time.time() - start, f"missing outputs {missing}")
+                else:
+                    finish(name, True, time.time() - start)
+            except Exception as e:
+                finish(name, False, time.time() - start, str(e))
+
+        with ThreadPoolExecutor(max_workers=max(1, sum(limits.values()))) as pool:
+            with cond:
+                while True:
+                    # Anything depending on a failed/blocked stage can never run
+                    for name in pending:
+                        if name not in status and any(status.get(d) in ("failed", "blocked")
+                                                      for d in self.stages[name].deps):
+                            status[name] = "blocked"
+                            print(f"⏭️ {name} blocked by a failed dependency")
+                    waiting = [n for n in pending if n not in status and n not in running]
+                    if not waiting and not running:
+                        break
+                    launched = False
+                    for name in waiting:
+                        stage = self.stages[name]
+                        if not all(status.get(d) in ("done", "skipped") for d in stage.deps):
+                            continue
+                        if all(free.get(r, 0) >= need for r, need in stage.resources.items()):
+                            for r, need in stage.resources.items():
+                                free[r] -= need
+                            running.add(name)
+                            print(f"▶ {name}")
+                            pool.submit(work, name)
+                            launched = True
+                    if not launched:
+                        if not running:
+                            # Nothing runs and nothing can start: waiting would never end
+                            for name in waiting:
+                                status[name] = "blocked"
+                                print(f"⏭️ {name} cannot be scheduled")
+                            break
+                        cond.wait()
+
+        failed = [n for n, s in status.items() if s in ("failed", "blocked")]
+        print(f"📊 done={sum(s == 'done' for s in status.values())} "
+              f"skipped={sum(s == 'skipped' for s in status.values())} failed/blocked={len(failed)}")
+        return not failed
+
+    def _topological(self, names):
+        order, seen = [], set()
+
+        def visit(n):
+            if n in seen:
+                return
+            seen.add(n)
+            for d in sorted(self.stages[n].deps):
+                visit(d)
+            if n in names:
+                order.append(n)
+
+        for n in sorted(names):
+            visit(n)
+        return order
+
+
+# ── the protein workflow ──────────────────────────────────────────────────────
+def stage_dali_inputs(model_pdb: Path, target_dir: Path, library_dir: Path):
+    """Lay out a per-target DALI working directory: refx.pdb + library links."""
+    pdb_dir = target_dir / "input_pdbs"
+    pdb_dir.mkdir(parents=True, exist_ok=True)
+    for lib_pdb in sorted(library_dir.glob("*.pdb")):
+        link = pdb_dir / lib_pdb.name
+        if lib_pdb.name == "refx.pdb" or link.exists():
+            continue
+        try:
+            link.symlink_to(lib_pdb.resolve())
+        except OSError:
+            shutil.copy2(lib_pdb, link)
+    shutil.copy2(model_pdb, pdb_dir / "refx.pdb")
+
+
+def build_protein_workflow(graph: StageGraph, targets, fasta_dir=FASTA_DIR, work_dir=WORK_DIR,
+                           library_dir=LIBRARY_DIR, supfam_results=SUPFAM_RESULTS, library_domains=None,
+                           template_mirror=None, template_top=None):
+    """Declare the per-target stages for every FASTA in *targets*."""
+    fasta_dir, work_dir = Path(fasta_dir), Path(work_dir)
+    library_dir, supfam_results = Path(library_dir), Path(supfam_results)
+    library_domains = [Path(p).resolve() for p in library_domains or []]
+    library = sorted(p.resolve() for p in library_dir.glob("*.pdb") if p.name != "refx.pdb")
+
+    for name in targets:
+        fasta = fasta_dir / f"{name}.fa"
+        tdir = work_dir / name
+        json_path = tdir / f"{name}.json"
+        model_pdb = tdir / f"{name}.pdb"
+        refx = tdir / "input_pdbs" / "refx.pdb"
+
+        graph.add(Stage(f"{name}/json", [fasta], [json_path],
+                        [PYTHON, SCRIPT_DIR / "src_gadget" / "fasta2json.py", fasta, "--out", json_path, "--name", name]))
+        graph.add(Stage(f"{name}/predict", [json_path], [model_pdb],
+                        [PYTHON, SCRIPT_DIR / "predictcif.py", json_path.resolve(), model_pdb.resolve()],
+                        resources={"gpu": 1, "cpu": 1}))
+        graph.add(Stage(f"{name}/ensemble", [model_pdb], [tdir / f"{name}_ensemble.json"],
+                        [PYTHON, SCRIPT_DIR / "ensemble.py", ShardedDir(PRED_DIR, "pred").path(f"tmp_{name}"), "--out", tdir,
+                         "--workers", 1, "--name", name],
+                        resources={"cpu": 1}))
+        graph.add(Stage(f"{name}/supfam", [fasta], [supfam_results / f"{name}.html"],
+                        [PYTHON, SCRIPT_DIR / "supfamhtml.py", fasta.resolve()],
+                        resources={"cpu": 1, "supfam": 1}))
+        graph.add(Stage(f"{name}/dali_in", [model_pdb, *library], [refx],
+                        lambda m=model_pdb, t=tdir: stage_dali_inputs(m, t, library_dir),
+                        resources={"disk": 1}))
+        # The library is compared too: a changed, added or removed structure reruns DALI
+        dali_inputs = [refx, *library]
+        if template_mirror:
+            # Template chains from the target's own pdb70 hits join the library as DALI queries
+            candidates = tdir / "candidates.tsv"
+            graph.add(Stage(f"{name}/templates", [refx], [candidates],
+                            [PYTHON, SCRIPT_DIR / "templdali.py", tdir.resolve(), "--mirror", template_mirror,
+                             "--no-compare", *(["--top", template_top] if template_top else [])],
+                            resources={"cpu": 1, "disk": 1}))
+            dali_inputs.append(candidates)
+        if library_domains:
+            # Only library domains of the target's own superfamilies are compared
+            supfam_html = (supfam_results / f"{name}.html").resolve()
+            graph.add(Stage(f"{name}/dali", [*dali_inputs, supfam_html, *library_domains], [tdir / "zscore_summary.csv"],
+                            [PYTHON, SCRIPT_DIR / "dali.py", "--domains", *library_domains,
+                             "--ref-superfamily", supfam_html], cwd=tdir))
+        else:
+            graph.add(Stage(f"{name}/dali", dali_inputs, [tdir / "zscore_summary.csv"],
+                            [PYTHON, SCRIPT_DIR / "dali.py"], cwd=tdir))
+    return graph
+
+
+def discover_targets(fasta_dir=FASTA_DIR):
+    return sorted(p.stem for p in Path(fasta_dir).glob("*.fa"))
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Resumable stage DAG runner for the prediction pipeline.")
+    parser.add_argument("command", choices=["run", "status"])
+    parser.add_argument("--targets", nargs="*", help="Target names (default: every fasta/*.fa)")
+    parser.add_argument("--fasta-dir", default=FASTA_DIR)
+    parser.add_argument("--work-dir", default=WORK_DIR)
+    parser.add_argument("--library", default=LIBRARY_DIR, help="PDB library compared against each model")
+    parser.add_argument("--supfam-results", default=SUPFAM_RESULTS)
+    parser.add_argument("--library-domains", nargs="+", metavar="ASS",
+                        help="SUPERFAMILY .ass/.html results for the library chains (domsplit.py fasta); "
+                             "enables per-domain DALI comparisons")
+    parser.add_argument("--template-mirror", metavar="DIR",
+                        help="Local mmCIF mirror; adds each target's top pdb70 template chains as DALI "
+                             "queries (templdali.py)")
+    parser.add_argument("--template-top", type=int, help="Template chains per target at most (templdali.py default)")
+    parser.add_argument("--state", default=STATE_FILE, help="Checkpoint file")
+    parser.add_argument("--cpu", type=int, default=DEFAULT_LIMITS["cpu"], help="CPU slots")
+    parser.add_argument("--gpu", type=int, default=DEFAULT_LIMITS["gpu"], help="GPU slots")
+    parser.add_argument("--disk", type=int, default=DEFAULT_LIMITS["disk"], help="Concurrent disk-heavy stages")
+    parser.add_argument("--dry-run", action="store_true", help="Only list the stages that would run")
+    parser.add_argument("--trace", metavar="DIR", help="Record timing/resource traces (also for every stage script)")
+    args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace)
+
+    targets = args.targets or discover_targets(args.fasta_dir)
+    if not targets:
+        print(f"❌ No targets found in {args.fasta_dir}")
+        sys.exit(1)
+
+    graph = StageGraph(state_file=args.state, log_dir=Path(args.work_dir) / "logs")
+    build_protein_workflow(graph, targets, args.fasta_dir, args.work_dir, args.library, args.supfam_results,
+                           args.library_domains, args.template_mirror, args.template_top)
+
+    if args.command == "status":
+        graph.resolve()
+        for name, stage in graph.stages.items():
+            record = graph.state.get(name, {})
+            flag = "up to date" if graph.is_current(stage) else record.get("status", "pending")
+            print(f"{name:<32s} {flag}")
+        return
+
+    ok = graph.run({"cpu": args.cpu, "gpu": args.gpu, "disk": args.disk}, dry_run=args.dry_run)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
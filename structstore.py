@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+"""
+structstore.py
+--------------------
+Compact, memory-mapped coordinate store for a structure library.
+
+Every stage used to re-parse the text PDB/mmCIF files (Biopython, gemmi,
+DaliLite import, PyMOL).  This script parses a library ONCE and writes a
+single columnar binary file that can be opened with `numpy.memmap`, so that
+opening a chain is an O(1) slice instead of a text parse.
+
+File layout (all blocks 64-byte aligned):
+    b"PPSTORE1"                  8-byte magic
+    uint64 (little endian)       length of the JSON header
+    JSON header                  columns (dtype/shape/offset) + chain index
+    column blocks                raw little-endian arrays
+
+Per-atom columns : coords (N,3) float32, atom_name, element, bfactor, res_index
+Per-residue cols : res_name, res_seq, ins_code, hetero, ca_index, plddt
+Chain index      : key ("3wdl_B"), entry, chain, source, atom/residue ranges
+Source index     : resolved path → size and mtime when it was stored
+
+Consumers read through the store: `StructStore.source_chains(path)` returns
+the stored chains of a file only while the file is unchanged, and None
+otherwise, so a caller falls back to parsing the file itself.
+src_gadget/convert.py, campreport.py, seqcluster.py and pymol1.py (all --store)
+do this.
+
+Usage:
+    python structstore.py build input_pdbs/ --out library.ppstore
+    python structstore.py list library.ppstore
+    python structstore.py export library.ppstore 3wdl_B --out 3wdl_B.pdb
+"""
+
+import argparse
+import json
+import struct
+import sys
+from pathlib import Path
+
+import numpy as np
+
+MAGIC = b"PPSTORE1"
+ALIGN = 64
+STRUCTURE_SUFFIXES = (".pdb", ".ent", ".cif", ".mmcif")
+
+ATOM_COLUMNS = {
+    "coords": ("<f4", 3),
+    "atom_name": ("S4", None),
+    "element": ("S2", None),
+    "bfactor": ("<f4", None),
+    "res_index": ("<i4", None),
+}
+RESIDUE_COLUMNS = {
+    "res_name": ("S3", None),
+    "res_seq": ("<i4", None),
+    "ins_code": ("S1", None),
+    "hetero": ("?", None),
+    "ca_index": ("<i4", None),
+    "plddt": ("<f4", None),
+}
+
+THREE_TO_ONE = {
+    "ALA": "A", "ARG": "R", "ASN": "N", "ASP": "D", "CYS": "C",
+    "GLN": "Q", "GLU": "E", "GLY": "G", "HIS": "H", "ILE": "I",
+    "LEU": "L", "LYS": "K", "MET": "M", "PHE": "F", "PRO": "P",
+    "SER": "S", "THR": "T", "TRP": "W", "TYR": "Y", "VAL": "V",
+    "MSE": "M", "SEC": "U", "PYL": "O",
+}
+
+
+def _aligned(n: int) -> int:
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def chain_key(entry: str, chain: str) -> str:
+    """Library key of a chain, same form as zscore_summary.csv (e.g. 3wdl_B)."""
+    return f"{entry.lower()}_{chain}"
+
+
+def entry_name(path) -> str:
+    """Entry of a structure file: '3wdl' for 3wdl.pdb and 3wdl_B.pdb, the whole stem otherwise
+    (Protenix samples X_seed_1_sample_0 and X_seed_1_sample_1 are different entries)."""
+    stem = Path(path).stem
+    entry, _, chain = stem.partition("_")
+    return (entry if chain and len(chain) <= 2 else stem).lower()
+
+
+def _signature(path):
+    st = Path(path).stat()
+    return [st.st_size, st.st_mtime_ns]
+
+
+def _pdb_lines(view, keep, serial):
+    """ATOM/HETATM records of the residues of *view* selected by *keep*, numbered from *serial* + 1."""
+    atom_keep = keep[view.res_index - view._res_start]
+    lines = []
+    for i in np.flatnonzero(atom_keep):
+        r = view.res_index[i] - view._res_start
+        serial += 1
+        name = view.atom_names[i].decode()
+        element = view.elements[i].decode()
+        # PDB convention: 4-letter names start in column 13, others in 14
+        padded = name if len(name) == 4 or len(element) == 2 else f" {name}"
+        x, y, z = view.coords[i]
+        lines.append(
+            f"{'HETATM' if view.hetero[r] else 'ATOM  '}{serial % 100000:5d} "
+            f"{padded:<4s} {view.res_names[r].decode():>3s} {view.chain[:1]}"
+            f"{view.res_seq[r]:4d}{view.ins_codes[r].decode() or ' '}   "
+            f"{x:8.3f}{y:8.3f}{z:8.3f}{1.0:6.2f}{view.bfactors[i]:6.2f}"
+            f"          {element:>2s}\n"
+        )
+    return lines, serial
+
+
+def pdb_text(views):
+    """Several chains (e.g. every chain of one source) as the text of one PDB file."""
+    lines, serial = [], 0
+    for view in views:
+        chain_lines, serial = _pdb_lines(view, np.ones(len(view), dtype=bool), serial)
+        lines += chain_lines + ["TER\n"]
+    lines.append("END\n")
+    return "".join(lines)
+
+
+def write_pdb(views, path):
+    """Write several chains as one PDB file."""
+    Path(path).write_text(pdb_text(views))
+
+
+# ── reader ────────────────────────────────────────────────────────────────────
+class ChainView:
+    """Zero-copy view of one chain; every array is a slice of the memmap."""
+
+    def __init__(self, store, meta):
+        self.meta = meta
+        self.key = meta["key"]
+        self.entry = meta["entry"]
+        self.chain = meta["chain"]
+        a0, a1 = meta["atom_start"], meta["atom_stop"]
+        r0, r1 = meta["res_start"], meta["res_stop"]
+        self._res_start = r0
+        self._atom_start = a0
+
+        self.coords = store.columns["coords"][a0:a1]
+        self.atom_names = store.columns["atom_name"][a0:a1]
+        self.elements = store.columns["element"][a0:a1]
+        self.bfactors = store.columns["bfactor"][a0:a1]
+        self.res_index = store.columns["res_index"][a0:a1]
+
+        self.res_names = store.columns["res_name"][r0:r1]
+        self.res_seq = store.columns["res_seq"][r0:r1]
+        self.ins_codes = store.columns["ins_code"][r0:r1]
+        self.hetero = store.columns["hetero"][r0:r1]
+        self.ca_index = store.columns["ca_index"][r0:r1]
+        self.plddt = store.columns["plddt"][r0:r1]
+
+    def __len__(self):
+        return len(self.res_names)
+
+    @property
+    def polymer_mask(self):
+        """Residues that are part of the polymer and carry a CA atom."""
+        return (~self.hetero) & (self.ca_index >= 0)
+
+    @property
+    def ca_coords(self):
+        """(n_residues, 3) CA coordinates of the polymer residues."""
+        idx = self.ca_index[self.polymer_mask] - self._atom_start
+        return self.coords[idx]
+
+    @property
+    def sequence(self):
+        names = self.res_names[self.polymer_mask]
+        return "".join(THREE_TO_ONE.get(n.decode(), "X") for n in names)
+
+    def write_pdb(self, path, residue_mask=None):
+        """Write the chain (optionally a subset of residues) as a PDB file."""
+        keep = np.ones(len(self), dtype=bool) if residue_mask is None else np.asarray(residue_mask)
+        lines, _ = _pdb_lines(self, keep, 0)
+        lines.append("TER\nEND\n")
+        Path(path).write_text("".join(lines))
+
+
+class StructStore:
+    """Read-only, memory-mapped structure library."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        with self.path.open("rb") as fh:
+            if fh.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"Not a structure store: {self.path}")
+            (header_len,) = struct.unpack("<Q", fh.read(8))
+            self.header = json.loads(fh.read(header_len))
+
+        self.columns = {}
+        for name, col in self.header["columns"].items():
+            shape = tuple(col["shape"])
+            if shape[0] == 0:
+                self.columns[name] = np.zeros(shape, dtype=col["dtype"])
+            else:
+                self.columns[name] = np.memmap(self.path, dtype=col["dtype"], mode="r",
+                                               offset=col["offset"], shape=shape)
+        self.index = {c["key"]: c for c in self.header["chains"]}
+        self.sources = self.header.get("sources", {})     # version 1 stores have no source index
+        self._by_source = None
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def keys(self):
+        return list(self.index)
+
+    def chain(self, key) -> ChainView:
+        """Open one chain by key (e.g. '3wdl_B'); O(1), no parsing."""
+        try:
+            return ChainView(self, self.index[key])
+        except KeyError:
+            raise KeyError(f"Chain {key} not found in {self.path}") from None
+
+    def chains(self, entry=None):
+        """Iterate over all chains, or over the chains of a single entry."""
+        for meta in self.header["chains"]:
+            if entry is None or meta["entry"] == entry.lower():
+                yield ChainView(self, meta)
+
+    def is_current(self, path):
+        """True if *path* is in the store and has not changed since it was stored."""
+        path = Path(path).resolve()
+        recorded = self.sources.get(str(path))
+        try:
+            return recorded is not None and recorded == _signature(path)
+        except OSError:
+            return False
+
+    def source_chains(self, path):
+        """Chains stored from the file *path*, or None if it is not stored or has changed since."""
+        if not self.is_current(path):
+            return None
+        if self._by_source is None:
+            self._by_source = {}
+            for meta in self.header["chains"]:
+                self._by_source.setdefault(meta.get("path"), []).append(meta)
+        return [ChainView(self, meta) for meta in self._by_source.get(str(Path(path).resolve()), [])]
+
+
+# ── writer ────────────────────────────────────────────────────────────────────
+def _collect_structure(path: Path, atoms, residues, chains):
+    """Parse one PDB/mmCIF with gemmi and append its first model to the columns."""
+    import gemmi  # pip install gemmi
+
+    st = gemmi.read_structure(str(path))
+    st.remove_waters()
+    entry = entry_name(path)
+
+    for ch in st[0]:
+        if len(ch) == 0:
+            continue
+        atom_start = len(atoms["bfactor"])
+        res_start = len(residues["res_seq"])
+        for res in ch:
+            r = len(residues["res_seq"])
+            ca = -1
+            ca_b = None
+            b_sum = 0.0
+            for atom in res:
+                if atom.name == "CA" and ca < 0:
+                    ca = len(atoms["bfactor"])
+                    ca_b = atom.b_iso
+                b_sum += atom.b_iso
+                atoms["coords"].append((atom.pos.x, atom.pos.y, atom.pos.z))
+                atoms["atom_name"].append(atom.name)
+                atoms["element"].append(atom.element.name)
+                atoms["bfactor"].append(atom.b_iso)
+                atoms["res_index"].append(r)
+            residues["res_name"].append(res.name)
+            residues["res_seq"].append(res.seqid.num)
+            residues["ins_code"].append(res.seqid.icode.strip())
+            residues["hetero"].append(res.het_flag == "H")
+            residues["ca_index"].append(ca)
+            # Protenix/AF-style models store pLDDT in the B-factor column
+            residues["plddt"].append(ca_b if ca_b is not None else b_sum / max(len(res), 1))
+        chains.append({
+            "key": chain_key(entry, ch.name),
+            "entry": entry,
+            "chain": ch.name,
+            "source": str(path),
+            "path": str(path.resolve()),       # what source_chains() looks files up by
+            "atom_start": atom_start,
+            "atom_stop": len(atoms["bfactor"]),
+            "res_start": res_start,
+            "res_stop": len(residues["res_seq"]),
+        })
+
+
+def build_store(sources, out_path):
+    """Parse all *sources* (files, or directories searched recursively) into one store at *out_path*."""
+    files = []
+    for src in sources:
+        src = Path(src)
+        if src.is_dir():
+            # Recursive, like convert.py: Protenix nests its CIFs in <target>/seed_<n>/predictions/
+            files.extend(sorted(p for p in src.rglob("*") if p.suffix.lower() in STRUCTURE_SUFFIXES and p.is_file()))
+        else:
+            files.append(src)
+    if not files:
+        raise ValueError("No PDB/mmCIF files to store")
+
+    atoms = {name: [] for name in ATOM_COLUMNS}
+    residues = {name: [] for name in RESIDUE_COLUMNS}
+    chains = []
+    sources = {}
+    for path in files:
+        sources[str(Path(path).resolve())] = _signature(path)
+        _collect_structure(path, atoms, residues, chains)
+
+    seen = set()
+    for meta in chains:
+        if meta["key"] in seen:
+            raise ValueError(f"Duplicate chain key {meta['key']} ({meta['source']})")
+        seen.add(meta["key"])
+
+    arrays = {}
+    for spec, values in ((ATOM_COLUMNS, atoms), (RESIDUE_COLUMNS, residues)):
+        for name, (dtype, width) in spec.items():
+            arr = np.asarray(values[name], dtype=dtype)
+            if width and arr.size == 0:
+                arr = arr.reshape(0, width)
+            arrays[name] = arr
+
+    # The header size depends on the offsets it contains, so lay out the
+    # columns against a generous header reservation and fix it afterwards.
+    columns = {name: {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": 0}
+               for name, arr in arrays.items()}
+    header = {"version": 2, "chains": chains, "columns": columns, "sources": sources}
+    reserve = _aligned(len(MAGIC) + 8 + len(json.dumps(header)) + 32 * len(columns) + 256)
+    offset = reserve
+    for name, arr in arrays.items():
+        columns[name]["offset"] = offset
+        offset = _aligned(offset + arr.nbytes)
+    blob = json.dumps(header).encode()
+    assert len(MAGIC) + 8 + len(blob) <= reserve
+
+    out_path = Path(out_path)
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    with tmp_path.open("wb") as fh:
+        fh.write(MAGIC)
+        fh.write(struct.pack("<Q", len(blob)))
+        fh.write(blob)
+        for name, arr in arrays.items():
+            fh.seek(columns[name]["offset"])
+            fh.write(np.ascontiguousarray(arr).tobytes())
+        fh.truncate(offset)
+    tmp_path.replace(out_path)
+    return len(files), len(chains), len(arrays["bfactor"])
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Memory-mapped coordinate store for a structure library.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_build = sub.add_parser("build", help="Parse PDB/mmCIF files into a store")
+    p_build.add_argument("sources", nargs="+", help="PDB/mmCIF files or directories (searched recursively)")
+    p_build.add_argument("--out", default="library.ppstore", help="Output store (default: library.ppstore)")
+
+    p_list = sub.add_parser("list", help="List the chains in a store")
+    p_list.add_argument("store")
+
+    p_export = sub.add_parser("export", help="Write one chain of a store as PDB")
+    p_export.add_argument("store")
+    p_export.add_argument("key", help="Chain key, e.g. 3wdl_B")
+    p_export.add_argument("--out", help="Output PDB (default: <key>.pdb)")
+
+    args = parser.parse_args()
+
+    if args.command == "build":
+        n_files, n_chains, n_atoms = build_store(args.sources, args.out)
+        print(f"✅ Stored {n_chains} chains ({n_atoms} atoms) from {n_files} files → {args.out}")
+    elif args.command == "list":
+        store = StructStore(args.store)
+        for view in store.chains():
+            print(f"{view.key:<12s} {len(view):6d} residues  {len(view.coords):7d} atoms  {view.meta['source']}")
+    elif args.command == "export":
+        store = StructStore(args.store)
+        out = args.out or f"{args.key}.pdb"
+        store.chain(args.key).write_pdb(out)
+        print(f"✓ Wrote {out}")
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except (KeyError, ValueError) as exc:
+        print("ERROR:", exc, file=sys.stderr, flush=True)
+        sys.exit(1)
@@ -1,9 +1,11 @@
 import os
 import shutil
-import subprocess
 import argparse
 import glob
 
+from asyncrunner import Job, run_job, tail
+import tracing
+
 # Fixed paths
 superfamily_dir = '/mnt/data2/supfam/supfam/'
 superfamily_script = os.path.join(superfamily_dir, 'superfamily.pl')
@@ -22,12 +24,15 @@ def run_superfamily_pipeline(input_fasta):
 
     print(f"\n✅ Running SUPERFAMILY on: {target_fasta}")
     try:
-        # Run the annotation script
-        subprocess.run(
-            ['perl', superfamily_script, f"{base_name}.fa"],
-            cwd=superfamily_dir,
-            check=True
-        )
+        # Run the annotation script (output streamed to fangshun/logs/)
+        result = run_job(Job(f"superfamily_{base_name}",
+                             ['perl', superfamily_script, f"{base_name}.fa"],
+                             tool="superfamily", cwd=superfamily_dir, target=base_name),
+                         os.path.join(fangshun_dir, 'logs'))
+        if not result.ok:
+            print(f"❌ Error running SUPERFAMILY: {result.error or f'exit status {result.returncode}'}")
+            print(tail(result.stderr_log))
+            return False
 
         # Default output filenames from the pipeline
         raw_ass = os.path.join(superfamily_dir, '.ass')
@@ -50,11 +55,11 @@ def run_superfamily_pipeline(input_fasta):
 
         print(f"✅ Output saved as: {out_ass}, {out_html}")
         print(f"📁 Copied to results folder: {dest_ass}, {dest_html}")
+        return True
 
-    except subprocess.CalledProcessError as e:
-        print(f"❌ Error running SUPERFAMILY: {e}")
-    except FileNotFoundError:
-        print("❌ superfamily.pl not found or not executable.")
+    except (OSError, shutil.Error) as e:
+        print(f"❌ Failed to collect SUPERFAMILY output: {e}")
+        return False
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
@@ -62,8 +67,11 @@ if __name__ == "__main__":
     )
     parser.add_argument('input_fasta', nargs='?', default=None,
                         help="Path to input FASTA file or directory")
+    parser.add_argument('--trace', metavar='DIR', help="Record timing/resource trace files in DIR")
 
     args = parser.parse_args()
+    if args.trace:
+        tracing.enable(args.trace)
 
     fasta_dir = os.path.join(fangshun_dir, 'fasta/')
 
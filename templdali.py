@@ -0,0 +1,427 @@
+#!/usr/bin/env python3
+"""
+templdali.py
+--------------------
+Template-seeded DALI candidates from the Protenix MSA search.
+
+Every MSA folder of a prediction (tmp_<target>/<target>/msa_res*/) holds the
+pdb70 template hits of the query (pdb70_220313_db.m8, BLAST tabular):
+
+    query  4MB0_B  fident alnlen mismatch gapopen qstart qend tstart tend evalue bits [cigar]
+
+Instead of comparing the predicted model against whatever was put into
+input_pdbs/ by hand, this stage
+
+    1. streams the m8 files (also from .ppred.npz archives) and keeps the
+       best hit per distinct PDB chain, at most --per-entry chains per PDB
+       entry (chains of one entry are mostly copies) and at most --top in
+       total, ranked by e-value or bitscore
+    2. pulls those chains from a local mmCIF mirror (divided mmCIF/<xy>/
+       layout or flat, .cif or .cif.gz) and writes single-chain PDBs
+       (first model, protein only) into input_pdbs/templates/ in parallel
+    3. imports them and compares them against the predicted model
+       (input_pdbs/refx.pdb) with DaliPipeline, or queues the work on a
+       workqueue.py queue (--queue)
+
+Every candidate chain gets its own 4-character DALI code (t001, t002, ...;
+PDB ids start with a digit, so codes never clash with hand-placed PDBs) and
+is written as input_pdbs/templates/t001_4mb0_B.pdb, where dali.py also
+picks it up as a query.  A chain keeps its code across runs.
+
+candidates.tsv in the work directory lists the selected hits with their
+code, status and, after the comparisons, their Z-score.  Candidates of an
+earlier run that are no longer selected are removed again, with their DATs
+and DALI outputs; input_pdbs/ itself is never touched.
+
+Usage:
+    python templdali.py work/7.6.2.14 --mirror /mnt/pdb/mmCIF [--top 25] [--by bits]
+    python templdali.py work/7.6.2.14 --mirror /mnt/pdb/mmCIF --msa predicted_structures/tmp_7.6.2.14
+    python templdali.py work/7.6.2.14 --mirror /mnt/pdb/mmCIF --no-compare    # select and convert only
+    python templdali.py work/7.6.2.14 --mirror /mnt/pdb/mmCIF --queue queue.db
+"""
+
+import argparse
+import csv
+import heapq
+import itertools
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from asyncrunner import run_jobs
+from shardlayout import ShardedDir
+import tracing
+
+# ── configuration ─────────────────────────────────────────────────────────────
+PRED_DIR = "predicted_structures"
+M8_PATTERN = "pdb70*.m8"
+TOP = 25                # candidates compared at most
+PER_ENTRY = 1           # chains per PDB entry
+MAX_EVALUE = 1e-3
+CANDIDATES_TSV = "candidates.tsv"
+M8_COLUMNS = ("query", "target", "fident", "alnlen", "mismatch", "gapopen",
+              "qstart", "qend", "tstart", "tend", "evalue", "bits")
+TSV_COLUMNS = ["rank", "pdb_chain", "code", "evalue", "bits", "fident", "alnlen", "qstart", "qend",
+               "source", "status", "pdb", "dali_id", "zscore"]
+CODE_PREFIX = "t"       # DALI codes t001...: PDB ids start with a digit
+
+
+# ── template hits ─────────────────────────────────────────────────────────────
+def m8_sources(paths):
+    """(label, line iterator factory) for every pdb70 m8 file in *paths* (files, directories, archives)."""
+    sources = []
+    for path in map(Path, paths):
+        if path.name.endswith(".ppred.npz"):
+            from predarchive import PredictionArchive
+            arc = PredictionArchive(path)
+            for rel in sorted(arc.files()):
+                if Path(rel).match(M8_PATTERN):
+                    sources.append((f"{path}:{rel}",
+                                    lambda a=arc, r=rel: iter(a.read_file(r).decode().splitlines())))
+        elif path.is_dir():
+            for m8 in sorted(path.rglob(M8_PATTERN)):
+                sources.append((str(m8), lambda p=m8: open(p)))
+        elif path.is_file():
+            sources.append((str(path), lambda p=path: open(p)))
+    return sources
+
+
+def iter_hits(sources):
+    """Hits of the m8 *sources*, one line at a time: {pdb, chain, evalue, bits, ..., source}"""
+    for label, open_lines in sources:
+        lines = open_lines()
+        try:
+            for line in lines:
+                fields = line.rstrip("\n").split("\t")
+                if len(fields) < len(M8_COLUMNS) or "_" not in fields[1]:
+                    continue
+                pdb, _, chain = fields[1].partition("_")
+                try:
+                    hit = {"pdb": pdb.lower(), "chain": chain, "evalue": float(fields[10]), "bits": float(fields[11]),
+                           "fident": float(fields[2]), "alnlen": int(fields[3]),
+                           "qstart": int(fields[6]), "qend": int(fields[7]), "source": label}
+                except ValueError:
+                    continue    # header or truncated line
+                yield hit
+        finally:
+            if hasattr(lines, "close"):
+                lines.close()
+
+
+def _rank_key(hit, by):
+    return (hit["evalue"], -hit["bits"]) if by == "evalue" else (-hit["bits"], hit["evalue"])
+
+
+def select_candidates(hits, top=TOP, by="evalue", max_evalue=MAX_EVALUE, per_entry=PER_ENTRY):
+    """Best *top* distinct PDB chains: best hit per chain, at most *per_entry* chains per PDB entry."""
+    best = {}
+    for hit in hits:
+        if hit["evalue"] > max_evalue:
+            continue
+        key = (hit["pdb"], hit["chain"])
+        if key not in best or _rank_key(hit, by) < _rank_key(best[key], by):
+            best[key] = hit
+    chosen, per_pdb = [], {}
+    # Entries are capped while walking the ranking, so only the heap head is sorted
+    ranked = [(_rank_key(h, by), h["pdb"], h["chain"], h) for h in best.values()]
+    heapq.heapify(ranked)
+    while ranked and len(chosen) < top:
+        *_, hit = heapq.heappop(ranked)
+        if per_entry and per_pdb.get(hit["pdb"], 0) >= per_entry:
+            continue
+        per_pdb[hit["pdb"]] = per_pdb.get(hit["pdb"], 0) + 1
+        chosen.append(hit)
+    return chosen
+
+
+# ── mmCIF mirror ──────────────────────────────────────────────────────────────
+def mirror_path(mirror, pdb_id):
+    """mmCIF file of *pdb_id* in a local mirror (divided <xy>/ or flat layout), or None."""
+    pdb_id = pdb_id.lower()
+    for rel in (f"{pdb_id[1:3]}/{pdb_id}.cif.gz", f"{pdb_id[1:3]}/{pdb_id}.cif",
+                f"{pdb_id}.cif.gz", f"{pdb_id}.cif"):
+        path = Path(mirror) / rel
+        if path.exists():
+            return path
+    return None
+
+
+def candidate_pdb_name(hit):
+    return f"{hit['code']}_{hit['pdb']}_{hit['chain']}.pdb"
+
+
+def convert_chain(task):
+    """(mmCIF, chain, out PDB) → (author chain written, error or None): first model, protein of one chain."""
+    cif, chain, out_pdb = task
+    import gemmi  # pip install gemmi
+
+    try:
+        st = gemmi.read_structure(str(cif))
+        st.setup_entities()
+        while len(st) > 1:
+            del st[1]
+        model = st[0]
+        if model.find_chain(chain) is None:
+            # pdb70 ids normally use author chains; fall back to the label_asym_id
+            sub = [ch.name for ch in model if ch.get_polymer() and ch.get_polymer().subchain_id() == chain]
+            if not sub:
+                return chain, f"chain {chain} not in {Path(cif).name}"
+            chain = sub[0]
+        if len(chain) > 1:
+            return chain, f"chain id {chain} does not fit the PDB format"
+        for name in {ch.name for ch in model} - {chain}:
+            model.remove_chain(name)
+        st.remove_ligands_and_waters()
+        st.remove_hydrogens()
+        st.remove_alternative_conformations()
+        st.remove_empty_chains()
+        if len(model) == 0 or len(model[0]) == 0:
+            return chain, f"no protein residues in chain {chain}"
+        tmp = Path(out_pdb).with_suffix(".part")
+        st.write_pdb(str(tmp))
+        os.replace(tmp, out_pdb)
+        return chain, None
+    except (RuntimeError, ValueError, OSError) as e:
+        return chain, str(e)
+
+
+def _written_chain(pdb_file):
+    with open(pdb_file) as fh:
+        for line in fh:
+            if line.startswith(("ATOM", "HETATM")):
+                return line[21]
+    return None
+
+
+def fetch_candidates(candidates, mirror, templates_dir, workers=None):
+    """Write the candidate chains into *templates_dir* in parallel; sets hit['status'], ['pdb_file'], ['dali_chain']."""
+    templates_dir = Path(templates_dir)
+    templates_dir.mkdir(parents=True, exist_ok=True)
+    tasks = []
+    for hit in candidates:
+        out_pdb = templates_dir / candidate_pdb_name(hit)
+        hit["pdb_file"] = str(out_pdb)
+        cif = mirror_path(mirror, hit["pdb"])
+        if cif is None:
+            hit["status"] = "not in mirror"
+        elif out_pdb.exists() and out_pdb.stat().st_mtime >= cif.stat().st_mtime:
+            hit["status"] = "ok"        # converted by an earlier run
+            hit["dali_chain"] = _written_chain(out_pdb) or hit["chain"]
+        else:
+            tasks.append(((cif, hit["chain"], out_pdb), hit))
+    if tasks:
+        workers = min(workers or os.cpu_count() or 1, len(tasks))
+        if workers == 1:
+            done = [convert_chain(task) for task, _ in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                done = list(pool.map(convert_chain, [task for task, _ in tasks]))
+        for (_, hit), (chain, error) in zip(tasks, done):
+            hit["status"] = error or "ok"
+            hit["dali_chain"] = None if error else chain
+    return candidates
+
+
+# ── candidate list ────────────────────────────────────────────────────────────
+def read_candidates(path):
+    path = Path(path)
+    if not path.exists():
+        return []
+    with path.open(newline="") as fh:
+        return list(csv.DictReader(fh, delimiter="\t"))
+
+
+def write_candidates(path, candidates):
+    with Path(path).open("w", newline="") as fh:
+        writer = csv.writer(fh, delimiter="\t")
+        writer.writerow(TSV_COLUMNS)
+        for rank, hit in enumerate(candidates, 1):
+            writer.writerow([rank, f"{hit['pdb']}_{hit['chain']}", hit["code"], f"{hit['evalue']:.3g}", hit["bits"],
+                             hit["fident"], hit["alnlen"], hit["qstart"], hit["qend"], hit["source"],
+                             hit.get("status", ""), Path(hit.get("pdb_file", "")).name, dali_id(hit) or "",
+                             hit.get("zscore", "")])
+
+
+def assign_codes(candidates, previous):
+    """Give every candidate a DALI code (t001...); chains of the previous run keep theirs.
+
+    Returns the newly assigned codes: whatever an earlier run left under them must go first.
+    """
+    known = {row["pdb_chain"]: row["code"] for row in previous if row.get("code")}
+    taken = set(known.values())
+    fresh = (code for code in (f"{CODE_PREFIX}{n:03d}" for n in itertools.count(1)) if code not in taken)
+    new = []
+    for hit in candidates:
+        code = known.get(f"{hit['pdb']}_{hit['chain']}")
+        if code is None:
+            code = next(fresh)
+            if len(code) != 4:
+                raise ValueError("more than 999 template candidates; DALI codes are 4 characters")
+            new.append(code)
+        hit["code"] = code
+    return new
+
+
+def dali_id(hit):
+    """DALI chain id of a fetched candidate, e.g. T001B"""
+    return f"{hit['code'].upper()}{hit['dali_chain']}" if hit.get("dali_chain") else None
+
+
+def drop_code(pipeline, code):
+    """Delete the template PDB, DATs and DALI outputs filed under *code*"""
+    base = code.upper()
+    for pdb in pipeline.templates_dir.glob(f"{code}_*.pdb"):
+        pdb.unlink()
+    dats = pipeline._artifacts(pipeline.dat1_dir, "dat")
+    stale = pipeline.chain_dats(base, pipeline.dat1_dir)
+    for dat in stale:
+        dat.unlink()
+    dats.forget([dat.name for dat in stale])
+    outputs = pipeline._artifacts(pipeline.outputs_dir, "dali")
+    names = [n for n in outputs.names(status=None, prefix=base) if len(n.partition("_vs_")[0]) == len(base) + 1]
+    for name in names:
+        outputs.path(name).unlink(missing_ok=True)
+    outputs.forget(names)
+
+
+def remove_stale(previous, candidates, pipeline):
+    """Delete PDB, DATs and DALI outputs of earlier candidates that are no longer selected.
+
+    Only codes listed in the previous candidates.tsv are touched; input_pdbs/ itself never is.
+    """
+    keep = {h["code"] for h in candidates}
+    stale = {row["code"] for row in previous if row.get("code") and row["code"] not in keep}
+    for code in stale:
+        # Otherwise a full dali.py run would keep comparing and reporting the old candidate
+        drop_code(pipeline, code)
+    return len(stale)
+
+
+# ── DALI ──────────────────────────────────────────────────────────────────────
+def candidate_queries(candidates):
+    """(pdb_file, DALI base) of the fetched candidates, as DaliPipeline._query_pdbs lists them"""
+    return [(Path(h["pdb_file"]), h["code"].upper()) for h in candidates if h.get("status") == "ok"]
+
+
+def compare_candidates(pipeline, candidates):
+    """Import the fetched candidates and compare them against the predicted model; fills hit['zscore']."""
+    p = pipeline
+    ready = [h for h in candidates if h.get("status") == "ok"]
+    queries = candidate_queries(ready)
+    if not queries or not p.check_prerequisites():
+        return False
+
+    def do_import():
+        ref_pdb = p._prepare_reference(p.pdb_dir / p.ref_pdb)
+        if not p._is_imported(ref_pdb, p.ref_base.upper(), p.dat2_dir) and \
+                not p.run_import(ref_pdb, p.ref_base.upper(), p.dat2_dir):
+            return False
+        todo = [(f, base) for f, base in queries if not p._is_imported(f, base, p.dat1_dir)]
+        jobs = [p._import_job(f, base, p.dat1_dir) for f, base in todo]
+        results = run_jobs(jobs, p.log_dir, limits={"import": p.workers}, max_parallel=p.workers)
+        return all([p._check_import(r, base, p.dat1_dir) for r, (_, base) in zip(results, todo)])
+
+    chain_ids = [dali_id(h) for h in ready]
+
+    def compare():
+        if p.backend == "native":
+            wanted = {cid: (Path(h["pdb_file"]), h["dali_chain"]) for cid, h in zip(chain_ids, ready)}
+            return p.run_native_comparisons(p._native_references(), wanted)
+        jobs = [p._comparison_job(cid) for cid in chain_ids]
+        print(f"> Comparing {len(jobs)} template candidates vs {p.ref_chain} ({p.workers} workers)")
+        results = run_jobs(jobs, p.log_dir, limits={"dali": p.workers}, max_parallel=p.workers)
+        return any([p._collect_comparison(cid, r) for cid, r in zip(chain_ids, results)])
+
+    if p.backend == "dalilite" and not p.run_step("import", do_import):
+        print("⚠️ Some template imports failed; comparing the others")
+    p.run_step("compare", compare)
+    for cid, hit in zip(chain_ids, ready):
+        hit["zscore"] = p._extract_zscore(p.output_path(cid)) if p.output_path(cid).exists() else "NA"
+    return p.run_step("extract", p.extract_zscores)
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Pick DALI candidates from the Protenix pdb70 template hits.")
+    parser.add_argument("work_dir", help="DALI work directory with input_pdbs/refx.pdb (e.g. work/<target>)")
+    parser.add_argument("--msa", nargs="+", metavar="PATH",
+                        help=f"m8 files, prediction directories or .ppred.npz archives "
+                             f"(default: {PRED_DIR}/tmp_<work_dir name>)")
+    parser.add_argument("--mirror", required=True, help="Local mmCIF mirror (e.g. /mnt/pdb/data/structures/divided/mmCIF)")
+    parser.add_argument("--top", type=int, default=TOP, help=f"Candidate chains at most (default: {TOP})")
+    parser.add_argument("--by", choices=["evalue", "bits"], default="evalue", help="Ranking of the hits")
+    parser.add_argument("--max-evalue", type=float, default=MAX_EVALUE, help=f"Default: {MAX_EVALUE:g}")
+    parser.add_argument("--per-entry", type=int, default=PER_ENTRY,
+                        help=f"Chains per PDB entry at most, 0 for no limit (default: {PER_ENTRY})")
+    parser.add_argument("--workers", type=int, help="Parallel conversions / imports / comparisons (default: CPU count)")
+    parser.add_argument("--no-compare", action="store_true", help="Select and convert only")
+    parser.add_argument("--queue", metavar="DB", help="Queue the DALI work on a workqueue.py queue instead")
+    parser.add_argument("--dali-bin", metavar="DIR", help="Directory with dali.pl and import.pl")
+    parser.add_argument("--backend", choices=["dalilite", "native"], default="dalilite")
+    parser.add_argument("--trace", metavar="DIR", help="Record timing/resource trace files in DIR")
+    args = parser.parse_args()
+
+    if args.trace:
+        tracing.enable(args.trace)
+    work_dir = Path(args.work_dir).resolve()
+    msa = args.msa or [ShardedDir(PRED_DIR, "pred").path(f"tmp_{work_dir.name}")]
+    sources = m8_sources(msa)
+    if not sources:
+        print(f"❌ No {M8_PATTERN} files in {', '.join(map(str, msa))}")
+        sys.exit(1)
+
+    from dali import DaliPipeline
+    pipeline = DaliPipeline(work_dir)
+    if args.dali_bin:
+        # Absolute: every DALI job runs in its own working directory
+        pipeline.dali_pl = Path(args.dali_bin).resolve() / "dali.pl"
+        pipeline.import_pl = Path(args.dali_bin).resolve() / "import.pl"
+    if args.workers:
+        pipeline.workers = args.workers
+    pipeline.backend = args.backend
+    templates_dir = pipeline.templates_dir
+
+    with tracing.get_tracer().span("templates", target=work_dir.name) as info:
+        candidates = select_candidates(iter_hits(sources), args.top, args.by, args.max_evalue, args.per_entry)
+        print(f"🧩 {len(candidates)} template chains from {len(sources)} m8 file(s) "
+              f"(top {args.top} by {args.by}, e-value <= {args.max_evalue:g})")
+        tsv = work_dir / CANDIDATES_TSV
+        previous = read_candidates(tsv)
+        try:
+            for code in assign_codes(candidates, previous):
+                drop_code(pipeline, code)       # left over by an interrupted or older run
+        except ValueError as e:
+            print(f"❌ {e}")
+            sys.exit(1)
+        removed = remove_stale(previous, candidates, pipeline)
+        if removed:
+            print(f"🧹 Removed {removed} candidate(s) no longer selected")
+        fetch_candidates(candidates, args.mirror, templates_dir, args.workers)
+        info["candidates"] = len(candidates)
+    for hit in candidates:
+        if hit["status"] != "ok":
+            print(f"⚠️ {hit['pdb']}_{hit['chain']}: {hit['status']}")
+    fetched = sum(h["status"] == "ok" for h in candidates)
+    print(f"✅ {fetched}/{len(candidates)} candidate chains in {templates_dir}")
+    write_candidates(tsv, candidates)
+    if args.no_compare or not fetched:
+        sys.exit(0 if fetched or not candidates else 1)
+
+    if args.queue:
+        from workqueue import WorkQueue, submit_dali
+        queries = candidate_queries(candidates)
+        if submit_dali(WorkQueue(args.queue), pipeline, queries) is None:
+            sys.exit(1)
+        print(f"📥 Queued the imports of {len(queries)} candidates for {work_dir} (compares follow the imports)")
+        return
+    ok = compare_candidates(pipeline, candidates)
+    write_candidates(tsv, candidates)
+    for hit in candidates:
+        if hit.get("zscore") not in (None, "", "NA"):
+            print(f"  {hit['pdb']}_{hit['chain']:<4s} e-value {hit['evalue']:.2g}  Z {hit['zscore']}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
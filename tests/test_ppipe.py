@@ -0,0 +1,28 @@
+"""`ppipe` start-up stays free of the heavy scientific imports."""
+
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from ppipe import HEAVY_MODULES
+
+
+def loaded_after(code):
+    # A fresh interpreter: modules imported by other tests must not count
+    report = f"; print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    return subprocess.run([sys.executable, "-c", "import sys, ppipe; " + code + report], cwd=ROOT,
+                          capture_output=True, text=True, check=True).stdout.strip()
+
+
+def test_import_loads_no_heavy_module():
+    assert loaded_after("pass") == ""
+
+
+@pytest.mark.parametrize("argv", [["dali", "check"], ["convert"], ["render", "x.pdb", "y.pdb"]])
+def test_argument_parsing_loads_no_heavy_module(argv):
+    assert loaded_after(f"ppipe.build_parser().parse_args({argv!r})") == ""
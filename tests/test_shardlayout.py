@@ -0,0 +1,94 @@
+"""Interrupted and resumed `shardlayout.migrate` runs."""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import shardlayout
+from shardlayout import ShardedDir, migrate
+
+
+def flat_outputs(root, n):
+    root.mkdir()
+    names = [f"Q{i:03d}A_vs_refxA.txt" for i in range(n)]
+    for i, name in enumerate(names):
+        (root / name).write_text(f"   1:  refx-A  {i / 2:4.1f}\n")
+    return names
+
+
+def interrupt_after(monkeypatch, n_moves):
+    real_replace = shardlayout.os.replace
+    calls = []
+
+    def replace(src, dst):
+        if len(calls) == n_moves:
+            raise KeyboardInterrupt
+        calls.append(src)
+        real_replace(src, dst)
+
+    monkeypatch.setattr(shardlayout.os, "replace", replace)
+
+
+@pytest.mark.parametrize("n_moves", [0, 7, 15])
+def test_migrate_resumes_after_interruption(tmp_path, monkeypatch, n_moves):
+    root = tmp_path / "dali_outputs"
+    names = flat_outputs(root, 16)
+    monkeypatch.setattr(shardlayout, "BATCH", 10)
+
+    interrupt_after(monkeypatch, n_moves)
+    with pytest.raises(KeyboardInterrupt):
+        migrate(root, "dali")
+    monkeypatch.undo()
+
+    migrate(root, "dali")
+    store = ShardedDir(root)
+    assert store.names(group="refxA") == sorted(names)
+    assert store.names(status="moving") == []
+    assert all(store.path(name).read_text() for name in names)
+    assert not list(root.glob("*_vs_*.txt"))
+
+
+def test_migrate_records_files_moved_before_the_manifest_update(tmp_path, monkeypatch):
+    root = tmp_path / "dali_outputs"
+    names = flat_outputs(root, 12)
+    monkeypatch.setattr(shardlayout, "BATCH", 100)
+
+    # Killed between the renames and the final record(): files sit in their shards as 'moving'
+    real_record = ShardedDir.record
+
+    def record(self, batch, status=None, meta=None):
+        if status is None:
+            raise KeyboardInterrupt
+        real_record(self, batch, status, meta)
+
+    monkeypatch.setattr(ShardedDir, "record", record)
+    with pytest.raises(KeyboardInterrupt):
+        migrate(root, "dali")
+    monkeypatch.undo()
+    assert not list(root.glob("*_vs_*.txt"))
+
+    migrate(root, "dali")
+    assert ShardedDir(root).names() == sorted(names)
+
+
+def test_pred_shards_ec_named_targets_by_their_full_name(tmp_path):
+    pred = ShardedDir.create(tmp_path / "predicted_structures", "pred")
+    assert pred.key("tmp_7.6.2.14") == "7.6.2.14"
+    assert pred.key("tmp_7.6.2.14") != pred.key("tmp_7.1.1.1")
+    # The packed archive of a target lands next to its tmp_<name>/ directory
+    assert pred.key("7.6.2.14.ppred.npz") == "7.6.2.14"
+    assert pred.path("tmp_7.6.2.14").parent == pred.path("7.6.2.14.ppred.npz").parent
+    assert pred.path("tmp_7.6.2.14").parent.relative_to(pred.root).as_posix() == shardlayout.shard_of("7.6.2.14")
+
+
+def test_reindex_moves_entries_out_of_a_stale_shard(tmp_path):
+    pred = ShardedDir.create(tmp_path / "predicted_structures", "pred")
+    stale = pred.root / shardlayout.shard_of("7") / "tmp_7.6.2.14"
+    stale.mkdir(parents=True)
+    (stale / "model.cif").write_text("data_x\n")
+    assert pred.reindex() == (1, 0)
+    assert (pred.path("tmp_7.6.2.14") / "model.cif").exists()
+    assert pred.names() == ["tmp_7.6.2.14"]
@@ -0,0 +1,53 @@
+"""Failure propagation in `stagedag.StageGraph.run`."""
+
+import sys
+import threading
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from stagedag import Stage, StageGraph
+
+
+def write(path):
+    return lambda: Path(path).write_text("x")
+
+
+def fail():
+    raise RuntimeError("boom")
+
+
+def run_with_timeout(graph, timeout=20):
+    result = {}
+    thread = threading.Thread(target=lambda: result.setdefault("ok", graph.run({"cpu": 2})), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "StageGraph.run hung"
+    return result["ok"]
+
+
+def test_failure_in_the_middle_of_a_chain_blocks_everything_downstream(tmp_path):
+    a, b, c, d = (tmp_path / f"{n}.txt" for n in "abcd")
+    graph = StageGraph(tmp_path / "state.json", tmp_path / "logs")
+    # Inserted downstream-first, so a single pass in insertion order would miss D
+    graph.add(Stage("D", [c], [d], write(d)))
+    graph.add(Stage("C", [b], [c], write(c)))
+    graph.add(Stage("B", [a], [b], fail))
+    graph.add(Stage("A", [], [a], write(a)))
+
+    assert run_with_timeout(graph) is False
+    assert a.exists() and not b.exists() and not c.exists() and not d.exists()
+    assert graph.state["A"]["status"] == "done"
+    assert graph.state["B"]["status"] == "failed"
+    assert "C" not in graph.state and "D" not in graph.state
+
+
+def test_independent_stages_still_run_next_to_a_failed_chain(tmp_path):
+    a, b, e = (tmp_path / f"{n}.txt" for n in "abe")
+    graph = StageGraph(tmp_path / "state.json", tmp_path / "logs")
+    graph.add(Stage("B", [a], [b], write(b)))
+    graph.add(Stage("A", [], [a], fail))
+    graph.add(Stage("E", [], [e], write(e)))
+
+    assert run_with_timeout(graph) is False
+    assert e.exists() and not b.exists()
@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+"""
+tracing.py
+--------------------
+Lightweight timing / resource instrumentation for the pipeline.
+
+Every Python stage (import, compare, extract, predict, convert, superfamily)
+and every external call made through asyncrunner.py is recorded with wall
+time, CPU time, memory and exit status.  External calls carry the peak RSS
+of the tool; a Python stage carries how far it raised the process's RSS
+high-water mark (rss_delta_kb), since the process-lifetime peak says nothing
+about the stage itself.  Each process appends events to
+    <trace_dir>/trace-<host>-<pid>.jsonl
+and writes a Chrome-trace / Perfetto file (trace-<host>-<pid>.json) on exit.
+
+Tracing is off unless a script is run with --trace DIR or the environment
+variable PIPELINE_TRACE_DIR is set (child scripts inherit it).
+
+External calls are measured from the tool's wait4() rusage, which includes
+every child it reaped (e.g. the Fortran binaries behind dali.pl), combined
+with /proc samples of the job's process group (Linux) for children still
+running side by side.
+
+`summary` reports self time: a stage's wall/CPU excludes the stages and
+external calls nested inside it, so the rows add up without double counting.
+
+Usage:
+    python dali.py --trace traces/
+    python tracing.py summary traces/            # slowest targets + stage totals
+    python tracing.py chrome traces/ --out campaign.trace.json
+"""
+
+import argparse
+import asyncio
+import atexit
+import json
+import os
+import resource
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+TRACE_ENV = "PIPELINE_TRACE_DIR"
+SAMPLE_INTERVAL = 0.5   # seconds between /proc samples of running tools
+
+_CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+_PAGE_KB = (os.sysconf("SC_PAGE_SIZE") // 1024) if hasattr(os, "sysconf") else 4
+
+
+def _self_peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss  # KiB on Linux
+
+
+# ── /proc sampler for external process groups ─────────────────────────────────
+class ProcessGroupSampler:
+    """Tracks peak RSS and CPU time of process groups by periodically scanning /proc."""
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.groups = {}          # pgid -> {"peak_rss_kb": int, "cpu": float}
+        self._task = None
+        self.available = Path("/proc/self/stat").exists()
+
+    def _scan(self):
+        totals = {}
+        for entry in os.scandir("/proc"):
+            if not entry.name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entry.name}/stat", "rb") as fh:
+                    stat = fh.read().decode(errors="replace")
+            except OSError:
+                continue
+            # Fields after the parenthesised command name; pgrp is field 5
+            fields = stat[stat.rfind(")") + 2:].split()
+            pgid = int(fields[2])
+            if pgid not in self.groups:
+                continue
+            ticks = sum(int(x) for x in fields[11:15])   # utime stime cutime cstime
+            rss_kb = int(fields[21]) * _PAGE_KB
+            rss, cpu = totals.get(pgid, (0, 0.0))
+            totals[pgid] = (rss + rss_kb, cpu + ticks / _CLK_TCK)
+        for pgid, (rss, cpu) in totals.items():
+            g = self.groups[pgid]
+            g["peak_rss_kb"] = max(g["peak_rss_kb"], rss)
+            g["cpu"] = max(g["cpu"], cpu)
+
+    async def _loop(self):
+        while self.groups:
+            self._scan()
+            await asyncio.sleep(self.interval)
+        self._task = None
+
+    def track(self, pgid):
+        if not self.available:
+            return
+        self.groups[pgid] = {"peak_rss_kb": 0, "cpu": 0.0}
+        self._scan()
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    def release(self, pgid):
+        """Stop tracking *pgid* and return its metrics (None when /proc is unavailable)."""
+        return self.groups.pop(pgid, None)
+
+
+# ── tracer ────────────────────────────────────────────────────────────────────
+class Tracer:
+    enabled = True
+
+    def __init__(self, trace_dir, run_name=None):
+        self.trace_dir = Path(trace_dir)
+        self.trace_dir.mkdir(parents=True, exist_ok=True)
+        stem = run_name or f"trace-{socket.gethostname()}-{os.getpid()}"
+        self.jsonl_path = self.trace_dir / f"{stem}.jsonl"
+        self.chrome_path = self.trace_dir / f"{stem}.json"
+        self.events = []
+        self._lock = threading.Lock()
+        self._samplers = {}
+        atexit.register(self.close)
+
+    def sampler(self):
+        """Sampler bound to the running event loop."""
+        loop = asyncio.get_running_loop()
+        if loop not in self._samplers:
+            self._samplers = {loop: ProcessGroupSampler()}
+        return self._samplers[loop]
+
+    def record(self, name, category, start, wall, cpu=None, peak_rss_kb=None, rss_delta_kb=None,
+               status="ok", exit_status=None, target=None, **args):
+        event = {
+            "name": name, "cat": category, "target": target,
+            "start": round(start, 6), "wall": round(wall, 6),
+            "cpu": None if cpu is None else round(cpu, 3),
+            "peak_rss_kb": peak_rss_kb, "rss_delta_kb": rss_delta_kb,
+            "status": status, "exit_status": exit_status,
+            "pid": os.getpid(), "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+            with self.jsonl_path.open("a") as fh:
+                fh.write(json.dumps(event) + "\n")
+        return event
+
+    @contextmanager
+    def span(self, name, category="stage", target=None, **args):
+        """Time a Python stage; the yielded dict can carry exit_status/extra args."""
+        info = {}
+        start, cpu0, rss0 = time.time(), time.process_time(), _self_peak_rss_kb()
+        status = "ok"
+        try:
+            yield info
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            if info.get("exit_status") not in (None, 0, True):
+                status = "failed"
+            self.record(name, category, start, time.time() - start,
+                        cpu=time.process_time() - cpu0, rss_delta_kb=_self_peak_rss_kb() - rss0,
+                        status=info.pop("status", status), exit_status=info.pop("exit_status", None),
+                        target=target, **args, **info)
+
+    def close(self):
+        with self._lock:
+            if self.events:
+                write_chrome_trace(self.events, self.chrome_path)
+
+
+class NullTracer:
+    """Stand-in used when tracing is disabled; costs nothing."""
+    enabled = False
+
+    def record(self, *args, **kwargs):
+        return None
+
+    @contextmanager
+    def span(self, *args, **kwargs):
+        yield {}
+
+
+_tracer = None
+
+
+def enable(trace_dir, run_name=None):
+    """Turn tracing on for this process and for the scripts it launches."""
+    global _tracer
+    os.environ[TRACE_ENV] = str(trace_dir)
+    _tracer = Tracer(trace_dir, run_name)
+    return _tracer
+
+
+def get_tracer():
+    global _tracer
+    if _tracer is None:
+        trace_dir = os.environ.get(TRACE_ENV)
+        _tracer = Tracer(trace_dir) if trace_dir else NullTracer()
+    return _tracer
+
+
+# ── reporting ─────────────────────────────────────────────────────────────────
+def load_events(paths):
+    events = []
+    for path in paths:
+        path = Path(path)
+        files = sorted(path.glob("*.jsonl")) if path.is_dir() else [path]
+        for f in files:
+            with f.open() as fh:
+                events.extend(json.loads(line) for line in fh if line.strip())
+    return events
+
+
+def write_chrome_trace(events, out_path):
+    """Chrome trace-event format (chrome://tracing, ui.perfetto.dev)."""
+    trace = []
+    for e in events:
+        args = {k: e[k] for k in ("target", "cpu", "peak_rss_kb", "rss_delta_kb", "status", "exit_status")
+                if e.get(k) is not None}
+        args.update(e.get("args", {}))
+        trace.append({
+            "name": e["name"] if not e.get("target") else f"{e['name']} [{e['target']}]",
+            "cat": e["cat"], "ph": "X",
+            "ts": int(e["start"] * 1e6), "dur": int(e["wall"] * 1e6),
+            "pid": e["pid"], "tid": e["tid"] % 2**31, "args": args,
+        })
+    Path(out_path).write_text(json.dumps({"traceEvents": trace, "displayTimeUnit": "ms"}))
+
+
+def self_times(events):
+    """(wall, cpu) of each event minus the events nested directly inside it.
+
+    Only Python stages nest; an event is a child of the innermost stage of the
+    same process whose time span contains it.  Concurrent children are merged
+    before subtracting, and external CPU is not subtracted because it was never
+    part of the stage's own process time.
+    """
+    spans = sorted((e for e in events if e["cat"] != "external"), key=lambda e: (e["start"], -e["wall"]))
+    children = {id(e): [] for e in spans}
+    for e in events:
+        end = e["start"] + e["wall"]
+        parent = None
+        for s in spans:
+            if s["start"] > e["start"] + 1e-6:
+                break
+            if (s is not e and s["pid"] == e["pid"] and s["start"] + s["wall"] >= end - 1e-6
+                    and (s["wall"] > e["wall"] or e["cat"] == "external")
+                    and (parent is None or s["wall"] <= parent["wall"])):
+                parent = s
+        if parent is not None:
+            children[id(parent)].append(e)
+
+    result = {}
+    for e in events:
+        wall, cpu = e["wall"], e["cpu"] or 0.0
+        covered, last_end = 0.0, None
+        for c in sorted(children.get(id(e), ()), key=lambda c: c["start"]):
+            lo, hi = c["start"], c["start"] + c["wall"]
+            if last_end is not None:
+                lo = max(lo, last_end)
+            covered += max(0.0, hi - lo)
+            last_end = hi if last_end is None else max(last_end, hi)
+            if c["cat"] != "external":
+                cpu -= c["cpu"] or 0.0
+        result[id(e)] = (max(0.0, wall - covered), max(0.0, cpu))
+    return result
+
+
+def summarize(events, top=10):
+    """Print stage totals (self time) and the slowest targets."""
+    own = self_times(events)
+    by_name = {}
+    for e in events:
+        key = (e["cat"], e["name"].split("_")[0])
+        wall, cpu = own[id(e)]
+        t = by_name.setdefault(key, [0, 0.0, 0.0, 0, 0, 0])
+        t[0] += 1
+        t[1] += wall
+        t[2] += cpu
+        t[3] = max(t[3], e["peak_rss_kb"] or 0)
+        t[4] = max(t[4], e.get("rss_delta_kb") or 0)
+        t[5] += e["status"] != "ok"
+
+    print(f"{'category':<10s} {'step':<14s} {'calls':>6s} {'self wall s':>12s} {'self cpu s':>11s} "
+          f"{'peak MB':>9s} {'+RSS MB':>8s} {'failed':>6s}")
+    for (cat, name), (n, wall, cpu, rss, grew, bad) in sorted(by_name.items(), key=lambda kv: -kv[1][1]):
+        print(f"{cat:<10s} {name:<14s} {n:6d} {wall:12.1f} {cpu:11.1f} {rss / 1024:9.1f} {grew / 1024:8.1f} {bad:6d}")
+
+    by_target = {}
+    for e in events:
+        if e.get("target"):
+            wall = own[id(e)][0]
+            t = by_target.setdefault(e["target"], {"wall": 0.0, "steps": {}})
+            t["wall"] += wall
+            step = e["name"].split("_")[0]
+            t["steps"][step] = t["steps"].get(step, 0.0) + wall
+    if by_target:
+        print(f"\n🐢 Slowest {min(top, len(by_target))} targets")
+        print(f"{'target':<24s} {'wall s':>10s}  bottleneck")
+        ranked = sorted(by_target.items(), key=lambda kv: -kv[1]["wall"])[:top]
+        for target, t in ranked:
+            step, secs = max(t["steps"].items(), key=lambda kv: kv[1])
+            print(f"{target:<24s} {t['wall']:10.1f}  {step} ({secs:.1f}s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarise pipeline trace files.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_sum = sub.add_parser("summary", help="Print stage totals and slowest targets")
+    p_sum.add_argument("paths", nargs="+", help="Trace directories or .jsonl files")
+    p_sum.add_argument("--top", type=int, default=10)
+    p_chrome = sub.add_parser("chrome", help="Merge JSONL traces into one Chrome/Perfetto trace")
+    p_chrome.add_argument("paths", nargs="+")
+    p_chrome.add_argument("--out", default="pipeline.trace.json")
+    args = parser.parse_args()
+
+    events = load_events(args.paths)
+    if not events:
+        print("❌ No trace events found")
+        raise SystemExit(1)
+    if args.command == "summary":
+        summarize(events, args.top)
+    else:
+        write_chrome_trace(events, args.out)
+        print(f"✅ Wrote {len(events)} events to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,567 @@
+#!/usr/bin/env python3
+"""
+workqueue.py
+--------------------
+SQLite work queue for spreading DALI imports/comparisons and SUPERFAMILY
+scans over many worker processes and nodes.
+
+The queue is a single SQLite file, normally on the shared filesystem that
+already holds the work/<target>/ directories.  Every worker, local or on
+another node, opens the same file:
+
+• claims are atomic (BEGIN IMMEDIATE): a task is handed to exactly one worker
+• a claimed task carries a lease that the worker renews with heartbeats; the
+  lease of a crashed/killed worker expires and the task is re-queued (or
+  marked failed once its attempts are used up)
+• tasks may depend on other tasks (compare waits for the reference import);
+  dependencies must already be queued, and a task whose dependency failed or
+  is missing fails too, so a drained queue always ends
+• per-type limits cap how many tasks of a type run at once across all nodes
+  (SUPERFAMILY works in one fixed directory, so "scan" is limited to 1)
+
+Task types:
+    import    import.pl of one PDB; a query import then enqueues its compares
+    compare   dali.pl of one query chain against one reference chain
+    extract   zscore_summary.csv / zscore_wide.csv once the compares are done
+    scan      supfamhtml.run_superfamily_pipeline on one FASTA file
+
+The journal stays in the default rollback mode (WAL needs shared memory and
+does not work over NFS); the filesystem must support POSIX locks.
+
+Usage:
+    python workqueue.py submit-dali queue.db work/7.6.2.14 [--refs a.pdb b.pdb:B] [--dali-bin DIR]
+    python workqueue.py submit-supfam queue.db fasta/*.fa
+    python workqueue.py worker queue.db [--processes 4] [--types import compare] [--exit-when-empty]
+    python workqueue.py status queue.db [--failed]
+    python workqueue.py retry queue.db [--type compare]
+"""
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from multiprocessing import Process
+from pathlib import Path
+
+from asyncrunner import run_job
+import tracing
+
+LEASE = 300.0           # seconds a claim stays valid without a heartbeat
+MAX_ATTEMPTS = 3
+POLL = 2.0              # seconds between claim attempts when nothing is ready
+DEFER = 10.0            # default back-off of a task that is not ready yet
+BUSY_TIMEOUT = 60.0     # SQLite lock wait; shared filesystems can be slow
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    id           INTEGER PRIMARY KEY AUTOINCREMENT,
+    key          TEXT NOT NULL UNIQUE,
+    type         TEXT NOT NULL,
+    grp          TEXT NOT NULL DEFAULT '',
+    payload      TEXT NOT NULL,
+    status       TEXT NOT NULL DEFAULT 'queued',    -- queued | running | done | failed
+    priority     INTEGER NOT NULL DEFAULT 0,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker       TEXT,
+    lease_until  REAL,
+    not_before   REAL NOT NULL DEFAULT 0,
+    result       TEXT,
+    error        TEXT,
+    created      REAL NOT NULL,
+    updated      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS tasks_ready ON tasks (status, type, priority);
+CREATE INDEX IF NOT EXISTS tasks_group ON tasks (grp, type, status);
+CREATE TABLE IF NOT EXISTS deps (
+    task_id INTEGER NOT NULL,
+    dep_key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deps_task ON deps (task_id);
+CREATE TABLE IF NOT EXISTS limits (
+    type        TEXT PRIMARY KEY,
+    max_running INTEGER NOT NULL
+);
+"""
+
+CLAIM_SQL = """
+SELECT t.id FROM tasks t
+WHERE t.status = 'queued' AND t.not_before <= :now {types}
+  AND NOT EXISTS (
+      SELECT 1 FROM deps d LEFT JOIN tasks u ON u.key = d.dep_key
+      WHERE d.task_id = t.id AND (u.status IS NULL OR u.status != 'done'))
+  AND (NOT EXISTS (SELECT 1 FROM limits l WHERE l.type = t.type)
+       OR (SELECT COUNT(*) FROM tasks r WHERE r.type = t.type AND r.status = 'running')
+          < (SELECT l.max_running FROM limits l WHERE l.type = t.type))
+ORDER BY t.priority DESC, t.id
+LIMIT 1
+"""
+
+
+class Defer(Exception):
+    """Raised by a handler when its task cannot run yet; it is re-queued without using an attempt."""
+
+    def __init__(self, reason, delay=DEFER):
+        super().__init__(reason)
+        self.delay = delay
+
+
+class WorkQueue:
+    """Task table in one SQLite file; every method is its own short transaction."""
+
+    def __init__(self, path, lease=LEASE):
+        self.path = str(path)
+        self.lease = lease
+        db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT)
+        try:
+            db.executescript(SCHEMA)
+        finally:
+            db.close()
+
+    @contextmanager
+    def _tx(self):
+        # A fresh connection per transaction: nothing holds a lock between calls,
+        # and the heartbeat thread never shares a connection with the worker
+        db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            yield db
+            db.execute("COMMIT")
+        except BaseException:
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    # ── producers ─────────────────────────────────────────────────────────────
+    def submit(self, type, payload, key=None, group="", deps=(), priority=0, max_attempts=MAX_ATTEMPTS):
+        """Add a task; a task with the same *key* already in the queue is left alone. Returns the key.
+
+        Every key in *deps* must already be in the queue (ValueError otherwise): a task waiting
+        for a key that never arrives could not be claimed, and workers would never drain the queue.
+        """
+        key = key or f"{type}:{json.dumps(payload, sort_keys=True)}"
+        deps = list(deps)
+        now = time.time()
+        with self._tx() as db:
+            known = {row[0] for row in db.execute(
+                f"SELECT key FROM tasks WHERE key IN ({', '.join('?' * len(deps))})", deps)} if deps else set()
+            unknown = [dep for dep in deps if dep not in known]
+            if unknown:
+                raise ValueError(f"{key}: unknown dependencies {', '.join(unknown)}")
+            cur = db.execute(
+                "INSERT OR IGNORE INTO tasks (key, type, grp, payload, priority, max_attempts, created, updated) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, type, group, json.dumps(payload), priority, max_attempts, now, now))
+            if cur.rowcount:
+                db.executemany("INSERT INTO deps (task_id, dep_key) VALUES (?, ?)",
+                               [(cur.lastrowid, dep) for dep in deps])
+        return key
+
+    def set_limit(self, type, max_running):
+        """Run at most *max_running* tasks of *type* at once over all workers (None removes the limit)."""
+        with self._tx() as db:
+            if max_running is None:
+                db.execute("DELETE FROM limits WHERE type = ?", (type,))
+            else:
+                db.execute("INSERT OR REPLACE INTO limits (type, max_running) VALUES (?, ?)", (type, max_running))
+
+    # ── workers ───────────────────────────────────────────────────────────────
+    def _housekeeping(self, db, now):
+        """Re-queue expired leases; fail tasks out of attempts or with failed or missing dependencies."""
+        db.execute("UPDATE tasks SET status = 'failed', error = 'lease expired, no attempts left', "
+                   "worker = NULL, updated = :now "
+                   "WHERE status = 'running' AND lease_until < :now AND attempts >= max_attempts", {"now": now})
+        requeued = db.execute("UPDATE tasks SET status = 'queued', worker = NULL, updated = :now "
+                              "WHERE status = 'running' AND lease_until < :now", {"now": now}).rowcount
+        db.execute("UPDATE tasks SET status = 'failed', error = 'dependency failed', updated = :now "
+                   "WHERE status = 'queued' AND id IN (SELECT d.task_id FROM deps d JOIN tasks u "
+                   "ON u.key = d.dep_key WHERE u.status = 'failed')", {"now": now})
+        # Rows from before submit() checked dependencies; they would stay queued forever
+        db.execute("UPDATE tasks SET status = 'failed', error = 'unknown dependency', updated = :now "
+                   "WHERE status = 'queued' AND id IN (SELECT d.task_id FROM deps d LEFT JOIN tasks u "
+                   "ON u.key = d.dep_key WHERE u.id IS NULL)", {"now": now})
+        return requeued
+
+    def requeue_expired(self):
+        """Number of expired leases put back into the queue."""
+        with self._tx() as db:
+            return self._housekeeping(db, time.time())
+
+    def claim(self, worker, types=None):
+        """Lease the next ready task to *worker*: a dict, or None when nothing is ready."""
+        now = time.time()
+        params = {"now": now}
+        clause = ""
+        if types:
+            params.update({f"t{i}": t for i, t in enumerate(types)})
+            clause = f"AND t.type IN ({', '.join(f':t{i}' for i in range(len(types)))})"
+        with self._tx() as db:
+            self._housekeeping(db, now)
+            row = db.execute(CLAIM_SQL.format(types=clause), params).fetchone()
+            if row is None:
+                return None
+            db.execute("UPDATE tasks SET status = 'running', worker = ?, lease_until = ?, "
+                       "attempts = attempts + 1, updated = ? WHERE id = ?",
+                       (worker, now + self.lease, now, row["id"]))
+            task = db.execute("SELECT id, key, type, grp, payload, attempts FROM tasks WHERE id = ?",
+                              (row["id"],)).fetchone()
+        return {**dict(task), "payload": json.loads(task["payload"])}
+
+    def _finish(self, task_id, worker, sql, params):
+        with self._tx() as db:
+            return db.execute(f"UPDATE tasks SET {sql}, updated = :now "
+                              "WHERE id = :id AND worker = :worker AND status = 'running'",
+                              {**params, "id": task_id, "worker": worker, "now": time.time()}).rowcount == 1
+
+    def heartbeat(self, task_id, worker):
+        """Extend the lease; False if the task is no longer held by *worker*."""
+        return self._finish(task_id, worker, "lease_until = :until", {"until": time.time() + self.lease})
+
+    def complete(self, task_id, worker, result=None):
+        return self._finish(task_id, worker, "status = 'done', lease_until = NULL, result = :result, error = NULL",
+                            {"result": json.dumps(result)})
+
+    def fail(self, task_id, worker, error):
+        """Record a failure; the task is re-queued until it runs out of attempts."""
+        return self._finish(task_id, worker,
+                            "status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'queued' END, "
+                            "worker = NULL, lease_until = NULL, error = :error", {"error": str(error)[-2000:]})
+
+    def defer(self, task_id, worker, delay=DEFER, reason=""):
+        """Put a task back without counting the attempt; it becomes ready again after *delay* seconds."""
+        return self._finish(task_id, worker,
+                            "status = 'queued', attempts = attempts - 1, worker = NULL, lease_until = NULL, "
+                            "not_before = :nb, error = :reason", {"nb": time.time() + delay, "reason": reason})
+
+    # ── inspection ────────────────────────────────────────────────────────────
+    def pending(self, group=None, types=None):
+        """Number of queued or running tasks, optionally of one *group* and/or *types*."""
+        sql = "SELECT COUNT(*) FROM tasks WHERE status IN ('queued', 'running')"
+        params = []
+        if group is not None:
+            sql += " AND grp = ?"
+            params.append(group)
+        if types:
+            sql += f" AND type IN ({', '.join('?' * len(types))})"
+            params.extend(types)
+        with self._tx() as db:
+            return db.execute(sql, params).fetchone()[0]
+
+    def stats(self):
+        """{(group, type): {status: count}}"""
+        with self._tx() as db:
+            rows = db.execute("SELECT grp, type, status, COUNT(*) AS n FROM tasks GROUP BY grp, type, status")
+            table = {}
+            for row in rows:
+                table.setdefault((row["grp"], row["type"]), {})[row["status"]] = row["n"]
+        return table
+
+    def tasks(self, status=None):
+        with self._tx() as db:
+            sql = "SELECT * FROM tasks" + (" WHERE status = ?" if status else "") + " ORDER BY id"
+            return [dict(row) for row in db.execute(sql, (status,) if status else ())]
+
+    def retry(self, type=None):
+        """Re-queue failed tasks with a fresh attempt budget; returns how many."""
+        sql = "UPDATE tasks SET status = 'queued', attempts = 0, not_before = 0, updated = ? WHERE status = 'failed'"
+        params = [time.time()]
+        if type:
+            sql += " AND type = ?"
+            params.append(type)
+        with self._tx() as db:
+            return db.execute(sql, params).rowcount
+
+
+# ── task handlers ─────────────────────────────────────────────────────────────
+def _pipeline(payload):
+    """DaliPipeline for a work/<target>/ directory as described by a task payload."""
+    from dali import DaliPipeline
+
+    pipeline = DaliPipeline(payload["base_dir"])
+    pipeline.dali_pl = Path(payload["dali_pl"])
+    pipeline.import_pl = Path(payload["import_pl"])
+    pipeline.trim_plddt = payload.get("trim_plddt")
+    for pdb_name, chain in payload.get("references", []):
+        pipeline.add_reference(pdb_name, chain)
+    if payload.get("clusters") and pipeline.clusters_tsv.exists():
+        from seqcluster import read_clusters
+        pipeline.clusters = read_clusters(pipeline.clusters_tsv)
+    return pipeline
+
+
+def handle_import(queue, task):
+    payload = task["payload"]
+    pipeline = _pipeline(payload)
+    dat_dir = Path(payload["dat_dir"])
+    if not pipeline.run_import(pipeline._prepare_reference(Path(payload["pdb"]))
+                               if payload["role"] == "reference" else Path(payload["pdb"]),
+                               payload["pdb_base"], dat_dir):
+        raise RuntimeError(f"import of {payload['pdb']} failed")
+    chain_ids = sorted(d.stem for d in pipeline.chain_dats(payload["pdb_base"], dat_dir))
+    if payload["role"] == "query":
+        # One compare per (representative chain, reference); each waits for its reference import
+        for chain_id in chain_ids:
+            if not pipeline._is_representative(chain_id):
+                continue
+            for ref_chain, ref_key in payload["compare"]:
+                queue.submit("compare", {**_common(payload), "chain_id": chain_id, "ref_chain": ref_chain},
+                             key=f"compare:{payload['base_dir']}:{chain_id}:{ref_chain}",
+                             group=task["grp"], deps=[ref_key], priority=1)
+    return {"chains": chain_ids}
+
+
+def handle_compare(queue, task):
+    payload = task["payload"]
+    pipeline = _pipeline(payload)
+    chain_id, ref_chain = payload["chain_id"], payload["ref_chain"]
+    result = run_job(pipeline._comparison_job(chain_id, ref_chain), pipeline.log_dir)
+    if not pipeline._collect_comparison(chain_id, result, ref_chain):
+        raise RuntimeError(f"no DALI output for {chain_id} vs {ref_chain}")
+    return {"output": str(pipeline.output_path(chain_id, ref_chain))}
+
+
+def handle_extract(queue, task):
+    payload = task["payload"]
+    # Compares are enqueued by the query imports, so they cannot be listed as dependencies
+    waiting = queue.pending(group=task["grp"], types=["import", "compare"])
+    if waiting:
+        raise Defer(f"{waiting} import/compare task(s) still pending")
+    pipeline = _pipeline(payload)
+    ok = pipeline.extract_zscore_table() if pipeline.references else pipeline.extract_zscores()
+    if not ok:
+        raise RuntimeError("no valid Z-scores found")
+    return {"csv": str(pipeline.zscore_wide_csv if pipeline.references else pipeline.zscore_csv)}
+
+
+def handle_scan(queue, task):
+    import supfamhtml  # creates the SUPERFAMILY results directory on import
+
+    if not supfamhtml.run_superfamily_pipeline(task["payload"]["fasta"]):
+        raise RuntimeError(f"SUPERFAMILY failed for {task['payload']['fasta']}")
+    return {"fasta": task["payload"]["fasta"]}
+
+
+HANDLERS = {"import": handle_import, "compare": handle_compare, "extract": handle_extract, "scan": handle_scan}
+
+
+def _common(payload):
+    return {k: payload[k] for k in ("base_dir", "dali_pl", "import_pl", "trim_plddt", "references", "clusters")
+            if k in payload}
+
+
+def submit_dali(queue, pipeline, queries=None):
+    """Enqueue the imports and the final extraction of one DaliPipeline; compares follow from the imports.
+
+    *queries* [(pdb_file, pdb_base)] limits the imports to those PDBs (default: all queries of the pipeline).
+    """
+    if not pipeline.check_prerequisites():
+        return None
+    if pipeline.cluster_identity:
+        pipeline.cluster_queries()
+    base_dir = str(pipeline.base_dir.resolve())
+    # Absolute paths throughout: workers run on other nodes and in their own working directories
+    common = {"base_dir": base_dir, "dali_pl": str(pipeline.dali_pl.resolve()),
+              "import_pl": str(pipeline.import_pl.resolve()),
+              "trim_plddt": pipeline.trim_plddt, "clusters": bool(pipeline.clusters),
+              "references": [[str(ref["pdb"]), ref["chain"][-1]] for ref in pipeline.references]}
+
+    if pipeline.references:
+        refs = [(ref["pdb"], ref["code"].upper(), ref["chain"]) for ref in pipeline.references]
+        mapping = {ref["chain"]: {"name": ref["name"], "pdb": str(ref["pdb"])} for ref in pipeline.references}
+        (pipeline.dat2_dir / "references.json").write_text(json.dumps(mapping, indent=2))
+    else:
+        refs = [(pipeline.pdb_dir / pipeline.ref_pdb, pipeline.ref_base.upper(), pipeline.ref_chain)]
+    compare = []
+    keys = []
+    for pdb_file, pdb_base, ref_chain in refs:
+        key = queue.submit("import", {**common, "role": "reference", "pdb": str(pdb_file), "pdb_base": pdb_base,
+                                      "dat_dir": str(pipeline.dat2_dir)},
+                           key=f"import:{base_dir}:ref:{pdb_base}", group=base_dir)
+        compare.append([ref_chain, key])
+        keys.append(key)
+
+    redundant = {cid[:-1] for cid in pipeline.clusters} - {cid[:-1] for cid in pipeline.clusters.values()}
+    for pdb_file, pdb_base in pipeline._query_pdbs() if queries is None else queries:
+        if pdb_base in redundant:
+            continue
+        keys.append(queue.submit("import", {**common, "role": "query", "pdb": str(pdb_file), "pdb_base": pdb_base,
+                                            "dat_dir": str(pipeline.dat1_dir), "compare": compare},
+                                 key=f"import:{base_dir}:query:{pdb_base}", group=base_dir))
+    # No dependencies: failed imports must not block the extraction of the others
+    queue.submit("extract", common, key=f"extract:{base_dir}", group=base_dir, priority=-1)
+    return keys
+
+
+def submit_supfam(queue, fasta_files):
+    queue.set_limit("scan", 1)      # SUPERFAMILY writes .ass/.html into its own fixed directory
+    return [queue.submit("scan", {"fasta": str(Path(fa).resolve())}, key=f"scan:{Path(fa).resolve()}",
+                         group="superfamily") for fa in fasta_files]
+
+
+# ── worker loop ───────────────────────────────────────────────────────────────
+class Worker:
+    def __init__(self, queue, worker_id=None, types=None, exit_when_empty=False, poll=POLL):
+        self.queue = queue
+        self.id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.types = types
+        self.exit_when_empty = exit_when_empty
+        self.poll = poll
+        self.done = 0
+
+    def _beat(self, task, stop):
+        """Renew the lease every third of its length until *stop* is set."""
+        while not stop.wait(self.queue.lease / 3):
+            if not self.queue.heartbeat(task["id"], self.id):
+                print(f"⚠️ [{self.id}] lost the lease on {task['key']}", flush=True)
+                return
+
+    def run_one(self, task):
+        stop = threading.Event()
+        beat = threading.Thread(target=self._beat, args=(task, stop), daemon=True)
+        beat.start()
+        try:
+            with tracing.get_tracer().span(f"queue_{task['type']}", target=task["grp"], key=task["key"]) as info:
+                try:
+                    result = HANDLERS[task["type"]](self.queue, task)
+                except Defer as exc:
+                    info["status"] = "deferred"
+                    self.queue.defer(task["id"], self.id, exc.delay, str(exc))
+                    return
+                except Exception as exc:
+                    info["status"] = "failed"
+                    print(f"❌ [{self.id}] {task['key']}: {exc}", flush=True)
+                    self.queue.fail(task["id"], self.id, f"{type(exc).__name__}: {exc}")
+                    return
+            if self.queue.complete(task["id"], self.id, result):
+                self.done += 1
+                print(f"✅ [{self.id}] {task['key']}", flush=True)
+        finally:
+            stop.set()
+            beat.join()
+
+    def run(self):
+        while True:
+            task = self.queue.claim(self.id, self.types)
+            if task is not None:
+                self.run_one(task)
+                continue
+            if self.exit_when_empty and not self.queue.pending(types=self.types):
+                return self.done
+            time.sleep(self.poll)
+
+
+def _worker_process(path, lease, types, exit_when_empty, index, trace):
+    if trace:
+        tracing.enable(trace)
+    worker_id = f"{socket.gethostname()}:{os.getpid()}:{index}"
+    Worker(WorkQueue(path, lease), worker_id, types, exit_when_empty).run()
+
+
+# ── entry point ───────────────────────────────────────────────────────────────
+def print_status(queue, failed=False):
+    stats = queue.stats()
+    if not stats:
+        print("📭 Queue is empty")
+        return
+    print(f"{'group':<40s} {'type':<8s} {'queued':>7s} {'running':>8s} {'done':>6s} {'failed':>7s}")
+    for (group, type), counts in sorted(stats.items()):
+        print(f"{Path(group).name or group or '-':<40s} {type:<8s} {counts.get('queued', 0):>7d} "
+              f"{counts.get('running', 0):>8d} {counts.get('done', 0):>6d} {counts.get('failed', 0):>7d}")
+    for task in queue.tasks("running"):
+        print(f"⏳ {task['key']} on {task['worker']} (lease {task['lease_until'] - time.time():+.0f}s)")
+    if failed:
+        for task in queue.tasks("failed"):
+            print(f"❌ {task['key']} after {task['attempts']} attempt(s): {task['error']}")
+
+
+def main():
+    from dali import DaliPipeline
+
+    parser = argparse.ArgumentParser(description="Shared SQLite work queue for DALI and SUPERFAMILY tasks.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_dali = sub.add_parser("submit-dali", help="Enqueue the DALI pipeline of a work/<target>/ directory")
+    p_dali.add_argument("queue")
+    p_dali.add_argument("base_dir", help="Directory holding input_pdbs/ (and refx.pdb)")
+    p_dali.add_argument("--refs", nargs="+", metavar="PDB[:CHAIN]", help="Multi-reference mode, as in dali.py")
+    p_dali.add_argument("--dali-bin", metavar="DIR", help="Directory with dali.pl and import.pl")
+    p_dali.add_argument("--trim-plddt", type=float, metavar="THRESH")
+    p_dali.add_argument("--cluster-identity", type=float, metavar="FRAC")
+    p_dali.add_argument("--sharded", action="store_true", help="Sharded DAT/output layout, as in dali.py")
+
+    p_sf = sub.add_parser("submit-supfam", help="Enqueue SUPERFAMILY scans of FASTA files")
+    p_sf.add_argument("queue")
+    p_sf.add_argument("fasta", nargs="+")
+
+    p_work = sub.add_parser("worker", help="Claim and run tasks until stopped")
+    p_work.add_argument("queue")
+    p_work.add_argument("--lease", type=float, default=LEASE, help=f"Lease length in seconds (default: {LEASE:.0f})")
+    p_work.add_argument("--processes", type=int, default=1, help="Worker processes on this node")
+    p_work.add_argument("--types", nargs="+", choices=sorted(HANDLERS), help="Only run these task types")
+    p_work.add_argument("--exit-when-empty", action="store_true", help="Stop once no task is queued or running")
+    p_work.add_argument("--trace", metavar="DIR", help="Record timing/resource trace files in DIR")
+
+    p_stat = sub.add_parser("status", help="Task counts per group/type/status")
+    p_stat.add_argument("queue")
+    p_stat.add_argument("--failed", action="store_true", help="List failed tasks with their errors")
+
+    p_retry = sub.add_parser("retry", help="Re-queue failed tasks")
+    p_retry.add_argument("queue")
+    p_retry.add_argument("--type", choices=sorted(HANDLERS))
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue, getattr(args, "lease", LEASE))
+    if args.command == "submit-dali":
+        pipeline = DaliPipeline(Path(args.base_dir).resolve())
+        if args.dali_bin:
+            pipeline.dali_pl = Path(args.dali_bin) / "dali.pl"
+            pipeline.import_pl = Path(args.dali_bin) / "import.pl"
+        pipeline.trim_plddt = args.trim_plddt
+        pipeline.cluster_identity = args.cluster_identity
+        for ref in args.refs or []:
+            pdb_name, _, chain = ref.partition(":")
+            pipeline.add_reference(pdb_name, chain or "A")
+        if args.sharded:
+            try:
+                pipeline.use_sharded_layout()     # workers pick the layout up from the directories
+            except ValueError as e:
+                print(f"❌ {e}")
+                sys.exit(1)
+        keys = submit_dali(queue, pipeline)
+        if keys is None:
+            sys.exit(1)
+        print(f"📥 Queued {len(keys)} import tasks for {args.base_dir} (compares follow the imports)")
+    elif args.command == "submit-supfam":
+        keys = submit_supfam(queue, args.fasta)
+        print(f"📥 Queued {len(keys)} SUPERFAMILY scans")
+    elif args.command == "worker":
+        if args.processes == 1:
+            if args.trace:
+                tracing.enable(args.trace)
+            done = Worker(queue, types=args.types, exit_when_empty=args.exit_when_empty).run()
+            print(f"🏁 Worker finished {done} task(s)")
+            return
+        procs = [Process(target=_worker_process,
+                         args=(args.queue, args.lease, args.types, args.exit_when_empty, i, args.trace))
+                 for i in range(args.processes)]
+        for proc in procs:
+            proc.start()
+        for proc in procs:
+            proc.join()
+        print(f"🏁 {len(procs)} workers finished")
+    elif args.command == "status":
+        print_status(queue, args.failed)
+    elif args.command == "retry":
+        print(f"🔁 Re-queued {queue.retry(args.type)} failed task(s)")
+
+
+if __name__ == "__main__":
+    main()